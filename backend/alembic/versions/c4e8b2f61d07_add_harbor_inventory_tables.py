@@ -0,0 +1,61 @@
+"""add harbor inventory tables
+
+Revision ID: c4e8b2f61d07
+Revises: a7d3c91e5b20
+Create Date: 2025-10-21 15:40:27.905113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e8b2f61d07'
+down_revision = 'a7d3c91e5b20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Harbor仓库同步状态
+    op.create_table(
+        'harbor_repository_states',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('project_name', sa.String(length=255), nullable=False),
+        sa.Column('repository_name', sa.String(length=255), nullable=False),
+        sa.Column('update_time', sa.String(length=64), nullable=True),
+        sa.Column('artifact_count', sa.Integer(), nullable=True),
+        sa.Column('artifacts_etag', sa.String(length=255), nullable=True),
+        sa.Column('synced_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('project_name', 'repository_name', name='uq_harbor_repository_state')
+    )
+    op.create_index(op.f('ix_harbor_repository_states_id'), 'harbor_repository_states', ['id'], unique=False)
+
+    # Harbor artifact 清单
+    op.create_table(
+        'harbor_artifacts',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('project_name', sa.String(length=255), nullable=False),
+        sa.Column('repository_name', sa.String(length=255), nullable=False),
+        sa.Column('digest', sa.String(length=255), nullable=False),
+        sa.Column('size', sa.BigInteger(), nullable=True),
+        sa.Column('tags', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column('push_time', sa.String(length=64), nullable=True),
+        sa.Column('pull_time', sa.String(length=64), nullable=True),
+        sa.Column('artifact_info', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column('synced_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('project_name', 'repository_name', 'digest', name='uq_harbor_artifact')
+    )
+    op.create_index(op.f('ix_harbor_artifacts_id'), 'harbor_artifacts', ['id'], unique=False)
+    op.create_index('idx_harbor_artifacts_repository', 'harbor_artifacts', ['project_name', 'repository_name'])
+
+
+def downgrade() -> None:
+    op.drop_index('idx_harbor_artifacts_repository', table_name='harbor_artifacts')
+    op.drop_index(op.f('ix_harbor_artifacts_id'), table_name='harbor_artifacts')
+    op.drop_table('harbor_artifacts')
+    op.drop_index(op.f('ix_harbor_repository_states_id'), table_name='harbor_repository_states')
+    op.drop_table('harbor_repository_states')
@@ -0,0 +1,48 @@
+"""add file version delta storage
+
+Revision ID: d1f5a8c3e947
+Revises: c4e8b2f61d07
+Create Date: 2025-10-23 10:12:44.518302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd1f5a8c3e947'
+down_revision = 'c4e8b2f61d07'
+branch_labels = None
+depends_on = None
+
+
+def _has_file_versions() -> bool:
+    # file_versions 曾在 9802c7eae6a3 中被删除，表不存在的环境跳过
+    return sa.inspect(op.get_bind()).has_table('file_versions')
+
+
+def upgrade() -> None:
+    if not _has_file_versions():
+        return
+
+    # 已有版本都是完整内容
+    op.add_column('file_versions', sa.Column('storage_type', sa.String(length=20), server_default='full', nullable=True))
+    op.add_column('file_versions', sa.Column('base_version_id', sa.Integer(), nullable=True))
+    op.add_column('file_versions', sa.Column('delta_depth', sa.Integer(), server_default='0', nullable=True))
+    op.add_column('file_versions', sa.Column('stored_size', sa.BIGINT(), nullable=True))
+    op.create_foreign_key(
+        'fk_file_versions_base_version_id', 'file_versions', 'file_versions',
+        ['base_version_id'], ['id'], ondelete='CASCADE'
+    )
+    op.execute("UPDATE file_versions SET stored_size = file_size WHERE stored_size IS NULL")
+
+
+def downgrade() -> None:
+    if not _has_file_versions():
+        return
+
+    op.drop_constraint('fk_file_versions_base_version_id', 'file_versions', type_='foreignkey')
+    op.drop_column('file_versions', 'stored_size')
+    op.drop_column('file_versions', 'delta_depth')
+    op.drop_column('file_versions', 'base_version_id')
+    op.drop_column('file_versions', 'storage_type')
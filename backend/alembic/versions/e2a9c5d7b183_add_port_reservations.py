@@ -0,0 +1,34 @@
+"""add port reservations
+
+Revision ID: e2a9c5d7b183
+Revises: d1f5a8c3e947
+Create Date: 2025-10-27 09:31:05.227416
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a9c5d7b183'
+down_revision = 'd1f5a8c3e947'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # 服务端口预留，替代只在事务内有效的 advisory lock
+    op.create_table(
+        'port_reservations',
+        sa.Column('port', sa.Integer(), nullable=False, comment='预留的端口'),
+        sa.Column('reserved_by', sa.String(length=100), nullable=True, comment='预留端口的进程标识'),
+        sa.Column('reserved_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True, comment='预留时间'),
+        sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False, comment='过期时间，过期后可被重新预留'),
+        sa.PrimaryKeyConstraint('port')
+    )
+    op.create_index('idx_port_reservations_expires_at', 'port_reservations', ['expires_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('idx_port_reservations_expires_at', table_name='port_reservations')
+    op.drop_table('port_reservations')
@@ -53,6 +53,12 @@ class Settings(BaseSettings):
     # mManager Configuration
     mmanager_enabled: bool = True
     mmanager_api_key: str = "mmanager-secure-key-12345"
+    mmanager_upload_timeout: int = 600  # 流式上传归档到容器时的读超时(秒)
+    mmanager_batch_timeout: int = 600  # 批量容器操作的读超时(秒)
+    mmanager_log_stream_timeout: int = 60  # 跟随容器日志的读超时(秒)，需大于mManager的保活间隔
+    mmanager_batch_size: int = 200  # 单次批量请求的最大容器数，需与mManager一致
+    controller_telemetry_max_age: int = 15  # 控制器遥测有效期(秒)，过期后轮询或回退到数据库
+    controller_telemetry_poll_interval: int = 5  # 轮询遥测过期控制器的间隔(秒)
     mmanager_controllers: List[dict] = [
         {
             "id": "mmanager-local-01",
@@ -92,6 +98,26 @@ class Settings(BaseSettings):
     harbor_username: str = "admin"
     harbor_password: str = "Harbor12345"
     harbor_default_project: str = "geoml-hub"
+    image_upload_max_bytes: int = 5 * 1024 * 1024 * 1024  # 镜像tar包最大大小
+    harbor_layer_push_enabled: bool = True  # 未压缩的tar包按层推送，只上传Harbor中不存在的层；关闭时使用skopeo
+    harbor_layer_push_concurrency: int = 4  # 并行上传的层数
+    harbor_layer_push_timeout: int = 600  # 层上传的读超时(秒)
+    harbor_crawl_concurrency: int = 8  # 抓取镜像清单时并发的Harbor API请求数
+    harbor_page_size: int = 100  # Harbor列表接口的分页大小（Harbor最大100）
+
+    # Background Jobs
+    job_worker_enabled: bool = True  # API进程内运行任务工作协程；单独部署 python -m app.worker 时可关闭
+    job_worker_concurrency: int = 2  # 每个工作进程同时执行的任务数
+    job_poll_interval: float = 2.0  # 队列为空时的轮询间隔(秒)
+    job_max_attempts: int = 3  # 默认最大执行次数
+    job_retry_backoff: int = 30  # 重试基础间隔(秒)，按执行次数指数增长
+    job_heartbeat_interval: int = 10  # 运行中任务的心跳和取消检查间隔(秒)
+    job_lock_timeout: int = 120  # 超过该时间没有心跳的运行中任务视为工作进程已退出，重新入队
+    job_spool_dir: str = "/tmp/geoml-jobs"  # 任务附带文件的落盘目录，需对所有工作进程可见
+    job_progress_persist_interval: float = 5.0  # 任务进度写库的最小间隔(秒)，实时进度通过SSE推送
+    progress_notify_enabled: bool = True  # 通过PostgreSQL NOTIFY在进程间转发进度（独立部署工作进程时需要）
+    progress_notify_interval: float = 1.0  # 进程间转发进度的间隔(秒)，期间同一任务只转发最新进度
+    progress_stream_keepalive: int = 15  # SSE进度流的保活间隔(秒)
 
     # Logging
     log_level: str = "INFO"
@@ -109,16 +135,29 @@ class Settings(BaseSettings):
     max_total_size_gb: int = 5  # 5GB per user
     chunk_size_mb: int = 5  # 5MB per chunk
     upload_session_expires_hours: int = 24
+    image_upload_chunk_size_mb: int = 16  # 镜像tar包续传的建议分片大小
+    image_upload_chunk_max_mb: int = 64  # 镜像tar包续传的单个分片上限
+    file_version_keyframe_interval: int = 20  # 文件版本每隔多少个增量保存一次完整快照
+    file_version_delta_max_bytes: int = 2 * 1024 * 1024  # 超过该大小的文件版本直接保存完整内容
+    file_version_delta_max_ratio: float = 0.5  # 增量超过完整内容该比例时改为保存完整内容
+    file_version_cache_mb: int = 64  # 还原后的版本内容缓存大小
+    file_diff_max_bytes: int = 2 * 1024 * 1024  # 超过该大小的版本只计算近似的差异摘要
+    file_diff_max_edit_cost: int = 1000  # 单个片段的最大编辑距离，超过时整体视为替换
+    file_diff_cache_size: int = 256  # 缓存的版本差异数量
 
     # Model Service Management
     service_port_start: int = 7000  # 服务端口范围开始
     service_port_end: int = 8000  # 服务端口范围结束
+    port_reservation_ttl: int = 3600  # 端口预留有效期(秒)，需覆盖镜像拉取和容器创建的耗时
     max_services_per_user: int = 20  # 每用户最大同时运行服务数
     max_services_per_repository: int = 3  # 每仓库最大服务数
     service_idle_timeout: int = 30  # 空闲超时时间(分钟)
+    service_scale_to_zero_enabled: bool = True  # 空闲服务停止但保留容器，访问时快速恢复
+    service_resume_timeout: int = 120  # 空闲服务恢复等待健康检查的超时(秒)
     health_check_interval: int = 60  # 健康检查间隔(秒)
     service_startup_timeout: int = 300  # 服务启动超时(秒)
     service_shutdown_timeout: int = 30  # 服务关闭超时(秒)
+    health_summary_cache_ttl: int = 5  # 健康摘要缓存时间(秒)，0表示不缓存
     docker_image_name: str = "geoml-service:latest"  # 默认Docker镜像
 
     # Auto-start Configuration
@@ -135,6 +174,19 @@ class Settings(BaseSettings):
     max_cpu_limit: str = "8"  # 最大CPU限制
     max_memory_limit: str = "8Gi"  # 最大内存限制
 
+    # Image Distribution
+    image_pull_verify_timeout: int = 30  # 拉取后确认镜像可用的最长等待(秒)
+    image_prewarm_enabled: bool = True  # 是否在空闲控制器上预拉取热门镜像
+    image_prewarm_interval: int = 600  # 镜像预热间隔(秒)
+    image_prewarm_top_n: int = 5  # 预热的热门镜像数量
+    image_prewarm_max_load: float = 30.0  # 控制器负载不高于该百分比时才预热
+    image_prewarm_max_pulls: int = 2  # 每个控制器每轮最多预拉取的镜像数
+    image_gc_enabled: bool = True  # 是否定期回收控制器上无服务引用的镜像
+    image_gc_interval: int = 1800  # 镜像回收间隔(秒)
+    image_gc_disk_high_percent: float = 80.0  # 磁盘使用率达到该值时按LRU回收无引用的镜像
+    image_gc_disk_target_percent: float = 70.0  # LRU回收直到预计使用率降到该值
+    image_gc_min_idle_hours: int = 24  # 最近该时间内使用过的镜像不回收
+
     # Skopeo Push Configuration
     enable_skopeo_push: bool = True  # 是否启用Skopeo推送
 
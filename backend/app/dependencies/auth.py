@@ -8,7 +8,7 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_async_db
+from app.database import get_async_db, AsyncSessionLocal
 from app.config import settings
 from app.services.user_service import UserService
 from app.models.user import User
@@ -24,6 +24,19 @@ async def get_current_user(
     Get current authenticated user from JWT token
     Returns None if no token provided or invalid token
     """
+    external_user_id = _external_user_id(credentials)
+    if external_user_id is None:
+        return None
+
+    user_service = UserService(db)
+    user = await user_service.get_user_by_external_id(external_user_id)
+    return user
+
+
+def _external_user_id(
+    credentials: Optional[HTTPAuthorizationCredentials],
+) -> Optional[str]:
+    """从JWT中解析外部用户ID，无效时返回None"""
     if not credentials:
         return None
 
@@ -33,16 +46,41 @@ async def get_current_user(
             settings.jwt_secret_key,
             algorithms=[settings.algorithm],
         )
-        external_user_id = payload.get("sub")
-        if external_user_id is None:
-            return None
-
     except JWTError:
         return None
+    return payload.get("sub")
 
-    user_service = UserService(db)
-    user = await user_service.get_user_by_external_id(external_user_id)
-    return user
+
+async def get_streaming_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+) -> Optional[User]:
+    """
+    Current user for streaming (SSE) endpoints, None if not authenticated.
+    The user is loaded in a short-lived session that is closed before the
+    response starts, so long streams do not pin a pooled connection
+    (yield dependencies are only torn down after the stream finishes).
+    """
+    external_user_id = _external_user_id(credentials)
+    if external_user_id is None:
+        return None
+
+    async with AsyncSessionLocal() as db:
+        return await UserService(db).get_user_by_external_id(external_user_id)
+
+
+async def get_streaming_user_required(
+    current_user: Optional[User] = Depends(get_streaming_user),
+) -> User:
+    """
+    Authenticated user for streaming (SSE) endpoints, raise 401 if not authenticated
+    """
+    if current_user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Authentication required",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return current_user
 
 
 async def get_current_user_required(
@@ -18,10 +18,14 @@ from app.routers import (
     personal_files,
     services,
     images,
+    jobs,
 )
 from app.middleware.error_response import global_exception_handler
 from app.services.model_service import service_manager
+from app.services.job_queue import job_queue
+from app.services.progress_broker import progress_broker
 from app.database import get_async_db
+from app.worker import load_job_handlers
 
 # Configure logging
 from app.utils.logger import setup_logging, get_logger
@@ -46,6 +50,18 @@ async def startup_event():
         finally:
             await db.close()
 
+    # 启动进程内的后台任务工作协程（也可单独运行 python -m app.worker）
+    load_job_handlers()
+    if settings.job_worker_enabled:
+        job_queue.start()
+        logger.info("后台任务工作协程已启动")
+
+
+async def shutdown_event():
+    """应用关闭时停止后台任务，运行中的任务重新排队"""
+    await job_queue.stop()
+    await progress_broker.close()
+
 
 # Create FastAPI app
 app = FastAPI(
@@ -55,6 +71,7 @@ app = FastAPI(
     docs_url="/docs",
     redoc_url="/redoc",
     on_startup=[startup_event],
+    on_shutdown=[shutdown_event],
 )
 
 # Add CORS middleware
@@ -112,6 +129,8 @@ app.include_router(system.router, prefix="/api/system", tags=["system"])
 app.include_router(services.router, prefix="/api/services", tags=["services"])
 # 镜像管理
 app.include_router(images.router, prefix="/api/images", tags=["images"])
+# 后台任务
+app.include_router(jobs.router, prefix="/api/jobs", tags=["jobs"])
 
 
 @app.get("/")
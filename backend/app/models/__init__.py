@@ -5,8 +5,10 @@ from .repository import Repository, RepositoryFile, RepositoryStar, RepositoryCl
 from .file_storage import FileUploadSession, SystemStorage, MinIOServiceHealth, UploadStatus
 from .personal_files import PersonalFile, PersonalFileDownload, PersonalFolder
 from .image import Image, ImageBuildLog
-from .service import ModelService, ServiceLog, ServiceHealthCheck
+from .service import ModelService, ServiceLog, ServiceHealthCheck, PortReservation
 from .container_registry import MManagerController
+from .job import BackgroundJob
+from .harbor_inventory import HarborRepositoryState, HarborArtifact
 __all__ = [
     "Classification",
     "TaskClassification",
@@ -15,6 +17,8 @@ __all__ = [
     "FileUploadSession", "SystemStorage", "MinIOServiceHealth", "UploadStatus",
     "PersonalFile", "PersonalFileDownload", "PersonalFolder",
     "Image", "ImageBuildLog",
-    "ModelService", "ServiceLog", "ServiceHealthCheck",
-    "MManagerController"
+    "ModelService", "ServiceLog", "ServiceHealthCheck", "PortReservation",
+    "MManagerController",
+    "BackgroundJob",
+    "HarborRepositoryState", "HarborArtifact"
 ]
\ No newline at end of file
@@ -38,6 +38,10 @@ class FileVersion(Base):
     # MinIO存储信息
     minio_bucket = Column(String(255), nullable=False)
     minio_object_key = Column(String(1000), nullable=False)
+    storage_type = Column(String(20), default="full")  # 存储方式：full 完整内容 / delta 相对基准版本的增量
+    base_version_id = Column(Integer, ForeignKey("file_versions.id", ondelete="CASCADE"), nullable=True)  # 增量的基准版本
+    delta_depth = Column(Integer, default=0)  # 距最近完整快照的增量层数
+    stored_size = Column(BIGINT)  # 实际存储的字节数
     
     # 差异信息
     parent_version_id = Column(Integer, ForeignKey("file_versions.id", ondelete="SET NULL"), nullable=True)
@@ -53,8 +57,8 @@ class FileVersion(Base):
     # 关系
     file = relationship("RepositoryFile")
     author = relationship("User")
-    parent_version = relationship("FileVersion", remote_side=[id])
-    child_versions = relationship("FileVersion", back_populates="parent_version")
+    parent_version = relationship("FileVersion", remote_side=[id], foreign_keys=[parent_version_id])
+    child_versions = relationship("FileVersion", back_populates="parent_version", foreign_keys=[parent_version_id])
 
 
 class FileEditSession(Base):
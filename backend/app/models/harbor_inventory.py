@@ -0,0 +1,63 @@
+"""
+Harbor镜像清单模型
+
+本地缓存Harbor中的仓库和artifact，增量同步后供一致性检查、孤立镜像清理和存储统计使用
+"""
+
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, UniqueConstraint, Index
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class HarborRepositoryState(Base):
+    """Harbor仓库同步状态 - 仓库的更新时间/artifact数量未变化时跳过artifact抓取"""
+    __tablename__ = "harbor_repository_states"
+
+    id = Column(Integer, primary_key=True, index=True)
+    project_name = Column(String(255), nullable=False, comment="Harbor项目名")
+    repository_name = Column(String(255), nullable=False, comment="仓库名（不含项目前缀）")
+    update_time = Column(String(64), comment="Harbor返回的仓库更新时间")
+    artifact_count = Column(Integer, default=0, comment="Harbor返回的artifact数量")
+    artifacts_etag = Column(String(255), comment="artifact列表首页的ETag")
+    synced_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("project_name", "repository_name", name="uq_harbor_repository_state"),
+    )
+
+
+class HarborArtifact(Base):
+    """Harbor artifact 清单"""
+    __tablename__ = "harbor_artifacts"
+
+    id = Column(Integer, primary_key=True, index=True)
+    project_name = Column(String(255), nullable=False, comment="Harbor项目名")
+    repository_name = Column(String(255), nullable=False, comment="仓库名（不含项目前缀）")
+    digest = Column(String(255), nullable=False, comment="artifact摘要")
+    size = Column(BigInteger, default=0, comment="大小(字节)")
+    tags = Column(JSONB, default=list, comment="标签列表")
+    push_time = Column(String(64), comment="推送时间")
+    pull_time = Column(String(64), comment="最后拉取时间")
+    artifact_info = Column(JSONB, comment="Harbor返回的artifact信息")
+    synced_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("project_name", "repository_name", "digest", name="uq_harbor_artifact"),
+        Index("idx_harbor_artifacts_repository", "project_name", "repository_name"),
+    )
+
+    def to_image_info(self) -> dict:
+        """转换为与 HarborClient.get_all_harbor_images 相同的结构"""
+        return {
+            "project_name": self.project_name,
+            "repository_name": self.repository_name,
+            "digest": self.digest,
+            "size": self.size or 0,
+            "push_time": self.push_time,
+            "pull_time": self.pull_time,
+            "tags": self.tags or [],
+            "full_repository_name": f"{self.project_name}/{self.repository_name}",
+            "harbor_storage_path": self.repository_name,
+            "artifact_info": self.artifact_info,
+        }
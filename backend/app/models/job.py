@@ -0,0 +1,95 @@
+"""
+后台任务队列模型
+
+长时间运行的任务（镜像推送、基于tar包创建服务、容器文件更新、统计任务）写入该表，
+由任务工作进程认领执行，支持重试、进度上报和取消
+"""
+
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class BackgroundJob(Base):
+    """后台任务表"""
+    __tablename__ = "background_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_type = Column(String(100), nullable=False, comment="任务类型，对应已注册的处理函数")
+    payload = Column(JSONB, nullable=False, default=dict, comment="任务参数")
+
+    # 执行状态
+    status = Column(String(20), nullable=False, default="queued",
+                    comment="任务状态: queued, running, succeeded, failed, cancelled")
+    progress = Column(Integer, nullable=False, default=0, comment="进度(0-100)")
+    message = Column(Text, comment="当前阶段说明")
+    result = Column(JSONB, comment="执行结果")
+    error = Column(Text, comment="最后一次错误信息")
+
+    # 重试
+    attempts = Column(Integer, nullable=False, default=0, comment="已执行次数")
+    max_attempts = Column(Integer, nullable=False, default=3, comment="最大执行次数")
+    run_after = Column(DateTime(timezone=True), server_default=func.now(), comment="最早执行时间")
+
+    # 认领与取消
+    locked_by = Column(String(255), comment="执行中的工作进程标识")
+    locked_at = Column(DateTime(timezone=True), comment="认领/心跳时间")
+    cancel_requested = Column(Boolean, nullable=False, default=False, comment="是否已请求取消")
+
+    # 关联信息
+    created_by = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), comment="提交用户ID")
+    resource_type = Column(String(50), comment="关联资源类型: image, service 等")
+    resource_id = Column(Integer, comment="关联资源ID")
+
+    # 时间戳
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        # 工作进程按状态和执行时间认领
+        Index("idx_background_jobs_status_run_after", "status", "run_after"),
+        Index("idx_background_jobs_resource", "resource_type", "resource_id"),
+    )
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ("succeeded", "failed", "cancelled")
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "job_type": self.job_type,
+            "status": self.status,
+            "progress": self.progress,
+            "message": self.message,
+            "result": self.result,
+            "error": self.error,
+            "attempts": self.attempts,
+            "max_attempts": self.max_attempts,
+            "cancel_requested": self.cancel_requested,
+            "resource_type": self.resource_type,
+            "resource_id": self.resource_id,
+            "created_by": self.created_by,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+    def to_progress_event(self) -> dict:
+        """推送给进度订阅者的精简状态"""
+        return {
+            "job_id": self.id,
+            "job_type": self.job_type,
+            "status": self.status,
+            "progress": self.progress,
+            "message": self.message,
+            "error": self.error,
+            "resource_type": self.resource_type,
+            "resource_id": self.resource_id,
+        }
+
+    def __repr__(self):
+        return f"<BackgroundJob(id={self.id}, type='{self.job_type}', status='{self.status}')>"
@@ -6,6 +6,7 @@
 - ServiceInstance: 服务实例表  
 - ServiceLog: 服务日志表
 - ServiceHealthCheck: 服务健康检查表
+- PortReservation: 服务端口预留表
 """
 
 from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, DECIMAL, BIGINT, ForeignKey, UniqueConstraint, Index
@@ -170,4 +171,17 @@ class ServiceHealthCheck(Base):
     )
     
     # 关系
-    service = relationship("ModelService", back_populates="health_checks")
\ No newline at end of file
+    service = relationship("ModelService", back_populates="health_checks")
+
+class PortReservation(Base):
+    """服务端口预留表 - 服务记录提交前防止多个worker分配同一端口"""
+    __tablename__ = "port_reservations"
+
+    port = Column(Integer, primary_key=True, comment="预留的端口")
+    reserved_by = Column(String(100), comment="预留端口的进程标识")
+    reserved_at = Column(DateTime(timezone=True), server_default=func.now(), comment="预留时间")
+    expires_at = Column(DateTime(timezone=True), nullable=False, comment="过期时间，过期后可被重新预留")
+
+    __table_args__ = (
+        Index('idx_port_reservations_expires_at', 'expires_at'),
+    )
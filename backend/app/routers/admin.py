@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Path
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query, Path
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, and_, or_, desc, text
 from sqlalchemy.orm import selectinload
@@ -7,6 +7,7 @@ from app.database import get_async_db
 from app.services.repository_service import RepositoryService
 from app.services.model_service import service_manager
 from app.services.harbor_client import HarborClient
+from app.services.harbor_inventory import harbor_inventory
 from app.services.mmanager_client import mmanager_client
 from app.models.image import Image
 from app.models import (
@@ -22,10 +23,12 @@ from app.schemas.user import UserProfile
 from app.schemas.repository import RepositoryListItem
 from app.services.minio_service import minio_service
 from app.services.file_upload_service import FileUploadService
+from app.services.job_queue import job_queue
 from app.services.mmanager_client import mmanager_client
 from app.services.harbor_client import HarborClient
 from app.config import settings
 from datetime import datetime, timedelta, timezone
+import hmac
 import logging
 
 logger = logging.getLogger(__name__)
@@ -406,6 +409,9 @@ async def cleanup_storage(
         upload_service = FileUploadService(db)
         session_cleanup = await upload_service.cleanup_expired_sessions()
         cleanup_results["expired_sessions"] = session_cleanup
+        cleanup_results["expired_image_tar_sessions"] = (
+            await upload_service.cleanup_expired_image_tar_sessions()
+        )
 
     # 清理孤儿文件
     if cleanup_orphaned:
@@ -975,6 +981,20 @@ async def get_repositories_stats(
     }
 
 
+@router.post("/repositories/stats/refresh")
+async def refresh_repositories_trending_stats(
+    admin_user: User = Depends(require_admin),
+    db: AsyncSession = Depends(get_async_db),
+) -> Dict[str, Any]:
+    """提交后台任务，重新计算仓库时间窗口统计"""
+    from app.services.stats_scheduler import TRENDING_STATS_JOB
+
+    job = await job_queue.enqueue(
+        db, TRENDING_STATS_JOB, {}, created_by=admin_user.id
+    )
+    return {"message": "统计更新任务已提交", "job_id": job.id, "status": job.status}
+
+
 # mManager控制器管理相关API
 
 
@@ -1006,6 +1026,52 @@ async def sync_mmanager_controllers(
         raise HTTPException(status_code=500, detail=f"控制器同步失败: {str(e)}")
 
 
+@router.get("/mmanager/images/gc")
+async def plan_mmanager_image_gc(
+    admin_user: User = Depends(require_admin),
+    db: AsyncSession = Depends(get_async_db),
+) -> Dict[str, Any]:
+    """查看各控制器的镜像回收计划"""
+    try:
+        plans = await mmanager_client.plan_image_gc(db)
+        return {"status": "success", "data": plans}
+    except Exception as e:
+        logger.error(f"生成镜像回收计划失败: {e}")
+        raise HTTPException(status_code=500, detail=f"生成镜像回收计划失败: {str(e)}")
+
+
+@router.post("/mmanager/images/gc")
+async def run_mmanager_image_gc(
+    dry_run: bool = Query(False, description="只生成计划，不删除"),
+    admin_user: User = Depends(require_admin),
+    db: AsyncSession = Depends(get_async_db),
+) -> Dict[str, Any]:
+    """立即回收各控制器上无服务引用的镜像"""
+    try:
+        plans = await mmanager_client.collect_unused_images(db, dry_run=dry_run)
+        return {"status": "success", "dry_run": dry_run, "data": plans}
+    except Exception as e:
+        logger.error(f"镜像回收失败: {e}")
+        raise HTTPException(status_code=500, detail=f"镜像回收失败: {str(e)}")
+
+
+@router.post("/mmanager/telemetry", include_in_schema=False)
+async def receive_mmanager_telemetry(
+    report: Dict[str, Any] = Body(...),
+    authorization: Optional[str] = Header(None),
+) -> Dict[str, Any]:
+    """接收mManager推送的负载遥测（使用mManager API密钥认证）"""
+    token = (authorization or "").removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(token.encode(), settings.mmanager_api_key.encode()):
+        raise HTTPException(status_code=401, detail="无效的API密钥")
+
+    if not mmanager_client.record_telemetry(report):
+        raise HTTPException(
+            status_code=404, detail=f"控制器 {report.get('server_id')} 未注册"
+        )
+    return {"status": "success"}
+
+
 @router.post("/mmanager/controllers/{controller_id}/health-check")
 async def trigger_controller_health_check(
     controller_id: str = Path(..., description="控制器ID"),
@@ -1290,17 +1356,20 @@ async def check_harbor_image_consistency(
             for img in db_images
         ]
 
-        # 使用Harbor客户端检查一致性
+        # 增量同步Harbor镜像清单后基于清单检查一致性
         async with HarborClient() as harbor_client:
+            sync_summary = await harbor_inventory.sync(db, harbor_client)
+            harbor_images = await harbor_inventory.get_images(db)
             consistency_check = await harbor_client.compare_with_database_images(
-                db_images_data
+                db_images_data, harbor_images
             )
-            storage_usage = await harbor_client.get_harbor_storage_usage()
+            storage_usage = await harbor_client.get_harbor_storage_usage(harbor_images)
 
         return {
             "status": "success",
             "consistency_check": consistency_check,
             "storage_usage": storage_usage,
+            "inventory_sync": sync_summary,
             "timestamp": datetime.now(timezone.utc).isoformat(),
         }
 
@@ -1340,9 +1409,11 @@ async def cleanup_harbor_orphan_images(
 
         # 获取孤立镜像并清理
         async with HarborClient() as harbor_client:
-            # 检查一致性获取孤立镜像
+            # 增量同步清单后检查一致性获取孤立镜像
+            await harbor_inventory.sync(db, harbor_client)
+            harbor_images = await harbor_inventory.get_images(db)
             consistency_check = await harbor_client.compare_with_database_images(
-                db_images_data
+                db_images_data, harbor_images
             )
             orphan_images = consistency_check.get("orphan_images", [])
 
@@ -1360,6 +1431,13 @@ async def cleanup_harbor_orphan_images(
                 orphan_images, dry_run=dry_run
             )
 
+        # 已删除的镜像同步移出清单
+        deleted_images = [
+            img for img in cleanup_results["cleaned_images"] if img["action"] == "deleted"
+        ]
+        if deleted_images:
+            await harbor_inventory.remove_images(db, deleted_images)
+
         return {
             "status": "success",
             "message": f"{'模拟' if dry_run else '实际'}清理完成",
@@ -1377,6 +1455,7 @@ async def cleanup_harbor_orphan_images(
 async def list_harbor_images(
     project_name: Optional[str] = Query(None, description="项目名称"),
     admin_user: User = Depends(require_admin),
+    db: AsyncSession = Depends(get_async_db),
 ) -> Dict[str, Any]:
     """列出Harbor中的所有镜像"""
     try:
@@ -1389,9 +1468,10 @@ async def list_harbor_images(
                     detail=f"Harbor连接失败: {connectivity.get('message')}",
                 )
 
-            # 获取所有镜像
-            harbor_images = await harbor_client.get_all_harbor_images(project_name)
-            storage_usage = await harbor_client.get_harbor_storage_usage()
+            # 增量同步后从清单获取所有镜像
+            await harbor_inventory.sync(db, harbor_client, project_name)
+            harbor_images = await harbor_inventory.get_images(db, project_name)
+            storage_usage = await harbor_client.get_harbor_storage_usage(harbor_images)
 
         return {
             "status": "success",
@@ -1484,17 +1564,44 @@ async def delete_harbor_artifact(
         raise HTTPException(status_code=500, detail=f"删除失败: {str(e)}")
 
 
+@router.post("/harbor/inventory/sync")
+async def sync_harbor_inventory(
+    project_name: Optional[str] = Query(None, description="项目名称"),
+    force: bool = Query(False, description="是否重新抓取所有仓库"),
+    admin_user: User = Depends(require_admin),
+    db: AsyncSession = Depends(get_async_db),
+) -> Dict[str, Any]:
+    """同步Harbor镜像清单（默认增量同步）"""
+    try:
+        async with HarborClient() as harbor_client:
+            sync_summary = await harbor_inventory.sync(
+                db, harbor_client, project_name, force=force
+            )
+
+        return {
+            "status": "success",
+            "inventory_sync": sync_summary,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+        }
+
+    except Exception as e:
+        logger.error(f"同步Harbor镜像清单失败: {e}")
+        raise HTTPException(status_code=500, detail=f"同步失败: {str(e)}")
+
+
 @router.get("/harbor/status")
 async def get_harbor_status(
     admin_user: User = Depends(require_admin),
+    db: AsyncSession = Depends(get_async_db),
 ) -> Dict[str, Any]:
-    """获取Harbor服务状态"""
+    """获取Harbor服务状态（存储统计基于本地镜像清单）"""
     try:
         async with HarborClient() as harbor_client:
             connectivity = await harbor_client.check_harbor_connectivity()
 
             if connectivity.get("status") == "connected":
-                storage_usage = await harbor_client.get_harbor_storage_usage()
+                harbor_images = await harbor_inventory.get_images(db)
+                storage_usage = await harbor_client.get_harbor_storage_usage(harbor_images)
                 return {
                     "status": "connected",
                     "harbor_info": connectivity,
@@ -140,6 +140,7 @@ async def get_version_diff(
     old_version_id: int,
     new_version_id: int,
     include_content: bool = Query(False),
+    context_lines: int = Query(3, ge=0, le=50, description="差异块的上下文行数"),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
     minio_service: MinIOService = Depends(get_minio_service)
@@ -160,7 +161,7 @@ async def get_version_diff(
     
     try:
         diff_info = await version_service.get_version_diff(
-            old_version_id, new_version_id, include_content
+            old_version_id, new_version_id, include_content, context_lines
         )
         
         return FileDiffResponse(**diff_info)
@@ -3,13 +3,28 @@
 """
 
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, status
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    UploadFile,
+    File,
+    Form,
+    Header,
+    Query,
+    Request,
+    status,
+)
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_async_db
+from app.database import get_async_db, AsyncSessionLocal
 from app.dependencies import get_current_user
+from app.dependencies.auth import get_current_user_required, get_streaming_user_required
 from app.models.user import User
+from app.services.file_upload_service import FileUploadService
 from app.services.image_service import image_management_service
+from app.services.job_queue import job_queue
 from app.schemas.image import (
     ImageListResponse,
     ImageUploadResponse,
@@ -21,6 +36,7 @@ from app.schemas.image import (
 )
 from app.config import settings
 from app.utils.logger import logger
+from app.utils.tar_ingest import TarFormatError, TarTooLargeError
 
 router = APIRouter()
 
@@ -48,11 +64,11 @@ async def upload_image(
                 detail="只支持tar格式的镜像文件(.tar, .tar.gz, .tgz)",
             )
 
-        # 验证文件大小 (5GB限制)
-        if image_file.size and image_file.size > 5 * 1024 * 1024 * 1024:
+        # 验证文件大小
+        if image_file.size and image_file.size > settings.image_upload_max_bytes:
             raise HTTPException(
                 status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-                detail="镜像文件过大，最大支持5GB",
+                detail=f"镜像文件过大，最大支持{settings.image_upload_max_bytes // 1024 ** 3}GB",
             )
 
         # 验证镜像名称格式
@@ -86,6 +102,213 @@ async def upload_image(
         )
 
 
+@router.put(
+    "/repositories/{repository_id}/upload-stream", response_model=ImageUploadResponse
+)
+async def upload_image_stream(
+    repository_id: int,
+    request: Request,
+    name: str = Query(..., min_length=1, max_length=255, description="镜像名称"),
+    tag: str = Query("latest", min_length=1, max_length=100, description="镜像标签"),
+    description: str = Query("", max_length=1000, description="镜像描述"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    以原始请求体上传Docker镜像tar包（Content-Type: application/x-tar）
+
+    请求体直接写入推送目录，不经过multipart临时文件，适合大镜像
+    """
+    try:
+        content_length = request.headers.get("content-length")
+        if content_length and int(content_length) > settings.image_upload_max_bytes:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"镜像文件过大，最大支持{settings.image_upload_max_bytes // 1024 ** 3}GB",
+            )
+
+        # 验证镜像名称格式
+        if not name.replace("-", "").replace("_", "").replace(".", "").isalnum():
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="镜像名称只能包含字母、数字、连字符、下划线和点",
+            )
+
+        result = await image_management_service.upload_image_from_tar(
+            db=db,
+            repository_id=repository_id,
+            tar_file=request.stream(),
+            image_name=name,
+            tag=tag,
+            description=description,
+            user_id=current_user.id,
+        )
+
+        return ImageUploadResponse(
+            success=True, data=result, message="镜像上传已开始，请稍后查看状态"
+        )
+
+    except HTTPException:
+        raise
+    except TarTooLargeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e)
+        )
+    except TarFormatError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        logger.error(f"镜像流式上传API失败: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"内部错误: {str(e)}",
+        )
+
+
+@router.post("/repositories/{repository_id}/upload-sessions")
+async def create_image_upload_session(
+    repository_id: int,
+    file_name: str = Form(..., description="镜像tar包文件名"),
+    file_size: int = Form(..., gt=0, description="文件总大小(字节)"),
+    file_hash: Optional[str] = Form(None, description="可选的整个文件的sha256，完成时校验"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_required),
+):
+    """
+    创建镜像tar包续传会话
+
+    之后按 offset 顺序 PUT 分片到 /upload-sessions/{session_id}，网络中断后
+    GET 会话获取 offset 继续上传；全部上传后调用 complete 开始推送
+    """
+    if not file_name.endswith((".tar", ".tar.gz", ".tgz")):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="只支持tar格式的镜像文件(.tar, .tar.gz, .tgz)",
+        )
+
+    upload_service = FileUploadService(db)
+    session = await upload_service.initiate_image_tar_session(
+        repository_id=repository_id,
+        user_id=current_user.id,
+        file_name=file_name,
+        file_size=file_size,
+        file_hash=file_hash,
+    )
+    session["max_chunk_size"] = settings.image_upload_chunk_max_mb * 1024 * 1024
+    return {"success": True, "data": session}
+
+
+@router.get("/upload-sessions/{session_id}")
+async def get_image_upload_session(
+    session_id: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_required),
+):
+    """
+    获取续传会话状态，offset 为下一个分片的起始位置
+    """
+    upload_service = FileUploadService(db)
+    return {
+        "success": True,
+        "data": await upload_service.get_image_tar_session(session_id, current_user.id),
+    }
+
+
+@router.put("/upload-sessions/{session_id}")
+async def upload_image_chunk(
+    session_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0, description="分片在文件中的起始位置"),
+    chunk_sha256: str = Header(..., alias="X-Chunk-SHA256", description="分片的sha256"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_required),
+):
+    """
+    上传一个分片（请求体为原始分片数据）
+
+    偏移与会话已确认的 offset 不一致时返回409，按会话的 offset 继续即可
+    """
+    max_chunk = settings.image_upload_chunk_max_mb * 1024 * 1024
+    content_length = request.headers.get("content-length")
+    if content_length and int(content_length) > max_chunk:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"分片过大，最大 {settings.image_upload_chunk_max_mb}MB",
+        )
+
+    data = bytearray()
+    async for chunk in request.stream():
+        data += chunk
+        if len(data) > max_chunk:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"分片过大，最大 {settings.image_upload_chunk_max_mb}MB",
+            )
+
+    upload_service = FileUploadService(db)
+    session = await upload_service.append_image_tar_chunk(
+        session_id, current_user.id, offset, bytes(data), chunk_sha256
+    )
+    return {"success": True, "data": session}
+
+
+@router.delete("/upload-sessions/{session_id}")
+async def abort_image_upload_session(
+    session_id: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_required),
+):
+    """
+    取消续传会话并删除已上传的数据
+    """
+    upload_service = FileUploadService(db)
+    await upload_service.abort_image_tar_session(session_id, current_user.id)
+    return {"success": True, "message": "上传已取消"}
+
+
+@router.post(
+    "/repositories/{repository_id}/upload-sessions/{session_id}/complete",
+    response_model=ImageUploadResponse,
+)
+async def complete_image_upload_session(
+    repository_id: int,
+    session_id: str,
+    name: str = Form(..., min_length=1, max_length=255, description="镜像名称"),
+    tag: str = Form("latest", min_length=1, max_length=100, description="镜像标签"),
+    description: str = Form("", max_length=1000, description="镜像描述"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_required),
+):
+    """
+    续传完成后创建镜像记录并开始推送到Harbor
+    """
+    if not name.replace("-", "").replace("_", "").replace(".", "").isalnum():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="镜像名称只能包含字母、数字、连字符、下划线和点",
+        )
+
+    upload_service = FileUploadService(db)
+    tar = await upload_service.take_image_tar_upload(session_id, current_user.id)
+
+    try:
+        result = await image_management_service.upload_image_from_tar(
+            db=db,
+            repository_id=repository_id,
+            tar_file=tar,
+            image_name=name,
+            tag=tag,
+            description=description,
+            user_id=current_user.id,
+        )
+    except Exception as e:
+        logger.error(f"续传镜像创建失败: {e}")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    return ImageUploadResponse(
+        success=True, data=result, message="镜像上传已开始，请稍后查看状态"
+    )
+
+
 @router.get("/repositories/{repository_id}")
 async def list_images(
     repository_id: int,
@@ -113,6 +336,33 @@ async def list_images(
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.get("/{image_id}/progress/stream")
+async def stream_image_progress(
+    image_id: int,
+    request: Request,
+    current_user: User = Depends(get_streaming_user_required),
+):
+    """
+    以SSE方式推送镜像最近一次上传/创建服务任务的进度，替代轮询镜像接口
+    """
+    # 查询使用短会话，返回流之前关闭，避免长连接占用数据库连接
+    async with AsyncSessionLocal() as db:
+        jobs = await job_queue.list_jobs(
+            db, resource_type="image", resource_id=image_id, limit=1
+        )
+    if not jobs:
+        raise HTTPException(status_code=404, detail="该镜像没有上传任务")
+    job = jobs[0]
+    if job.created_by != current_user.id and not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="无权限访问此镜像的上传进度")
+
+    return StreamingResponse(
+        job_queue.stream_events(job.id, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get("/{image_id}/services")
 async def list_image_services(
     image_id: int,
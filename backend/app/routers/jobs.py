@@ -0,0 +1,99 @@
+"""
+后台任务API路由
+查询任务状态/进度、订阅实时进度和取消任务
+"""
+
+from typing import Any, Dict, Optional
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import get_async_db, AsyncSessionLocal
+from app.dependencies.auth import get_current_user_required, get_streaming_user_required
+from app.models.job import BackgroundJob
+from app.models.user import User
+from app.services.job_queue import job_queue, JOB_STATUSES
+
+router = APIRouter()
+
+
+async def _get_job_with_permission(
+    db: AsyncSession, job_id: int, current_user: User
+) -> BackgroundJob:
+    """获取任务，只有提交者和管理员可以访问"""
+    job = await job_queue.get_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    if job.created_by != current_user.id and not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="无权限访问此任务")
+    return job
+
+
+@router.get("")
+async def list_jobs(
+    status: Optional[str] = Query(None, description="按状态过滤"),
+    resource_type: Optional[str] = Query(None, description="关联资源类型: image, service"),
+    resource_id: Optional[int] = Query(None, description="关联资源ID"),
+    limit: int = Query(50, ge=1, le=200, description="返回数量"),
+    current_user: User = Depends(get_current_user_required),
+    db: AsyncSession = Depends(get_async_db),
+) -> Dict[str, Any]:
+    """列出当前用户提交的任务（管理员可查看全部）"""
+    if status and status not in JOB_STATUSES:
+        raise HTTPException(status_code=400, detail=f"无效的任务状态: {status}")
+
+    jobs = await job_queue.list_jobs(
+        db,
+        created_by=None if current_user.is_admin else current_user.id,
+        status=status,
+        resource_type=resource_type,
+        resource_id=resource_id,
+        limit=limit,
+    )
+    return {"jobs": [job.to_dict() for job in jobs], "total": len(jobs)}
+
+
+@router.get("/{job_id}")
+async def get_job(
+    job_id: int = Path(..., description="任务ID"),
+    current_user: User = Depends(get_current_user_required),
+    db: AsyncSession = Depends(get_async_db),
+) -> Dict[str, Any]:
+    """获取任务状态和进度"""
+    job = await _get_job_with_permission(db, job_id, current_user)
+    return job.to_dict()
+
+
+@router.get("/{job_id}/events")
+async def stream_job_events(
+    request: Request,
+    job_id: int = Path(..., description="任务ID"),
+    current_user: User = Depends(get_streaming_user_required),
+):
+    """以SSE方式推送任务进度，任务结束后关闭连接"""
+    # 权限检查使用短会话，返回流之前关闭，避免长连接占用数据库连接
+    async with AsyncSessionLocal() as db:
+        await _get_job_with_permission(db, job_id, current_user)
+    return StreamingResponse(
+        job_queue.stream_events(job_id, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/{job_id}/cancel")
+async def cancel_job(
+    job_id: int = Path(..., description="任务ID"),
+    current_user: User = Depends(get_current_user_required),
+    db: AsyncSession = Depends(get_async_db),
+) -> Dict[str, Any]:
+    """取消任务：排队中的任务立即取消，运行中的任务在下一次心跳时中止"""
+    job = await _get_job_with_permission(db, job_id, current_user)
+    if job.is_finished:
+        raise HTTPException(status_code=400, detail=f"任务已结束（{job.status}），无法取消")
+
+    job = await job_queue.cancel(db, job_id)
+    return {
+        "message": "任务已取消" if job.status == "cancelled" else "已请求取消任务",
+        "job": job.to_dict(),
+    }
@@ -22,13 +22,19 @@ from fastapi import (
     File,
     Form,
     Path,
+    Request,
 )
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, or_, func
+from sqlalchemy import select, and_, or_, func, case, true
 from sqlalchemy.orm import selectinload
 
-from app.database import get_async_db
-from app.dependencies.auth import get_current_user, get_current_user_required
+from app.database import get_async_db, AsyncSessionLocal
+from app.dependencies.auth import (
+    get_current_user,
+    get_current_user_required,
+    get_streaming_user,
+)
 from app.models.user import User
 from app.models.repository import Repository
 from app.models.service import ModelService, ServiceLog, ServiceHealthCheck
@@ -40,6 +46,7 @@ from app.schemas.service import (
     ServiceListResponse,
     ServiceStartRequest,
     ServiceStopRequest,
+    ServiceStatus,
     ServiceStatusResponse,
     ServiceLogListResponse,
     ServiceHealthCheckListResponse,
@@ -48,8 +55,14 @@ from app.schemas.service import (
     ServiceAccessRequest,
     ServiceAccessResponse,
 )
-from app.services.container_service import container_file_service
+from app.services.container_service import container_file_service, UPDATE_FILES_JOB
 from app.services.model_service import service_manager
+from app.services.mmanager_client import MManagerAPIError
+from app.services.image_service import SERVICE_FROM_TAR_JOB
+from app.services.job_queue import job_queue
+from app.services.file_upload_service import FileUploadService
+from app.utils.skopeo_pusher import SkopeoPusher
+from app.utils.tar_ingest import TarFormatError, TarTooLargeError
 from app.config import settings
 from app.utils.service_helpers import (
     ServicePermissionManager,
@@ -586,6 +599,52 @@ async def get_service_logs(
     return ServiceLogListResponse(logs=logs, total=total, page=page, size=size)
 
 
+@router.get("/{service_id:int}/container-logs")
+async def get_service_container_logs(
+    service: ModelService = Depends(get_service_with_permission),
+    lines: int = Query(100, ge=1, le=10000, description="日志行数"),
+    since: Optional[str] = Query(None, description="上次响应中的 cursor，只返回新日志"),
+    timestamps: bool = Query(False, description="日志行是否保留时间戳"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """获取服务容器日志（轮询时传入上次的 cursor 只获取增量）"""
+
+    return await service_manager.get_service_logs(
+        db, service.id, lines=lines, since=since, timestamps=timestamps
+    )
+
+
+@router.get("/{service_id:int}/container-logs/stream")
+async def stream_service_container_logs(
+    request: Request,
+    service_id: int,
+    lines: int = Query(100, ge=1, le=10000, description="初始日志行数"),
+    since: Optional[str] = Query(None, description="游标，从游标之后开始跟随"),
+    current_user: Optional[User] = Depends(get_streaming_user),
+):
+    """以SSE方式跟随服务容器日志（事件 id 为游标，支持 Last-Event-ID 续传）"""
+
+    since = since or request.headers.get("last-event-id")
+    # 权限检查与容器定位在短会话中完成，避免整个跟随期间占用数据库连接
+    async with AsyncSessionLocal() as db:
+        service = await get_service_with_permission(service_id, current_user, db)
+        try:
+            chunks = await service_manager.stream_service_logs(
+                db, service.id, since=since, lines=lines
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except MManagerAPIError as e:
+            status_code = e.status if e.status < 500 else 502
+            raise HTTPException(status_code=status_code, detail=e.detail)
+
+    return StreamingResponse(
+        chunks,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # 服务访问管理API
 @router.get("/{service_id:int}/demo")
 async def access_service_demo(
@@ -593,11 +652,23 @@ async def access_service_demo(
     current_user: Optional[User] = Depends(get_current_user),
     db: AsyncSession = Depends(get_async_db),
 ):
-    """访问Gradio界面（重定向）"""
+    """访问Gradio界面（重定向）
+
+    空闲（已缩容至零）的服务会先在原控制器上恢复，健康检查通过后再重定向。
+    """
 
     if not service.service_url:
         raise HTTPException(status_code=400, detail="服务未运行")
 
+    if service.status == ServiceStatus.IDLE:
+        try:
+            resumed = await service_manager.resume_service(service.id)
+        except TimeoutError:
+            raise HTTPException(status_code=504, detail="服务正在启动，请稍后重试")
+        if not resumed:
+            raise HTTPException(status_code=503, detail="服务恢复失败，请稍后重试")
+        await db.refresh(service)
+
     # 更新访问统计和时间
     service.access_count += 1
     service.last_accessed_at = func.now()
@@ -795,7 +866,6 @@ async def batch_start_services(
     batch_request: BatchServiceRequest,
     repository: Repository = Depends(get_repository_with_permission),
     current_user: User = Depends(get_current_user),
-    background_tasks: BackgroundTasks = BackgroundTasks(),
     db: AsyncSession = Depends(get_async_db),
 ):
     """批量启动服务"""
@@ -805,8 +875,7 @@ async def batch_start_services(
         service_ids=batch_request.service_ids,
         repository=repository,
         current_user=current_user,
-        operation_func=service_manager.start_service,
-        background_tasks=background_tasks,
+        batch_func=service_manager.batch_start_services,
         operation_name="启动",
     )
 
@@ -818,7 +887,6 @@ async def batch_stop_services(
     batch_request: BatchServiceRequest,
     repository: Repository = Depends(get_repository_with_permission),
     current_user: User = Depends(get_current_user),
-    background_tasks: BackgroundTasks = BackgroundTasks(),
     db: AsyncSession = Depends(get_async_db),
 ):
     """批量停止服务"""
@@ -828,8 +896,7 @@ async def batch_stop_services(
         service_ids=batch_request.service_ids,
         repository=repository,
         current_user=current_user,
-        operation_func=service_manager.stop_service,
-        background_tasks=background_tasks,
+        batch_func=service_manager.batch_stop_services,
         operation_name="停止",
     )
 
@@ -841,7 +908,6 @@ async def batch_delete_services(
     batch_request: BatchServiceRequest,
     repository: Repository = Depends(get_repository_with_permission),
     current_user: User = Depends(get_current_user),
-    background_tasks: BackgroundTasks = BackgroundTasks(),
     db: AsyncSession = Depends(get_async_db),
 ):
     """批量删除服务"""
@@ -851,8 +917,7 @@ async def batch_delete_services(
         service_ids=batch_request.service_ids,
         repository=repository,
         current_user=current_user,
-        operation_func=service_manager.delete_service,
-        background_tasks=background_tasks,
+        batch_func=service_manager.batch_delete_services,
         operation_name="删除",
     )
 
@@ -1013,62 +1078,96 @@ async def perform_system_maintenance(
     return {"message": "系统维护任务已启动"}
 
 
+# 健康摘要短期缓存: {user_id: (过期时间, 摘要)}，按写入顺序排列
+_health_summary_cache: Dict[int, tuple] = {}
+_HEALTH_SUMMARY_CACHE_MAX_ENTRIES = 1024
+
+
+def _cache_health_summary(user_id: int, expires_at: float, summary: Dict[str, int]):
+    """写入健康摘要缓存，同时清理过期条目并限制条目数"""
+    now = time.monotonic()
+    for key in [k for k, (expiry, _) in _health_summary_cache.items() if expiry <= now]:
+        del _health_summary_cache[key]
+    _health_summary_cache.pop(user_id, None)
+    while len(_health_summary_cache) >= _HEALTH_SUMMARY_CACHE_MAX_ENTRIES:
+        del _health_summary_cache[next(iter(_health_summary_cache))]
+    _health_summary_cache[user_id] = (expires_at, summary)
+
+
 @router.get("/health-summary")
 async def get_services_health_summary(
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_async_db),
 ):
-    """获取服务健康状态摘要"""
+    """获取服务健康状态摘要
+
+    通过LATERAL连接取每个服务最近一次健康检查，并在同一条聚合查询中完成状态统计，
+    结果按用户缓存 settings.health_summary_cache_ttl 秒。
+    """
 
     try:
-        # 获取用户有权限查看的服务
-        user_services_query = select(ModelService).where(
-            or_(ModelService.user_id == current_user.id, ModelService.is_public == True)
+        now = time.monotonic()
+        cached = _health_summary_cache.get(current_user.id)
+        if cached and cached[0] > now:
+            return dict(cached[1])
+
+        # 每个服务最近一次健康检查（LATERAL子查询，按服务走索引取一行）
+        latest_check = (
+            select(ServiceHealthCheck.status.label("check_status"))
+            .where(
+                ServiceHealthCheck.service_id == ModelService.id,
+                ModelService.status == "running",
+            )
+            .order_by(ServiceHealthCheck.checked_at.desc())
+            .limit(1)
+            .lateral("latest_check")
+        )
+
+        is_running = ModelService.status == "running"
+        check_status = latest_check.c.check_status
+        summary_query = (
+            select(
+                func.count(ModelService.id).label("total"),
+                func.count(case((is_running, 1))).label("running"),
+                func.count(
+                    case((and_(is_running, check_status == "healthy"), 1))
+                ).label("healthy"),
+                func.count(
+                    case(
+                        (
+                            and_(
+                                is_running,
+                                check_status.in_(["unhealthy", "timeout"]),
+                            ),
+                            1,
+                        )
+                    )
+                ).label("unhealthy"),
+                func.count(case((ModelService.status == "error", 1))).label("error"),
+            )
+            .select_from(ModelService)
+            .outerjoin(latest_check, true())
+            .where(
+                or_(ModelService.user_id == current_user.id, ModelService.is_public == True)
+            )
         )
 
-        result = await db.execute(user_services_query)
-        services = result.scalars().all()
+        row = (await db.execute(summary_query)).one()
 
-        # 统计健康状态
+        # 运行中但没有健康/不健康结论的服务（含无检查记录）计为unknown
         health_summary = {
-            "total": len(services),
-            "running": 0,
-            "healthy": 0,
-            "unhealthy": 0,
-            "unknown": 0,
-            "stopped": 0,
-            "error": 0,
+            "total": row.total,
+            "running": row.running,
+            "healthy": row.healthy,
+            "unhealthy": row.unhealthy,
+            "unknown": row.running - row.healthy - row.unhealthy,
+            "stopped": row.total - row.running - row.error,
+            "error": row.error,
         }
 
-        for service in services:
-            if service.status == "running":
-                health_summary["running"] += 1
-
-                # 获取最近的健康检查结果
-                latest_check_query = (
-                    select(ServiceHealthCheck)
-                    .where(ServiceHealthCheck.service_id == service.id)
-                    .order_by(ServiceHealthCheck.checked_at.desc())
-                    .limit(1)
-                )
-
-                check_result = await db.execute(latest_check_query)
-                latest_check = check_result.scalar_one_or_none()
-
-                if latest_check:
-                    if latest_check.status == "healthy":
-                        health_summary["healthy"] += 1
-                    elif latest_check.status in ["unhealthy", "timeout"]:
-                        health_summary["unhealthy"] += 1
-                    else:
-                        health_summary["unknown"] += 1
-                else:
-                    health_summary["unknown"] += 1
-
-            elif service.status == "error":
-                health_summary["error"] += 1
-            else:
-                health_summary["stopped"] += 1
+        ttl = settings.health_summary_cache_ttl
+        if ttl > 0:
+            _cache_health_summary(current_user.id, now + ttl, health_summary)
 
         return health_summary
 
@@ -1088,6 +1187,7 @@ async def update_service_files(
     examples_archive: Optional[UploadFile] = File(
         None, description="examples目录压缩包"
     ),
+    background: bool = Form(False, description="是否作为后台任务执行（返回job_id）"),
 ):
     """
     更新服务文件
@@ -1097,6 +1197,8 @@ async def update_service_files(
     - mc_config_file: JSON配置文件 (.json)
     - model_archive: 模型文件压缩包 (.zip, .tar, .tar.gz)
     - examples_archive: 示例数据压缩包 (.zip, .tar, .tar.gz)
+
+    background=true 时文件落盘后提交后台任务，立即返回 job_id
     """
     try:
         # 检查是否至少上传了一个文件
@@ -1135,6 +1237,31 @@ async def update_service_files(
         if not file_updates:
             raise HTTPException(status_code=400, detail="请至少上传一个文件")
 
+        if background:
+            service = await service_manager._get_service_by_id(db, service_id)
+            if service.user_id != current_user.id:
+                raise PermissionError("无权限操作此服务")
+
+            files = {}
+            try:
+                for file_type, upload in file_updates.items():
+                    files[file_type] = await job_queue.spool_upload(
+                        upload, prefix=f"{file_type}_"
+                    )
+                job = await job_queue.enqueue(
+                    db,
+                    UPDATE_FILES_JOB,
+                    {"service_id": service_id, "user_id": current_user.id, "files": files},
+                    created_by=current_user.id,
+                    resource_type="service",
+                    resource_id=service_id,
+                )
+            except Exception:
+                for info in files.values():
+                    job_queue.remove_spooled_upload(info)
+                raise
+            return {"message": "文件更新任务已提交", "job_id": job.id, "status": job.status}
+
         # 调用容器文件更新服务 - 使用显式事务管理
         try:
             result = await container_file_service.update_service_files(
@@ -1164,7 +1291,10 @@ async def update_service_files(
 async def create_service_with_docker_tar(
     username: str = Path(..., description="仓库所有者用户名"),
     repo_name: str = Path(..., description="仓库名称"),
-    docker_tar: UploadFile = File(..., description="Docker镜像tar包"),
+    docker_tar: Optional[UploadFile] = File(None, description="Docker镜像tar包"),
+    upload_session_id: Optional[str] = Form(
+        None, description="已通过续传会话上传完成的镜像tar包，与docker_tar二选一"
+    ),
     description: Optional[str] = Form(None, description="服务描述"),
     cpu_limit: str = Form("2", description="CPU限制"),
     memory_limit: str = Form("2Gi", description="内存限制"),
@@ -1183,19 +1313,38 @@ async def create_service_with_docker_tar(
     - gogogo.py: 模型服务启动文件
     - mc.json: 配置文件
     - model/: 模型文件夹
+
+    镜像推送和服务创建在后台任务中执行，返回的 job_id 可用于查询进度或取消。
+    大文件可先通过 /api/images/repositories/{id}/upload-sessions 续传，再传入 upload_session_id
     """
+    spooled = None
+    examples = None
     try:
+        if (docker_tar is None) == (upload_session_id is None):
+            raise HTTPException(
+                status_code=400, detail="docker_tar 和 upload_session_id 必须且只能提供一个"
+            )
+
+        upload_service = FileUploadService(db)
+        if upload_session_id:
+            upload_session = await upload_service.get_image_tar_session(
+                upload_session_id, current_user.id
+            )
+            tar_filename = upload_session["file_name"]
+        else:
+            tar_filename = docker_tar.filename
+
         logger.info(
-            f"开始创建服务: username={username}, repo_name={repo_name}, file={docker_tar.filename}"
+            f"开始创建服务: username={username}, repo_name={repo_name}, file={tar_filename}"
         )
 
         # 验证tar包文件
-        if not docker_tar.filename.lower().endswith((".tar", ".tar.gz", ".tgz")):
+        if not tar_filename.lower().endswith((".tar", ".tar.gz", ".tgz")):
             raise HTTPException(status_code=400, detail="Docker镜像必须是tar包格式")
 
         # 验证文件大小 (最大20GB)
         max_size = 20 * 1024 * 1024 * 1024
-        if docker_tar.size and docker_tar.size > max_size:
+        if docker_tar is not None and docker_tar.size and docker_tar.size > max_size:
             raise HTTPException(
                 status_code=400, detail=f"Docker镜像tar包大小不能超过{max_size}GB"
             )
@@ -1219,15 +1368,9 @@ async def create_service_with_docker_tar(
             repository, current_user, "创建服务"
         )
 
-        # 1. 上传Docker tar包到Harbor镜像仓库
-        logger.info(f"开始上传Docker tar包到Harbor: {docker_tar.filename}")
-
-        from app.services.harbor_client import HarborClient
-        from app.models.image import Image
-        import time
-
+        # 1. 解析镜像名称
         # 从文件名提取镜像名称和tag：最后一个-后面的内容作为tag
-        filename_without_ext = docker_tar.filename
+        filename_without_ext = tar_filename
         if filename_without_ext.endswith(".tar"):
             filename_without_ext = filename_without_ext[:-4]
 
@@ -1262,6 +1405,17 @@ async def create_service_with_docker_tar(
 
         logger.info(f"准备创建镜像: {image_name}:{image_tag}")
 
+        # 2. 落盘并校验镜像包（数据只写一次，推送任务直接使用该文件）
+        if upload_session_id:
+            # 续传的文件已在上传时校验，会话随本事务标记为完成；失败回滚后会话仍可重试，不删除文件
+            tar = await upload_service.take_image_tar_upload(
+                upload_session_id, current_user.id
+            )
+        else:
+            spooled = tar = await SkopeoPusher().ingest(
+                docker_tar, max_size=max_size, fail_fast=True
+            )
+
         # 检查是否已存在相同original_name:original_tag的镜像，如果存在则删除旧的
         existing_image_query = select(Image).where(
             and_(
@@ -1287,9 +1441,7 @@ async def create_service_with_docker_tar(
                 is_public if is_public is not None else existing_image.is_public
             )
             existing_image.updated_at = datetime.now(timezone.utc)
-
-            await db.commit()
-            await db.refresh(existing_image)
+            await db.flush()
 
             # 使用现有镜像对象（ID保持不变，Harbor路径也不变）
             image = existing_image
@@ -1308,117 +1460,64 @@ async def create_service_with_docker_tar(
             )
 
             db.add(image)
-            await db.commit()
-            await db.refresh(image)
+            await db.flush()
             logger.info(
                 f"创建新镜像记录: id={image.id}, harbor_path={image.harbor_repository_path}"
             )
 
-        # 上传Docker tar包到Harbor
-        try:
-
-            async def progress_callback(percent: int, stage: str):
-                """上传进度回调"""
-                image.upload_progress = percent
-                if percent == 100:
-                    image.status = "ready"
-                await db.commit()
-                logger.info(
-                    f"镜像{image.original_name}-{image.id}:{image.original_tag} 上传进度: {percent}% ({stage})"
-                )
-
-            async with HarborClient() as harbor:
-                # 重置文件指针到开始位置
-                docker_tar.file.seek(0)
-
-                result = await harbor.push_image_from_tar(
-                    project_name=harbor_project,
-                    repository_name=image.harbor_repository_path,  # 使用新的简化路径
-                    tag=image_tag,  # 使用解析出的实际标签
-                    tar_file=docker_tar.file,
-                    progress_callback=progress_callback,
-                )
-
-                # 更新镜像信息
-                image.harbor_digest = result.get("digest")
-                image.harbor_size = result.get("size")
-                image.status = "ready"
-                image.upload_progress = 100
-                await db.commit()
-
-            logger.info(f"Docker镜像上传完成: {image.full_name}")
-
-        except Exception as e:
-            logger.error(f"上传Docker镜像失败: {e}")
-
-            # 区分处理：新镜像删除记录，已存在镜像标记失败
-            if existing_image:
-                # 覆盖上传失败，保留记录但标记为失败
-                image.status = "failed"
-                image.error_message = str(e)
-                await db.commit()
-                logger.info(
-                    f"覆盖上传失败，已标记镜像为失败状态: {image_name}:{image_tag} (id={image.id})"
-                )
-            else:
-                # 新镜像上传失败，删除记录
-                await db.delete(image)
-                await db.commit()
-                logger.info(f"新镜像上传失败，已删除记录: {image_name}:{image_tag}")
-
-            raise HTTPException(status_code=500, detail=f"镜像上传失败: {str(e)}")
-
-        # 2. 创建服务并关联到镜像（服务名称将根据镜像信息自动生成）
-        service_data = ServiceCreate(
-            image_id=image.id,  # 使用镜像ID
-            description=description,
-            cpu_limit=cpu_limit,
-            memory_limit=memory_limit,
-            is_public=is_public,
-            priority=priority,
-        )
-
-        logger.info(f"准备创建服务: repository_id={repository.id}, image_id={image.id}")
-        service_response = await service_manager.create_service(
-            db, service_data, repository.id, current_user.id
-        )
-        logger.info(
-            f"服务创建成功: service_id={service_response.id}, service_name={service_response.service_name}"
-        )
-
-        # TODO: 处理Docker tar包 - 这里需要实现tar包的加载和验证逻辑
-        # 可以考虑：
-        # 1. 保存tar包到临时目录
-        # 2. 验证tar包中包含必需文件
-        # 3. 加载Docker镜像到Docker引擎
-        # 4. 验证镜像可以正常启动
-
-        # 如果上传了examples文件，处理它
+        # 3. 提交后台任务（与镜像记录在同一事务中写入）：推送镜像到Harbor后创建服务并上传examples
+        examples = None
         if examples_archive:
-            file_updates = {"examples": examples_archive}
-            try:
-                await container_file_service.update_service_files(
-                    db, service_response.id, file_updates, current_user.id
-                )
-                # 提交examples文件更新
-                await db.commit()
-            except Exception as e:
-                # 回滚examples文件更新，但不影响服务创建
-                await db.rollback()
-                logger.warning(f"上传examples文件失败，但服务创建成功: {e}")
+            examples = await job_queue.spool_upload(examples_archive, prefix="examples_")
+        job = await job_queue.enqueue(
+            db,
+            SERVICE_FROM_TAR_JOB,
+            {
+                "image_id": image.id,
+                "overwrite": existing_image is not None,
+                "tar": tar.to_dict(),
+                "project": harbor_project,
+                "tag": image_tag,
+                "repository_id": repository.id,
+                "user_id": current_user.id,
+                "service": {
+                    "description": description,
+                    "cpu_limit": cpu_limit,
+                    "memory_limit": memory_limit,
+                    "is_public": is_public,
+                    "priority": priority,
+                },
+                "examples": examples,
+            },
+            created_by=current_user.id,
+            resource_type="image",
+            resource_id=image.id,
+            commit=False,
+        )
+        await db.commit()
+        spooled = None
+        examples = None
 
         return {
-            "message": "服务创建成功",
-            "service": service_response,
-            "docker_tar_filename": docker_tar.filename,
+            "message": "服务创建任务已提交",
+            "job_id": job.id,
+            "image_id": image.id,
+            "status": job.status,
+            "docker_tar_filename": tar_filename,
             "examples_uploaded": examples_archive is not None,
         }
 
     except HTTPException:
         raise
+    except (TarFormatError, TarTooLargeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"创建服务失败: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"服务创建失败: {str(e)}")
+    finally:
+        if spooled:
+            spooled.cleanup()
+        job_queue.remove_spooled_upload(examples)
 
 
 @router.get("/{service_id:int}/container-info")
@@ -174,6 +174,9 @@ class FileDiffResponse(BaseModel):
     new_version_id: int
     diff_summary: Dict[str, int]
     diff_content: Optional[str] = None
+    hunks: Optional[List[Dict[str, Any]]] = None
+    is_binary: bool = False
+    truncated: bool = False
 
 
 class FileHistoryResponse(BaseModel):
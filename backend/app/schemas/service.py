@@ -34,7 +34,7 @@ class ServiceStatus(str, Enum):
     STOPPING = "stopping"  # 容器正在停止中
     STOPPED = "stopped"  # 容器已停止
     ERROR = "error"  # 容器或服务出现错误
-    IDLE = "idle"  # 容器运行但长时间无访问
+    IDLE = "idle"  # 长时间无访问，容器已停止但保留（含端口和控制器），访问时自动恢复
     RESTARTING = "restarting"  # 容器正在重启中
     FAILED = "failed"  # 容器启动失败或崩溃
 
@@ -20,13 +20,17 @@ from fastapi import UploadFile
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
+from app.database import AsyncSessionLocal
 from app.models.service import ModelService
 from app.schemas.service import ServiceStatus, HealthStatus
 from app.services.model_service import service_manager
 from app.services.mmanager_client import mmanager_client
+from app.services.job_queue import job_queue, JobContext
 
 logger = logging.getLogger(__name__)
 
+UPDATE_FILES_JOB = "service.update_files"
+
 
 class ContainerFileUpdateService:
     """容器文件更新服务"""
@@ -81,6 +85,32 @@ class ContainerFileUpdateService:
             logger.error(f"更新服务 {service_id} 文件失败: {e}")
             raise RuntimeError(f"文件更新失败: {str(e)}")
 
+    async def run_update_files_job(self, ctx: JobContext) -> Dict[str, Any]:
+        """后台任务：使用落盘的上传文件更新服务容器"""
+        payload = ctx.payload
+        file_updates = {
+            file_type: job_queue.open_spooled_upload(info)
+            for file_type, info in payload["files"].items()
+        }
+        try:
+            await ctx.progress(10, "正在更新服务文件")
+            async with AsyncSessionLocal() as db:
+                result = await self.update_service_files(
+                    db, payload["service_id"], file_updates, payload["user_id"]
+                )
+                await db.commit()
+            return result
+        finally:
+            for upload in file_updates.values():
+                await upload.close()
+
+    async def finish_update_files_job(
+        self, payload: Dict[str, Any], status: str, error: Optional[str]
+    ):
+        """文件更新任务结束，删除落盘的上传文件"""
+        for info in payload["files"].values():
+            job_queue.remove_spooled_upload(info)
+
     async def _get_service_info_for_update(
         self, db: AsyncSession, service_id: int, user_id: int
     ) -> Dict[str, Any]:
@@ -232,9 +262,7 @@ class ContainerFileUpdateService:
             
             # 保存上传的压缩包
             archive_path = os.path.join(work_dir, file_obj.filename)
-            content = await file_obj.read()
-            with open(archive_path, 'wb') as f:
-                f.write(content)
+            archive_size = await self._save_upload_file(file_obj, archive_path)
                 
             # 解压文件
             await self._extract_archive(archive_path, extract_dir)
@@ -264,7 +292,7 @@ class ContainerFileUpdateService:
                 'success': True,
                 'directory_name': dir_type,
                 'file_count': file_count,
-                'archive_size': len(content)
+                'archive_size': archive_size
             }
             
         except Exception as e:
@@ -280,23 +308,13 @@ class ContainerFileUpdateService:
         """复制文件到容器 - 无数据库依赖版本"""
         
         try:
-            import base64
-            
-            # 读取文件内容并编码为base64
-            with open(host_path, 'rb') as f:
-                file_content = f.read()
-            content_base64 = base64.b64encode(file_content).decode('utf-8')
-            file_name = os.path.basename(container_path)
-            
-            # 使用mManager客户端复制文件
-            controller_client = mmanager_client.get_client(service_info["controller_id"])
-            result = await controller_client.copy_file_to_container(
-                service_info["container_id"], container_path, content_base64, file_name
+            await self._put_path_to_container(
+                service_info["controller_id"],
+                service_info["container_id"],
+                host_path,
+                container_path,
+                remove_existing=False
             )
-            
-            if not result.get("success", False):
-                raise RuntimeError(f"文件复制失败: {result.get('message', '未知错误')}")
-                
         except Exception as e:
             raise RuntimeError(f"复制文件到容器失败: {str(e)}")
 
@@ -306,33 +324,72 @@ class ContainerFileUpdateService:
         """复制目录到容器 - 无数据库依赖版本"""
         
         try:
-            import base64
-            
-            # 创建tar包并编码为base64
-            tar_data = self._create_directory_tar_archive(host_dir)
-            archive_base64 = base64.b64encode(tar_data).decode('utf-8')
+            await self._put_path_to_container(
+                service_info["controller_id"],
+                service_info["container_id"],
+                host_dir,
+                container_path,
+                remove_existing=True
+            )
+        except Exception as e:
+            raise RuntimeError(f"复制目录到容器失败: {str(e)}")
+
+    async def _put_path_to_container(
+        self,
+        controller_id: str,
+        container_id: str,
+        host_path: str,
+        container_path: str,
+        remove_existing: bool
+    ):
+        """
+        将本地文件或目录打包为tar文件后以二进制流上传到容器
+        
+        tar包写入临时文件并分块发送，不在内存中保留整个归档，也不做base64编码
+        """
+        with tempfile.TemporaryDirectory() as tar_dir:
+            tar_path = os.path.join(tar_dir, "payload.tar")
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(
+                None,
+                self._write_tar_archive,
+                host_path,
+                os.path.basename(container_path),
+                tar_path
+            )
             
-            # 使用mManager客户端复制目录
-            controller_client = mmanager_client.get_client(service_info["controller_id"])
-            result = await controller_client.copy_directory_to_container(
-                service_info["container_id"], container_path, archive_base64, remove_existing=True
+            controller_client = mmanager_client.get_client(controller_id)
+            result = await controller_client.put_archive(
+                container_id,
+                os.path.dirname(container_path) or "/",
+                tar_path,
+                remove_path=container_path if remove_existing else None
             )
             
             if not result.get("success", False):
-                raise RuntimeError(f"目录复制失败: {result.get('message', '未知错误')}")
-                
-        except Exception as e:
-            raise RuntimeError(f"复制目录到容器失败: {str(e)}")
+                raise RuntimeError(f"归档上传失败: {result.get('message', '未知错误')}")
+
+    async def _save_upload_file(
+        self, file_obj: UploadFile, dest_path: str, chunk_size: int = 1024 * 1024
+    ) -> int:
+        """分块保存上传文件，返回文件大小"""
+        size = 0
+        with open(dest_path, 'wb') as f:
+            while True:
+                chunk = await file_obj.read(chunk_size)
+                if not chunk:
+                    break
+                f.write(chunk)
+                size += len(chunk)
+        return size
 
     async def _restart_container_with_fresh_session(
         self, service_id: int, user_id: int
     ) -> Dict[str, Any]:
         """使用新的数据库会话重启容器"""
-        from app.database import get_db
-        
         try:
             # 获取新的数据库会话
-            async with get_db() as fresh_db:
+            async with AsyncSessionLocal() as fresh_db:
                 service = await self._get_service_by_id(fresh_db, service_id)
                 result = await self._restart_container_and_verify(fresh_db, service, user_id)
                 await fresh_db.commit()  # 显式提交
@@ -422,9 +479,7 @@ class ContainerFileUpdateService:
             
             # 保存上传的压缩包
             archive_path = os.path.join(work_dir, file_obj.filename)
-            content = await file_obj.read()
-            with open(archive_path, 'wb') as f:
-                f.write(content)
+            archive_size = await self._save_upload_file(file_obj, archive_path)
                 
             # 解压文件
             await self._extract_archive(archive_path, extract_dir)
@@ -455,7 +510,7 @@ class ContainerFileUpdateService:
                 'success': True,
                 'directory_name': dir_type,
                 'file_count': file_count,
-                'archive_size': len(content)
+                'archive_size': archive_size
             }
             
         except Exception as e:
@@ -559,27 +614,15 @@ class ContainerFileUpdateService:
         """复制文件到容器"""
         
         try:
-            import base64
-            
-            # 读取文件内容并编码为base64
-            with open(host_path, 'rb') as f:
-                file_content = f.read()
-            content_base64 = base64.b64encode(file_content).decode('utf-8')
-            file_name = os.path.basename(container_path)
-            
             # 找到容器所在的控制器
             location = await mmanager_client.find_container_location(db, container_id)
             if not location:
                 raise RuntimeError(f"无法找到容器 {container_id} 的位置")
             
-            # 使用mManager客户端复制文件
-            controller_client = mmanager_client.get_client(location["controller_id"])
-            result = await controller_client.copy_file_to_container(
-                container_id, container_path, content_base64, file_name
+            await self._put_path_to_container(
+                location["controller_id"], container_id, host_path, container_path,
+                remove_existing=False
             )
-            
-            if not result.get("success", False):
-                raise RuntimeError(f"文件复制失败: {result.get('message', '未知错误')}")
                 
         except Exception as e:
             raise RuntimeError(f"复制文件到容器失败: {str(e)}")
@@ -588,52 +631,23 @@ class ContainerFileUpdateService:
         """复制目录到容器"""
         
         try:
-            import base64
-            
-            # 创建tar包并编码为base64
-            tar_data = self._create_directory_tar_archive(host_dir)
-            archive_base64 = base64.b64encode(tar_data).decode('utf-8')
-            
             # 找到容器所在的控制器
             location = await mmanager_client.find_container_location(db, container_id)
             if not location:
                 raise RuntimeError(f"无法找到容器 {container_id} 的位置")
             
-            # 使用mManager客户端复制目录
-            controller_client = mmanager_client.get_client(location["controller_id"])
-            result = await controller_client.copy_directory_to_container(
-                container_id, container_path, archive_base64, remove_existing=True
+            await self._put_path_to_container(
+                location["controller_id"], container_id, host_dir, container_path,
+                remove_existing=True
             )
-            
-            if not result.get("success", False):
-                raise RuntimeError(f"目录复制失败: {result.get('message', '未知错误')}")
                 
         except Exception as e:
             raise RuntimeError(f"复制目录到容器失败: {str(e)}")
             
-    def _create_tar_archive(self, filename: str, content: bytes) -> bytes:
-        """创建单文件tar包"""
-        import io
-        import tarfile
-        
-        tar_buffer = io.BytesIO()
-        with tarfile.open(fileobj=tar_buffer, mode='w') as tar:
-            info = tarfile.TarInfo(name=filename)
-            info.size = len(content)
-            tar.addfile(info, io.BytesIO(content))
-        tar_buffer.seek(0)
-        return tar_buffer.read()
-        
-    def _create_directory_tar_archive(self, directory: str) -> bytes:
-        """创建目录tar包"""
-        import io
-        import tarfile
-        
-        tar_buffer = io.BytesIO()
-        with tarfile.open(fileobj=tar_buffer, mode='w') as tar:
-            tar.add(directory, arcname=os.path.basename(directory))
-        tar_buffer.seek(0)
-        return tar_buffer.read()
+    def _write_tar_archive(self, source_path: str, arcname: str, tar_path: str):
+        """将文件或目录写入tar文件（以容器内目标名称作为归档根）"""
+        with tarfile.open(tar_path, mode='w') as tar:
+            tar.add(source_path, arcname=arcname)
         
     async def _restart_container_and_verify(
         self,
@@ -700,4 +714,12 @@ class ContainerFileUpdateService:
 
 
 # 创建全局实例
-container_file_service = ContainerFileUpdateService()
\ No newline at end of file
+container_file_service = ContainerFileUpdateService()
+
+# 文件更新会重启容器，失败时不自动重试
+job_queue.register(
+    UPDATE_FILES_JOB,
+    container_file_service.run_update_files_job,
+    on_finished=container_file_service.finish_update_files_job,
+    max_attempts=1,
+)
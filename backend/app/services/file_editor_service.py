@@ -1,11 +1,15 @@
+import asyncio
+import functools
 import hashlib
 import uuid
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict, Any
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, desc, and_, or_
 from sqlalchemy.orm import selectinload
 
+from app.config import settings
 from app.models.file_editor import (
     FileVersion, FileEditSession, FileEditPermission, FileTemplate, FileDraft,
     FileVersionType
@@ -13,10 +17,55 @@ from app.models.file_editor import (
 from app.models.repository import RepositoryFile
 from app.models.user import User
 from app.services.minio_service import MinIOService
+from app.utils.logger import logger
+from app.utils.text_delta import compute_delta, apply_delta, encode_delta, decode_delta
+from app.utils.text_diff import DEFAULT_CONTEXT_LINES, compute_diff, diff_summary
+
+# 版本存储方式
+STORAGE_FULL = "full"
+STORAGE_DELTA = "delta"
+
+
+class VersionContentCache:
+    """还原后的版本内容LRU缓存，按版本哈希索引，限制总大小（按字符数估算）"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._items: "OrderedDict[str, str]" = OrderedDict()
+        self._size = 0
+
+    def get(self, version_hash: str) -> Optional[str]:
+        content = self._items.get(version_hash)
+        if content is not None:
+            self._items.move_to_end(version_hash)
+        return content
+
+    def put(self, version_hash: str, content: str):
+        if len(content) > self.max_size:
+            return
+        old = self._items.pop(version_hash, None)
+        if old is not None:
+            self._size -= len(old)
+        self._items[version_hash] = content
+        self._size += len(content)
+        while self._size > self.max_size:
+            _, evicted = self._items.popitem(last=False)
+            self._size -= len(evicted)
+
+
+# 全局版本内容缓存（服务按请求创建，缓存跨请求共享）
+version_content_cache = VersionContentCache(settings.file_version_cache_mb * 1024 * 1024)
+
+# 全局版本差异缓存，按 (旧版本哈希, 新版本哈希, 上下文行数) 索引；版本内容不可变，无需失效
+version_diff_cache: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
 
 
 class FileVersionService:
-    """文件版本控制服务"""
+    """文件版本控制服务
+
+    文本版本保存为相对上一版本的行增量，每隔 file_version_keyframe_interval 个版本
+    （或增量不划算时）保存一次完整快照；读取时从最近的快照按顺序应用增量还原
+    """
     
     def __init__(self, db: AsyncSession, minio_service: MinIOService):
         self.db = db
@@ -44,26 +93,85 @@ class FileVersionService:
         
         return version
     
-    async def get_version_diff(self, old_version_id: int, new_version_id: int, include_content: bool = False) -> Dict[str, Any]:
-        """获取版本差异"""
+    async def get_version_diff(
+        self,
+        old_version_id: int,
+        new_version_id: int,
+        include_content: bool = False,
+        context_lines: int = DEFAULT_CONTEXT_LINES
+    ) -> Dict[str, Any]:
+        """获取版本差异
+
+        include_content 为True时返回 unified diff 文本和结构化的差异块
+        """
         old_version = await self.get_version_info(old_version_id)
         new_version = await self.get_version_info(new_version_id)
         
+        # 相邻版本只需要摘要时直接使用保存的摘要
+        if (
+            not include_content
+            and new_version.parent_version_id == old_version.id
+            and new_version.diff_summary
+        ):
+            return {
+                "old_version_id": old_version_id,
+                "new_version_id": new_version_id,
+                "diff_summary": new_version.diff_summary
+            }
+        
+        diff = await self._compute_version_diff(old_version, new_version, context_lines)
         diff_info = {
             "old_version_id": old_version_id,
             "new_version_id": new_version_id,
-            "diff_summary": new_version.diff_summary or {}
+            "diff_summary": diff["summary"],
+            "is_binary": diff["is_binary"],
+            "truncated": diff["truncated"]
         }
         
         if include_content:
-            old_content = await self.get_version_content(old_version_id)
-            new_content = await self.get_version_content(new_version_id)
-            
-            # 简单的差异显示，实际可以使用更复杂的diff算法
-            diff_info["diff_content"] = f"--- Version {old_version.version_number}\n+++ Version {new_version.version_number}\n"
+            diff_info["diff_content"] = diff["unified"]
+            diff_info["hunks"] = diff["hunks"]
         
         return diff_info
     
+    async def _compute_version_diff(
+        self,
+        old_version: FileVersion,
+        new_version: FileVersion,
+        context_lines: int
+    ) -> Dict[str, Any]:
+        """计算两个版本的差异，结果按版本哈希缓存"""
+        
+        key = (old_version.version_hash, new_version.version_hash, context_lines)
+        cached = version_diff_cache.get(key)
+        if cached is not None:
+            version_diff_cache.move_to_end(key)
+            return cached
+        
+        # 同一个数据库会话不能并发查询，依次还原
+        old_content = await self._materialize(old_version)
+        new_content = await self._materialize(new_version)
+        
+        loop = asyncio.get_event_loop()
+        diff = await loop.run_in_executor(
+            None,
+            functools.partial(
+                compute_diff,
+                old_content,
+                new_content,
+                context_lines=context_lines,
+                max_bytes=settings.file_diff_max_bytes,
+                max_cost=settings.file_diff_max_edit_cost,
+                old_label=f"Version {old_version.version_number}",
+                new_label=f"Version {new_version.version_number}"
+            )
+        )
+        
+        version_diff_cache[key] = diff
+        while len(version_diff_cache) > settings.file_diff_cache_size:
+            version_diff_cache.popitem(last=False)
+        return diff
+    
     async def create_initial_version(
         self,
         file_id: int,
@@ -88,15 +196,11 @@ class FileVersionService:
         if not file_obj:
             raise ValueError(f"File with id {file_id} not found")
         
-        # 存储到MinIO
+        # 存储到MinIO（初始版本总是完整快照）
         bucket_name = file_obj.minio_bucket
         object_key = f"versions/{file_id}/{version_hash}"
-        
-        await self.minio_service.upload_text(
-            bucket_name=bucket_name,
-            object_name=object_key,
-            content=content,
-            content_type=mime_type
+        storage = await self._store_content(
+            bucket_name, object_key, content, mime_type, encoding
         )
         
         # 创建版本记录
@@ -112,13 +216,15 @@ class FileVersionService:
             minio_bucket=bucket_name,
             minio_object_key=object_key,
             encoding=encoding,
-            mime_type=mime_type
+            mime_type=mime_type,
+            **storage
         )
         
         self.db.add(file_version)
         await self.db.commit()
         await self.db.refresh(file_version)
         
+        version_content_cache.put(version_hash, content)
         return file_version
     
     async def create_new_version(
@@ -158,25 +264,28 @@ class FileVersionService:
         file_result = await self.db.execute(file_query)
         file_obj = file_result.scalar_one_or_none()
         
+        # 还原上一版本内容，用于计算增量和差异摘要
+        try:
+            latest_content = await self._materialize(latest_version)
+        except Exception as e:
+            logger.warning(f"还原文件 {file_id} 的版本 {latest_version.version_number} 失败，新版本保存完整内容: {e}")
+            latest_content = None
+        
         # 存储到MinIO
         bucket_name = file_obj.minio_bucket
         object_key = f"versions/{file_id}/{version_hash}"
-        
-        await self.minio_service.upload_text(
-            bucket_name=bucket_name,
-            object_name=object_key,
-            content=content,
-            content_type=latest_version.mime_type
+        storage = await self._store_content(
+            bucket_name,
+            object_key,
+            content,
+            latest_version.mime_type,
+            encoding,
+            base_version=latest_version,
+            base_content=latest_content
         )
         
         # 计算差异摘要
-        diff_summary = await self._calculate_diff_summary(
-            latest_version.content_hash,
-            content_hash,
-            latest_version.minio_bucket,
-            latest_version.minio_object_key,
-            content
-        )
+        diff_summary = await self._calculate_diff_summary(latest_content, content)
         
         # 创建新版本记录
         file_version = FileVersion(
@@ -193,13 +302,15 @@ class FileVersionService:
             parent_version_id=parent_version_id or latest_version.id,
             diff_summary=diff_summary,
             encoding=encoding,
-            mime_type=latest_version.mime_type
+            mime_type=latest_version.mime_type,
+            **storage
         )
         
         self.db.add(file_version)
         await self.db.commit()
         await self.db.refresh(file_version)
         
+        version_content_cache.put(version_hash, content)
         return file_version
     
     async def get_file_versions(
@@ -222,51 +333,159 @@ class FileVersionService:
     async def get_version_content(self, version_id: int) -> str:
         """获取指定版本的内容"""
         
-        version_query = select(FileVersion).where(FileVersion.id == version_id)
-        version_result = await self.db.execute(version_query)
-        version = version_result.scalar_one_or_none()
-        
-        if not version:
-            raise ValueError(f"Version with id {version_id} not found")
+        version = await self.get_version_info(version_id)
+        return await self._materialize(version)
+    
+    async def _store_content(
+        self,
+        bucket_name: str,
+        object_key: str,
+        content: str,
+        mime_type: Optional[str],
+        encoding: str,
+        base_version: Optional[FileVersion] = None,
+        base_content: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """保存版本内容，返回版本记录的存储字段
+
+        满足以下条件时保存为相对 base_version 的增量，否则保存完整快照：
+        - 基准内容可用，且增量链长度未达到快照间隔
+        - 新旧内容都不超过 file_version_delta_max_bytes（限制计算增量的耗时）
+        - 增量大小不超过完整内容的 file_version_delta_max_ratio
+        """
+        full_size = len(content.encode(encoding))
+        depth = (base_version.delta_depth or 0) + 1 if base_version else 0
+        
+        if (
+            base_content is not None
+            and depth < settings.file_version_keyframe_interval
+            and full_size <= settings.file_version_delta_max_bytes
+            and len(base_content.encode(encoding, errors="replace"))
+            <= settings.file_version_delta_max_bytes
+        ):
+            loop = asyncio.get_event_loop()
+            ops = await loop.run_in_executor(
+                None,
+                compute_delta,
+                base_content,
+                content,
+                settings.file_diff_max_edit_cost,
+            )
+            payload = encode_delta(ops, base_version.content_hash)
+            payload_size = len(payload.encode("utf-8"))
+            
+            if payload_size <= full_size * settings.file_version_delta_max_ratio:
+                await self.minio_service.upload_text(
+                    bucket_name=bucket_name,
+                    object_name=object_key,
+                    content=payload,
+                    content_type="application/json"
+                )
+                return {
+                    "storage_type": STORAGE_DELTA,
+                    "base_version_id": base_version.id,
+                    "delta_depth": depth,
+                    "stored_size": payload_size
+                }
         
-        # 从MinIO获取内容
-        content = await self.minio_service.get_text_content(
-            bucket_name=version.minio_bucket,
-            object_name=version.minio_object_key
+        await self.minio_service.upload_text(
+            bucket_name=bucket_name,
+            object_name=object_key,
+            content=content,
+            content_type=mime_type,
+            encoding=encoding
         )
+        return {
+            "storage_type": STORAGE_FULL,
+            "base_version_id": None,
+            "delta_depth": 0,
+            "stored_size": full_size
+        }
+    
+    async def _materialize(self, version: FileVersion) -> str:
+        """还原版本内容：从缓存或最近的完整快照开始依次应用增量"""
+        
+        cached = version_content_cache.get(version.version_hash)
+        if cached is not None:
+            return cached
+        
+        # 收集增量链 [目标版本, ..., 完整快照]；遇到已缓存的基准版本时提前结束
+        chain = [version]
+        base_content = None
+        if version.storage_type == STORAGE_DELTA:
+            # 增量的基准总是上一版本，一次查询取出链上所有版本
+            query = select(FileVersion).where(
+                and_(
+                    FileVersion.file_id == version.file_id,
+                    FileVersion.version_number < version.version_number,
+                    FileVersion.version_number >= version.version_number - (version.delta_depth or 0)
+                )
+            )
+            result = await self.db.execute(query)
+            candidates = {v.id: v for v in result.scalars().all()}
+            
+            current = version
+            while current.storage_type == STORAGE_DELTA:
+                base = candidates.get(current.base_version_id)
+                if base is None and current.base_version_id:
+                    base = await self.db.get(FileVersion, current.base_version_id)
+                if base is None:
+                    raise ValueError(f"Base version of version {current.version_number} not found")
+                
+                base_content = version_content_cache.get(base.version_hash)
+                if base_content is not None:
+                    break
+                chain.append(base)
+                current = base
+        
+        # 并发读取链上的所有对象
+        payloads = await asyncio.gather(*[
+            self.minio_service.get_text_content(
+                bucket_name=v.minio_bucket,
+                object_name=v.minio_object_key,
+                encoding="utf-8" if v.storage_type == STORAGE_DELTA else (v.encoding or "utf-8")
+            )
+            for v in chain
+        ])
+        
+        content = base_content
+        for v, payload in zip(reversed(chain), reversed(payloads)):
+            if v.storage_type != STORAGE_DELTA:
+                content = payload
+                continue
+            base = next(
+                (b for b in chain if b.id == v.base_version_id), None
+            )
+            base_hash = base.content_hash if base is not None else None
+            content = apply_delta(content, decode_delta(payload, base_hash))
         
+        if hashlib.sha256(content.encode(version.encoding or "utf-8")).hexdigest() != version.content_hash:
+            raise ValueError(f"Content of version {version.version_number} failed integrity check")
+        
+        version_content_cache.put(version.version_hash, content)
         return content
     
     async def _calculate_diff_summary(
         self,
-        old_content_hash: str,
-        new_content_hash: str,
-        old_bucket: str,
-        old_object_key: str,
+        old_content: Optional[str],
         new_content: str
     ) -> Dict[str, int]:
         """计算差异摘要"""
         
-        try:
-            # 获取旧内容
-            old_content = await self.minio_service.get_text_content(old_bucket, old_object_key)
-            
-            # 简单的行差异计算
-            old_lines = old_content.splitlines()
-            new_lines = new_content.splitlines()
-            
-            # 这里使用简单的逻辑，实际可以使用更复杂的diff算法
-            lines_added = max(0, len(new_lines) - len(old_lines))
-            lines_removed = max(0, len(old_lines) - len(new_lines))
-            lines_changed = min(len(old_lines), len(new_lines))
-            
-            return {
-                "lines_added": lines_added,
-                "lines_removed": lines_removed,
-                "lines_changed": lines_changed
-            }
-        except Exception:
+        if old_content is None:
             return {"lines_added": 0, "lines_removed": 0, "lines_changed": 0}
+        
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            None,
+            functools.partial(
+                diff_summary,
+                old_content,
+                new_content,
+                max_bytes=settings.file_diff_max_bytes,
+                max_cost=settings.file_diff_max_edit_cost
+            )
+        )
 
 
 class FileEditSessionService:
@@ -2,16 +2,28 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_
 from typing import Dict, Any, Optional, List
 from app.models import FileUploadSession, RepositoryFile, Repository
+from app.models.file_storage import UploadStatus
 from app.services.minio_service import minio_service
 from app.config import settings
-from app.middleware.error_response import NotFoundError, DataValidationError
+from app.middleware.error_response import NotFoundError, DataValidationError, ConflictError
+from app.utils.tar_ingest import ResumableTarSpool, SpooledTar
+import asyncio
 import hashlib
 import time
+import uuid
+from pathlib import Path
 from datetime import datetime, timedelta, timezone
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 镜像tar包续传会话的类型标记（数据追加到本地推送目录，不经过MinIO）
+IMAGE_TAR_MIME_TYPE = "application/x-tar"
+
+# 进程内的续传状态和会话锁: {session_id: ResumableTarSpool / Lock}
+_image_tar_spools: Dict[str, ResumableTarSpool] = {}
+_image_tar_locks: Dict[str, asyncio.Lock] = {}
+
 
 class FileUploadService:
     def __init__(self, db: AsyncSession):
@@ -371,3 +383,256 @@ class FileUploadService:
             "cleaned_sessions": cleaned_count,
             "total_expired": len(expired_sessions),
         }
+
+    # ================== 镜像tar包续传 ==================
+
+    async def initiate_image_tar_session(
+        self,
+        repository_id: int,
+        user_id: int,
+        file_name: str,
+        file_size: int,
+        file_hash: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """初始化镜像tar包续传会话
+
+        分片按偏移顺序追加到推送目录下的同一文件，每个分片附带sha256校验，
+        中断后从最后确认的偏移继续上传
+        """
+        from app.utils.skopeo_pusher import SkopeoPusher
+
+        if file_size <= 0:
+            raise DataValidationError("文件大小无效")
+        if file_size > settings.image_upload_max_bytes:
+            raise DataValidationError(
+                f"镜像文件过大，最大支持{settings.image_upload_max_bytes // 1024 ** 3}GB"
+            )
+
+        # 顺便清理过期会话遗留的落盘数据
+        await self.cleanup_expired_image_tar_sessions()
+
+        session_id = uuid.uuid4().hex
+        chunk_size = settings.image_upload_chunk_size_mb * 1024 * 1024
+        spool_path = SkopeoPusher().spool_dir / f"session_{session_id}.tar"
+
+        upload_session = FileUploadSession(
+            session_id=session_id,
+            user_id=user_id,
+            repository_id=repository_id,
+            filename=file_name,
+            file_path=str(spool_path),
+            file_size=file_size,
+            mime_type=IMAGE_TAR_MIME_TYPE,
+            file_hash=file_hash.lower() if file_hash else None,
+            chunk_size=chunk_size,
+            total_chunks=(file_size + chunk_size - 1) // chunk_size,
+            uploaded_chunks=0,
+            chunk_status={"offset": 0, "chunks": []},
+            status=UploadStatus.PENDING,
+            progress_percentage=0,
+            expires_at=datetime.now(timezone.utc)
+            + timedelta(hours=settings.upload_session_expires_hours),
+        )
+        self.db.add(upload_session)
+        await self.db.commit()
+
+        return self._image_tar_session_info(upload_session)
+
+    @staticmethod
+    def _image_tar_session_info(session: FileUploadSession) -> Dict[str, Any]:
+        offset = (session.chunk_status or {}).get("offset", 0)
+        return {
+            "session_id": session.session_id,
+            "status": session.status.value if session.status else None,
+            "file_name": session.filename,
+            "file_size": session.file_size,
+            "offset": offset,
+            "chunk_size": session.chunk_size,
+            "uploaded_chunks": session.uploaded_chunks,
+            "progress": session.progress_percentage,
+            "expires_at": session.expires_at.isoformat() if session.expires_at else None,
+            "error_message": session.error_message,
+        }
+
+    async def _get_image_tar_session(
+        self, session_id: str, user_id: int, for_update: bool = False
+    ) -> FileUploadSession:
+        query = select(FileUploadSession).where(
+            and_(
+                FileUploadSession.session_id == session_id,
+                FileUploadSession.mime_type == IMAGE_TAR_MIME_TYPE,
+            )
+        )
+        if for_update:
+            query = query.with_for_update()
+        result = await self.db.execute(query)
+        session = result.scalar_one_or_none()
+        if not session or session.user_id != user_id:
+            raise NotFoundError("上传会话不存在")
+        return session
+
+    def _image_tar_spool(self, session: FileUploadSession) -> ResumableTarSpool:
+        spool = _image_tar_spools.get(session.session_id)
+        if spool is None:
+            spool = ResumableTarSpool(Path(session.file_path), settings.image_upload_max_bytes)
+            _image_tar_spools[session.session_id] = spool
+        return spool
+
+    def _forget_image_tar_session(self, session_id: str):
+        _image_tar_spools.pop(session_id, None)
+        _image_tar_locks.pop(session_id, None)
+
+    async def _fail_image_tar_session(self, session: FileUploadSession, message: str):
+        session.status = UploadStatus.FAILED
+        session.error_message = message
+        await self.db.commit()
+        self._image_tar_spool(session).discard()
+        self._forget_image_tar_session(session.session_id)
+
+    async def get_image_tar_session(self, session_id: str, user_id: int) -> Dict[str, Any]:
+        """获取续传会话状态，offset 为下一个分片应当开始的位置"""
+        session = await self._get_image_tar_session(session_id, user_id)
+        return self._image_tar_session_info(session)
+
+    async def append_image_tar_chunk(
+        self,
+        session_id: str,
+        user_id: int,
+        offset: int,
+        data: bytes,
+        checksum: str,
+    ) -> Dict[str, Any]:
+        """在 offset 处追加一个分片
+
+        - checksum 为分片的sha256，不一致时拒绝，客户端重传该分片
+        - offset 小于已确认偏移且与已确认的分片相同时视为重传，直接确认
+        - offset 与已确认偏移不一致时返回 409，客户端从会话的 offset 继续
+        """
+        if not data:
+            raise DataValidationError("分片数据为空")
+        if hashlib.sha256(data).hexdigest() != checksum.lower():
+            raise DataValidationError("分片校验和不匹配，请重新上传该分片")
+
+        # 先确认会话存在且属于该用户，避免无效的 session_id 在锁字典中残留
+        await self._get_image_tar_session(session_id, user_id)
+        await self.db.rollback()
+
+        lock = _image_tar_locks.setdefault(session_id, asyncio.Lock())
+        async with lock:
+            # 行锁防止多个进程同时向同一会话追加
+            try:
+                session = await self._get_image_tar_session(
+                    session_id, user_id, for_update=True
+                )
+            except NotFoundError:
+                self._forget_image_tar_session(session_id)
+                raise
+            if session.status not in (UploadStatus.PENDING, UploadStatus.UPLOADING):
+                raise ConflictError(f"上传会话状态无效: {session.status.value}")
+            if session.expires_at and session.expires_at < datetime.now(timezone.utc):
+                await self._fail_image_tar_session(session, "上传会话已过期")
+                raise DataValidationError("上传会话已过期")
+
+            chunk_status = dict(session.chunk_status or {"offset": 0, "chunks": []})
+            acked = chunk_status.get("offset", 0)
+            chunks = list(chunk_status.get("chunks", []))
+
+            if offset != acked:
+                # 确认响应丢失后的重传
+                if [offset, len(data), checksum.lower()] in chunks:
+                    await self.db.rollback()
+                    return self._image_tar_session_info(session)
+                await self.db.rollback()
+                raise ConflictError(
+                    f"分片偏移不匹配，应从 {acked} 继续上传",
+                    context={"offset": acked},
+                )
+            if offset + len(data) > session.file_size:
+                await self.db.rollback()
+                raise DataValidationError("分片超出声明的文件大小")
+
+            spool = self._image_tar_spool(session)
+            loop = asyncio.get_event_loop()
+            try:
+                new_offset = await loop.run_in_executor(None, spool.append, offset, data)
+            except ValueError as e:
+                # 不是有效的tar包或超过大小限制，会话作废
+                await self._fail_image_tar_session(session, str(e))
+                raise DataValidationError(str(e))
+
+            chunks.append([offset, len(data), checksum.lower()])
+            session.chunk_status = {"offset": new_offset, "chunks": chunks}
+            session.uploaded_chunks = len(chunks)
+            session.progress_percentage = int(new_offset * 100 / session.file_size)
+            session.status = UploadStatus.UPLOADING
+            await self.db.commit()
+
+            return self._image_tar_session_info(session)
+
+    async def take_image_tar_upload(self, session_id: str, user_id: int) -> SpooledTar:
+        """取出已上传完成的镜像tar包
+
+        会话被标记为已完成（随调用方的事务一起提交），调用方提交后文件归其所有；
+        调用方失败回滚时会话保持可用，可以重试。
+        文件sha256与声明的不一致时只抛出错误，不修改会话也不提交调用方的事务，
+        由客户端取消会话后重新上传
+        """
+        session = await self._get_image_tar_session(session_id, user_id, for_update=True)
+        if session.status not in (UploadStatus.PENDING, UploadStatus.UPLOADING):
+            raise ConflictError(f"上传会话状态无效: {session.status.value}")
+
+        offset = (session.chunk_status or {}).get("offset", 0)
+        if offset != session.file_size:
+            raise DataValidationError(
+                f"镜像文件尚未上传完成: {offset}/{session.file_size} 字节",
+                context={"offset": offset},
+            )
+
+        spool = self._image_tar_spool(session)
+        loop = asyncio.get_event_loop()
+        spooled = await loop.run_in_executor(None, spool.finish, offset)
+        if session.file_hash and spooled.sha256 != session.file_hash:
+            raise DataValidationError(
+                "文件sha256与声明的不一致，请取消该会话后重新上传",
+                context={"expected": session.file_hash, "actual": spooled.sha256},
+            )
+
+        session.status = UploadStatus.COMPLETED
+        session.progress_percentage = 100
+        session.completed_at = datetime.now(timezone.utc)
+        self._forget_image_tar_session(session_id)
+        return spooled
+
+    async def abort_image_tar_session(self, session_id: str, user_id: int) -> None:
+        """取消续传会话并删除已上传的数据"""
+        session = await self._get_image_tar_session(session_id, user_id)
+        if session.status == UploadStatus.COMPLETED:
+            raise ConflictError("上传已完成，无法取消")
+        session.status = UploadStatus.CANCELLED
+        await self.db.commit()
+        self._image_tar_spool(session).discard()
+        self._forget_image_tar_session(session_id)
+
+    async def cleanup_expired_image_tar_sessions(self) -> Dict[str, Any]:
+        """清理过期的镜像tar包续传会话及其落盘数据"""
+        result = await self.db.execute(
+            select(FileUploadSession).where(
+                and_(
+                    FileUploadSession.mime_type == IMAGE_TAR_MIME_TYPE,
+                    FileUploadSession.expires_at < datetime.now(timezone.utc),
+                    FileUploadSession.status.in_(
+                        [UploadStatus.PENDING, UploadStatus.UPLOADING]
+                    ),
+                )
+            )
+        )
+        expired_sessions = result.scalars().all()
+
+        for session in expired_sessions:
+            session.status = UploadStatus.FAILED
+            session.error_message = "上传会话已过期"
+            self._image_tar_spool(session).discard()
+            self._forget_image_tar_session(session.session_id)
+        await self.db.commit()
+
+        return {"cleaned_sessions": len(expired_sessions)}
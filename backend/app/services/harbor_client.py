@@ -5,13 +5,53 @@ Harbor镜像仓库客户端 (优化版)
 
 import aiohttp
 import asyncio
+import hashlib
 import re
 import ssl
-from typing import Dict, List, Optional, BinaryIO, Any
+import time
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, BinaryIO, Any, Union
+from yarl import URL
 
 from app.config import settings
+from app.utils.docker_archive import DockerArchiveError, read_push_plan
 from app.utils.logger import logger
 from app.utils.skopeo_pusher import SkopeoPusher
+from app.utils.tar_ingest import SpooledTar
+
+BLOB_CHUNK_SIZE = 1024 * 1024
+
+
+class RegistryError(Exception):
+    """Registry V2 接口调用失败"""
+
+
+def _ssl_context() -> ssl.SSLContext:
+    """创建SSL上下文，用于处理自签名证书"""
+    ssl_context = ssl.create_default_context()
+    ssl_context.check_hostname = False
+    ssl_context.verify_mode = ssl.CERT_NONE
+    return ssl_context
+
+
+async def _read_file_range(
+    path: Path, offset: int, size: int, on_chunk=None
+) -> AsyncIterator[bytes]:
+    """异步读取文件中的一段数据（用于流式上传层数据）"""
+    loop = asyncio.get_event_loop()
+    with open(path, "rb") as f:
+        f.seek(offset)
+        remaining = size
+        while remaining:
+            chunk = await loop.run_in_executor(
+                None, f.read, min(BLOB_CHUNK_SIZE, remaining)
+            )
+            if not chunk:
+                raise RegistryError(f"读取层数据失败: {path} 数据不完整")
+            remaining -= len(chunk)
+            if on_chunk:
+                on_chunk(len(chunk))
+            yield chunk
 
 
 class HarborClient:
@@ -22,21 +62,21 @@ class HarborClient:
         self.username = settings.harbor_username
         self.password = settings.harbor_password
         self.session = None
+        # Registry V2 接口使用独立会话（Bearer令牌认证，不能与默认的Basic认证混用）
+        self._registry_session: Optional[aiohttp.ClientSession] = None
+        self._registry_auth: Dict[str, str] = {}
+        # 限制清单抓取时并发的Harbor API请求数
+        self._crawl_semaphore = asyncio.Semaphore(settings.harbor_crawl_concurrency)
 
     async def __aenter__(self):
         """异步上下文管理器入口"""
         auth = aiohttp.BasicAuth(self.username, self.password)
 
-        # 创建SSL上下文，用于处理自签名证书
-        ssl_context = ssl.create_default_context()
-        ssl_context.check_hostname = False
-        ssl_context.verify_mode = ssl.CERT_NONE
-
         # 创建优化的连接器
         connector = aiohttp.TCPConnector(
-            ssl=ssl_context,
-            limit=10,  # 连接池大小
-            limit_per_host=5,  # 每个主机的连接数
+            ssl=_ssl_context(),
+            limit=max(10, settings.harbor_crawl_concurrency),  # 连接池大小
+            limit_per_host=max(5, settings.harbor_crawl_concurrency),  # 每个主机的连接数
             keepalive_timeout=30,  # 保持连接时间
             enable_cleanup_closed=True,
         )
@@ -53,6 +93,9 @@ class HarborClient:
         """异步上下文管理器退出"""
         if self.session:
             await self.session.close()
+        if self._registry_session:
+            await self._registry_session.close()
+            self._registry_session = None
 
     # ================== 项目管理 ==================
 
@@ -89,7 +132,7 @@ class HarborClient:
         project_name: str,
         repository_name: str,
         tag: str,
-        tar_file: BinaryIO,
+        tar_file: Union[SpooledTar, BinaryIO],
         progress_callback=None,
     ) -> Dict:
         """从tar文件推送镜像到Harbor (优化版)"""
@@ -113,7 +156,20 @@ class HarborClient:
         except Exception as e:
             logger.warning(f"创建Harbor项目失败，可能已存在: {e}")
 
-        # 2. 使用Skopeo直推（唯一推送方式）
+        # 2. 未压缩的落盘tar包按层推送，只上传Harbor中不存在的层
+        if (
+            settings.harbor_layer_push_enabled
+            and isinstance(tar_file, SpooledTar)
+            and not tar_file.compressed
+        ):
+            try:
+                return await self.layered_push_image_from_tar(
+                    project_name, repository_name, tag, tar_file, progress_callback
+                )
+            except DockerArchiveError as e:
+                logger.warning(f"镜像包不支持按层推送，改用Skopeo: {e}")
+
+        # 3. 其他情况使用Skopeo直推
         logger.info(f"使用Skopeo直推: {project_name}/{repository_name}:{tag}")
         return await self.skopeo_push_image_from_tar(
             project_name, repository_name, tag, tar_file, progress_callback
@@ -124,7 +180,7 @@ class HarborClient:
         project_name: str,
         repository_name: str,
         tag: str,
-        tar_file: BinaryIO,
+        tar_file: Union[SpooledTar, BinaryIO],
         progress_callback=None,
     ) -> Dict:
         """
@@ -174,7 +230,7 @@ class HarborClient:
         project_name: str,
         repository_name: str,
         tag: str,
-        tar_file: BinaryIO,
+        tar_file: Union[SpooledTar, BinaryIO],
         progress_callback=None,
     ) -> Dict:
         """
@@ -192,6 +248,292 @@ class HarborClient:
 
 
 
+    # ================== Registry V2 按层推送 ==================
+
+    async def _get_registry_session(self) -> aiohttp.ClientSession:
+        if self._registry_session is None:
+            self._registry_session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(
+                    total=None,
+                    sock_connect=30,
+                    sock_read=settings.harbor_layer_push_timeout,
+                ),
+                connector=aiohttp.TCPConnector(
+                    ssl=_ssl_context(),
+                    limit=settings.harbor_layer_push_concurrency * 2,
+                ),
+            )
+        return self._registry_session
+
+    async def _authorize_registry(self, repository: str, challenge: str) -> str:
+        """根据 WWW-Authenticate 质询获取Registry认证头（Bearer令牌或Basic）"""
+        scheme, _, params = challenge.partition(" ")
+        if scheme.lower() == "basic":
+            return aiohttp.BasicAuth(self.username, self.password).encode()
+        if scheme.lower() != "bearer":
+            raise RegistryError(f"不支持的Registry认证方式: {challenge}")
+
+        fields = dict(re.findall(r'(\w+)="([^"]*)"', params))
+        realm = fields.get("realm")
+        if not realm:
+            raise RegistryError(f"Registry认证质询缺少realm: {challenge}")
+        query = {"scope": f"repository:{repository}:pull,push"}
+        if fields.get("service"):
+            query["service"] = fields["service"]
+
+        session = await self._get_registry_session()
+        async with session.get(
+            realm,
+            params=query,
+            auth=aiohttp.BasicAuth(self.username, self.password),
+        ) as response:
+            if response.status != 200:
+                raise RegistryError(
+                    f"获取Registry令牌失败: {response.status} - {await response.text()}"
+                )
+            data = await response.json(content_type=None)
+        token = data.get("token") or data.get("access_token")
+        if not token:
+            raise RegistryError("Registry令牌响应中没有token")
+        return f"Bearer {token}"
+
+    async def _registry_request(
+        self,
+        method: str,
+        repository: str,
+        url: Union[str, URL],
+        expected: tuple,
+        data_factory=None,
+        headers: Optional[Dict[str, str]] = None,
+        **kwargs,
+    ) -> aiohttp.ClientResponse:
+        """调用Registry V2接口，401时按质询重新认证后重试一次
+
+        data_factory 每次调用返回新的请求体，保证重试时可以重新发送流式数据。
+        返回的响应已读取完毕，调用方只使用状态码和响应头
+        """
+        session = await self._get_registry_session()
+        for attempt in range(2):
+            request_headers = dict(headers or {})
+            if repository in self._registry_auth:
+                request_headers["Authorization"] = self._registry_auth[repository]
+            data = data_factory() if data_factory else None
+            async with session.request(
+                method, url, headers=request_headers, data=data, **kwargs
+            ) as response:
+                body = await response.read()
+                if response.status == 401 and attempt == 0:
+                    self._registry_auth[repository] = await self._authorize_registry(
+                        repository, response.headers.get("WWW-Authenticate", "")
+                    )
+                    continue
+                if response.status not in expected:
+                    raise RegistryError(
+                        f"{method} {URL(url).path} 失败: {response.status} - "
+                        f"{body[:500].decode('utf-8', 'replace')}"
+                    )
+                return response
+        raise RegistryError(f"{method} {URL(url).path} 认证失败")
+
+    def _registry_url(self, repository: str, path: str) -> URL:
+        return URL(f"{self.base_url.rstrip('/')}/v2/{repository}/{path}")
+
+    async def blob_exists(self, repository: str, digest: str) -> bool:
+        """检查Harbor中是否已有该层（HEAD blob）"""
+        response = await self._registry_request(
+            "HEAD", repository, self._registry_url(repository, f"blobs/{digest}"), (200, 404)
+        )
+        return response.status == 200
+
+    async def upload_blob(
+        self, repository: str, digest: str, path: Path, offset: int, size: int, on_chunk=None
+    ):
+        """把文件中的一段数据作为blob整体上传"""
+        response = await self._registry_request(
+            "POST", repository, self._registry_url(repository, "blobs/uploads/"), (202,)
+        )
+        location = response.headers.get("Location")
+        if not location:
+            raise RegistryError("Registry未返回上传地址")
+        upload_url = URL(self.base_url).join(URL(location)).update_query(digest=digest)
+
+        await self._registry_request(
+            "PUT",
+            repository,
+            upload_url,
+            (201,),
+            data_factory=lambda: _read_file_range(path, offset, size, on_chunk),
+            headers={
+                "Content-Type": "application/octet-stream",
+                "Content-Length": str(size),
+            },
+        )
+
+    async def put_manifest(
+        self, repository: str, reference: str, manifest: bytes, media_type: str
+    ) -> str:
+        """上传镜像清单，返回清单摘要"""
+        response = await self._registry_request(
+            "PUT",
+            repository,
+            self._registry_url(repository, f"manifests/{reference}"),
+            (200, 201),
+            data_factory=lambda: manifest,
+            headers={"Content-Type": media_type},
+        )
+        return response.headers.get("Docker-Content-Digest") or (
+            f"sha256:{hashlib.sha256(manifest).hexdigest()}"
+        )
+
+    async def layered_push_image_from_tar(
+        self,
+        project_name: str,
+        repository_name: str,
+        tag: str,
+        tar_file: SpooledTar,
+        progress_callback=None,
+    ) -> Dict:
+        """按层推送镜像
+
+        先对每个层做 HEAD 检查，只上传Harbor中不存在的层（多个层并行），最后上传清单。
+        同一项目内不同镜像、不同版本共享的基础层只需上传一次
+        """
+        repository = f"{project_name}/{repository_name}"
+        loop = asyncio.get_event_loop()
+
+        async def report(percent: int, stage: str):
+            if progress_callback:
+                await progress_callback(percent, stage)
+
+        # 1. 读取清单和各层在tar中的位置
+        await report(5, "解析镜像层...")
+        plan = await loop.run_in_executor(
+            None, read_push_plan, tar_file.path, tar_file.members
+        )
+        blobs = list({blob["digest"]: blob for blob in plan["blobs"]}.values())
+
+        # 2. 检查Harbor中已有的层
+        await report(8, f"检查Harbor中已有的镜像层 ({len(blobs)} 个blob)...")
+        semaphore = asyncio.Semaphore(settings.harbor_layer_push_concurrency * 2)
+
+        async def check(blob):
+            async with semaphore:
+                return await self.blob_exists(repository, blob["digest"])
+
+        exists = await asyncio.gather(*(check(blob) for blob in blobs))
+        missing = [blob for blob, found in zip(blobs, exists) if not found]
+        # 进度信息按镜像层统计（配置blob不计入）
+        layers_total = sum(1 for blob in blobs if blob["kind"] == "layer")
+        layers_missing = sum(1 for blob in missing if blob["kind"] == "layer")
+        reused = layers_total - layers_missing
+        total_bytes = sum(blob["size"] for blob in missing)
+        reused_bytes = sum(blob["size"] for blob, found in zip(blobs, exists) if found)
+        logger.info(
+            f"按层推送 {repository}:{tag}: 共 {layers_total} 层，复用 {reused} 层 "
+            f"({reused_bytes} bytes)，需上传 {len(missing)} 个blob ({total_bytes} bytes)"
+        )
+
+        # 3. 并行上传缺失的层，按层汇报进度
+        sent: Dict[str, int] = {blob["digest"]: 0 for blob in missing}
+        completed: List[str] = []
+        upload_semaphore = asyncio.Semaphore(settings.harbor_layer_push_concurrency)
+
+        async def upload(blob):
+            digest = blob["digest"]
+            async with upload_semaphore:
+                for attempt in range(1, 4):
+                    sent[digest] = 0
+
+                    def on_chunk(n, digest=digest):
+                        sent[digest] += n
+
+                    try:
+                        await self.upload_blob(
+                            repository,
+                            digest,
+                            tar_file.path,
+                            blob["offset"],
+                            blob["size"],
+                            on_chunk,
+                        )
+                        break
+                    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                        if attempt == 3:
+                            raise RegistryError(f"上传层 {digest[:19]} 失败: {e}")
+                        logger.warning(f"上传层 {digest[:19]} 失败，重试第 {attempt} 次: {e}")
+                        await asyncio.sleep(2 * attempt)
+            completed.append(digest)
+            logger.info(f"层上传完成 {digest[:19]} ({blob['size']} bytes)")
+
+        def progress_state():
+            uploaded = sum(sent.values())
+            percent = 10 + int(85 * uploaded / total_bytes) if total_bytes else 95
+            active = [
+                f"{blob['digest'][7:19]} {sent[blob['digest']] * 100 // max(blob['size'], 1)}%"
+                for blob in missing
+                if blob["digest"] not in completed and sent[blob["digest"]]
+            ]
+            done_layers = sum(
+                1 for blob in missing if blob["kind"] == "layer" and blob["digest"] in completed
+            )
+            stage = f"上传镜像层 {done_layers}/{layers_missing}（复用 {reused} 层）"
+            if active:
+                stage += ": " + ", ".join(active)
+            return percent, stage
+
+        async def report_loop():
+            while True:
+                await asyncio.sleep(1)
+                await report(*progress_state())
+
+        started = time.monotonic()
+        if missing:
+            uploads = asyncio.ensure_future(
+                asyncio.gather(*(upload(blob) for blob in missing))
+            )
+            reporter = asyncio.ensure_future(report_loop())
+            try:
+                done, _ = await asyncio.wait(
+                    {uploads, reporter}, return_when=asyncio.FIRST_COMPLETED
+                )
+                # 进度回调抛出异常（例如任务被取消）时中止上传
+                if reporter in done:
+                    uploads.cancel()
+                    reporter.result()
+                await uploads
+            finally:
+                reporter.cancel()
+                if not uploads.done():
+                    uploads.cancel()
+            await report(*progress_state())
+
+        # 4. 上传清单
+        await report(96, "上传镜像清单...")
+        manifest_digest = await self.put_manifest(
+            repository, tag, plan["manifest"], plan["manifest_media_type"]
+        )
+        elapsed = time.monotonic() - started
+        image_size = sum(blob["size"] for blob in blobs)
+        await report(100, f"推送完成（上传 {layers_missing} 层，复用 {reused} 层）")
+        logger.info(
+            f"按层推送成功 {repository}:{tag} -> {manifest_digest}，"
+            f"上传 {total_bytes} bytes，耗时 {elapsed:.1f}s"
+        )
+
+        return {
+            "status": "success",
+            "method": "registry_layer_push",
+            "image": f"{repository}:{tag}",
+            "full_name": f"{repository}:{tag}",
+            "digest": manifest_digest,
+            "size": image_size,
+            "layers_total": layers_total,
+            "layers_uploaded": layers_missing,
+            "layers_reused": reused,
+            "bytes_uploaded": total_bytes,
+            "message": f"镜像推送成功（上传 {layers_missing} 层，复用 {reused} 层）",
+        }
+
     # ================== 工具方法 ==================
 
     def normalize_repository_name(self, name: str) -> str:
@@ -222,57 +564,99 @@ class HarborClient:
 
     # ================== 镜像一致性检查和清理 ==================
 
+    @staticmethod
+    def _repository_path(repository_name: str) -> str:
+        """API路径中的仓库名，多级仓库名中的 / 需要二次编码"""
+        return repository_name.replace("/", "%252F")
+
+    @staticmethod
+    def _build_image_info(
+        project_name: str, repository_name: str, artifact: Dict
+    ) -> Dict:
+        """由artifact构建镜像信息"""
+        return {
+            "project_name": project_name,
+            "repository_name": repository_name,
+            "digest": artifact["digest"],
+            "size": artifact.get("size", 0),
+            "push_time": artifact.get("push_time"),
+            "pull_time": artifact.get("pull_time"),
+            "tags": [tag["name"] for tag in artifact.get("tags") or []],
+            "full_repository_name": f"{project_name}/{repository_name}",
+            "harbor_storage_path": repository_name,  # Harbor中的存储路径
+            "artifact_info": artifact,
+        }
+
+    async def crawl_repository(
+        self, project_name: str, repository_name: str, etag: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """抓取单个仓库的artifacts（含标签）
+
+        传入上次的ETag时，Harbor返回304则 not_modified 为True、images 为空
+        """
+        artifacts, new_etag, not_modified = await self._list_all(
+            f"/projects/{project_name}/repositories/"
+            f"{self._repository_path(repository_name)}/artifacts",
+            params={"with_tag": "true"},
+            etag=etag,
+        )
+        return {
+            "images": [
+                self._build_image_info(project_name, repository_name, artifact)
+                for artifact in artifacts
+            ],
+            "etag": new_etag,
+            "not_modified": not_modified,
+        }
+
+    async def crawl_repositories(
+        self, project_name: str, repositories: Dict[str, Optional[str]]
+    ) -> Dict[str, Dict[str, Any]]:
+        """并发抓取多个仓库，repositories 为 仓库名 -> 上次的ETag
+
+        抓取失败的仓库不出现在结果中
+        """
+
+        async def crawl(repository_name: str, etag: Optional[str]):
+            try:
+                return repository_name, await self.crawl_repository(
+                    project_name, repository_name, etag
+                )
+            except Exception as e:
+                logger.error(f"获取仓库 {repository_name} 的artifacts失败: {e}")
+                return repository_name, None
+
+        results = await asyncio.gather(
+            *(crawl(name, etag) for name, etag in repositories.items())
+        )
+        return {name: result for name, result in results if result is not None}
+
+    def repository_short_name(self, project_name: str, full_name: str) -> str:
+        """去除仓库名中的项目前缀"""
+        prefix = f"{project_name}/"
+        return full_name[len(prefix):] if full_name.startswith(prefix) else full_name
+
     async def get_all_harbor_images(
         self, project_name: Optional[str] = None
     ) -> List[Dict]:
-        """获取Harbor中所有镜像的完整信息"""
+        """获取Harbor中所有镜像的完整信息（并发抓取所有仓库）"""
         if not project_name:
             project_name = settings.harbor_default_project
 
-        all_images = []
-
         try:
             repositories = await self.list_repositories(project_name)
             logger.info(f"找到 {len(repositories)} 个仓库")
 
-            for repo in repositories:
-                # 提取仓库名（去除项目前缀）
-                repo_name = (
-                    repo["name"].split("/")[-1] if "/" in repo["name"] else repo["name"]
-                )
-
-                try:
-                    artifacts = await self.list_artifacts(project_name, repo_name)
-                    logger.info(f"仓库 {repo_name} 包含 {len(artifacts)} 个artifacts")
-
-                    for artifact in artifacts:
-                        # 获取artifact的标签
-                        tags = await self.get_artifact_tags(
-                            project_name, repo_name, artifact["digest"]
-                        )
-
-                        # 构建镜像信息
-                        image_info = {
-                            "project_name": project_name,
-                            "repository_name": repo_name,
-                            "digest": artifact["digest"],
-                            "size": artifact.get("size", 0),
-                            "push_time": artifact.get("push_time"),
-                            "pull_time": artifact.get("pull_time"),
-                            "tags": [tag["name"] for tag in tags] if tags else [],
-                            "full_repository_name": f"{project_name}/{repo_name}",
-                            "harbor_storage_path": repo_name,  # Harbor中的存储路径
-                            "artifact_info": artifact,
-                        }
-
-                        all_images.append(image_info)
-
-                except Exception as e:
-                    logger.error(f"获取仓库 {repo_name} 的artifacts失败: {e}")
-                    continue
-
-                # 避免过于频繁的API调用
-                await asyncio.sleep(0.1)
+            crawled = await self.crawl_repositories(
+                project_name,
+                {
+                    self.repository_short_name(project_name, repo["name"]): None
+                    for repo in repositories
+                },
+            )
+            all_images = [
+                image for result in crawled.values() for image in result["images"]
+            ]
 
             logger.info(f"从Harbor获取到 {len(all_images)} 个镜像")
             return all_images
@@ -288,7 +672,8 @@ class HarborClient:
         try:
             result = await self._request(
                 "GET",
-                f"/projects/{project_name}/repositories/{repository_name}/artifacts/{digest}/tags",
+                f"/projects/{project_name}/repositories/"
+                f"{self._repository_path(repository_name)}/artifacts/{digest}/tags",
             )
             return result if result else []
         except Exception as e:
@@ -296,12 +681,15 @@ class HarborClient:
             return []
 
     async def compare_with_database_images(
-        self, db_images: List[Dict]
+        self, db_images: List[Dict], harbor_images: Optional[List[Dict]] = None
     ) -> Dict[str, List]:
-        """比较Harbor镜像与数据库记录，找出孤立镜像"""
+        """比较Harbor镜像与数据库记录，找出孤立镜像
+
+        harbor_images 为空时实时抓取Harbor，否则使用传入的（本地清单中的）镜像列表
+        """
         try:
-            # 获取Harbor中的所有镜像
-            harbor_images = await self.get_all_harbor_images()
+            if harbor_images is None:
+                harbor_images = await self.get_all_harbor_images()
 
             # 构建数据库镜像的Harbor存储路径集合
             db_storage_paths = set()
@@ -380,7 +768,7 @@ class HarborClient:
             f"{'模拟' if dry_run else '开始'}清理 {len(orphan_images)} 个孤立镜像"
         )
 
-        for image in orphan_images:
+        async def cleanup(image: Dict):
             cleanup_results["attempted"] += 1
 
             try:
@@ -392,7 +780,7 @@ class HarborClient:
                     error_msg = f"镜像信息不完整: {image}"
                     cleanup_results["errors"].append(error_msg)
                     cleanup_results["failed"] += 1
-                    continue
+                    return
 
                 if dry_run:
                     logger.info(
@@ -410,9 +798,10 @@ class HarborClient:
                     )
                 else:
                     # 实际删除镜像
-                    success = await self.delete_artifact(
-                        project_name, repository_name, digest
-                    )
+                    async with self._crawl_semaphore:
+                        success = await self.delete_artifact(
+                            project_name, repository_name, digest
+                        )
 
                     if success:
                         logger.info(
@@ -435,28 +824,36 @@ class HarborClient:
                         cleanup_results["errors"].append(error_msg)
                         cleanup_results["failed"] += 1
 
-                # 避免过于频繁的API调用
-                await asyncio.sleep(0.2)
-
             except Exception as e:
                 error_msg = f"处理镜像时出错: {image.get('repository_name', 'unknown')} - {str(e)}"
                 cleanup_results["errors"].append(error_msg)
                 cleanup_results["failed"] += 1
                 logger.error(error_msg)
 
+        await asyncio.gather(*(cleanup(image) for image in orphan_images))
+
         logger.info(
             f"清理完成: 尝试 {cleanup_results['attempted']} 个, 成功 {cleanup_results['succeeded']} 个, 失败 {cleanup_results['failed']} 个"
         )
         return cleanup_results
 
-    async def get_harbor_storage_usage(self) -> Dict[str, Any]:
-        """获取Harbor存储使用情况"""
+    async def get_harbor_storage_usage(
+        self, harbor_images: Optional[List[Dict]] = None
+    ) -> Dict[str, Any]:
+        """获取Harbor存储使用情况
+
+        harbor_images 为空时实时抓取Harbor，否则基于传入的（本地清单中的）镜像列表统计
+        """
         try:
             # 获取系统信息
             system_info = await self._request("GET", "/systeminfo")
 
             # 获取所有项目的镜像
-            all_images = await self.get_all_harbor_images()
+            all_images = (
+                harbor_images
+                if harbor_images is not None
+                else await self.get_all_harbor_images()
+            )
 
             # 计算存储使用情况
             total_size = sum(img.get("size", 0) for img in all_images)
@@ -503,6 +900,76 @@ class HarborClient:
             logger.error(f"Harbor API请求失败: {method} {url} - {e}")
             raise Exception(f"Harbor API请求失败: {e}")
 
+    async def _request_page(
+        self, endpoint: str, params: Dict, etag: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """请求分页列表的一页，返回条目、总数(X-Total-Count)和ETag"""
+        url = f"{self.base_url}/api/v2.0/{endpoint.lstrip('/')}"
+        headers = {"If-None-Match": etag} if etag else None
+
+        try:
+            async with self._crawl_semaphore:
+                async with self.session.get(
+                    url, params=params, headers=headers
+                ) as response:
+                    if response.status == 304:
+                        return {"items": [], "total": None, "etag": etag, "not_modified": True}
+                    if response.status == 404:
+                        return {"items": [], "total": 0, "etag": None, "not_modified": False}
+
+                    response.raise_for_status()
+                    items = await response.json()
+                    total = response.headers.get("X-Total-Count")
+                    return {
+                        "items": items or [],
+                        "total": int(total) if total and total.isdigit() else None,
+                        "etag": response.headers.get("ETag"),
+                        "not_modified": False,
+                    }
+
+        except aiohttp.ClientError as e:
+            logger.error(f"Harbor API请求失败: GET {url} - {e}")
+            raise Exception(f"Harbor API请求失败: {e}")
+
+    async def _list_all(
+        self, endpoint: str, params: Optional[Dict] = None, etag: Optional[str] = None
+    ) -> tuple:
+        """获取分页列表的全部条目，返回 (条目, ETag, 是否未修改)
+
+        首页确定总数后并发获取剩余页；Harbor未返回总数时逐页获取直到不足一页。
+        首页ETag只反映首页内容，因此仅在全部条目都在首页时返回ETag，否则为None
+        """
+        page_size = settings.harbor_page_size
+        params = {**(params or {}), "page_size": page_size}
+
+        first = await self._request_page(endpoint, {**params, "page": 1}, etag)
+        if first["not_modified"]:
+            return [], first["etag"], True
+
+        items = list(first["items"])
+        total = first["total"]
+
+        if total is not None:
+            pages = (total + page_size - 1) // page_size
+            rest = await asyncio.gather(
+                *(
+                    self._request_page(endpoint, {**params, "page": page})
+                    for page in range(2, pages + 1)
+                )
+            )
+            for result in rest:
+                items.extend(result["items"])
+        else:
+            page = 1
+            last = first["items"]
+            while len(last) >= page_size:
+                page += 1
+                last = (await self._request_page(endpoint, {**params, "page": page}))["items"]
+                items.extend(last)
+
+        single_page = len(items) == len(first["items"]) and len(items) < page_size
+        return items, first["etag"] if single_page else None, False
+
     # ================== Harbor API 方法 ==================
 
     async def get_project(self, project_name: str) -> Optional[Dict]:
@@ -519,23 +986,23 @@ class HarborClient:
         return result if result else []
 
     async def list_repositories(self, project_name: str) -> List[Dict]:
-        """列出项目下的仓库"""
-        result = await self._request("GET", f"/projects/{project_name}/repositories")
-        return result if result else []
+        """列出项目下的所有仓库（自动翻页）"""
+        items, _, _ = await self._list_all(f"/projects/{project_name}/repositories")
+        return items
 
     async def get_repository(
         self, project_name: str, repository_name: str
     ) -> Optional[Dict]:
         """获取仓库信息"""
         return await self._request(
-            "GET", f"/projects/{project_name}/repositories/{repository_name}"
+            "GET", f"/projects/{project_name}/repositories/{self._repository_path(repository_name)}"
         )
 
     async def delete_repository(self, project_name: str, repository_name: str) -> bool:
         """删除仓库"""
         try:
             await self._request(
-                "DELETE", f"/projects/{project_name}/repositories/{repository_name}"
+                "DELETE", f"/projects/{project_name}/repositories/{self._repository_path(repository_name)}"
             )
             logger.info(f"删除Harbor仓库成功: {project_name}/{repository_name}")
             return True
@@ -546,11 +1013,12 @@ class HarborClient:
     async def list_artifacts(
         self, project_name: str, repository_name: str
     ) -> List[Dict]:
-        """列出仓库的所有artifacts（镜像）"""
-        result = await self._request(
-            "GET", f"/projects/{project_name}/repositories/{repository_name}/artifacts"
+        """列出仓库的所有artifacts（镜像，自动翻页）"""
+        items, _, _ = await self._list_all(
+            f"/projects/{project_name}/repositories/"
+            f"{self._repository_path(repository_name)}/artifacts"
         )
-        return result if result else []
+        return items
 
     async def delete_artifact(
         self, project_name: str, repository_name: str, tag: str
@@ -559,7 +1027,7 @@ class HarborClient:
         try:
             await self._request(
                 "DELETE",
-                f"/projects/{project_name}/repositories/{repository_name}/artifacts/{tag}",
+                f"/projects/{project_name}/repositories/{self._repository_path(repository_name)}/artifacts/{tag}",
             )
             return True
         except Exception:
@@ -571,7 +1039,7 @@ class HarborClient:
         """获取镜像制品信息"""
         return await self._request(
             "GET",
-            f"/projects/{project_name}/repositories/{repository_name}/artifacts/{tag}",
+            f"/projects/{project_name}/repositories/{self._repository_path(repository_name)}/artifacts/{tag}",
         )
 
     # ================== 镜像扫描 ==================
@@ -584,7 +1052,7 @@ class HarborClient:
 
         result = await self._request(
             "POST",
-            f"/projects/{project_name}/repositories/{repository_name}/artifacts/{tag}/scan",
+            f"/projects/{project_name}/repositories/{self._repository_path(repository_name)}/artifacts/{tag}/scan",
             json=scan_data,
         )
         return result if result else {}
@@ -595,7 +1063,7 @@ class HarborClient:
         """获取镜像扫描结果"""
         return await self._request(
             "GET",
-            f"/projects/{project_name}/repositories/{repository_name}/artifacts/{tag}/scan/vulnerabilities",
+            f"/projects/{project_name}/repositories/{self._repository_path(repository_name)}/artifacts/{tag}/scan/vulnerabilities",
         )
 
     # ================== 连接和工具方法 ==================
@@ -609,6 +1077,22 @@ class HarborClient:
             logger.error(f"Harbor连接测试失败: {e}")
             return False
 
+    async def check_harbor_connectivity(self) -> Dict[str, Any]:
+        """检查Harbor连接状态"""
+        try:
+            system_info = await self._request("GET", "/systeminfo")
+            if system_info is None:
+                return {"status": "disconnected", "message": "Harbor系统信息接口不可用"}
+            return {
+                "status": "connected",
+                "message": "Harbor连接正常",
+                "harbor_version": system_info.get("harbor_version", "unknown"),
+                "registry_url": self.base_url,
+            }
+        except Exception as e:
+            logger.error(f"Harbor连接检查失败: {e}")
+            return {"status": "disconnected", "message": str(e)}
+
     def generate_image_name(
         self, username: str, repo_name: str, tag: str = "latest"
     ) -> str:
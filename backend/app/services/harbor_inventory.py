@@ -0,0 +1,197 @@
+"""
+Harbor镜像清单同步服务
+
+将Harbor中的仓库和artifact增量同步到本地清单表：
+- 仓库的 update_time / artifact_count 与上次同步一致时跳过，不再抓取其artifacts
+- 发生变化的仓库并发抓取（artifact不超过一页时带上次的ETag，Harbor返回304时同样跳过）
+- Harbor中已不存在的仓库从清单中删除
+一致性检查、孤立镜像清理和存储统计基于本地清单完成，不再每次全量遍历Harbor
+"""
+
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import select, delete, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.harbor_inventory import HarborRepositoryState, HarborArtifact
+from app.services.harbor_client import HarborClient
+from app.utils.logger import logger
+
+
+class HarborInventoryService:
+    """Harbor镜像清单服务"""
+
+    def __init__(self):
+        # 同一进程内的同步串行执行，避免并发写入同一仓库的清单
+        self._sync_lock = asyncio.Lock()
+
+    async def sync(
+        self,
+        db: AsyncSession,
+        harbor: HarborClient,
+        project_name: Optional[str] = None,
+        force: bool = False,
+    ) -> Dict[str, Any]:
+        """增量同步项目的镜像清单，force 为True时重新抓取所有仓库"""
+        project_name = project_name or settings.harbor_default_project
+        started = time.monotonic()
+
+        async with self._sync_lock:
+            repositories = await harbor.list_repositories(project_name)
+            current = {
+                harbor.repository_short_name(project_name, repo["name"]): repo
+                for repo in repositories
+            }
+
+            result = await db.execute(
+                select(HarborRepositoryState).where(
+                    HarborRepositoryState.project_name == project_name
+                )
+            )
+            states = {state.repository_name: state for state in result.scalars().all()}
+
+            # 找出需要重新抓取的仓库
+            changed = {}
+            for name, repo in current.items():
+                state = states.get(name)
+                if (
+                    force
+                    or state is None
+                    or state.update_time != repo.get("update_time")
+                    or state.artifact_count != repo.get("artifact_count", 0)
+                ):
+                    # ETag只覆盖首页，artifact数超过一页时必须完整抓取
+                    fits_one_page = repo.get("artifact_count", 0) < settings.harbor_page_size
+                    changed[name] = (
+                        state.artifacts_etag
+                        if state is not None and not force and fits_one_page
+                        else None
+                    )
+
+            crawled = await harbor.crawl_repositories(project_name, changed)
+
+            artifacts_written = 0
+            for name, crawl in crawled.items():
+                repo = current[name]
+                if not crawl["not_modified"]:
+                    await db.execute(
+                        delete(HarborArtifact).where(
+                            and_(
+                                HarborArtifact.project_name == project_name,
+                                HarborArtifact.repository_name == name,
+                            )
+                        )
+                    )
+                    for image in crawl["images"]:
+                        db.add(
+                            HarborArtifact(
+                                project_name=project_name,
+                                repository_name=name,
+                                digest=image["digest"],
+                                size=image["size"] or 0,
+                                tags=image["tags"],
+                                push_time=image["push_time"],
+                                pull_time=image["pull_time"],
+                                artifact_info=image["artifact_info"],
+                            )
+                        )
+                    artifacts_written += len(crawl["images"])
+
+                state = states.get(name)
+                if state is None:
+                    state = HarborRepositoryState(
+                        project_name=project_name, repository_name=name
+                    )
+                    db.add(state)
+                state.update_time = repo.get("update_time")
+                state.artifact_count = repo.get("artifact_count", 0)
+                state.artifacts_etag = crawl["etag"]
+
+            # 删除Harbor中已不存在的仓库
+            removed = [name for name in states if name not in current]
+            if removed:
+                await db.execute(
+                    delete(HarborArtifact).where(
+                        and_(
+                            HarborArtifact.project_name == project_name,
+                            HarborArtifact.repository_name.in_(removed),
+                        )
+                    )
+                )
+                await db.execute(
+                    delete(HarborRepositoryState).where(
+                        and_(
+                            HarborRepositoryState.project_name == project_name,
+                            HarborRepositoryState.repository_name.in_(removed),
+                        )
+                    )
+                )
+
+            await db.commit()
+
+        summary = {
+            "project_name": project_name,
+            "repositories": len(current),
+            "changed": len(changed),
+            "crawled": len(crawled),
+            "failed": len(changed) - len(crawled),
+            "removed": len(removed),
+            "artifacts_written": artifacts_written,
+            "duration_seconds": round(time.monotonic() - started, 2),
+        }
+        logger.info(
+            f"Harbor镜像清单同步完成: 仓库 {summary['repositories']} 个, 变化 {summary['changed']} 个, "
+            f"抓取失败 {summary['failed']} 个, 删除 {summary['removed']} 个, 耗时 {summary['duration_seconds']}s"
+        )
+        return summary
+
+    async def get_images(
+        self, db: AsyncSession, project_name: Optional[str] = None
+    ) -> List[Dict]:
+        """从本地清单读取镜像列表，结构与 HarborClient.get_all_harbor_images 一致"""
+        project_name = project_name or settings.harbor_default_project
+        result = await db.execute(
+            select(HarborArtifact)
+            .where(HarborArtifact.project_name == project_name)
+            .order_by(HarborArtifact.repository_name, HarborArtifact.push_time)
+        )
+        return [artifact.to_image_info() for artifact in result.scalars().all()]
+
+    async def remove_images(self, db: AsyncSession, images: List[Dict]) -> int:
+        """从清单中移除已在Harbor删除的镜像
+
+        对应仓库的同步状态一并清除，下次同步时重新抓取
+        """
+        removed = 0
+        for image in images:
+            result = await db.execute(
+                delete(HarborArtifact).where(
+                    and_(
+                        HarborArtifact.project_name == image["project_name"],
+                        HarborArtifact.repository_name == image["repository_name"],
+                        HarborArtifact.digest == image["digest"],
+                    )
+                )
+            )
+            removed += result.rowcount or 0
+
+        repositories = {(image["project_name"], image["repository_name"]) for image in images}
+        for project_name, repository_name in repositories:
+            await db.execute(
+                delete(HarborRepositoryState).where(
+                    and_(
+                        HarborRepositoryState.project_name == project_name,
+                        HarborRepositoryState.repository_name == repository_name,
+                    )
+                )
+            )
+
+        await db.commit()
+        return removed
+
+
+# 全局清单服务实例
+harbor_inventory = HarborInventoryService()
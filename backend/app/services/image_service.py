@@ -3,9 +3,8 @@
 负责协调Harbor、mManager和数据库之间的镜像操作
 """
 
-import asyncio
 import tempfile
-from typing import Dict, List, Optional, BinaryIO
+from typing import AsyncIterator, Dict, List, Optional, BinaryIO, Union
 from pathlib import Path
 from datetime import datetime
 
@@ -19,9 +18,16 @@ from app.models.repository import Repository
 from app.models.service import ModelService
 from app.services.harbor_client import HarborClient
 from app.services.mmanager_client import mmanager_client
+from app.services.job_queue import job_queue, JobContext, JobFailed
+from app.database import AsyncSessionLocal
 from app.utils.logger import logger
+from app.utils.skopeo_pusher import SkopeoPusher
+from app.utils.tar_ingest import SpooledTar
 from app.config import settings
 
+HARBOR_PUSH_JOB = "image.harbor_push"
+SERVICE_FROM_TAR_JOB = "service.create_from_tar"
+
 
 class ImageManagementService:
     """镜像管理服务 - 三层架构的协调中心"""
@@ -38,7 +44,7 @@ class ImageManagementService:
         self,
         db: AsyncSession,
         repository_id: int,
-        tar_file: UploadFile,
+        tar_file: Union[UploadFile, AsyncIterator[bytes], SpooledTar],
         image_name: str,
         tag: str = "latest",
         description: str = "",
@@ -46,7 +52,12 @@ class ImageManagementService:
     ) -> Dict:
         """
         从tar文件上传镜像到Harbor，并记录到数据库
+
+        tar_file 可以是 UploadFile 或请求体的异步迭代器；数据只落盘一次（skopeo可读的目录），
+        落盘时同时计算sha256并解析 manifest.json，之后的推送直接使用该文件。
+        也可以是续传会话已落盘的 SpooledTar，此时失败不删除文件，会话可以重试
         """
+        spooled = None
         try:
             # 1. 验证仓库和权限
             repository = await self._get_repository_with_validation(
@@ -71,7 +82,23 @@ class ImageManagementService:
             if existing_image.scalar_one_or_none():
                 raise Exception(f"镜像 {image_name}:{tag} 已存在")
 
-            # 4. 创建数据库记录
+            # 4. 落盘并校验镜像包结构（非tar数据在首个数据块即中止接收）
+            pusher = SkopeoPusher()
+            if isinstance(tar_file, SpooledTar):
+                tar = tar_file
+            else:
+                spooled = tar = await pusher.ingest(
+                    tar_file, max_size=settings.image_upload_max_bytes, fail_fast=True
+                )
+            archive_info = await pusher.get_image_info_from_tar(tar)
+            if archive_info["status"] != "success":
+                raise Exception(f"无效的镜像tar包: {archive_info['message']}")
+            logger.info(
+                f"镜像包校验通过: {archive_info['layers_count']} 层, "
+                f"{archive_info['size']} bytes, sha256 {tar.sha256[:12]}"
+            )
+
+            # 5. 创建数据库记录
             project_name = repository.owner.username  # 使用用户名作为Harbor项目名
             harbor_repository = f"{repository.name}/{image_name}"
 
@@ -88,18 +115,30 @@ class ImageManagementService:
             )
 
             db.add(image_record)
-            await db.commit()
-            await db.refresh(image_record)
-
-            # 5. 异步上传到Harbor
-            upload_task = asyncio.create_task(
-                self._upload_to_harbor_async(
-                    db, image_record.id, tar_file, project_name, harbor_repository, tag
-                )
+            await db.flush()
+
+            # 6. 提交推送任务（与镜像记录在同一事务中写入，落盘文件由任务结束时清理）
+            job = await job_queue.enqueue(
+                db,
+                HARBOR_PUSH_JOB,
+                {
+                    "image_id": image_record.id,
+                    "tar": tar.to_dict(),
+                    "project": project_name,
+                    "repository": harbor_repository,
+                    "tag": tag,
+                },
+                created_by=user_id,
+                resource_type="image",
+                resource_id=image_record.id,
+                commit=False,
             )
+            await db.commit()
+            spooled = None
 
             return {
                 "image_id": image_record.id,
+                "job_id": job.id,
                 "name": image_name,
                 "tag": tag,
                 "status": "uploading",
@@ -108,114 +147,249 @@ class ImageManagementService:
 
         except Exception as e:
             logger.error(f"镜像上传失败: {e}")
+            if spooled:
+                spooled.cleanup()
             raise
 
-    async def _upload_to_harbor_async(
+    async def _push_spooled_image(
         self,
+        ctx: JobContext,
         db: AsyncSession,
         image_id: int,
-        tar_file: UploadFile,
+        tar_file: SpooledTar,
         project_name: str,
         repository_name: str,
         tag: str,
-    ):
-        """异步上传镜像到Harbor"""
+        progress_span: int = 100,
+    ) -> Dict:
+        """将落盘的tar包推送到Harbor，同步更新任务和镜像进度，成功后标记镜像就绪
+
+        推送进度映射到任务进度的 0~progress_span；实时进度通过任务推送，
+        镜像记录的 upload_progress 只在每跨过10%时写库
+        """
+        persisted = {"bucket": -1}
 
         async def progress_callback(progress, stage):
             """更新上传进度"""
+            percent = progress if isinstance(progress, int) else 50
+            await ctx.progress(percent * progress_span // 100, stage)
+            bucket = percent // 10
+            if bucket == persisted["bucket"]:
+                return
+            persisted["bucket"] = bucket
             try:
                 await db.execute(
                     update(Image)
                     .where(Image.id == image_id)
-                    .values(
-                        upload_progress=progress if isinstance(progress, int) else 50,
-                        updated_at=datetime.utcnow(),
-                    )
+                    .values(upload_progress=percent, updated_at=datetime.utcnow())
                 )
                 await db.commit()
                 logger.debug(f"镜像 {image_id} 上传进度: {progress}% - {stage}")
             except Exception as e:
                 logger.warning(f"更新上传进度失败: {e}")
 
-        try:
-            # 重置文件指针
-            await tar_file.seek(0)
+        if not tar_file.path.exists():
+            raise JobFailed(f"镜像 {image_id} 的tar包已不存在: {tar_file.path}")
 
-            # 记录开始上传
-            await self._add_build_log(
-                db, image_id, "upload", "开始上传镜像到Harbor", "info"
+        # 记录开始上传
+        await self._add_build_log(
+            db,
+            image_id,
+            "upload",
+            f"开始上传镜像到Harbor (第 {ctx.attempt} 次)",
+            "info",
+        )
+
+        async with HarborClient() as harbor:
+            result = await harbor.push_image_from_tar(
+                project_name, repository_name, tag, tar_file, progress_callback
             )
 
-            # 上传到Harbor
-            async with HarborClient() as harbor:
-                result = await harbor.push_image_from_tar(
-                    project_name, repository_name, tag, tar_file.file, progress_callback
-                )
+        # 验证上传结果
+        if result.get("status") != "success":
+            message = result.get("message") or result
+            await self._add_build_log(
+                db, image_id, "upload", f"镜像上传失败: {message}", "warning"
+            )
+            raise Exception(f"Harbor返回失败状态: {message}")
+
+        # 更新数据库记录
+        await db.execute(
+            update(Image)
+            .where(Image.id == image_id)
+            .values(
+                status="ready",
+                upload_progress=100,
+                harbor_digest=result.get("digest"),
+                harbor_size=result.get("size"),
+                error_message=None,
+                updated_at=datetime.utcnow(),
+            )
+        )
+        await db.commit()
 
-                # 验证上传结果
-                if result.get("status") != "success":
-                    raise Exception(f"Harbor返回失败状态: {result}")
+        # 记录成功日志
+        await self._add_build_log(
+            db,
+            image_id,
+            "upload",
+            f"镜像上传成功 - 大小: {result.get('size', 'unknown')}, 摘要: {(result.get('digest') or 'unknown')[:12]}...",
+            "info",
+        )
+        logger.info(f"镜像 {image_id} 上传成功: {result.get('full_name')}")
+        return result
+
+    async def run_harbor_push_job(self, ctx: JobContext) -> Dict:
+        """后台任务：将落盘的tar包推送到Harbor并更新镜像记录（使用独立的数据库会话）"""
+        payload = ctx.payload
+        async with AsyncSessionLocal() as db:
+            result = await self._push_spooled_image(
+                ctx,
+                db,
+                payload["image_id"],
+                SpooledTar.from_dict(payload["tar"]),
+                payload["project"],
+                payload["repository"],
+                payload["tag"],
+            )
+        return {
+            "image_id": payload["image_id"],
+            "digest": result.get("digest"),
+            "size": result.get("size"),
+        }
 
-                # 更新数据库记录
-                await db.execute(
-                    update(Image)
-                    .where(Image.id == image_id)
-                    .values(
-                        status="ready",
-                        upload_progress=100,
-                        harbor_digest=result.get("digest"),
-                        harbor_size=result.get("size"),
-                        error_message=None,
-                        updated_at=datetime.utcnow(),
+    async def finish_harbor_push_job(
+        self, payload: Dict, status: str, error: Optional[str]
+    ):
+        """推送任务结束：失败或取消时标记镜像状态，并删除落盘的tar包"""
+        image_id = payload["image_id"]
+        try:
+            if status != "succeeded":
+                error_msg = error or "镜像上传已取消"
+                logger.error(f"镜像 {image_id} 上传失败: {error_msg}")
+                async with AsyncSessionLocal() as db:
+                    await db.execute(
+                        update(Image)
+                        .where(Image.id == image_id)
+                        .values(
+                            status="failed",
+                            error_message=error_msg,
+                            updated_at=datetime.utcnow(),
+                        )
                     )
-                )
-                await db.commit()
+                    await db.commit()
+                    await self._add_build_log(
+                        db, image_id, "upload", f"镜像上传失败: {error_msg}", "error"
+                    )
+        except Exception as db_error:
+            logger.error(f"更新镜像失败状态时出错: {db_error}")
+        finally:
+            # 删除落盘的tar包
+            SpooledTar.from_dict(payload["tar"]).cleanup()
+
+    # ================== 服务创建协调 ==================
+
+    async def run_service_from_tar_job(self, ctx: JobContext) -> Dict:
+        """后台任务：推送Docker tar包到Harbor，再基于该镜像创建服务并上传可选的examples"""
+        from app.schemas.service import ServiceCreate
+        from app.services.model_service import service_manager
+        from app.services.container_service import container_file_service
+
+        payload = ctx.payload
+        image_id = payload["image_id"]
+
+        async with AsyncSessionLocal() as db:
+            image = await db.get(Image, image_id)
+            if image is None:
+                raise JobFailed(f"镜像 {image_id} 不存在")
 
-                # 记录成功日志
-                await self._add_build_log(
+            # 1. 推送镜像（重试时镜像已就绪则跳过）
+            if image.status != "ready":
+                await self._push_spooled_image(
+                    ctx,
                     db,
                     image_id,
-                    "upload",
-                    f"镜像上传成功 - 大小: {result.get('size', 'unknown')}, 摘要: {result.get('digest', 'unknown')[:12]}...",
-                    "info",
+                    SpooledTar.from_dict(payload["tar"]),
+                    payload["project"],
+                    image.harbor_repository_path,
+                    payload["tag"],
+                    progress_span=80,
                 )
 
-                logger.info(f"镜像 {image_id} 上传成功: {result.get('full_name')}")
+            # 2. 创建服务并关联到镜像（服务名称将根据镜像信息自动生成）
+            ctx.check_cancelled()
+            service_id = payload.get("service_id")
+            if service_id is None:
+                await ctx.progress(80, "镜像上传完成，正在创建服务")
 
-        except Exception as e:
-            error_msg = str(e)
-            logger.error(f"镜像 {image_id} 上传失败: {error_msg}")
+                async def creation_progress(percent: int, step: str):
+                    # 创建过程中已分配端口等资源，不在这里中断
+                    await ctx.progress(80 + percent * 15 // 100, step, interruptible=False)
 
-            try:
-                # 更新失败状态
-                await db.execute(
-                    update(Image)
-                    .where(Image.id == image_id)
-                    .values(
-                        status="failed",
-                        error_message=error_msg,
-                        updated_at=datetime.utcnow(),
-                    )
+                service_response = await service_manager.create_service(
+                    db,
+                    ServiceCreate(image_id=image_id, **payload["service"]),
+                    payload["repository_id"],
+                    payload["user_id"],
+                    progress_callback=creation_progress,
                 )
-                await db.commit()
-
-                # 记录错误日志
-                await self._add_build_log(
-                    db, image_id, "upload", f"镜像上传失败: {error_msg}", "error"
+                service_id = service_response.id
+                # 记录已创建的服务，重试时不再重复创建
+                payload["service_id"] = service_id
+                await ctx.save_payload()
+                logger.info(
+                    f"服务创建成功: service_id={service_id}, service_name={service_response.service_name}"
                 )
 
-            except Exception as db_error:
-                logger.error(f"更新镜像失败状态时出错: {db_error}")
+            # 3. 上传examples（失败不影响服务创建）
+            examples_uploaded = False
+            examples = payload.get("examples")
+            if examples:
+                await ctx.progress(95, "正在上传examples文件")
+                upload = job_queue.open_spooled_upload(examples)
+                try:
+                    await container_file_service.update_service_files(
+                        db, service_id, {"examples": upload}, payload["user_id"]
+                    )
+                    await db.commit()
+                    examples_uploaded = True
+                except Exception as e:
+                    await db.rollback()
+                    logger.warning(f"上传examples文件失败，但服务创建成功: {e}")
+                finally:
+                    await upload.close()
+
+        return {
+            "image_id": image_id,
+            "service_id": service_id,
+            "examples_uploaded": examples_uploaded,
+        }
 
+    async def finish_service_from_tar_job(
+        self, payload: Dict, status: str, error: Optional[str]
+    ):
+        """基于tar包创建服务的任务结束：镜像上传失败时处理镜像记录，并清理落盘文件"""
+        image_id = payload["image_id"]
+        try:
+            if status != "succeeded":
+                async with AsyncSessionLocal() as db:
+                    image = await db.get(Image, image_id)
+                    if image is not None and image.status != "ready":
+                        if payload.get("overwrite"):
+                            # 覆盖上传失败，保留记录但标记为失败
+                            image.status = "failed"
+                            image.error_message = error or "镜像上传已取消"
+                            logger.info(f"覆盖上传失败，已标记镜像为失败状态: id={image_id}")
+                        else:
+                            # 新镜像上传失败，删除记录
+                            await db.delete(image)
+                            logger.info(f"新镜像上传失败，已删除记录: id={image_id}")
+                        await db.commit()
+        except Exception as db_error:
+            logger.error(f"处理镜像 {image_id} 失败状态时出错: {db_error}")
         finally:
-            # 确保文件资源被释放
-            try:
-                if hasattr(tar_file, "file") and hasattr(tar_file.file, "close"):
-                    tar_file.file.close()
-            except Exception:
-                pass
-
-    # ================== 服务创建协调 ==================
+            SpooledTar.from_dict(payload["tar"]).cleanup()
+            job_queue.remove_spooled_upload(payload.get("examples"))
 
     async def create_service_with_image(
         self,
@@ -239,15 +413,15 @@ class ImageManagementService:
                     f"镜像 {image.name}:{image.tag} 无法创建服务（状态: {image.status}，已有服务: {image.service_count}/2）"
                 )
 
-            # 3. 选择最优控制器
+            # 3. 选择最优控制器（优先已缓存该镜像的控制器）
+            full_image_name = image.full_name
             controller_info = await mmanager_client.select_optimal_controller(
-                db, service_config.get("requirements", {})
+                db, {**service_config.get("requirements", {}), "image": full_image_name}
             )
             if not controller_info:
                 raise Exception("没有可用的mManager控制器")
 
             controller_id = controller_info["id"]
-            full_image_name = image.full_name
 
             # 4. 确保镜像在目标控制器上可用
             image_available = await mmanager_client.ensure_image_available(
@@ -471,3 +645,14 @@ class ImageManagementService:
 
 # 全局镜像管理服务实例
 image_management_service = ImageManagementService()
+
+job_queue.register(
+    HARBOR_PUSH_JOB,
+    image_management_service.run_harbor_push_job,
+    on_finished=image_management_service.finish_harbor_push_job,
+)
+job_queue.register(
+    SERVICE_FROM_TAR_JOB,
+    image_management_service.run_service_from_tar_job,
+    on_finished=image_management_service.finish_service_from_tar_job,
+)
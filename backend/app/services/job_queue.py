@@ -0,0 +1,574 @@
+"""
+后台任务队列服务
+基于数据库表 background_jobs 的持久化任务队列：任务提交后写入数据库，由工作进程通过
+SELECT ... FOR UPDATE SKIP LOCKED 认领执行，每个任务使用独立的数据库会话。
+支持失败重试（指数退避）、进度上报、取消，以及工作进程退出后的任务回收。
+状态变化和进度通过 progress_broker 实时推送，进度只按间隔写库
+"""
+
+import asyncio
+import os
+import socket
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set
+
+from fastapi import UploadFile
+from sqlalchemy import select, update, func, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models.job import BackgroundJob
+from app.services.progress_broker import progress_broker, job_topic
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+JOB_STATUSES = ("queued", "running", "succeeded", "failed", "cancelled")
+FINISHED_STATUSES = ("succeeded", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    """任务已被取消"""
+
+
+class JobFailed(Exception):
+    """不可重试的任务失败"""
+
+
+class JobContext:
+    """传给任务处理函数的上下文：参数、进度上报和取消检查"""
+
+    def __init__(self, queue: "JobQueue", job_id: int, payload: Dict[str, Any], attempt: int):
+        self.queue = queue
+        self.job_id = job_id
+        self.payload = payload
+        self.attempt = attempt
+        self.cancelled = False
+        self._last_event = None
+        self._last_persist_at = 0.0
+
+    async def progress(
+        self, percent: int, message: Optional[str] = None, interruptible: bool = True
+    ):
+        """上报进度，任务已取消时抛出 JobCancelled（interruptible 为False时不检查）
+
+        每次变化都实时推送给订阅者，写库按 job_progress_persist_interval 限频
+        """
+        if interruptible:
+            self.check_cancelled()
+        percent = max(0, min(100, int(percent)))
+        if (percent, message) == self._last_event:
+            return
+        self._last_event = (percent, message)
+        await progress_broker.publish(
+            job_topic(self.job_id),
+            {"job_id": self.job_id, "status": "running", "progress": percent, "message": message},
+        )
+
+        now = asyncio.get_event_loop().time()
+        if percent < 100 and now - self._last_persist_at < settings.job_progress_persist_interval:
+            return
+        self._last_persist_at = now
+        values = {"progress": percent}
+        if message is not None:
+            values["message"] = message
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(BackgroundJob).where(BackgroundJob.id == self.job_id).values(**values)
+                )
+                await db.commit()
+        except Exception as e:
+            logger.warning(f"更新任务 {self.job_id} 进度失败: {e}")
+
+    async def save_payload(self):
+        """保存对 payload 的修改（记录已完成的步骤，重试时跳过）"""
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(BackgroundJob)
+                .where(BackgroundJob.id == self.job_id)
+                .values(payload=self.payload)
+            )
+            await db.commit()
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise JobCancelled(f"任务 {self.job_id} 已取消")
+
+
+JobFunc = Callable[[JobContext], Awaitable[Optional[Dict[str, Any]]]]
+# 任务进入终态(succeeded/failed/cancelled)时调用，用于清理落盘文件和更新关联资源状态
+FinishFunc = Callable[[Dict[str, Any], str, Optional[str]], Awaitable[None]]
+
+
+@dataclass
+class JobHandler:
+    func: JobFunc
+    on_finished: Optional[FinishFunc] = None
+    max_attempts: Optional[int] = None
+
+
+class JobQueue:
+    """持久化任务队列"""
+
+    def __init__(self):
+        self.handlers: Dict[str, JobHandler] = {}
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._worker_task: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+
+    # ================== 注册与提交 ==================
+
+    def register(
+        self,
+        job_type: str,
+        func: JobFunc,
+        on_finished: Optional[FinishFunc] = None,
+        max_attempts: Optional[int] = None,
+    ):
+        """注册任务处理函数"""
+        self.handlers[job_type] = JobHandler(func, on_finished, max_attempts)
+
+    def handler(
+        self,
+        job_type: str,
+        on_finished: Optional[FinishFunc] = None,
+        max_attempts: Optional[int] = None,
+    ):
+        """注册任务处理函数的装饰器"""
+
+        def decorator(func: JobFunc) -> JobFunc:
+            self.register(job_type, func, on_finished, max_attempts)
+            return func
+
+        return decorator
+
+    async def enqueue(
+        self,
+        db: AsyncSession,
+        job_type: str,
+        payload: Dict[str, Any],
+        created_by: Optional[int] = None,
+        resource_type: Optional[str] = None,
+        resource_id: Optional[int] = None,
+        max_attempts: Optional[int] = None,
+        commit: bool = True,
+    ) -> BackgroundJob:
+        """提交任务
+
+        Args:
+            db: 数据库会话（与调用方的业务写入在同一事务中提交）
+            job_type: 任务类型
+            payload: 任务参数（需可JSON序列化）
+            created_by: 提交用户ID
+            resource_type/resource_id: 关联资源，用于按资源查询任务
+            max_attempts: 最大执行次数，默认取处理函数注册值或 job_max_attempts
+            commit: 是否立即提交
+        """
+        handler = self.handlers.get(job_type)
+        if handler is None:
+            raise ValueError(f"未注册的任务类型: {job_type}")
+
+        job = BackgroundJob(
+            job_type=job_type,
+            payload=payload,
+            status="queued",
+            progress=0,
+            attempts=0,
+            max_attempts=max_attempts or handler.max_attempts or settings.job_max_attempts,
+            cancel_requested=False,
+            created_by=created_by,
+            resource_type=resource_type,
+            resource_id=resource_id,
+        )
+        db.add(job)
+        if commit:
+            await db.commit()
+            await db.refresh(job)
+        else:
+            await db.flush()
+        logger.info(f"已提交任务 {job.id}: {job_type}")
+        return job
+
+    async def get_job(self, db: AsyncSession, job_id: int) -> Optional[BackgroundJob]:
+        result = await db.execute(select(BackgroundJob).where(BackgroundJob.id == job_id))
+        return result.scalar_one_or_none()
+
+    async def list_jobs(
+        self,
+        db: AsyncSession,
+        created_by: Optional[int] = None,
+        status: Optional[str] = None,
+        resource_type: Optional[str] = None,
+        resource_id: Optional[int] = None,
+        limit: int = 50,
+    ) -> List[BackgroundJob]:
+        query = select(BackgroundJob)
+        if created_by is not None:
+            query = query.where(BackgroundJob.created_by == created_by)
+        if status:
+            query = query.where(BackgroundJob.status == status)
+        if resource_type:
+            query = query.where(BackgroundJob.resource_type == resource_type)
+        if resource_id is not None:
+            query = query.where(BackgroundJob.resource_id == resource_id)
+        result = await db.execute(query.order_by(BackgroundJob.id.desc()).limit(limit))
+        return list(result.scalars().all())
+
+    async def cancel(self, db: AsyncSession, job_id: int) -> Optional[BackgroundJob]:
+        """请求取消任务
+
+        排队中的任务直接标记为已取消；运行中的任务由执行它的工作进程在下一次心跳时中止
+        """
+        job = await self.get_job(db, job_id)
+        if job is None or job.is_finished:
+            return job
+
+        if job.status == "queued":
+            result = await db.execute(
+                update(BackgroundJob)
+                .where(and_(BackgroundJob.id == job_id, BackgroundJob.status == "queued"))
+                .values(
+                    status="cancelled",
+                    cancel_requested=True,
+                    message="任务已取消",
+                    finished_at=func.now(),
+                )
+            )
+            await db.commit()
+            if result.rowcount:
+                await self._run_finish_hook(job.job_type, job.payload, "cancelled", None)
+                await db.refresh(job)
+                await self._publish(job)
+                logger.info(f"任务 {job_id} 已取消")
+                return job
+
+        # 运行中（或刚被认领）的任务
+        await db.execute(
+            update(BackgroundJob)
+            .where(BackgroundJob.id == job_id)
+            .values(cancel_requested=True)
+        )
+        await db.commit()
+        await db.refresh(job)
+        logger.info(f"已请求取消运行中的任务 {job_id}")
+        return job
+
+    def stream_events(
+        self, job_id: int, is_disconnected: Callable[[], Awaitable[bool]]
+    ) -> AsyncIterator[str]:
+        """任务进度的SSE消息流：当前状态快照 + 后续推送，任务结束时关闭"""
+
+        async def snapshot():
+            async with AsyncSessionLocal() as db:
+                job = await self.get_job(db, job_id)
+                return job.to_progress_event() if job else None
+
+        return progress_broker.stream(
+            job_topic(job_id),
+            snapshot,
+            lambda event: event.get("status") in FINISHED_STATUSES,
+            is_disconnected,
+        )
+
+    # ================== 任务附带文件 ==================
+
+    @property
+    def spool_dir(self) -> Path:
+        path = Path(settings.job_spool_dir)
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    async def spool_upload(self, upload: UploadFile, prefix: str = "upload_") -> Dict[str, Any]:
+        """将上传文件落盘到任务目录，返回可写入任务参数的描述"""
+        filename = os.path.basename(upload.filename or "upload")
+        path = self.spool_dir / f"{prefix}{uuid.uuid4().hex}_{filename}"
+
+        def copy():
+            upload.file.seek(0)
+            with open(path, "wb") as f:
+                while True:
+                    chunk = upload.file.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+
+        loop = asyncio.get_event_loop()
+        try:
+            await loop.run_in_executor(None, copy)
+        except BaseException:
+            path.unlink(missing_ok=True)
+            raise
+        return {
+            "path": str(path),
+            "filename": upload.filename,
+            "content_type": upload.content_type,
+        }
+
+    @staticmethod
+    def open_spooled_upload(info: Dict[str, Any]) -> UploadFile:
+        """把落盘的上传文件重新包装为 UploadFile（调用方负责关闭）"""
+        return UploadFile(file=open(info["path"], "rb"), filename=info["filename"])
+
+    @staticmethod
+    def remove_spooled_upload(info: Optional[Dict[str, Any]]):
+        if not info:
+            return
+        try:
+            Path(info["path"]).unlink(missing_ok=True)
+        except Exception as e:
+            logger.warning(f"清理任务文件失败: {e}")
+
+    # ================== 工作进程 ==================
+
+    async def _claim(self) -> Optional[BackgroundJob]:
+        """认领一个可执行的任务"""
+        if not self.handlers:
+            return None
+        async with AsyncSessionLocal() as db:
+            candidate = (
+                select(BackgroundJob.id)
+                .where(
+                    and_(
+                        BackgroundJob.status == "queued",
+                        BackgroundJob.run_after <= func.now(),
+                        BackgroundJob.job_type.in_(list(self.handlers)),
+                    )
+                )
+                .order_by(BackgroundJob.id)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+                .scalar_subquery()
+            )
+            result = await db.execute(
+                update(BackgroundJob)
+                .where(BackgroundJob.id == candidate)
+                .values(
+                    status="running",
+                    attempts=BackgroundJob.attempts + 1,
+                    locked_by=self.worker_id,
+                    locked_at=func.now(),
+                    started_at=func.coalesce(BackgroundJob.started_at, func.now()),
+                    error=None,
+                )
+                .returning(BackgroundJob)
+                .execution_options(synchronize_session=False)
+            )
+            job = result.scalar_one_or_none()
+            await db.commit()
+        if job is not None:
+            await self._publish(job)
+        return job
+
+    async def _recover_stale(self):
+        """回收心跳超时的运行中任务（执行它的工作进程已退出）"""
+        deadline = datetime.now(timezone.utc) - timedelta(seconds=settings.job_lock_timeout)
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(BackgroundJob)
+                .where(and_(BackgroundJob.status == "running", BackgroundJob.locked_at < deadline))
+                .with_for_update(skip_locked=True)
+            )
+            stale = result.scalars().all()
+            finished = []
+            for job in stale:
+                logger.warning(f"任务 {job.id} 的工作进程 {job.locked_by} 已失去心跳，回收任务")
+                job.locked_by = None
+                job.locked_at = None
+                if job.cancel_requested:
+                    job.status = "cancelled"
+                    job.finished_at = datetime.now(timezone.utc)
+                    finished.append((job, "cancelled"))
+                elif job.attempts >= job.max_attempts:
+                    job.status = "failed"
+                    job.error = "工作进程退出，已达到最大执行次数"
+                    job.finished_at = datetime.now(timezone.utc)
+                    finished.append((job, "failed"))
+                else:
+                    job.status = "queued"
+                    job.run_after = datetime.now(timezone.utc)
+            await db.commit()
+
+        for job in stale:
+            await self._publish(job)
+        for job, status in finished:
+            await self._run_finish_hook(job.job_type, job.payload, status, job.error)
+
+    async def _heartbeat(self, ctx: JobContext, task: asyncio.Task):
+        """定期刷新认领时间，发现取消请求时中止任务"""
+        while not task.done():
+            await asyncio.sleep(settings.job_heartbeat_interval)
+            try:
+                async with AsyncSessionLocal() as db:
+                    result = await db.execute(
+                        update(BackgroundJob)
+                        .where(BackgroundJob.id == ctx.job_id)
+                        .values(locked_at=func.now())
+                        .returning(BackgroundJob.cancel_requested)
+                    )
+                    cancel_requested = result.scalar_one_or_none()
+                    await db.commit()
+            except Exception as e:
+                logger.warning(f"任务 {ctx.job_id} 心跳失败: {e}")
+                continue
+            if cancel_requested and not ctx.cancelled:
+                logger.info(f"任务 {ctx.job_id} 收到取消请求，正在中止")
+                ctx.cancelled = True
+                task.cancel()
+
+    async def _publish(self, job: BackgroundJob):
+        """推送任务状态"""
+        await progress_broker.publish(
+            job_topic(job.id), job.to_progress_event(), urgent=True
+        )
+
+    async def _finish(self, job_id: int, **values):
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(BackgroundJob)
+                .where(BackgroundJob.id == job_id)
+                .values(locked_by=None, locked_at=None, **values)
+                .returning(BackgroundJob)
+                .execution_options(synchronize_session=False)
+            )
+            job = result.scalar_one_or_none()
+            await db.commit()
+        if job is not None:
+            await self._publish(job)
+
+    async def _run_finish_hook(
+        self, job_type: str, payload: Dict[str, Any], status: str, error: Optional[str]
+    ):
+        handler = self.handlers.get(job_type)
+        if handler is None or handler.on_finished is None:
+            return
+        try:
+            await handler.on_finished(payload, status, error)
+        except Exception as e:
+            logger.error(f"任务 {job_type} 结束处理失败: {e}")
+
+    async def _mark_cancelled(self, job: BackgroundJob, ctx: JobContext):
+        await self._finish(
+            job.id, status="cancelled", message="任务已取消", finished_at=func.now()
+        )
+        await self._run_finish_hook(job.job_type, ctx.payload, "cancelled", None)
+        logger.info(f"任务 {job.id} 已取消")
+
+    async def _execute(self, job: BackgroundJob):
+        """执行一个已认领的任务"""
+        handler = self.handlers[job.job_type]
+        ctx = JobContext(self, job.id, job.payload or {}, job.attempts)
+        if job.cancel_requested:
+            ctx.cancelled = True
+
+        logger.info(f"开始执行任务 {job.id}: {job.job_type} (第 {job.attempts}/{job.max_attempts} 次)")
+        if ctx.cancelled:
+            await self._mark_cancelled(job, ctx)
+            return
+
+        task = asyncio.ensure_future(handler.func(ctx))
+        heartbeat = asyncio.create_task(self._heartbeat(ctx, task))
+        try:
+            result = await task
+        except JobCancelled:
+            await self._mark_cancelled(job, ctx)
+            return
+        except asyncio.CancelledError:
+            if ctx.cancelled:
+                await self._mark_cancelled(job, ctx)
+                return
+            # 工作进程本身被停止：任务重新排队，本次不计入执行次数
+            task.cancel()
+            try:
+                await self._finish(
+                    job.id,
+                    status="queued",
+                    attempts=BackgroundJob.attempts - 1,
+                    message="工作进程停止，任务重新排队",
+                )
+            except Exception as e:
+                logger.warning(f"任务 {job.id} 重新排队失败，将由心跳超时回收: {e}")
+            raise
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+            if job.attempts < job.max_attempts and not isinstance(e, JobFailed):
+                delay = settings.job_retry_backoff * (2 ** (job.attempts - 1))
+                await self._finish(
+                    job.id,
+                    status="queued",
+                    error=error,
+                    message=f"执行失败，{delay}秒后重试",
+                    run_after=datetime.now(timezone.utc) + timedelta(seconds=delay),
+                )
+                logger.warning(f"任务 {job.id} 执行失败，{delay}秒后重试: {error}")
+            else:
+                await self._finish(
+                    job.id, status="failed", error=error, finished_at=func.now()
+                )
+                await self._run_finish_hook(job.job_type, ctx.payload, "failed", error)
+                logger.error(f"任务 {job.id} 执行失败: {error}")
+            return
+        finally:
+            heartbeat.cancel()
+
+        await self._finish(
+            job.id,
+            status="succeeded",
+            progress=100,
+            result=result,
+            error=None,
+            finished_at=func.now(),
+        )
+        await self._run_finish_hook(job.job_type, ctx.payload, "succeeded", None)
+        logger.info(f"任务 {job.id} 执行成功")
+
+    async def run_worker(self, concurrency: Optional[int] = None):
+        """工作循环：按并发上限认领并执行任务"""
+        concurrency = concurrency or settings.job_worker_concurrency
+        logger.info(f"任务工作进程 {self.worker_id} 启动，并发 {concurrency}，任务类型: {sorted(self.handlers)}")
+        last_recover = 0.0
+        loop = asyncio.get_event_loop()
+
+        while True:
+            try:
+                if loop.time() - last_recover > settings.job_lock_timeout / 2:
+                    last_recover = loop.time()
+                    await self._recover_stale()
+
+                job = None
+                if len(self._running) < concurrency:
+                    job = await self._claim()
+                if job is not None:
+                    task = asyncio.create_task(self._execute(job))
+                    self._running.add(task)
+                    task.add_done_callback(self._running.discard)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"任务工作循环异常: {e}")
+
+            await asyncio.sleep(settings.job_poll_interval)
+
+    def start(self, concurrency: Optional[int] = None):
+        """在当前事件循环中启动工作协程"""
+        if self._worker_task is None or self._worker_task.done():
+            self._worker_task = asyncio.create_task(self.run_worker(concurrency))
+
+    async def stop(self):
+        """停止工作协程，运行中的任务重新排队"""
+        tasks = list(self._running)
+        if self._worker_task is not None:
+            tasks.append(self._worker_task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._worker_task = None
+
+
+# 全局任务队列
+job_queue = JobQueue()
@@ -368,6 +368,29 @@ class MinIOService:
 
         return await asyncio.get_event_loop().run_in_executor(self.executor, _get_content)
 
+    async def get_text_content(
+        self, bucket_name: str, object_name: str, encoding: str = "utf-8"
+    ) -> str:
+        """获取文本文件内容"""
+        data = await self.get_file_content(bucket_name, object_name)
+        return data.decode(encoding)
+
+    async def upload_text(
+        self,
+        bucket_name: str,
+        object_name: str,
+        content: str,
+        content_type: Optional[str] = None,
+        encoding: str = "utf-8",
+    ) -> Dict[str, Any]:
+        """上传文本内容"""
+        return await self.upload_file(
+            bucket_name=bucket_name,
+            object_key=object_name,
+            file_data=content.encode(encoding),
+            content_type=content_type or f"text/plain; charset={encoding}",
+        )
+
     async def get_file_stream(self, bucket_name: str, object_key: str):
         """获取文件流"""
         def _get_stream():
@@ -3,9 +3,11 @@ mManager 客户端服务
 """
 
 import asyncio
+import json
+import time
 import aiohttp
-from typing import Dict, List, Optional, Any
-from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Any, Tuple
+from datetime import datetime, timedelta, timezone
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, update, delete, and_, or_, func
 from sqlalchemy.orm import selectinload
@@ -17,6 +19,19 @@ from app.utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+# 镜像预热与回收的数据库咨询锁：多进程部署时同一时刻只有一个进程执行其中之一，
+# 避免重复拉取/删除，也避免回收另一进程正在预热的镜像
+IMAGE_MAINTENANCE_LOCK_ID = 7_304_001
+
+
+class MManagerAPIError(Exception):
+    """mManager 返回的错误响应"""
+
+    def __init__(self, status: int, detail: str):
+        self.status = status
+        self.detail = detail
+        super().__init__(f"mManager API Error: {status} - {detail}")
+
 
 class MManagerClient:
     """mManager 客户端"""
@@ -53,10 +68,54 @@ class MManagerClient:
         except aiohttp.ClientError as e:
             raise Exception(f"连接 {self.controller_url} 失败: {str(e)}")
 
+    async def _stream_request(
+        self, method: str, endpoint: str, raw: bool = False, **kwargs
+    ):
+        """流式请求：逐行产出 NDJSON 响应中的记录，raw=True 时原样产出数据块"""
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+        timeout = aiohttp.ClientTimeout(
+            total=None, sock_read=settings.mmanager_upload_timeout
+        )
+
+        try:
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                async with session.request(
+                    method,
+                    f"{self.controller_url}{endpoint}",
+                    headers=headers,
+                    **kwargs,
+                ) as response:
+                    if response.status >= 400:
+                        error_text = await response.text()
+                        raise Exception(
+                            f"mManager API Error: {response.status} - {error_text}"
+                        )
+
+                    if raw:
+                        async for chunk in response.content.iter_any():
+                            yield chunk
+                        return
+
+                    async for line in response.content:
+                        line = line.strip()
+                        if line:
+                            yield json.loads(line)
+        except asyncio.TimeoutError:
+            raise Exception(f"请求 {self.controller_url} 超时")
+        except aiohttp.ClientError as e:
+            raise Exception(f"连接 {self.controller_url} 失败: {str(e)}")
+
     async def health_check(self) -> Dict:
         """健康检查"""
         return await self._request("GET", "/health")
 
+    async def get_telemetry(self) -> Dict:
+        """获取控制器负载遥测报告（mManager后台生成的缓存）"""
+        return await self._request("GET", "/telemetry")
+
     async def create_container(self, config: Dict) -> Dict:
         """创建容器"""
         return await self._request("POST", "/containers/", json=config)
@@ -79,20 +138,123 @@ class MManagerClient:
             params={"force": str(force).lower()},
         )
 
+    async def batch_containers(
+        self,
+        operation: str,
+        container_ids: List[str],
+        timeout: int = 10,
+        force: bool = True,
+    ) -> Dict:
+        """批量操作容器（start/stop/remove/inspect），返回逐个容器的结果"""
+        return await self._request(
+            "POST",
+            "/containers/batch",
+            json={
+                "operation": operation,
+                "container_ids": container_ids,
+                "timeout": timeout,
+                "force": force,
+            },
+            timeout=aiohttp.ClientTimeout(
+                total=None, sock_read=settings.mmanager_batch_timeout
+            ),
+        )
+
     async def get_container_info(self, container_id: str) -> Dict:
         """获取容器信息"""
         return await self._request("GET", f"/containers/{container_id}")
 
+    async def get_container_status(self, container_id: str) -> Dict:
+        """获取容器状态摘要（mManager内存缓存，不触发docker inspect）"""
+        return await self._request("GET", f"/containers/{container_id}/status")
+
     async def get_container_stats(self, container_id: str) -> Dict:
         """获取容器统计信息"""
         return await self._request("GET", f"/containers/{container_id}/stats")
 
-    async def get_container_logs(self, container_id: str, lines: int = 100) -> Dict:
-        """获取容器日志"""
+    async def get_container_stats_history(
+        self, container_id: str, limit: int = 60
+    ) -> List[Dict]:
+        """获取容器最近的统计样本"""
         return await self._request(
-            "GET", f"/containers/{container_id}/logs", params={"lines": lines}
+            "GET",
+            f"/containers/{container_id}/stats/history",
+            params={"limit": limit},
+        )
+
+    async def get_all_container_stats(self) -> Dict[str, Dict]:
+        """获取控制器上所有运行中容器的最新统计样本"""
+        return await self._request("GET", "/containers/stats")
+
+    async def get_container_logs(
+        self,
+        container_id: str,
+        lines: int = 100,
+        since: Optional[str] = None,
+        timestamps: bool = False,
+    ) -> Dict:
+        """获取容器日志，传入上次返回的 cursor 作为 since 时只返回新日志"""
+        params = {"lines": lines, "timestamps": str(timestamps).lower()}
+        if since:
+            params["since"] = since
+        return await self._request(
+            "GET", f"/containers/{container_id}/logs", params=params
+        )
+
+    async def stream_container_logs(
+        self, container_id: str, since: Optional[str] = None, lines: int = 100
+    ):
+        """跟随容器日志，返回原样产出mManager SSE数据块的异步迭代器
+
+        在返回前检查上游状态，容器不存在等错误以 MManagerAPIError 抛出，
+        而不是在响应已开始后才中断
+        """
+        params = {"lines": lines}
+        if since:
+            params["since"] = since
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        # mManager 无输出时会定期发送保活注释，读超时只需覆盖保活间隔
+        timeout = aiohttp.ClientTimeout(
+            total=None, sock_read=settings.mmanager_log_stream_timeout
         )
 
+        session = aiohttp.ClientSession(timeout=timeout)
+        try:
+            response = await session.get(
+                f"{self.controller_url}/containers/{container_id}/logs/stream",
+                headers=headers,
+                params=params,
+            )
+        except asyncio.TimeoutError:
+            await session.close()
+            raise Exception(f"请求 {self.controller_url} 超时")
+        except aiohttp.ClientError as e:
+            await session.close()
+            raise Exception(f"连接 {self.controller_url} 失败: {str(e)}")
+
+        if response.status >= 400:
+            try:
+                error_text = await response.text()
+            finally:
+                response.release()
+                await session.close()
+            raise MManagerAPIError(response.status, error_text)
+
+        async def chunks():
+            try:
+                async for chunk in response.content.iter_any():
+                    yield chunk
+            except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+                # 结束本次流，客户端可凭 Last-Event-ID 重连续传
+                logger.warning(
+                    f"跟随容器 {container_id} 日志中断: {type(e).__name__} {e}"
+                )
+            finally:
+                response.release()
+                await session.close()
+
+        return chunks()
+
     async def list_containers(self, all_containers: bool = False) -> Dict:
         """列出容器"""
         return await self._request(
@@ -113,6 +275,64 @@ class MManagerClient:
             "POST", f"/containers/{container_id}/files", json=request_data
         )
 
+    async def put_archive(
+        self,
+        container_id: str,
+        target_dir: str,
+        archive_path: str,
+        remove_path: Optional[str] = None,
+    ) -> Dict:
+        """以二进制tar流上传归档到容器（分块读取本地文件，不整体载入内存）
+
+        Args:
+            container_id: 容器ID
+            target_dir: 容器内解包目录
+            archive_path: 本地tar文件路径
+            remove_path: 解包前需要删除的容器内路径
+        """
+        params = {"path": target_dir}
+        if remove_path:
+            params["remove_path"] = remove_path
+
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/x-tar",
+        }
+        timeout = aiohttp.ClientTimeout(
+            total=None, sock_read=settings.mmanager_upload_timeout
+        )
+
+        try:
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                async with session.put(
+                    f"{self.controller_url}/containers/{container_id}/archive",
+                    headers=headers,
+                    params=params,
+                    data=self._iter_file(archive_path),
+                ) as response:
+                    if response.status >= 400:
+                        error_text = await response.text()
+                        raise Exception(
+                            f"mManager API Error: {response.status} - {error_text}"
+                        )
+
+                    return await response.json()
+        except asyncio.TimeoutError:
+            raise Exception(f"请求 {self.controller_url} 超时")
+        except aiohttp.ClientError as e:
+            raise Exception(f"连接 {self.controller_url} 失败: {str(e)}")
+
+    @staticmethod
+    async def _iter_file(path: str, chunk_size: int = 1024 * 1024):
+        """分块读取本地文件"""
+        loop = asyncio.get_event_loop()
+        with open(path, "rb") as f:
+            while True:
+                chunk = await loop.run_in_executor(None, f.read, chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
     async def copy_directory_to_container(
         self, container_id: str, container_path: str, archive_base64: str, remove_existing: bool = True
     ) -> Dict:
@@ -130,10 +350,40 @@ class MManagerClient:
 class MManagerControllerManager:
     """mManager 控制器管理器"""
 
+    # 控制器评分权重
+    SCORE_WEIGHT_LOAD = 0.4
+    SCORE_WEIGHT_IMAGE = 0.35
+    SCORE_WEIGHT_MEMORY = 0.1
+    SCORE_WEIGHT_CPU = 0.05
+    SCORE_WEIGHT_SLOTS = 0.1
+
     def __init__(self):
         self.controllers: Dict[str, MManagerClient] = {}
         self.health_check_interval = 30  # 秒
         self.last_health_check = {}
+        # 镜像分布: {controller_id: {image_name: [layer_digest, ...]}}
+        self.controller_images: Dict[str, Dict[str, List[str]]] = {}
+        # 已知镜像的层列表: {image_name: [layer_digest, ...]}
+        self.image_layers: Dict[str, List[str]] = {}
+        # 进行中的镜像拉取: {(controller_id, image_name): Task}
+        self._inflight_pulls: Dict[Tuple[str, str], asyncio.Task] = {}
+        # 容器所在控制器: {container_id: controller_id}
+        self._container_locations: Dict[str, str] = {}
+        # 最近一次镜像拉取进度: {(controller_id, image_name): progress}
+        self.pull_progress: Dict[Tuple[str, str], Dict] = {}
+        self._prewarm_task: Optional[asyncio.Task] = None
+        # 控制器负载遥测: {controller_id: {"report": Dict, "received_at": monotonic}}
+        self.controller_telemetry: Dict[str, Dict[str, Any]] = {}
+        # 尚未反映在遥测中的分配时间(UTC)，用于突发创建时修正负载
+        self._pending_placements: Dict[str, List[datetime]] = {}
+        # 已提示过 server_id 与配置不一致的控制器，避免每次轮询重复告警
+        self._telemetry_id_mismatch: set = set()
+        # 数据库中被禁用的控制器（后台健康检查时刷新）
+        self._disabled_controllers: set = set()
+        self._last_persist_at = 0.0
+        # 镜像最近使用时间（拉取/确认可用）: {(controller_id, image_name): unix时间}，用于LRU回收
+        self.image_last_used: Dict[Tuple[str, str], float] = {}
+        self._image_gc_task: Optional[asyncio.Task] = None
 
     async def initialize(self, db: AsyncSession):
         """初始化控制器管理器"""
@@ -143,6 +393,12 @@ class MManagerControllerManager:
         # 启动健康检查
         asyncio.create_task(self._periodic_health_check(db))
 
+        # 启动镜像预热与回收：每个进程都启动循环，每轮通过咨询锁只由一个进程执行
+        if settings.image_prewarm_enabled and not self._prewarm_task:
+            self._prewarm_task = asyncio.create_task(self._periodic_image_prewarm())
+        if settings.image_gc_enabled and not self._image_gc_task:
+            self._image_gc_task = asyncio.create_task(self._periodic_image_gc())
+
         logger.info(
             f"mManager控制器管理器初始化完成，已注册 {len(self.controllers)} 个控制器"
         )
@@ -222,6 +478,11 @@ class MManagerControllerManager:
                     logger.info(f"将新控制器 {controller_id} 注册到数据库")
 
             await db.commit()
+            self._disabled_controllers = {
+                controller_id
+                for controller_id, controller in db_controllers.items()
+                if not controller.enabled
+            }
             logger.info(
                 f"控制器同步完成，活跃控制器: {len(config_controller_ids)}, 清理废弃控制器: {len(deprecated_ids)}"
             )
@@ -252,12 +513,164 @@ class MManagerControllerManager:
                         "server_type": controller.server_type,
                         "load_percentage": controller.load_percentage,
                         "capabilities": controller.capabilities,
+                        "current_containers": controller.current_containers,
+                        "max_containers": controller.max_containers,
+                        "cpu_cores": controller.cpu_cores,
+                        "memory_total_gb": controller.memory_total_gb,
+                        "memory_available_gb": controller.memory_available_gb,
                         "client": self.controllers[controller.controller_id],
                     }
                 )
 
         return controllers
 
+    def record_telemetry(
+        self, report: Dict[str, Any], controller_id: Optional[str] = None
+    ) -> bool:
+        """记录控制器推送或轮询得到的遥测报告
+
+        轮询得到的报告按被轮询的 controller_id 记录（mManager 的 SERVER_ID 可能与后端配置不同）；
+        推送的报告按报告中的 server_id 匹配已注册的控制器
+
+        Returns:
+            控制器已注册时返回 True
+        """
+        reported_id = report.get("server_id")
+        if controller_id is None:
+            controller_id = reported_id
+            if controller_id not in self.controllers:
+                logger.warning(
+                    f"收到未注册控制器的遥测推送: server_id={reported_id}，"
+                    f"已注册: {', '.join(self.controllers) or '-'}"
+                )
+                return False
+        elif controller_id not in self.controllers:
+            return False
+        elif reported_id and reported_id != controller_id:
+            if controller_id not in self._telemetry_id_mismatch:
+                self._telemetry_id_mismatch.add(controller_id)
+                logger.warning(
+                    f"控制器 {controller_id} 的 SERVER_ID 为 {reported_id}，与后端配置不一致；"
+                    f"该控制器推送的遥测将被拒绝，只能通过轮询获取"
+                )
+
+        previous = self.controller_telemetry.get(controller_id)
+        # 同一进程内序号递增；序号回退说明mManager重启，照常接收
+        if (
+            previous
+            and previous["report"].get("seq", 0) == report.get("seq")
+            and report.get("seq") is not None
+        ):
+            return True
+
+        self.controller_telemetry[controller_id] = {
+            "report": report,
+            "received_at": time.monotonic(),
+        }
+        self._clear_reported_placements(controller_id, report)
+
+        images = report.get("images")
+        if images is not None:
+            # 以遥测中的镜像清单刷新镜像分布（保留已知的层信息）
+            known = self.controller_images.get(controller_id, {})
+            self.controller_images[controller_id] = {
+                image["name"]: known.get(
+                    image["name"], self.image_layers.get(image["name"], [])
+                )
+                for image in images
+                if image.get("name")
+            }
+        return True
+
+    def _clear_reported_placements(self, controller_id: str, report: Dict[str, Any]):
+        """移除报告采样之前的分配，之后的分配尚未计入报告，继续保留"""
+        placements = self._pending_placements.get(controller_id)
+        if not placements:
+            return
+        try:
+            sampled_at = datetime.fromisoformat(report["timestamp"])
+        except (KeyError, TypeError, ValueError):
+            sampled_at = None
+        if sampled_at is None or sampled_at.tzinfo is None:
+            # 无法确定采样时间时按接收时间处理
+            sampled_at = datetime.now(timezone.utc)
+
+        remaining = [placed_at for placed_at in placements if placed_at >= sampled_at]
+        if remaining:
+            self._pending_placements[controller_id] = remaining
+        else:
+            self._pending_placements.pop(controller_id, None)
+
+    def _pending_count(self, controller_id: str) -> int:
+        """尚未反映在遥测中的分配数"""
+        return len(self._pending_placements.get(controller_id, ()))
+
+    def _fresh_telemetry(self, controller_id: str) -> Optional[Dict[str, Any]]:
+        """获取未过期的遥测报告"""
+        entry = self.controller_telemetry.get(controller_id)
+        if not entry:
+            return None
+        if time.monotonic() - entry["received_at"] > settings.controller_telemetry_max_age:
+            return None
+        return entry["report"]
+
+    def _telemetry_age(self, controller_id: str) -> Optional[float]:
+        """最近一次遥测距今的秒数"""
+        entry = self.controller_telemetry.get(controller_id)
+        if not entry:
+            return None
+        return round(time.monotonic() - entry["received_at"], 1)
+
+    def _controller_from_telemetry(
+        self, controller_id: str, report: Dict[str, Any]
+    ) -> Dict:
+        """将遥测报告转换为控制器选择所用的结构，计入尚未反映在报告中的分配"""
+        containers = report.get("containers", {})
+        resources = report.get("resources", {})
+        max_containers = containers.get("max_allowed") or 100
+        running = (containers.get("running") or 0) + self._pending_count(controller_id)
+        client = self.controllers[controller_id]
+        return {
+            "id": controller_id,
+            "url": client.controller_url,
+            "server_type": report.get("server_type", "unknown"),
+            "load_percentage": round(running / max_containers * 100, 2),
+            "capabilities": report.get("capabilities") or {},
+            "current_containers": running,
+            "max_containers": max_containers,
+            "cpu_cores": resources.get("cpu_cores"),
+            "memory_total_gb": resources.get("memory_total_gb"),
+            "memory_available_gb": resources.get("memory_available_gb"),
+            "client": client,
+        }
+
+    async def get_live_controllers(self, db: AsyncSession) -> List[Dict]:
+        """获取可用控制器及其实时负载
+
+        有新鲜遥测的控制器直接使用内存数据；只有存在遥测过期的控制器时才查询数据库。
+        """
+        controllers = []
+        stale = False
+        for controller_id in self.controllers:
+            if controller_id in self._disabled_controllers:
+                continue
+            report = self._fresh_telemetry(controller_id)
+            if report is None:
+                stale = True
+                continue
+            controllers.append(self._controller_from_telemetry(controller_id, report))
+
+        if stale:
+            live_ids = {controller["id"] for controller in controllers}
+            for controller in await self.get_healthy_controllers(db):
+                if controller["id"] not in live_ids:
+                    controller["current_containers"] = (
+                        controller["current_containers"] or 0
+                    ) + self._pending_count(controller["id"])
+                    controllers.append(controller)
+
+        return controllers
+
     def get_client(self, controller_id: str) -> MManagerClient:
         """获取指定控制器的客户端"""
         if controller_id not in self.controllers:
@@ -268,49 +681,155 @@ class MManagerControllerManager:
     async def select_optimal_controller(
         self, db: AsyncSession, requirements: Dict = None
     ) -> Dict:
-        """选择最优控制器"""
-        healthy_controllers = await self.get_healthy_controllers(db)
+        """选择最优控制器
+
+        对满足硬性条件的控制器按负载、镜像/镜像层本地性、可用内存、CPU余量和
+        容器槽位综合评分，选择得分最高者。requirements 中可通过 image 指定服务镜像。
+        """
+        healthy_controllers = await self.get_live_controllers(db)
 
         if not healthy_controllers:
             raise Exception("没有可用的健康控制器")
 
+        requirements = requirements or {}
+
         # 根据需求筛选控制器
         suitable_controllers = []
 
         for controller in healthy_controllers:
-            capabilities = controller.get("capabilities", {})
+            capabilities = controller.get("capabilities") or {}
 
             # 检查GPU需求
-            if requirements and requirements.get("gpu_required", False):
+            if requirements.get("gpu_required", False):
                 if not capabilities.get("gpu_support", False):
                     continue
 
             # 检查内存需求
-            if requirements and requirements.get("memory_gb", 0) > 0:
+            if requirements.get("memory_gb", 0) > 0:
                 required_memory = requirements["memory_gb"]
                 max_memory = capabilities.get("max_memory_gb", 0)
                 if required_memory > max_memory:
                     continue
 
             # 检查负载
-            if controller["load_percentage"] >= 90:  # 负载过高
+            if (controller["load_percentage"] or 0) >= 90:  # 负载过高
                 continue
 
             suitable_controllers.append(controller)
 
         if not suitable_controllers:
-            # 如果没有完全匹配的，选择负载最低的
+            # 如果没有完全匹配的，在所有健康控制器中评分选择
             suitable_controllers = healthy_controllers
 
-        # 选择负载最低的控制器
-        best_controller = min(suitable_controllers, key=lambda x: x["load_percentage"])
+        image_name = requirements.get("image")
+        for controller in suitable_controllers:
+            controller["score"] = self._score_controller(
+                controller, requirements, image_name
+            )
+
+        best_controller = max(suitable_controllers, key=lambda x: x["score"])
+        # 下一份遥测到达前，本次分配计入该控制器负载
+        self._pending_placements.setdefault(best_controller["id"], []).append(
+            datetime.now(timezone.utc)
+        )
+        logger.info(
+            f"选择控制器 {best_controller['id']} (得分 {best_controller['score']:.3f}, "
+            f"负载 {best_controller['load_percentage']}%, "
+            f"镜像本地性 {self.get_image_locality(best_controller['id'], image_name):.2f})"
+        )
 
         return best_controller
 
+    def _score_controller(
+        self, controller: Dict, requirements: Dict, image_name: Optional[str]
+    ) -> float:
+        """计算控制器综合得分（0~1，越高越优）"""
+        load_score = 1.0 - min(max(controller["load_percentage"] or 0, 0), 100) / 100
+
+        image_score = self.get_image_locality(controller["id"], image_name)
+
+        # 内存余量：可用内存满足需求的程度
+        memory_score = 0.5
+        available_memory = controller.get("memory_available_gb")
+        if available_memory is not None:
+            required_memory = requirements.get("memory_gb") or 0
+            if required_memory > 0:
+                memory_score = min(available_memory / (required_memory * 4), 1.0)
+            elif controller.get("memory_total_gb"):
+                memory_score = available_memory / controller["memory_total_gb"]
+
+        # CPU余量：需求占控制器核数的比例越小越好
+        cpu_score = 0.5
+        cpu_cores = controller.get("cpu_cores")
+        if cpu_cores:
+            required_cpu = requirements.get("cpu_cores") or 0
+            cpu_score = max(1.0 - required_cpu / cpu_cores, 0.0)
+
+        # 容器槽位余量（端口/容器配额）
+        slots_score = 0.5
+        max_containers = controller.get("max_containers")
+        if max_containers:
+            used = controller.get("current_containers") or 0
+            slots_score = max(1.0 - used / max_containers, 0.0)
+
+        return (
+            self.SCORE_WEIGHT_LOAD * load_score
+            + self.SCORE_WEIGHT_IMAGE * image_score
+            + self.SCORE_WEIGHT_MEMORY * memory_score
+            + self.SCORE_WEIGHT_CPU * cpu_score
+            + self.SCORE_WEIGHT_SLOTS * slots_score
+        )
+
+    def get_image_locality(self, controller_id: str, image_name: Optional[str]) -> float:
+        """镜像在控制器上的本地性
+
+        返回 1.0 表示镜像已存在；否则返回控制器已有的镜像层占该镜像全部层的比例。
+        """
+        if not image_name:
+            return 0.0
+
+        images = self.controller_images.get(controller_id, {})
+        if image_name in images:
+            return 1.0
+
+        layers = self.image_layers.get(image_name)
+        if not layers or not images:
+            return 0.0
+
+        local_layers = set()
+        for image_layers in images.values():
+            local_layers.update(image_layers)
+
+        return len(local_layers.intersection(layers)) / len(layers) * 0.9
+
+    def _record_image_presence(
+        self, controller_id: str, image_name: str, image_info: Optional[Dict] = None
+    ):
+        """记录镜像存在于控制器上（来自 get_image_info/pull_image 结果）"""
+        layers = (image_info or {}).get("layers") or []
+        if layers:
+            self.image_layers[image_name] = layers
+        self.controller_images.setdefault(controller_id, {})[image_name] = (
+            layers or self.image_layers.get(image_name, [])
+        )
+
+    def _forget_image(self, controller_id: str, image_name: str):
+        """记录镜像已从控制器上移除"""
+        self.controller_images.get(controller_id, {}).pop(image_name, None)
+
     async def find_container_location(
         self, db: AsyncSession, container_id: str
     ) -> Optional[Dict]:
         """查找容器位置"""
+        # 容器不会在控制器之间迁移，已定位过的容器直接返回
+        controller_id = self._container_locations.get(container_id)
+        if controller_id in self.controllers:
+            return {
+                "controller_id": controller_id,
+                "client": self.controllers[controller_id],
+                "service": None,
+            }
+
         logger.info(f"查找容器位置: {container_id}")
 
         # 从 ModelService 表查找容器信息
@@ -344,6 +863,7 @@ class MManagerControllerManager:
                 None,
             )
             if controller_id:
+                self._container_locations[container_id] = controller_id
                 return {
                     "controller_id": controller_id,
                     "client": self.controllers[controller_id],
@@ -354,41 +874,241 @@ class MManagerControllerManager:
             f"数据库匹配失败，开始广播查询所有控制器: {list(self.controllers.keys())}"
         )
 
-        for controller_id, client in self.controllers.items():
+        async def probe(controller_id: str, client: MManagerClient) -> Optional[str]:
             try:
-                logger.debug(f"查询控制器 {controller_id} 是否有容器 {container_id}")
-                container_info = await client.get_container_info(container_id)
-                if container_info:
+                if await client.get_container_status(container_id):
+                    return controller_id
+            except Exception as e:
+                logger.debug(f"控制器 {controller_id} 查询容器失败: {e}")
+            return None
+
+        # 并行查询所有控制器（状态接口读取mManager内存缓存）
+        results = await asyncio.gather(
+            *(probe(cid, client) for cid, client in self.controllers.items())
+        )
+        for controller_id in results:
+            if controller_id:
+                logger.warning(f"在控制器 {controller_id} 发现未注册容器: {container_id}")
+                self._container_locations[container_id] = controller_id
+                return {
+                    "controller_id": controller_id,
+                    "client": self.controllers[controller_id],
+                    "service": None,
+                }
+
+        logger.error(f"容器 {container_id} 在所有控制器中都未找到")
+        return None  # 容器不存在
+
+    def _controller_id_for_ip(self, ip: Optional[str]) -> Optional[str]:
+        """根据控制器主机地址查找控制器ID"""
+        if not ip:
+            return None
+        for controller_id, client in self.controllers.items():
+            if (
+                "://" in client.controller_url
+                and client.controller_url.split("://")[1].split(":")[0] == ip
+            ):
+                return controller_id
+        return None
+
+    async def group_containers_by_controller(
+        self, db: AsyncSession, container_ids: List[str]
+    ) -> Tuple[Dict[str, List[str]], List[str]]:
+        """按控制器分组容器
+
+        依次使用位置缓存、一次数据库查询（model_ip）和各控制器的批量查询定位容器。
+
+        Returns:
+            (控制器ID -> 容器ID列表, 未找到的容器ID列表)
+        """
+        groups: Dict[str, List[str]] = {}
+        pending: List[str] = []
+
+        for container_id in dict.fromkeys(container_ids):
+            controller_id = self._container_locations.get(container_id)
+            if controller_id in self.controllers:
+                groups.setdefault(controller_id, []).append(container_id)
+            else:
+                pending.append(container_id)
+
+        if pending:
+            result = await db.execute(
+                select(ModelService.container_id, ModelService.model_ip).where(
+                    ModelService.container_id.in_(pending)
+                )
+            )
+            model_ips = {row.container_id: row.model_ip for row in result}
+            unresolved = []
+            for container_id in pending:
+                controller_id = self._controller_id_for_ip(model_ips.get(container_id))
+                if controller_id:
+                    self._container_locations[container_id] = controller_id
+                    groups.setdefault(controller_id, []).append(container_id)
+                else:
+                    unresolved.append(container_id)
+            pending = unresolved
+
+        if pending:
+            # 每个控制器一次批量查询，代替逐个容器广播
+            async def probe(controller_id: str, client: MManagerClient) -> List[str]:
+                try:
+                    response = await client.batch_containers("inspect", pending)
+                    return [
+                        item["container_id"]
+                        for item in response.get("results", [])
+                        if item.get("success")
+                    ]
+                except Exception as e:
+                    logger.debug(f"控制器 {controller_id} 批量查询容器失败: {e}")
+                    return []
+
+            controller_items = list(self.controllers.items())
+            found_lists = await asyncio.gather(
+                *(probe(cid, client) for cid, client in controller_items)
+            )
+            for (controller_id, _client), found in zip(controller_items, found_lists):
+                for container_id in found:
+                    if container_id in self._container_locations:
+                        continue
                     logger.warning(
                         f"在控制器 {controller_id} 发现未注册容器: {container_id}"
                     )
-                    return {
+                    self._container_locations[container_id] = controller_id
+                    groups.setdefault(controller_id, []).append(container_id)
+            pending = [
+                cid for cid in pending if cid not in self._container_locations
+            ]
+
+        return groups, pending
+
+    async def batch_container_operation(
+        self,
+        db: AsyncSession,
+        operation: str,
+        container_ids: List[str],
+        timeout: int = 10,
+        force: bool = True,
+    ) -> Dict[str, Dict]:
+        """按控制器分组后并行批量操作容器，每个控制器每批一个请求
+
+        Returns:
+            容器ID -> {"success": bool, "message": str, "controller_id": str}
+        """
+        groups, missing = await self.group_containers_by_controller(db, container_ids)
+        results: Dict[str, Dict] = {
+            container_id: {
+                "success": False,
+                "message": f"无法找到容器 {container_id}",
+                "controller_id": None,
+            }
+            for container_id in missing
+        }
+
+        async def run_chunk(controller_id: str, chunk: List[str]) -> Dict[str, Dict]:
+            client = self.controllers[controller_id]
+            error = "控制器未返回结果"
+            try:
+                response = await client.batch_containers(
+                    operation, chunk, timeout=timeout, force=force
+                )
+                chunk_results = {
+                    item["container_id"]: {
+                        "success": item.get("success", False),
+                        "message": item.get("message", ""),
+                        "info": item.get("info"),
                         "controller_id": controller_id,
-                        "client": client,
-                        "service": None,
                     }
+                    for item in response.get("results", [])
+                }
             except Exception as e:
-                logger.debug(f"控制器 {controller_id} 查询容器失败: {e}")
-                continue
+                logger.error(f"控制器 {controller_id} 批量{operation}失败: {e}")
+                chunk_results = {}
+                error = str(e)
+            for container_id in chunk:
+                chunk_results.setdefault(
+                    container_id,
+                    {
+                        "success": False,
+                        "message": error,
+                        "controller_id": controller_id,
+                    },
+                )
+            return chunk_results
 
-        logger.error(f"容器 {container_id} 在所有控制器中都未找到")
-        return None  # 容器不存在
+        batch_size = max(settings.mmanager_batch_size, 1)
+        tasks = [
+            run_chunk(controller_id, ids[i : i + batch_size])
+            for controller_id, ids in groups.items()
+            for i in range(0, len(ids), batch_size)
+        ]
+        for chunk_results in await asyncio.gather(*tasks):
+            results.update(chunk_results)
+
+        if operation == "remove":
+            for container_id, item in results.items():
+                if item["success"]:
+                    self.forget_container_location(container_id)
+
+        return results
 
     async def _periodic_health_check(self, db: AsyncSession):
-        """定期健康检查"""
+        """定期轮询遥测过期的控制器，并按健康检查间隔将负载写入数据库"""
         while True:
             try:
-                await asyncio.sleep(self.health_check_interval)
-                await self._check_all_controllers_health(db)
+                await asyncio.sleep(settings.controller_telemetry_poll_interval)
+                await self._poll_stale_telemetry()
+                if time.monotonic() - self._last_persist_at >= self.health_check_interval:
+                    await self._check_all_controllers_health(db)
             except Exception as e:
                 logger.error(f"定期健康检查失败: {e}")
 
+    async def _fetch_controller_report(
+        self, controller_id: str, client: MManagerClient
+    ) -> Dict:
+        """获取控制器负载报告，mManager不支持遥测接口时退回健康检查"""
+        try:
+            report = await client.get_telemetry()
+        except Exception as e:
+            logger.debug(f"获取遥测失败，改用健康检查: {e}")
+            return await client.health_check()
+        self.record_telemetry(report, controller_id=controller_id)
+        return report
+
+    async def _poll_stale_telemetry(self):
+        """轮询未推送遥测（或推送中断）的控制器"""
+        stale = [
+            (controller_id, client)
+            for controller_id, client in self.controllers.items()
+            if self._fresh_telemetry(controller_id) is None
+        ]
+        if not stale:
+            return
+
+        async def poll(controller_id: str, client: MManagerClient):
+            try:
+                report = await client.get_telemetry()
+                self.record_telemetry(report, controller_id=controller_id)
+            except Exception as e:
+                logger.debug(f"控制器 {controller_id} 遥测轮询失败: {e}")
+
+        await asyncio.gather(*(poll(cid, client) for cid, client in stale))
+
     async def _check_all_controllers_health(self, db: AsyncSession):
-        """检查所有配置中的控制器健康状态"""
+        """将所有控制器的负载与健康状态写入数据库
+
+        遥测新鲜的控制器直接使用内存中的报告，其余控制器主动查询。
+        """
+        self._last_persist_at = time.monotonic()
         for controller_id, client in self.controllers.items():
             try:
-                # 调用健康检查接口
-                health_data = await client.health_check()
+                health_data = self._fresh_telemetry(controller_id)
+                if health_data is None:
+                    health_data = await self._fetch_controller_report(controller_id, client)
+                if health_data.get("status") == "unhealthy":
+                    raise Exception(health_data.get("error") or "控制器报告不健康")
+
+                # 镜像清单只保存在内存中
+                health_data = {k: v for k, v in health_data.items() if k != "images"}
 
                 # 更新数据库记录
                 await db.execute(
@@ -453,6 +1173,18 @@ class MManagerControllerManager:
                     await db.rollback()
                     logger.error(f"控制器 {controller_id} 失败状态记录失败: {db_error}")
 
+        # 刷新禁用列表，供无数据库查询的控制器选择使用
+        try:
+            result = await db.execute(
+                select(MManagerController.controller_id).where(
+                    MManagerController.enabled == False
+                )
+            )
+            self._disabled_controllers = set(result.scalars())
+        except Exception as e:
+            await db.rollback()
+            logger.warning(f"刷新控制器禁用列表失败: {e}")
+
     async def sync_controllers(self, db: AsyncSession):
         """手动同步控制器配置"""
         logger.info("开始手动同步控制器配置...")
@@ -497,6 +1229,7 @@ class MManagerControllerManager:
                 "load_percentage": controller.load_percentage,
                 "enabled": controller.enabled,
                 "consecutive_failures": controller.consecutive_failures,
+                "telemetry_age_seconds": self._telemetry_age(controller.controller_id),
             }
             status_summary["controllers"].append(controller_info)
 
@@ -507,17 +1240,45 @@ class MManagerControllerManager:
     async def pull_image(
         self, controller_id: str, image_name: str, auth_config: Optional[Dict] = None
     ) -> Dict:
-        """在指定控制器上拉取镜像"""
+        """在指定控制器上拉取镜像
+
+        以 NDJSON 流接收逐层进度，最新进度保存在 pull_progress 中，
+        流结束即表示拉取完成或失败。
+        """
         if controller_id not in self.controllers:
             raise Exception(f"控制器 {controller_id} 不存在")
 
         client = self.controllers[controller_id]
-
+        key = (controller_id, image_name)
         pull_data = {"image": image_name, "auth": auth_config}
 
-        result = await client._request("POST", "/images/pull", json=pull_data)
-        logger.info(f"控制器 {controller_id} 拉取镜像 {image_name}: {result}")
-        return result
+        progress: Dict = {"image": image_name, "status": "pulling"}
+        self.pull_progress[key] = progress
+        last_logged = -25.0
+        async for progress in client._stream_request(
+            "POST", "/images/pull", json=pull_data, params={"stream": "ndjson"}
+        ):
+            self.pull_progress[key] = progress
+            percent = progress.get("progress_percent") or 0.0
+            if percent - last_logged >= 25:
+                last_logged = percent
+                logger.info(
+                    f"控制器 {controller_id} 拉取镜像 {image_name}: {percent}% "
+                    f"({progress.get('layers_completed', 0)}/{progress.get('layers_total', 0)} 层)"
+                )
+
+        logger.info(f"控制器 {controller_id} 拉取镜像 {image_name}: {progress.get('status')}")
+        if progress.get("status") == "success":
+            self._record_image_presence(controller_id, image_name)
+        return progress
+
+    def forget_container_location(self, container_id: str):
+        """容器删除后清除位置缓存"""
+        self._container_locations.pop(container_id, None)
+
+    def get_pull_progress(self, controller_id: str, image_name: str) -> Optional[Dict]:
+        """获取镜像在控制器上的最近一次拉取进度"""
+        return self.pull_progress.get((controller_id, image_name))
 
     async def list_images(self, controller_id: str) -> List[Dict]:
         """列出控制器上的所有镜像"""
@@ -526,7 +1287,19 @@ class MManagerControllerManager:
 
         client = self.controllers[controller_id]
         result = await client._request("GET", "/images/")
-        return result.get("images", []) if result else []
+        images = result.get("images", []) if result else []
+
+        # 以控制器的实际镜像清单刷新镜像分布（保留已知的层信息）
+        known = self.controller_images.get(controller_id, {})
+        self.controller_images[controller_id] = {
+            f"{img['repository']}:{img['tag']}": known.get(
+                f"{img['repository']}:{img['tag']}",
+                self.image_layers.get(f"{img['repository']}:{img['tag']}", []),
+            )
+            for img in images
+            if img.get("repository") and img.get("repository") != "<none>"
+        }
+        return images
 
     async def remove_image(
         self, controller_id: str, image_name: str, force: bool = False
@@ -555,6 +1328,7 @@ class MManagerControllerManager:
                 logger.debug(f"Docker镜像删除详情: {result}")
 
             logger.info(f"控制器 {controller_id} 成功删除镜像 {image_name}")
+            self._forget_image(controller_id, image_name)
             return True
         except Exception as e:
             logger.error(f"控制器 {controller_id} 删除镜像失败: {e}")
@@ -584,9 +1358,11 @@ class MManagerControllerManager:
             # 检查新的API响应格式
             if result and result.get("exists") == True:
                 # 镜像存在，返回镜像信息
+                self._record_image_presence(controller_id, image_name, result)
                 return result
             elif result and result.get("exists") == False:
                 # 镜像不存在，返回None（不是异常）
+                self._forget_image(controller_id, image_name)
                 return None
 
         except Exception as e:
@@ -617,7 +1393,10 @@ class MManagerControllerManager:
     async def ensure_image_available(
         self, controller_id: str, image_name: str, harbor_auth: Optional[Dict] = None
     ) -> bool:
-        """确保镜像在控制器上可用，如不存在则拉取"""
+        """确保镜像在控制器上可用，如不存在则拉取
+
+        同一控制器上同一镜像的并发调用共享一次拉取。
+        """
         try:
             logger.info(f"开始检查镜像 {image_name} 在控制器 {controller_id} 上的状态")
 
@@ -626,48 +1405,196 @@ class MManagerControllerManager:
 
             if image_info:
                 logger.info(f"镜像 {image_name} 已存在于控制器 {controller_id}")
+                self.image_last_used[(controller_id, image_name)] = time.time()
                 return True
             else:
                 logger.info(
                     f"镜像 {image_name} 不存在，开始拉取到控制器 {controller_id}"
                 )
 
-            # 2. 镜像不存在，尝试拉取
+            # 2. 镜像不存在，拉取（合并进行中的同名拉取）
+            return await self._pull_image_coalesced(
+                controller_id, image_name, harbor_auth
+            )
+
+        except Exception as e:
+            logger.error(f"确保镜像可用过程中发生系统错误: {e}")
+            return False
+
+    async def _pull_image_coalesced(
+        self, controller_id: str, image_name: str, harbor_auth: Optional[Dict] = None
+    ) -> bool:
+        """拉取镜像，若已有相同的拉取在进行中则等待其结果"""
+        key = (controller_id, image_name)
+        task = self._inflight_pulls.get(key)
+
+        if task:
+            logger.info(f"镜像 {image_name} 正在控制器 {controller_id} 上拉取，等待完成")
+        else:
+            task = asyncio.create_task(
+                self._pull_and_wait(controller_id, image_name, harbor_auth)
+            )
+            self._inflight_pulls[key] = task
+            task.add_done_callback(lambda _: self._inflight_pulls.pop(key, None))
+
+        # shield: 单个等待方被取消时不影响其他共享该拉取的调用
+        return await asyncio.shield(task)
+
+    async def _pull_and_wait(
+        self, controller_id: str, image_name: str, harbor_auth: Optional[Dict] = None
+    ) -> bool:
+        """执行拉取并轮询确认镜像可用"""
+        try:
             pull_result = await self.pull_image(controller_id, image_name, harbor_auth)
+        except Exception as e:
+            logger.error(f"镜像 {image_name} 拉取失败: {e}")
+            return False
 
-            # 3. 验证拉取是否成功
-            if pull_result.get("status") == "success":
-                logger.info(f"镜像 {image_name} 成功拉取到控制器 {controller_id}")
+        if pull_result.get("status") != "success":
+            logger.error(f"镜像 {image_name} 拉取失败: {pull_result.get('error') or pull_result}")
+            return False
 
-                # 4. 拉取成功后，等待一小段时间，然后再次验证
-                import asyncio
+        logger.info(f"镜像 {image_name} 成功拉取到控制器 {controller_id}")
 
-                await asyncio.sleep(1)
+        # 拉取流结束时镜像已落盘，通常首次查询即可确认（同时记录镜像层）
+        if await self._wait_for_image(controller_id, image_name):
+            logger.info(f"验证成功：镜像 {image_name} 现在可用于控制器 {controller_id}")
+            self.image_last_used[(controller_id, image_name)] = time.time()
+            return True
 
-                verify_info = await self.get_image_info(controller_id, image_name)
-                if verify_info:
-                    logger.info(
-                        f"验证成功：镜像 {image_name} 现在可用于控制器 {controller_id}"
-                    )
+        logger.warning(f"验证失败：拉取成功但镜像在 {settings.image_pull_verify_timeout} 秒内仍不可用")
+        return False
+
+    async def _wait_for_image(self, controller_id: str, image_name: str) -> bool:
+        """轮询镜像信息直到可用或超时（指数退避）"""
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + settings.image_pull_verify_timeout
+        delay = 0.2
+
+        while True:
+            try:
+                if await self.get_image_info(controller_id, image_name):
                     return True
-                else:
-                    logger.warning(
-                        f"验证失败：拉取成功但镜像仍不可用，可能需要更多时间"
-                    )
-                    return False
+            except Exception as e:
+                logger.debug(f"轮询镜像 {image_name} 状态失败: {e}")
 
-            else:
-                logger.error(f"镜像 {image_name} 拉取失败: {pull_result}")
+            if loop.time() + delay > deadline:
                 return False
 
-        except Exception as e:
-            logger.error(f"确保镜像可用过程中发生系统错误: {e}")
-            return False
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 2.0)
+
+    # ================== 镜像预热 ==================
+
+    async def _run_image_maintenance(self, task) -> bool:
+        """持有镜像维护咨询锁执行 task(db)，锁被其他进程持有时跳过本轮"""
+        from app.database import async_engine, AsyncSessionLocal
+
+        async with async_engine.connect() as conn:
+            acquired = await conn.scalar(
+                select(func.pg_try_advisory_lock(IMAGE_MAINTENANCE_LOCK_ID))
+            )
+            # 会话级锁在提交后仍保持，不让该连接在整个任务期间处于事务中
+            await conn.commit()
+            if not acquired:
+                return False
+            try:
+                async with AsyncSessionLocal() as db:
+                    await task(db)
+            finally:
+                await conn.scalar(
+                    select(func.pg_advisory_unlock(IMAGE_MAINTENANCE_LOCK_ID))
+                )
+                await conn.commit()
+        return True
+
+    async def _periodic_image_prewarm(self):
+        """定期在空闲控制器上预拉取热门镜像"""
+        while True:
+            try:
+                await asyncio.sleep(settings.image_prewarm_interval)
+                if not await self._run_image_maintenance(self.prewarm_popular_images):
+                    logger.debug("镜像维护任务由其他进程执行，跳过本轮预热")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"镜像预热失败: {e}")
+
+    async def _get_popular_images(self, db: AsyncSession, limit: int) -> List[str]:
+        """按服务数量获取热门镜像的完整名称"""
+        from app.models.image import Image
+
+        popular_query = (
+            select(Image, func.count(ModelService.id).label("service_count"))
+            .join(ModelService, ModelService.image_id == Image.id)
+            .where(Image.status == "ready")
+            .group_by(Image.id)
+            .order_by(func.count(ModelService.id).desc())
+            .limit(limit)
+        )
+        result = await db.execute(popular_query)
+        return [image.full_image_name_with_registry for image, _ in result.all()]
+
+    async def prewarm_popular_images(self, db: AsyncSession) -> Dict[str, List[str]]:
+        """在低负载控制器上预拉取缺失的热门镜像
+
+        每个控制器每轮最多拉取 settings.image_prewarm_max_pulls 个镜像。
+        """
+        popular_images = await self._get_popular_images(
+            db, settings.image_prewarm_top_n
+        )
+        if not popular_images:
+            return {}
+
+        harbor_auth = {
+            "username": settings.harbor_username,
+            "password": settings.harbor_password,
+        }
+
+        async def prewarm_controller(controller: Dict) -> List[str]:
+            controller_id = controller["id"]
+            # 刷新控制器镜像清单
+            await self.list_images(controller_id)
+            local_images = self.controller_images.get(controller_id, {})
+
+            pulled = []
+            for image_name in popular_images:
+                if len(pulled) >= settings.image_prewarm_max_pulls:
+                    break
+                if image_name in local_images:
+                    continue
+                logger.info(f"预热镜像 {image_name} 到控制器 {controller_id}")
+                if await self._pull_image_coalesced(
+                    controller_id, image_name, harbor_auth
+                ):
+                    pulled.append(image_name)
+            return pulled
+
+        idle_controllers = [
+            c
+            for c in await self.get_healthy_controllers(db)
+            if (c["load_percentage"] or 0) <= settings.image_prewarm_max_load
+        ]
+
+        results = await asyncio.gather(
+            *(prewarm_controller(c) for c in idle_controllers), return_exceptions=True
+        )
+
+        prewarmed = {}
+        for controller, result in zip(idle_controllers, results):
+            if isinstance(result, Exception):
+                logger.warning(f"控制器 {controller['id']} 镜像预热失败: {result}")
+            elif result:
+                prewarmed[controller["id"]] = result
+
+        if prewarmed:
+            logger.info(f"镜像预热完成: {prewarmed}")
+        return prewarmed
 
     async def cleanup_image_from_all_controllers(
         self, image_name: str
     ) -> Dict[str, Any]:
-        """从所有控制器清理指定镜像"""
+        """从所有控制器清理指定镜像（各控制器并发执行）"""
         cleanup_results = {
             "image_name": image_name,
             "controllers_processed": 0,
@@ -677,78 +1604,277 @@ class MManagerControllerManager:
             "errors": [],
         }
 
+        async def cleanup(controller_id: str) -> Dict[str, Any]:
+            # 检查镜像是否存在
+            image_info = await self.get_image_info(controller_id, image_name)
+            if not image_info:
+                logger.info(f"控制器 {controller_id} 上不存在镜像 {image_name}")
+                return {
+                    "controller_id": controller_id,
+                    "status": "not_found",
+                    "message": "镜像不存在，无需删除",
+                }
+
+            # 镜像存在，尝试删除
+            if await self.remove_image(controller_id, image_name, force=True):
+                self.image_last_used.pop((controller_id, image_name), None)
+                logger.info(f"成功从控制器 {controller_id} 删除镜像 {image_name}")
+                return {
+                    "controller_id": controller_id,
+                    "status": "removed",
+                    "message": "镜像成功删除",
+                }
+
+            logger.warning(f"从控制器 {controller_id} 删除镜像 {image_name} 失败")
+            return {
+                "controller_id": controller_id,
+                "status": "failed",
+                "message": "删除操作失败",
+            }
+
+        controller_ids = list(self.controllers.keys())
+        results = await asyncio.gather(
+            *(cleanup(controller_id) for controller_id in controller_ids),
+            return_exceptions=True,
+        )
+
+        for controller_id, result in zip(controller_ids, results):
+            cleanup_results["controllers_processed"] += 1
+            if isinstance(result, Exception):
+                error_msg = f"控制器 {controller_id} 清理失败: {str(result)}"
+                cleanup_results["errors"].append(error_msg)
+                result = {
+                    "controller_id": controller_id,
+                    "status": "error",
+                    "message": str(result),
+                }
+                logger.error(error_msg)
+            if result["status"] == "removed":
+                cleanup_results["successful_removals"] += 1
+            elif result["status"] in ("failed", "error"):
+                cleanup_results["failed_removals"] += 1
+            cleanup_results["results"].append(result)
+
+        logger.info(
+            f"镜像清理完成: {image_name}, 成功: {cleanup_results['successful_removals']}, 失败: {cleanup_results['failed_removals']}"
+        )
+        return cleanup_results
+
+    # ================== 镜像回收 ==================
+
+    @staticmethod
+    def _managed_image_prefix() -> str:
+        """平台推送到Harbor的镜像名前缀，只回收这些镜像"""
+        harbor_host = settings.harbor_url.split("://")[-1].rstrip("/")
+        return f"{harbor_host}/{settings.harbor_default_project}/"
+
+    async def _periodic_image_gc(self):
+        """定期回收各控制器上无服务引用的镜像"""
+        while True:
+            try:
+                await asyncio.sleep(settings.image_gc_interval)
+                if not await self._run_image_maintenance(self.collect_unused_images):
+                    logger.debug("镜像维护任务由其他进程执行，跳过本轮回收")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"镜像回收失败: {e}")
+
+    async def _get_disk_usage(self, controller_id: str) -> Optional[Dict[str, Any]]:
+        """控制器磁盘使用情况，优先使用遥测，否则调用健康检查"""
+        report = self._fresh_telemetry(controller_id)
+        if report and report.get("resources", {}).get("disk_usage"):
+            return report["resources"]["disk_usage"]
         try:
-            # 遍历所有控制器
-            for controller_id in list(self.controllers.keys()):
-                cleanup_results["controllers_processed"] += 1
+            health = await self.controllers[controller_id].health_check()
+            return (health.get("resources") or {}).get("disk_usage") or None
+        except Exception as e:
+            logger.warning(f"获取控制器 {controller_id} 磁盘使用情况失败: {e}")
+            return None
 
-                try:
-                    # 检查镜像是否存在
-                    image_info = await self.get_image_info(controller_id, image_name)
+    async def _get_image_references(
+        self, db: AsyncSession
+    ) -> Tuple[Dict[str, set], set, set]:
+        """统计镜像引用
 
-                    if image_info:
-                        # 镜像存在，尝试删除
-                        success = await self.remove_image(
-                            controller_id, image_name, force=True
-                        )
+        进行中的基于tar包创建服务任务所用的镜像尚无服务记录，视为在所有控制器上被引用
 
-                        if success:
-                            cleanup_results["successful_removals"] += 1
-                            cleanup_results["results"].append(
-                                {
-                                    "controller_id": controller_id,
-                                    "status": "removed",
-                                    "message": "镜像成功删除",
-                                }
-                            )
-                            logger.info(
-                                f"成功从控制器 {controller_id} 删除镜像 {image_name}"
-                            )
-                        else:
-                            cleanup_results["failed_removals"] += 1
-                            cleanup_results["results"].append(
-                                {
-                                    "controller_id": controller_id,
-                                    "status": "failed",
-                                    "message": "删除操作失败",
-                                }
-                            )
-                            logger.warning(
-                                f"从控制器 {controller_id} 删除镜像 {image_name} 失败"
-                            )
-                    else:
-                        # 镜像不存在，标记为已清理
-                        cleanup_results["results"].append(
-                            {
-                                "controller_id": controller_id,
-                                "status": "not_found",
-                                "message": "镜像不存在，无需删除",
-                            }
-                        )
-                        logger.info(f"控制器 {controller_id} 上不存在镜像 {image_name}")
+        Returns:
+            (各控制器上服务引用的镜像, 无法确定所在控制器的服务引用的镜像, 数据库中所有镜像)
+        """
+        from app.models.image import Image
+        from app.models.job import BackgroundJob
+        from app.services.image_service import SERVICE_FROM_TAR_JOB
 
-                except Exception as e:
-                    cleanup_results["failed_removals"] += 1
-                    error_msg = f"控制器 {controller_id} 清理失败: {str(e)}"
-                    cleanup_results["errors"].append(error_msg)
-                    cleanup_results["results"].append(
-                        {
-                            "controller_id": controller_id,
-                            "status": "error",
-                            "message": str(e),
-                        }
-                    )
-                    logger.error(error_msg)
+        result = await db.execute(select(Image))
+        images = {image.id: image.full_image_name_with_registry for image in result.scalars()}
 
-            logger.info(
-                f"镜像清理完成: {image_name}, 成功: {cleanup_results['successful_removals']}, 失败: {cleanup_results['failed_removals']}"
+        result = await db.execute(
+            select(ModelService.image_id, ModelService.model_ip).where(
+                ModelService.image_id.isnot(None)
             )
-            return cleanup_results
+        )
+        by_controller: Dict[str, set] = {}
+        unplaced = set()
+        for image_id, model_ip in result.all():
+            image_name = images.get(image_id)
+            if not image_name:
+                continue
+            controller_id = self._controller_id_for_ip(model_ip)
+            if controller_id:
+                by_controller.setdefault(controller_id, set()).add(image_name)
+            else:
+                unplaced.add(image_name)
 
-        except Exception as e:
-            logger.error(f"清理镜像过程中发生系统错误: {e}")
-            cleanup_results["errors"].append(f"系统错误: {str(e)}")
-            return cleanup_results
+        result = await db.execute(
+            select(BackgroundJob.payload).where(
+                BackgroundJob.job_type == SERVICE_FROM_TAR_JOB,
+                BackgroundJob.status.in_(("queued", "running")),
+            )
+        )
+        for (payload,) in result.all():
+            image_name = images.get((payload or {}).get("image_id"))
+            if image_name:
+                unplaced.add(image_name)
+
+        return by_controller, unplaced, set(images.values())
+
+    async def plan_image_gc(self, db: AsyncSession) -> Dict[str, Dict[str, Any]]:
+        """为每个控制器生成镜像回收计划
+
+        候选镜像：平台管理的镜像中，没有放置在该控制器上的服务引用、不在拉取中、
+        且最近 image_gc_min_idle_hours 小时内未使用的镜像。
+        - 数据库中已没有记录的镜像总是回收
+        - 磁盘使用率达到 image_gc_disk_high_percent 时，按最近使用时间从旧到新（LRU）
+          继续回收，直到预计使用率降到 image_gc_disk_target_percent
+        """
+        by_controller, unplaced, known_images = await self._get_image_references(db)
+        prefix = self._managed_image_prefix()
+        min_idle = settings.image_gc_min_idle_hours * 3600
+        now = time.time()
+
+        async def plan_controller(controller_id: str) -> Dict[str, Any]:
+            images, disk = await asyncio.gather(
+                self.list_images(controller_id), self._get_disk_usage(controller_id)
+            )
+            referenced = by_controller.get(controller_id, set()) | unplaced
+
+            candidates = []
+            for image in images:
+                image_name = f"{image.get('repository')}:{image.get('tag')}"
+                if not image_name.startswith(prefix) or image_name in referenced:
+                    continue
+                if (controller_id, image_name) in self._inflight_pulls:
+                    continue
+                last_used = self.image_last_used.get((controller_id, image_name))
+                if last_used is None:
+                    try:
+                        last_used = datetime.fromisoformat(image["created"]).timestamp()
+                    except (KeyError, TypeError, ValueError):
+                        last_used = 0.0
+                if now - last_used < min_idle:
+                    continue
+                candidates.append(
+                    {
+                        "image_name": image_name,
+                        "size": image.get("size") or 0,
+                        "last_used": last_used,
+                        "orphan": image_name not in known_images,
+                    }
+                )
+            candidates.sort(key=lambda c: c["last_used"])
+
+            percent = (disk or {}).get("percent")
+            total_bytes = ((disk or {}).get("total_gb") or 0) * 1024 ** 3
+            under_pressure = percent is not None and percent >= settings.image_gc_disk_high_percent
+
+            removals = []
+            projected = percent
+            for candidate in candidates:
+                if not candidate["orphan"]:
+                    if not under_pressure or projected is None or not total_bytes:
+                        continue
+                    if projected <= settings.image_gc_disk_target_percent:
+                        continue
+                candidate["reason"] = "orphan" if candidate["orphan"] else "disk_pressure"
+                removals.append(candidate)
+                if projected is not None and total_bytes:
+                    projected -= candidate["size"] / total_bytes * 100
+
+            return {
+                "controller_id": controller_id,
+                "disk_percent": percent,
+                "under_pressure": under_pressure,
+                "projected_disk_percent": round(projected, 2) if projected is not None else None,
+                "images_total": len(images),
+                "candidates": len(candidates),
+                "removals": [
+                    {
+                        "image_name": c["image_name"],
+                        "size": c["size"],
+                        "reason": c["reason"],
+                        "last_used": datetime.fromtimestamp(c["last_used"]).isoformat(),
+                    }
+                    for c in removals
+                ],
+                "reclaimable_bytes": sum(c["size"] for c in removals),
+            }
+
+        controller_ids = [
+            controller_id
+            for controller_id in self.controllers
+            if controller_id not in self._disabled_controllers
+        ]
+        results = await asyncio.gather(
+            *(plan_controller(controller_id) for controller_id in controller_ids),
+            return_exceptions=True,
+        )
+
+        plans = {}
+        for controller_id, result in zip(controller_ids, results):
+            if isinstance(result, Exception):
+                logger.warning(f"生成控制器 {controller_id} 镜像回收计划失败: {result}")
+                plans[controller_id] = {"controller_id": controller_id, "error": str(result)}
+            else:
+                plans[controller_id] = result
+        return plans
+
+    async def collect_unused_images(
+        self, db: AsyncSession, dry_run: bool = False
+    ) -> Dict[str, Dict[str, Any]]:
+        """按回收计划删除镜像：控制器之间并发，同一控制器内逐个删除
+
+        不强制删除，仍被（未登记的）容器使用的镜像由Docker拒绝删除
+        """
+        plans = await self.plan_image_gc(db)
+        if dry_run:
+            return plans
+
+        async def execute(plan: Dict[str, Any]):
+            controller_id = plan["controller_id"]
+            removed, failed = [], []
+            for removal in plan["removals"]:
+                image_name = removal["image_name"]
+                # 计划生成后开始拉取的镜像不再删除
+                if (controller_id, image_name) in self._inflight_pulls:
+                    continue
+                if await self.remove_image(controller_id, image_name):
+                    self.image_last_used.pop((controller_id, image_name), None)
+                    removed.append(image_name)
+                else:
+                    failed.append(image_name)
+            plan["removed"] = removed
+            plan["failed"] = failed
+            if removed:
+                logger.info(
+                    f"控制器 {controller_id} 回收镜像 {len(removed)} 个，"
+                    f"约释放 {round(plan['reclaimable_bytes'] / 1024 ** 3, 2)}GB"
+                )
+
+        await asyncio.gather(
+            *(execute(plan) for plan in plans.values() if plan.get("removals"))
+        )
+        return plans
 
 
 # 全局控制器管理器实例
@@ -8,7 +8,7 @@ import uuid
 import logging
 import re
 from datetime import datetime, timedelta, timezone
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, List, Any, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, and_, or_, update
 from sqlalchemy.orm import selectinload
@@ -46,6 +46,8 @@ class ModelServiceManager:
         self.idle_timeout_minutes = settings.service_idle_timeout
         self.startup_timeout = settings.service_startup_timeout
         self.shutdown_timeout = settings.service_shutdown_timeout
+        # 进行中的空闲服务恢复: {service_id: Task}
+        self._resuming: Dict[int, asyncio.Task] = {}
 
     async def initialize(self, db: AsyncSession):
         """初始化服务管理器"""
@@ -58,14 +60,21 @@ class ModelServiceManager:
         service_data: ServiceCreate,
         repository_id: int,
         user_id: int,
+        progress_callback=None,
     ) -> ServiceResponse:
         """
         创建模型服务并立即创建容器
 
-        不管是基于已有镜像还是基于tar包，这里都负责拉取指定镜像并创建容器
+        不管是基于已有镜像还是基于tar包，这里都负责拉取指定镜像并创建容器。
+        progress_callback(percent, step) 在每个创建步骤开始时调用
         """
 
+        async def report(percent: int, step: str):
+            if progress_callback:
+                await progress_callback(percent, step)
+
         # 检查用户服务配额
+        await report(0, "检查服务配额和资源限制")
         await self._check_user_quota(db, user_id)
 
         # 验证资源限制
@@ -108,10 +117,13 @@ class ModelServiceManager:
             "cpu_cores": (
                 float(service_data.cpu_limit) if service_data.cpu_limit else 0.3
             ),
+            "image": docker_image_name,
         }
 
+        await report(15, "选择控制器")
         controller = await mmanager_client.select_optimal_controller(db, requirements)
         if not controller:
+            await resource_manager.release_port(allocated_port)
             raise ValueError("没有可用的控制器")
         controller_id = controller.get("id")
         # Extract IP/host from controller URL
@@ -122,6 +134,7 @@ class ModelServiceManager:
             controller_ip = "127.0.0.1"
 
         # 确保镜像在目标控制器上可用
+        await report(30, f"在控制器 {controller_id} 上拉取镜像")
         try:
             logger.info(f"确保镜像在控制器 {controller_id} 上可用: {docker_image_name}")
 
@@ -139,6 +152,7 @@ class ModelServiceManager:
 
         except Exception as e:
             logger.error(f"确保镜像可用失败: {e}")
+            await resource_manager.release_port(allocated_port)
             raise RuntimeError(f"确保镜像在控制器上可用失败: {str(e)}")
 
         # 准备容器配置
@@ -170,6 +184,7 @@ class ModelServiceManager:
             "detach": True,
         }
 
+        await report(70, "创建容器")
         try:
             # 获取控制器客户端并创建容器
             logger.info(f"=== Backend 发送容器配置 ===")
@@ -190,6 +205,7 @@ class ModelServiceManager:
         except Exception as e:
             logger.error(f"创建容器失败: {e}")
             # 释放已分配的端口
+            await resource_manager.release_port(allocated_port)
             raise RuntimeError(f"创建容器失败: {str(e)}")
 
         # 创建服务记录
@@ -222,6 +238,7 @@ class ModelServiceManager:
         db.add(service)
         await db.commit()
         await db.refresh(service)
+        await resource_manager.confirm_port(allocated_port)
 
         # 记录创建日志
         log_message = (
@@ -232,6 +249,7 @@ class ModelServiceManager:
         await self._log_service_event(
             db, service.id, LogLevel.INFO, log_message, EventType.CREATE, user_id
         )
+        await report(100, "服务创建完成")
 
         return self._service_to_response(service)
 
@@ -419,8 +437,10 @@ class ModelServiceManager:
                 await self._remove_container_via_mmanager(db, service.container_id)
 
             # 删除数据库记录（级联删除相关表）
+            released_port = service.gradio_port
             await db.delete(service)
             await db.commit()
+            await resource_manager.release_port(released_port)
 
             logger.info(f"服务 {service_id} 删除成功")
             return True
@@ -429,6 +449,362 @@ class ModelServiceManager:
             logger.error(f"删除服务 {service_id} 失败: {e}")
             raise RuntimeError(f"服务删除失败: {str(e)}")
 
+    def _split_batch_services(
+        self, services: List[ModelService], user_id: int
+    ) -> Tuple[List[ModelService], List[Dict[str, Any]]]:
+        """批量操作前过滤无权限的服务"""
+        allowed = []
+        failed = []
+        for service in services:
+            if service.user_id != user_id:
+                failed.append({"service_id": service.id, "error": "无权限操作此服务"})
+            else:
+                allowed.append(service)
+        return allowed, failed
+
+    async def batch_start_services(
+        self, db: AsyncSession, services: List[ModelService], user_id: int
+    ) -> Tuple[List[int], List[Dict[str, Any]]]:
+        """批量启动服务，容器按控制器分组，每个控制器一次批量请求
+
+        Returns:
+            (启动成功的服务ID, 失败的服务及原因)
+        """
+        services, failed = self._split_batch_services(services, user_id)
+        successful = []
+        pending = []
+        for service in services:
+            if service.status == ServiceStatus.RUNNING:
+                successful.append(service.id)
+            elif not service.container_id:
+                failed.append(
+                    {
+                        "service_id": service.id,
+                        "error": "服务没有关联的容器，请重新创建服务",
+                    }
+                )
+            else:
+                pending.append(service)
+
+        if not pending:
+            return successful, failed
+
+        now = datetime.now(timezone.utc)
+        for service in pending:
+            service.status = ServiceStatus.STARTING
+            service.last_started_at = now
+            service.start_count += 1
+        await db.commit()
+
+        results = await mmanager_client.batch_container_operation(
+            db, "start", [service.container_id for service in pending]
+        )
+
+        now = datetime.now(timezone.utc)
+        started = []
+        for service in pending:
+            result = results.get(service.container_id, {})
+            if result.get("success"):
+                service.status = ServiceStatus.RUNNING
+                service.health_status = HealthStatus.UNKNOWN
+                service.last_heartbeat = now
+                started.append(service.id)
+                await self._log_service_event(
+                    db,
+                    service.id,
+                    LogLevel.INFO,
+                    f"服务启动成功，容器ID: {service.container_id}，端口: {service.gradio_port}",
+                    EventType.START,
+                    user_id,
+                    commit=False,
+                )
+            else:
+                error = f"启动容器失败: {result.get('message', '未知错误')}"
+                service.status = ServiceStatus.ERROR
+                service.error_message = error
+                failed.append({"service_id": service.id, "error": error})
+                await self._log_service_event(
+                    db,
+                    service.id,
+                    LogLevel.ERROR,
+                    f"服务启动失败: {error}",
+                    EventType.ERROR,
+                    user_id,
+                    commit=False,
+                )
+        await db.commit()
+
+        for service_id in started:
+            asyncio.create_task(self._start_health_monitoring(db, service_id))
+
+        logger.info(f"批量启动服务完成: 成功 {len(started)}/{len(pending)}")
+        return successful + started, failed
+
+    async def batch_stop_services(
+        self,
+        db: AsyncSession,
+        services: List[ModelService],
+        user_id: int,
+        timeout_seconds: int = 30,
+    ) -> Tuple[List[int], List[Dict[str, Any]]]:
+        """批量停止服务，容器按控制器分组，每个控制器一次批量请求"""
+        services, failed = self._split_batch_services(services, user_id)
+        successful = []
+        pending = []
+        for service in services:
+            if service.status in [ServiceStatus.STOPPED, ServiceStatus.STOPPING]:
+                successful.append(service.id)
+            else:
+                pending.append(service)
+
+        if not pending:
+            return successful, failed
+
+        for service in pending:
+            service.status = ServiceStatus.STOPPING
+        await db.commit()
+
+        container_ids = [s.container_id for s in pending if s.container_id]
+        results = (
+            await mmanager_client.batch_container_operation(
+                db, "stop", container_ids, timeout=timeout_seconds
+            )
+            if container_ids
+            else {}
+        )
+
+        now = datetime.now(timezone.utc)
+        for service in pending:
+            result = (
+                results.get(service.container_id, {})
+                if service.container_id
+                else {"success": True}
+            )
+            if result.get("success"):
+                service.status = ServiceStatus.STOPPED
+                service.last_stopped_at = now
+                service.health_status = HealthStatus.UNKNOWN
+                successful.append(service.id)
+                await self._log_service_event(
+                    db,
+                    service.id,
+                    LogLevel.INFO,
+                    "服务停止成功",
+                    EventType.STOP,
+                    user_id,
+                    commit=False,
+                )
+            else:
+                # 停止失败，记录错误但不回滚状态
+                error = f"停止容器失败: {result.get('message', '未知错误')}"
+                failed.append({"service_id": service.id, "error": error})
+                await self._log_service_event(
+                    db,
+                    service.id,
+                    LogLevel.ERROR,
+                    f"服务停止失败: {error}",
+                    EventType.ERROR,
+                    user_id,
+                    commit=False,
+                )
+        await db.commit()
+
+        logger.info(f"批量停止服务完成: 成功 {len(successful)}/{len(services)}")
+        return successful, failed
+
+    async def batch_delete_services(
+        self, db: AsyncSession, services: List[ModelService], user_id: int
+    ) -> Tuple[List[int], List[Dict[str, Any]]]:
+        """批量删除服务，容器强制删除后统一删除数据库记录并释放端口"""
+        services, failed = self._split_batch_services(services, user_id)
+        if not services:
+            return [], failed
+
+        container_ids = [s.container_id for s in services if s.container_id]
+        if container_ids:
+            results = await mmanager_client.batch_container_operation(
+                db, "remove", container_ids, force=True
+            )
+            for container_id, result in results.items():
+                if not result.get("success"):
+                    # 与单个删除一致：容器删除失败不阻止删除服务记录
+                    logger.warning(
+                        f"删除容器 {container_id} 失败，但继续处理: {result.get('message')}"
+                    )
+
+        released_ports = [service.gradio_port for service in services]
+        for service in services:
+            await db.delete(service)
+        await db.commit()
+        for port in released_ports:
+            await resource_manager.release_port(port)
+
+        successful = [service.id for service in services]
+        logger.info(f"批量删除服务完成: {successful}")
+        return successful, failed
+
+    async def cleanup_idle_services(self, db: AsyncSession) -> int:
+        """处理空闲服务
+
+        超过 service_idle_timeout 未访问的运行中服务：启用缩容至零时停止容器但保留
+        容器、端口和控制器位置，状态置为 idle，下次访问时快速恢复；否则直接停止。
+        """
+        threshold = datetime.now(timezone.utc) - timedelta(
+            minutes=self.idle_timeout_minutes
+        )
+
+        idle_services_query = select(ModelService).where(
+            and_(
+                ModelService.status == ServiceStatus.RUNNING,
+                func.coalesce(
+                    ModelService.last_accessed_at, ModelService.last_started_at
+                )
+                < threshold,
+            )
+        )
+        result = await db.execute(idle_services_query)
+        idle_services = result.scalars().all()
+
+        cleaned_count = 0
+        for service in idle_services:
+            try:
+                if not settings.service_scale_to_zero_enabled:
+                    await self.stop_service(db, service.id, service.user_id)
+                    cleaned_count += 1
+                    continue
+
+                if service.container_id:
+                    await self._stop_container_via_mmanager(
+                        db, service.container_id, self.shutdown_timeout
+                    )
+
+                service.status = ServiceStatus.IDLE
+                service.health_status = HealthStatus.UNKNOWN
+                service.last_stopped_at = datetime.now(timezone.utc)
+                await db.commit()
+
+                await self._log_service_event(
+                    db,
+                    service.id,
+                    LogLevel.INFO,
+                    f"服务空闲超过 {self.idle_timeout_minutes} 分钟，已停止容器（保留容器和端口，访问时自动恢复）",
+                    EventType.STOP,
+                )
+                cleaned_count += 1
+
+            except Exception as e:
+                await db.rollback()
+                logger.error(f"处理空闲服务 {service.id} 失败: {e}")
+
+        return cleaned_count
+
+    async def resume_service(self, service_id: int) -> bool:
+        """恢复空闲服务并等待健康检查通过
+
+        同一服务的并发恢复请求共享一次恢复过程，使用独立的数据库会话。
+        健康检查超时时服务保持空闲状态并抛出 TimeoutError。
+        """
+        task = self._resuming.get(service_id)
+        if not task:
+            task = asyncio.create_task(self._resume_idle_service(service_id))
+            self._resuming[service_id] = task
+            task.add_done_callback(lambda _: self._resuming.pop(service_id, None))
+
+        return await asyncio.shield(task)
+
+    async def _resume_idle_service(self, service_id: int) -> bool:
+        """在原控制器上启动保留的容器"""
+        from app.database import get_async_db
+
+        async for db in get_async_db():
+            service = await self._get_service_by_id(db, service_id)
+            if service.status == ServiceStatus.RUNNING:
+                return True
+            if service.status != ServiceStatus.IDLE or not service.container_id:
+                return False
+
+            try:
+                service.status = ServiceStatus.STARTING
+                await db.commit()
+
+                location = await mmanager_client.find_container_location(
+                    db, service.container_id
+                )
+                if not location:
+                    raise ValueError(f"无法找到容器 {service.container_id} 的位置")
+
+                start_result = await location["client"].start_container(
+                    service.container_id
+                )
+                if not start_result.get("success", False):
+                    raise Exception(
+                        f"启动容器失败: {start_result.get('message', '未知错误')}"
+                    )
+
+                if not await self._wait_until_healthy(
+                    service.service_url, settings.service_resume_timeout
+                ):
+                    raise TimeoutError(
+                        f"服务在 {settings.service_resume_timeout} 秒内未通过健康检查"
+                    )
+
+                now = datetime.now(timezone.utc)
+                service.status = ServiceStatus.RUNNING
+                service.health_status = HealthStatus.HEALTHY
+                service.last_started_at = now
+                service.last_heartbeat = now
+                service.last_health_check = now
+                service.start_count += 1
+                await db.commit()
+
+                await self._log_service_event(
+                    db, service.id, LogLevel.INFO, "空闲服务已恢复", EventType.START
+                )
+                return True
+
+            except TimeoutError as e:
+                # 冷启动较慢时保持空闲状态，容器继续启动，下次访问可再次恢复
+                logger.warning(f"恢复空闲服务 {service_id} 超时: {e}")
+                await db.rollback()
+                service = await self._get_service_by_id(db, service_id)
+                service.status = ServiceStatus.IDLE
+                await db.commit()
+                raise
+
+            except Exception as e:
+                logger.error(f"恢复空闲服务 {service_id} 失败: {e}")
+                await db.rollback()
+                service = await self._get_service_by_id(db, service_id)
+                service.status = ServiceStatus.ERROR
+                service.error_message = f"恢复空闲服务失败: {str(e)}"
+                await db.commit()
+                return False
+
+        return False
+
+    async def _wait_until_healthy(self, service_url: Optional[str], timeout: int) -> bool:
+        """轮询服务URL直到返回非5xx响应或超时"""
+        if not service_url:
+            return False
+
+        import aiohttp
+
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout
+        request_timeout = aiohttp.ClientTimeout(total=5)
+
+        async with aiohttp.ClientSession(timeout=request_timeout) as session:
+            while loop.time() < deadline:
+                try:
+                    async with session.get(service_url) as response:
+                        if response.status < 500:
+                            return True
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    pass
+                await asyncio.sleep(0.5)
+
+        return False
+
     async def get_service_status(
         self, db: AsyncSession, service_id: int
     ) -> Dict[str, Any]:
@@ -494,9 +870,25 @@ class ModelServiceManager:
         }
 
     async def get_service_logs(
-        self, db: AsyncSession, service_id: int, lines: int = 100
+        self,
+        db: AsyncSession,
+        service_id: int,
+        lines: int = 100,
+        since: Optional[str] = None,
+        timestamps: bool = False,
     ) -> Dict[str, Any]:
-        """获取服务日志"""
+        """获取服务容器日志
+
+        Args:
+            db: 数据库会话
+            service_id: 服务ID
+            lines: 未指定 since 时返回最后的行数；指定时为本次最多返回的行数
+            since: 上次响应中的 cursor，只返回之后的新日志
+            timestamps: 日志行是否保留时间戳
+
+        Returns:
+            包含 logs、lines、cursor 的字典，下次轮询将 cursor 作为 since 传入
+        """
 
         service = await self._get_service_by_id(db, service_id)
 
@@ -505,6 +897,7 @@ class ModelServiceManager:
                 "service_id": service_id,
                 "logs": "服务未运行，无容器日志可用",
                 "lines": 0,
+                "cursor": since,
             }
 
         try:
@@ -516,11 +909,13 @@ class ModelServiceManager:
                     "service_id": service_id,
                     "logs": "无法找到容器位置",
                     "lines": 0,
+                    "cursor": since,
                 }
 
             logs_response = await location["client"].get_container_logs(
-                service.container_id, lines
+                service.container_id, lines, since, timestamps
             )
+            logs_response["service_id"] = service_id
             return logs_response
 
         except Exception as e:
@@ -529,8 +924,32 @@ class ModelServiceManager:
                 "service_id": service_id,
                 "logs": f"获取日志失败: {str(e)}",
                 "lines": 0,
+                "cursor": since,
             }
 
+    async def stream_service_logs(
+        self,
+        db: AsyncSession,
+        service_id: int,
+        since: Optional[str] = None,
+        lines: int = 100,
+    ):
+        """跟随服务容器日志，返回mManager SSE数据块的异步迭代器"""
+
+        service = await self._get_service_by_id(db, service_id)
+        if not service.container_id:
+            raise ValueError("服务未运行，无容器日志可用")
+
+        location = await mmanager_client.find_container_location(
+            db, service.container_id
+        )
+        if not location:
+            raise ValueError("无法找到容器位置")
+
+        return await location["client"].stream_container_logs(
+            service.container_id, since, lines
+        )
+
     async def _get_container_resource_usage(
         self, container_id: str
     ) -> Dict[str, Any]:
@@ -556,11 +975,11 @@ class ModelServiceManager:
                         logger.warning(f"无法找到容器 {container_id} 的位置")
                         return {}
 
-                    # 获取容器统计信息
+                    # 获取容器统计信息（mManager统计流缓冲区中的最新样本）
                     stats = await location["client"].get_container_stats(container_id)
 
                     # 返回资源使用信息
-                    return stats.get("resource_usage", {}) if stats else {}
+                    return self._format_resource_usage(stats) if stats else {}
 
                 finally:
                     await db.close()
@@ -570,6 +989,64 @@ class ModelServiceManager:
             logger.error(f"获取容器 {container_id} 资源使用情况失败: {e}")
             return {}
 
+    @staticmethod
+    def _format_resource_usage(stats: Dict[str, Any]) -> Dict[str, Any]:
+        """将mManager统计样本转换为资源使用信息"""
+        return {
+            "cpu_percent": stats.get("cpu_percent", 0.0),
+            "memory_usage_mb": stats.get("memory_usage_mb", 0.0),
+            "memory_limit_mb": stats.get("memory_limit_mb", 0.0),
+            "memory_percent": stats.get("memory_percent", 0.0),
+            "network_rx_bytes": stats.get("network_rx_bytes", 0),
+            "network_tx_bytes": stats.get("network_tx_bytes", 0),
+            "network_rx_rate": stats.get("network_rx_rate", 0.0),
+            "network_tx_rate": stats.get("network_tx_rate", 0.0),
+            "block_read_bytes": stats.get("block_read_bytes", 0),
+            "block_write_bytes": stats.get("block_write_bytes", 0),
+            "pids": stats.get("pids", 0),
+            "timestamp": stats.get("timestamp"),
+        }
+
+    async def sync_resource_usage(self, db: AsyncSession) -> int:
+        """将各控制器统计流中的最新样本写回运行中服务的资源使用字段
+
+        每个控制器只请求一次，不逐个容器读取统计信息。
+
+        Returns:
+            更新的服务数量
+        """
+        latest: Dict[str, Dict[str, Any]] = {}
+        for controller_id, client in mmanager_client.controllers.items():
+            try:
+                latest.update(await client.get_all_container_stats() or {})
+            except Exception as e:
+                logger.warning(f"获取控制器 {controller_id} 容器统计失败: {e}")
+
+        if not latest:
+            return 0
+
+        result = await db.execute(
+            select(ModelService).where(
+                and_(
+                    ModelService.status == ServiceStatus.RUNNING,
+                    ModelService.container_id.isnot(None),
+                )
+            )
+        )
+        updated = 0
+        for service in result.scalars().all():
+            stats = latest.get(service.container_id)
+            if not stats:
+                continue
+            service.cpu_usage_percent = min(stats.get("cpu_percent", 0.0), 999.99)
+            service.memory_usage_bytes = int(
+                stats.get("memory_usage_mb", 0.0) * 1024 * 1024
+            )
+            updated += 1
+
+        await db.commit()
+        return updated
+
     # 私有方法
     async def _stop_container_via_mmanager(
         self,
@@ -618,6 +1095,7 @@ class ModelServiceManager:
                 )
             else:
                 logger.info(f"容器 {container_id} 删除成功")
+                mmanager_client.forget_container_location(container_id)
 
         except Exception as e:
             logger.warning(f"删除容器 {container_id} 失败，但继续处理: {e}")
@@ -855,8 +1333,9 @@ class ModelServiceManager:
         message: str,
         event_type: EventType,
         user_id: Optional[int] = None,
+        commit: bool = True,
     ):
-        """记录服务事件日志"""
+        """记录服务事件日志，commit=False 时由调用方统一提交"""
 
         log_entry = ServiceLog(
             service_id=service_id,
@@ -867,7 +1346,8 @@ class ModelServiceManager:
         )
 
         db.add(log_entry)
-        await db.commit()
+        if commit:
+            await db.commit()
 
 
 # 全局服务管理器实例
@@ -0,0 +1,215 @@
+"""
+进度推送服务
+
+后台任务（镜像推送、基于tar包创建服务等）的实时进度通过该服务发布，
+SSE接口订阅后直接推送给客户端，不再需要客户端反复轮询、也不需要每次进度回调都写库。
+
+同一进程内直接分发；独立部署的工作进程通过 PostgreSQL NOTIFY/LISTEN 转发到API进程，
+转发按主题合并限频，并复用一条长连接
+"""
+
+import asyncio
+import json
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Set
+
+import asyncpg
+from app.config import settings
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# NOTIFY 通道名
+PROGRESS_CHANNEL = "geoml_progress"
+
+
+def job_topic(job_id: int) -> str:
+    """任务进度的订阅主题"""
+    return f"job:{job_id}"
+
+
+def format_sse(data: Dict[str, Any], event: str = "progress") -> str:
+    """格式化为SSE消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+class ProgressBroker:
+    """进度发布/订阅
+
+    本进程内的订阅者立即收到每个事件；跨进程转发按主题合并（只保留最新事件），
+    每隔 progress_notify_interval 秒通过一条长连接批量 NOTIFY，
+    状态变化等 urgent 事件立即发送
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        # 本进程标识，忽略自己发出的NOTIFY（本进程内已直接分发）
+        self._origin = uuid.uuid4().hex
+        # LISTEN 和 NOTIFY 共用的长连接
+        self._connection: Optional[asyncpg.Connection] = None
+        self._connection_lock = asyncio.Lock()
+        self._listening = False
+        # 待转发的事件: {topic: 最新事件}
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._flush_now = asyncio.Event()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def publish(self, topic: str, event: Dict[str, Any], urgent: bool = False):
+        """发布进度事件，urgent 为True时立即转发到其他进程（用于状态变化等不能丢的事件）"""
+        self._deliver(topic, event)
+        if not settings.progress_notify_enabled:
+            return
+        self._pending[topic] = event
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+        if urgent:
+            self._flush_now.set()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self._flush_now.wait(), timeout=settings.progress_notify_interval
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            await self._flush()
+
+    async def _flush(self):
+        """将合并后的事件通过长连接发送 NOTIFY"""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        connection = await self._ensure_connection()
+        if connection is None:
+            return
+        # 同一连接上不能并发执行，与建立监听互斥
+        async with self._connection_lock:
+            try:
+                for topic, event in pending.items():
+                    payload = json.dumps(
+                        {"origin": self._origin, "topic": topic, "event": event},
+                        ensure_ascii=False,
+                        default=str,
+                    )
+                    await connection.execute(
+                        "SELECT pg_notify($1, $2)", PROGRESS_CHANNEL, payload
+                    )
+            except Exception as e:
+                logger.debug(f"转发进度事件失败: {e}")
+                await self._reset_connection()
+
+    def _deliver(self, topic: str, event: Dict[str, Any]):
+        for queue in list(self._subscribers.get(topic, ())):
+            if queue.full():
+                # 慢速订阅者丢弃最旧的事件，进度只关心最新值
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    pass
+            queue.put_nowait(event)
+
+    def _on_notify(self, connection, pid, channel, payload):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            return
+        if message.get("origin") == self._origin:
+            return
+        self._deliver(message.get("topic"), message.get("event") or {})
+
+    async def _ensure_connection(self, listen: bool = False) -> Optional[asyncpg.Connection]:
+        """获取长连接，断开后重建；listen 为True时同时开始监听"""
+        async with self._connection_lock:
+            if self._connection is not None and self._connection.is_closed():
+                self._connection = None
+                self._listening = False
+            try:
+                if self._connection is None:
+                    self._connection = await asyncpg.connect(settings.database_url)
+                if (listen or self._subscribers) and not self._listening:
+                    await self._connection.add_listener(PROGRESS_CHANNEL, self._on_notify)
+                    self._listening = True
+                    logger.info("进度推送已开始监听数据库通知")
+            except Exception as e:
+                logger.warning(f"连接数据库通知失败，进度只能在本进程内推送: {e}")
+                await self._reset_connection()
+            return self._connection
+
+    async def _reset_connection(self):
+        connection, self._connection = self._connection, None
+        self._listening = False
+        if connection is not None and not connection.is_closed():
+            try:
+                await connection.close()
+            except Exception:
+                pass
+
+    async def _ensure_listener(self):
+        """首次订阅时开始 LISTEN，连接断开后在下一次订阅或转发时重建"""
+        if not settings.progress_notify_enabled:
+            return
+        await self._ensure_connection(listen=True)
+
+    @asynccontextmanager
+    async def subscribe(self, topic: str) -> AsyncIterator[asyncio.Queue]:
+        """订阅主题，返回接收事件的队列"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=100)
+        self._subscribers.setdefault(topic, set()).add(queue)
+        try:
+            await self._ensure_listener()
+            yield queue
+        finally:
+            subscribers = self._subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[topic]
+
+    async def stream(
+        self,
+        topic: str,
+        snapshot: Callable[[], Awaitable[Optional[Dict[str, Any]]]],
+        is_final: Callable[[Dict[str, Any]], bool],
+        is_disconnected: Callable[[], Awaitable[bool]],
+    ) -> AsyncIterator[str]:
+        """生成SSE消息流：先发送当前状态快照，再推送后续事件，直到结束事件或客户端断开"""
+        async with self.subscribe(topic) as queue:
+            # 先订阅再读取快照，避免两者之间的事件丢失
+            current = await snapshot()
+            if current is None:
+                yield format_sse({"message": "资源不存在"}, event="error")
+                return
+            yield format_sse(current)
+            if is_final(current):
+                return
+
+            while not await is_disconnected():
+                try:
+                    event = await asyncio.wait_for(
+                        queue.get(), timeout=settings.progress_stream_keepalive
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(event)
+                if is_final(event):
+                    return
+
+    async def close(self):
+        """发送剩余的事件并关闭长连接"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self._flush()
+        await self._reset_connection()
+
+
+# 全局进度推送实例
+progress_broker = ProgressBroker()
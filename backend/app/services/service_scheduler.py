@@ -98,7 +98,8 @@ class ServiceScheduler:
                 async for db in get_async_db():
                     cleaned_count = await self.service_manager.cleanup_idle_services(db)
                     if cleaned_count > 0:
-                        logger.info(f"清理了 {cleaned_count} 个空闲服务")
+                        mode = "缩容至零" if settings.service_scale_to_zero_enabled else "停止"
+                        logger.info(f"{mode}了 {cleaned_count} 个空闲服务")
                     break
                 
                 # 每10分钟检查一次
@@ -134,6 +135,10 @@ class ServiceScheduler:
                                f"CPU占用: {service_resources['cpu_utilization']:.1f}%, "
                                f"内存占用: {service_resources['memory_utilization']:.1f}%")
                     
+                    # 同步容器实时资源使用（来自mManager统计流）
+                    updated = await self.service_manager.sync_resource_usage(db)
+                    logger.debug(f"已更新 {updated} 个服务的资源使用数据")
+                    
                     break
                 
                 # 每5分钟监控一次
@@ -5,13 +5,16 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 from app.models import Repository, RepositoryDailyStats
-from app.database import get_async_db
+from app.database import get_async_db, AsyncSessionLocal
+from app.services.job_queue import job_queue, JobContext
 from datetime import date, timedelta, datetime
 from app.utils.logger import get_logger
 import asyncio
 
 logger = get_logger(__name__)
 
+TRENDING_STATS_JOB = "stats.update_trending"
+
 
 async def update_repository_trending_stats(db: AsyncSession):
     """更新所有仓库的时间窗口统计
@@ -119,6 +122,14 @@ async def run_scheduled_tasks():
             await db.close()
 
 
+@job_queue.handler(TRENDING_STATS_JOB)
+async def run_trending_stats_job(ctx: JobContext):
+    """后台任务：更新仓库时间窗口统计"""
+    async with AsyncSessionLocal() as db:
+        count = await update_repository_trending_stats(db)
+    return {"updated_repositories": count}
+
+
 # 用于手动触发的函数
 async def manual_update_stats():
     """手动更新统计数据
@@ -0,0 +1,383 @@
+"""
+docker-archive / OCI 镜像包读取工具
+只读取 manifest.json（或 index.json）、镜像配置和层信息所在的tar成员，按偏移直接定位，
+不解包、不启动 skopeo，用于上传校验和镜像信息展示
+"""
+
+import hashlib
+import json
+import logging
+import posixpath
+import tarfile
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# 镜像元数据文件的最大读取大小
+METADATA_MAX_SIZE = 16 * 1024 * 1024
+
+MemberIndex = Dict[str, Tuple[int, int]]  # 名称 -> (数据偏移, 大小)
+
+OCI_MANIFEST_TYPE = "application/vnd.oci.image.manifest.v1+json"
+OCI_CONFIG_TYPE = "application/vnd.oci.image.config.v1+json"
+OCI_LAYER_TYPE = "application/vnd.oci.image.layer.v1.tar"
+OCI_LAYER_GZIP_TYPE = "application/vnd.oci.image.layer.v1.tar+gzip"
+
+
+class DockerArchiveError(Exception):
+    """无法识别的镜像包"""
+
+
+class _ArchiveReader:
+    """按成员名称读取tar中的小文件"""
+
+    def __init__(self, fileobj: BinaryIO, members: Optional[MemberIndex] = None):
+        self.fileobj = fileobj
+        # 压缩包无法按偏移读取，遍历时缓存元数据文件内容
+        self._cache: Optional[Dict[str, bytes]] = None
+        if members is None:
+            members = self._scan_members()
+        else:
+            members = {_normalize(name): entry for name, entry in members.items()}
+        self.members = members
+
+    def _scan_members(self) -> MemberIndex:
+        """遍历tar头部建立成员索引（未压缩的tar只读头部块，按偏移跳过数据）"""
+        members: MemberIndex = {}
+        self.fileobj.seek(0)
+        try:
+            with tarfile.open(fileobj=self.fileobj, mode="r:*") as archive:
+                if archive.fileobj is not self.fileobj:
+                    self._cache = {}
+                for info in archive:
+                    if not info.isreg():
+                        continue
+                    name = _normalize(info.name)
+                    members[name] = (info.offset_data, info.size)
+                    if self._cache is not None and _is_metadata(name, info.size):
+                        self._cache[name] = archive.extractfile(info).read()
+        except tarfile.TarError as e:
+            raise DockerArchiveError(f"无效的tar文件: {e}")
+        return members
+
+    def has(self, name: str) -> bool:
+        return _normalize(name) in self.members
+
+    def size(self, name: str) -> Optional[int]:
+        entry = self.members.get(_normalize(name))
+        return entry[1] if entry else None
+
+    def read(self, name: str) -> bytes:
+        name = _normalize(name)
+        if self._cache is not None:
+            if name not in self._cache:
+                raise DockerArchiveError(f"镜像包中缺少 {name}")
+            return self._cache[name]
+
+        entry = self.members.get(name)
+        if entry is None:
+            raise DockerArchiveError(f"镜像包中缺少 {name}")
+        offset, size = entry
+        if size > METADATA_MAX_SIZE:
+            raise DockerArchiveError(f"{name} 过大 ({size} bytes)")
+        self.fileobj.seek(offset)
+        data = self.fileobj.read(size)
+        if len(data) != size:
+            raise DockerArchiveError(f"{name} 数据不完整")
+        return data
+
+    def read_json(self, name: str) -> Any:
+        try:
+            return json.loads(self.read(name))
+        except ValueError as e:
+            raise DockerArchiveError(f"{name} 不是有效的JSON: {e}")
+
+
+def _normalize(name: str) -> str:
+    name = posixpath.normpath(name)
+    return name[2:] if name.startswith("./") else name
+
+
+def _is_metadata(name: str, size: int) -> bool:
+    """是否为需要读取内容的元数据文件（层数据除外）"""
+    if size > METADATA_MAX_SIZE:
+        return False
+    return name.endswith(".json") or (name.startswith("blobs/") and size < 1024 * 1024)
+
+
+def _blob_path(digest: str) -> str:
+    algorithm, _, hex_digest = digest.partition(":")
+    return f"blobs/{algorithm}/{hex_digest}"
+
+
+def _digest_from_path(path: str) -> Optional[str]:
+    """blobs/sha256/<hex> 形式的路径对应的摘要"""
+    parts = _normalize(path).split("/")
+    if len(parts) == 3 and parts[0] == "blobs":
+        return f"{parts[1]}:{parts[2]}"
+    return None
+
+
+def _read_docker_manifest(reader: _ArchiveReader) -> Dict[str, Any]:
+    """解析 docker save 生成的 manifest.json"""
+    manifest = reader.read_json("manifest.json")
+    if not isinstance(manifest, list) or not manifest:
+        raise DockerArchiveError("manifest.json 中没有镜像")
+    if len(manifest) > 1:
+        logger.info(f"镜像包包含 {len(manifest)} 个镜像，只读取第一个")
+    entry = manifest[0]
+
+    config_path = entry.get("Config")
+    if not config_path:
+        raise DockerArchiveError("manifest.json 缺少 Config")
+    config = reader.read_json(config_path)
+    config_digest = _digest_from_path(config_path) or (
+        f"sha256:{posixpath.basename(config_path).removesuffix('.json')}"
+    )
+
+    diff_ids = (config.get("rootfs") or {}).get("diff_ids") or []
+    layer_sources = entry.get("LayerSources") or {}
+    layer_paths = entry.get("Layers") or []
+    if diff_ids and len(diff_ids) != len(layer_paths):
+        raise DockerArchiveError(
+            f"层数量不一致: manifest {len(layer_paths)} 层，配置 {len(diff_ids)} 层"
+        )
+
+    layers = []
+    for i, layer_path in enumerate(layer_paths):
+        size = reader.size(layer_path)
+        if size is None:
+            raise DockerArchiveError(f"镜像包中缺少层 {layer_path}")
+        diff_id = diff_ids[i] if i < len(diff_ids) else None
+        # 新版 docker save 的层位于 blobs/ 下，路径即摘要；旧版 <id>/layer.tar 为未压缩层，摘要等于 diff_id
+        digest = _digest_from_path(layer_path) or diff_id
+        source = layer_sources.get(diff_id) if diff_id else None
+        layers.append(
+            {
+                "Digest": digest,
+                "DiffID": diff_id,
+                "Size": size,
+                "MIMEType": (source or {}).get(
+                    "mediaType", "application/vnd.docker.image.rootfs.diff.tar"
+                ),
+                "Path": layer_path,
+            }
+        )
+
+    return {
+        "format": "docker-archive",
+        "repo_tags": entry.get("RepoTags") or [],
+        "config_path": config_path,
+        "config_digest": config_digest,
+        "config": config,
+        "layers": layers,
+    }
+
+
+def _read_oci_layout(reader: _ArchiveReader) -> Dict[str, Any]:
+    """解析 OCI 镜像布局（index.json + blobs）"""
+    index = reader.read_json("index.json")
+    descriptors = index.get("manifests") or []
+    if not descriptors:
+        raise DockerArchiveError("index.json 中没有镜像")
+
+    descriptor = descriptors[0]
+    manifest = reader.read_json(_blob_path(descriptor["digest"]))
+    # 多平台索引时取第一个平台的清单
+    if manifest.get("manifests"):
+        descriptor = manifest["manifests"][0]
+        manifest = reader.read_json(_blob_path(descriptor["digest"]))
+
+    config_descriptor = manifest.get("config") or {}
+    config = reader.read_json(_blob_path(config_descriptor["digest"]))
+    diff_ids = (config.get("rootfs") or {}).get("diff_ids") or []
+
+    layers = []
+    for i, layer in enumerate(manifest.get("layers") or []):
+        path = _blob_path(layer["digest"])
+        if not reader.has(path):
+            raise DockerArchiveError(f"镜像包中缺少层 {layer['digest']}")
+        layers.append(
+            {
+                "Digest": layer["digest"],
+                "DiffID": diff_ids[i] if i < len(diff_ids) else None,
+                "Size": layer.get("size") or reader.size(path),
+                "MIMEType": layer.get("mediaType"),
+                "Path": path,
+            }
+        )
+
+    ref_name = (descriptor.get("annotations") or {}).get(
+        "io.containerd.image.name"
+    ) or (descriptor.get("annotations") or {}).get("org.opencontainers.image.ref.name")
+
+    return {
+        "format": "oci",
+        "repo_tags": [ref_name] if ref_name else [],
+        "config_path": _blob_path(config_descriptor["digest"]),
+        "config_digest": config_descriptor["digest"],
+        "config": config,
+        "layers": layers,
+        "manifest_digest": descriptor["digest"],
+        "manifest_media_type": manifest.get("mediaType")
+        or descriptor.get("mediaType")
+        or OCI_MANIFEST_TYPE,
+    }
+
+
+def inspect_archive(
+    source: Union[str, Path, BinaryIO],
+    members: Optional[MemberIndex] = None,
+) -> Dict[str, Any]:
+    """读取镜像包信息，返回与 skopeo inspect 相近的结构
+
+    Args:
+        source: tar文件路径或可随机读取的文件对象
+        members: 已知的成员索引（例如落盘时解析得到的），提供时不再遍历tar头部
+    """
+    if isinstance(source, (str, Path)):
+        with open(source, "rb") as f:
+            return inspect_archive(f, members)
+
+    reader = _ArchiveReader(source, members)
+    if reader.has("manifest.json"):
+        parsed = _read_docker_manifest(reader)
+    elif reader.has("index.json"):
+        parsed = _read_oci_layout(reader)
+    else:
+        raise DockerArchiveError("不是docker-archive或OCI镜像包: 缺少 manifest.json / index.json")
+
+    config = parsed["config"]
+    container_config = config.get("config") or {}
+    layers = parsed["layers"]
+    return {
+        "Format": parsed["format"],
+        "RepoTags": parsed["repo_tags"],
+        "Digest": parsed["config_digest"],
+        "Created": config.get("created"),
+        "Architecture": config.get("architecture"),
+        "Os": config.get("os"),
+        "Variant": config.get("variant"),
+        "Env": container_config.get("Env") or [],
+        "Labels": container_config.get("Labels") or {},
+        "ExposedPorts": sorted((container_config.get("ExposedPorts") or {}).keys()),
+        "Layers": [layer["Digest"] for layer in layers],
+        "LayersData": layers,
+        "Size": sum(layer["Size"] or 0 for layer in layers),
+    }
+
+
+def _entry(reader: _ArchiveReader, path: str) -> Tuple[int, int]:
+    entry = reader.members.get(_normalize(path))
+    if entry is None:
+        raise DockerArchiveError(f"镜像包中缺少 {path}")
+    return entry
+
+
+def _sha256_range(fileobj: BinaryIO, offset: int, size: int) -> str:
+    """计算tar中一段数据的sha256"""
+    digest = hashlib.sha256()
+    fileobj.seek(offset)
+    remaining = size
+    while remaining:
+        chunk = fileobj.read(min(1024 * 1024, remaining))
+        if not chunk:
+            raise DockerArchiveError("镜像包数据不完整")
+        digest.update(chunk)
+        remaining -= len(chunk)
+    return f"sha256:{digest.hexdigest()}"
+
+
+def read_push_plan(
+    source: Union[str, Path, BinaryIO],
+    members: Optional[MemberIndex] = None,
+) -> Dict[str, Any]:
+    """生成按层推送所需的信息：清单内容，以及配置和各层blob在tar中的位置
+
+    只支持未压缩的tar包（需按偏移读取层数据）。docker-archive 生成 OCI 清单，层按原样上传，
+    摘要与 diff_id 一致，因此同一基础层在不同镜像、不同版本之间摘要稳定，可以按摘要去重。
+    OCI 镜像布局直接使用包内的清单。
+
+    Returns:
+        {"manifest": bytes, "manifest_media_type": str,
+         "blobs": [{"digest", "size", "offset", "media_type", "kind"}]}，blobs 第一项为配置
+    """
+    if isinstance(source, (str, Path)):
+        with open(source, "rb") as f:
+            return read_push_plan(f, members)
+
+    reader = _ArchiveReader(source, members)
+    if reader._cache is not None:
+        raise DockerArchiveError("压缩的镜像包不支持按层推送")
+
+    if reader.has("manifest.json"):
+        parsed = _read_docker_manifest(reader)
+    elif reader.has("index.json"):
+        parsed = _read_oci_layout(reader)
+    else:
+        raise DockerArchiveError("不是docker-archive或OCI镜像包: 缺少 manifest.json / index.json")
+
+    config_offset, config_size = _entry(reader, parsed["config_path"])
+    config_bytes = reader.read(parsed["config_path"])
+    config_digest = f"sha256:{hashlib.sha256(config_bytes).hexdigest()}"
+    blobs = [
+        {
+            "kind": "config",
+            "digest": config_digest,
+            "size": config_size,
+            "offset": config_offset,
+            "media_type": OCI_CONFIG_TYPE,
+        }
+    ]
+
+    for layer in parsed["layers"]:
+        offset, size = _entry(reader, layer["Path"])
+        source.seek(offset)
+        gzipped = source.read(2) == b"\x1f\x8b"
+        digest = _digest_from_path(layer["Path"])
+        if digest is None:
+            # 旧版 <id>/layer.tar：未压缩时摘要即 diff_id，否则需要计算
+            digest = layer["DiffID"] if layer["DiffID"] and not gzipped else None
+        if digest is None:
+            digest = _sha256_range(source, offset, size)
+        blobs.append(
+            {
+                "kind": "layer",
+                "digest": digest,
+                "size": size,
+                "offset": offset,
+                "media_type": (
+                    layer["MIMEType"]
+                    if parsed["format"] == "oci" and layer["MIMEType"]
+                    else (OCI_LAYER_GZIP_TYPE if gzipped else OCI_LAYER_TYPE)
+                ),
+            }
+        )
+
+    if parsed["format"] == "oci":
+        # 使用包内原始清单，保持清单摘要不变
+        manifest_bytes = reader.read(_blob_path(parsed["manifest_digest"]))
+        media_type = parsed["manifest_media_type"]
+    else:
+        manifest = {
+            "schemaVersion": 2,
+            "mediaType": OCI_MANIFEST_TYPE,
+            "config": {
+                "mediaType": OCI_CONFIG_TYPE,
+                "digest": config_digest,
+                "size": config_size,
+            },
+            "layers": [
+                {"mediaType": blob["media_type"], "digest": blob["digest"], "size": blob["size"]}
+                for blob in blobs[1:]
+            ],
+        }
+        manifest_bytes = json.dumps(manifest, separators=(",", ":")).encode()
+        media_type = OCI_MANIFEST_TYPE
+
+    return {
+        "manifest": manifest_bytes,
+        "manifest_media_type": media_type,
+        "blobs": blobs,
+    }
@@ -9,19 +9,36 @@
 """
 
 import re
+import time
+import uuid
+import heapq
 import psutil
 import asyncio
 import logging
+from datetime import datetime, timedelta, timezone
 from typing import Dict, List, Optional, Tuple, Set
 from dataclasses import dataclass
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+from sqlalchemy import select, func, delete
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
-from app.models.service import ModelService
+from app.database import AsyncSessionLocal
+from app.models.service import ModelService, PortReservation
+from app.schemas.service import ServiceStatus
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+# 预留失败或本机已占用的端口，间隔该时间(秒)后重新放回空闲端口池
+PORT_RETRY_DELAY = 60
+
+# 这些状态的服务即使容器未监听也保留端口（空闲服务恢复时沿用原端口）
+_PORT_RETAINING_STATUSES = (
+    ServiceStatus.RUNNING,
+    ServiceStatus.STARTING,
+    ServiceStatus.IDLE,
+)
+
 
 @dataclass
 class ResourceUsage:
@@ -53,45 +70,182 @@ class ResourceManager:
         self.max_memory_limit = settings.max_memory_limit
         self.default_cpu_limit = settings.default_cpu_limit
         self.default_memory_limit = settings.default_memory_limit
-    
-    async def allocate_port(self, db: AsyncSession, exclude_ports: Optional[Set[int]] = None) -> int:
-        """分配可用端口"""
-        
-        # 获取已使用的端口
+
+        # 内存空闲端口池：最小堆 + 成员集合（堆中可能残留已分配端口，弹出时惰性跳过）
+        self._free_ports_heap: List[int] = []
+        self._free_ports: Set[int] = set()
+        self._port_pool_seeded = False
+        self._port_pool_lock = asyncio.Lock()
+        # 暂时不可用的端口: {port: 可重试的monotonic时间}
+        self._deferred_ports: Dict[int, float] = {}
+        # 本进程标识，记录在端口预留中便于排查
+        self._instance_id = uuid.uuid4().hex[:12]
+
+    async def _seed_port_pool(self, db: AsyncSession):
+        """从数据库加载已使用（含空闲服务保留）和未过期预留的端口，重建空闲端口池"""
         used_ports_query = select(ModelService.gradio_port).where(
             ModelService.gradio_port.isnot(None)
         )
         result = await db.execute(used_ports_query)
         used_ports = {port for (port,) in result.fetchall() if port}
-        
-        # 添加排除的端口
-        if exclude_ports:
-            used_ports.update(exclude_ports)
-        
-        # 检查系统端口使用情况
-        system_used_ports = self._get_system_used_ports()
-        used_ports.update(system_used_ports)
-        
-        # 查找可用端口
-        available_ports = set(range(self.port_range_start, self.port_range_end)) - used_ports
-        
-        if not available_ports:
-            raise RuntimeError(f"端口范围 {self.port_range_start}-{self.port_range_end} 内没有可用端口")
-        
-        # 如果系统端口检查失败（权限不足），使用端口绑定测试验证可用性
-        if not system_used_ports:  # 如果系统端口列表为空，说明获取失败
-            logger.info("使用端口绑定测试验证端口可用性")
-            for port in sorted(available_ports):
-                if self._is_port_available(port):
-                    logger.info(f"分配端口: {port} (通过绑定测试验证)")
-                    return port
-            raise RuntimeError(f"端口范围内所有候选端口都不可用")
-        
-        # 正常情况：返回最小可用端口
-        allocated_port = min(available_ports)
-        logger.info(f"分配端口: {allocated_port}")
-        return allocated_port
-    
+
+        reserved_query = select(PortReservation.port).where(
+            PortReservation.expires_at > func.now()
+        )
+        result = await db.execute(reserved_query)
+        used_ports.update(port for (port,) in result.fetchall())
+        self._deferred_ports.clear()
+
+        self._free_ports = (
+            set(range(self.port_range_start, self.port_range_end)) - used_ports
+        )
+        self._free_ports_heap = list(self._free_ports)
+        heapq.heapify(self._free_ports_heap)
+        self._port_pool_seeded = True
+        logger.info(
+            f"端口池已初始化: 空闲 {len(self._free_ports)} 个, 已使用 {len(used_ports)} 个"
+        )
+
+    async def _ensure_port_pool(self, db: AsyncSession):
+        """确保空闲端口池已初始化（仅首次分配时访问数据库）"""
+        if self._port_pool_seeded:
+            return
+        async with self._port_pool_lock:
+            if not self._port_pool_seeded:
+                await self._seed_port_pool(db)
+
+    def _pop_free_port(self) -> Optional[int]:
+        """弹出最小的空闲端口"""
+        while self._free_ports_heap:
+            port = heapq.heappop(self._free_ports_heap)
+            if port in self._free_ports:
+                self._free_ports.discard(port)
+                return port
+        return None
+
+    def _return_port(self, port: int):
+        """将端口放回空闲端口池"""
+        if not self._port_pool_seeded or port in self._free_ports:
+            return
+        self._free_ports.add(port)
+        heapq.heappush(self._free_ports_heap, port)
+
+    def _defer_port(self, port: int):
+        """暂时不可用的端口稍后重新放回空闲端口池"""
+        self._deferred_ports[port] = time.monotonic() + PORT_RETRY_DELAY
+
+    def _requeue_deferred_ports(self):
+        now = time.monotonic()
+        for port in [p for p, retry_at in self._deferred_ports.items() if retry_at <= now]:
+            del self._deferred_ports[port]
+            self._return_port(port)
+
+    async def release_port(self, port: Optional[int]):
+        """释放端口：删除预留并归还到空闲端口池"""
+        if not port or not (self.port_range_start <= port < self.port_range_end):
+            return
+        await self._delete_reservation(port)
+        self._deferred_ports.pop(port, None)
+        self._return_port(port)
+        logger.debug(f"释放端口: {port}")
+
+    async def confirm_port(self, port: Optional[int]):
+        """服务记录提交后删除端口预留，此后由服务记录占用端口"""
+        if port:
+            await self._delete_reservation(port)
+
+    async def _delete_reservation(self, port: int):
+        try:
+            async with AsyncSessionLocal() as session:
+                await session.execute(
+                    delete(PortReservation).where(PortReservation.port == port)
+                )
+                await session.commit()
+        except Exception as e:
+            # 预留到期后会被自动接管，这里只记录
+            logger.warning(f"删除端口 {port} 的预留失败: {e}")
+
+    async def _acquire_port_lease(self, port: int) -> bool:
+        """预留端口
+
+        在独立的短事务中写入预留记录并立即提交，预留在 port_reservation_ttl 内有效，
+        不依赖调用方事务的生命周期；已过期的预留可被接管。
+        写入成功后再确认端口未被其他worker已提交的服务占用。
+        """
+        expires_at = datetime.now(timezone.utc) + timedelta(
+            seconds=settings.port_reservation_ttl
+        )
+        async with AsyncSessionLocal() as session:
+            stmt = (
+                pg_insert(PortReservation)
+                .values(port=port, reserved_by=self._instance_id, expires_at=expires_at)
+                .on_conflict_do_update(
+                    index_elements=[PortReservation.port],
+                    set_={
+                        "reserved_by": self._instance_id,
+                        "reserved_at": func.now(),
+                        "expires_at": expires_at,
+                    },
+                    where=PortReservation.expires_at < func.now(),
+                )
+                .returning(PortReservation.port)
+            )
+            reserved = (await session.execute(stmt)).scalar_one_or_none()
+            if reserved is None:
+                await session.rollback()
+                return False
+
+            taken_query = (
+                select(ModelService.id).where(ModelService.gradio_port == port).limit(1)
+            )
+            if (await session.execute(taken_query)).scalar_one_or_none() is not None:
+                await session.rollback()
+                return False
+
+            await session.commit()
+            return True
+
+    async def allocate_port(self, db: AsyncSession, exclude_ports: Optional[Set[int]] = None) -> int:
+        """分配可用端口
+
+        从内存空闲端口池中取最小端口，并通过数据库中的预留记录保证多worker间不重复分配。
+        服务记录提交后调用 confirm_port 删除预留，失败时调用方需通过 release_port 归还。
+        """
+        await self._ensure_port_pool(db)
+        self._requeue_deferred_ports()
+
+        skipped_ports = []
+        try:
+            while True:
+                port = self._pop_free_port()
+                if port is None:
+                    raise RuntimeError(
+                        f"端口范围 {self.port_range_start}-{self.port_range_end} 内没有可用端口"
+                    )
+
+                if exclude_ports and port in exclude_ports:
+                    skipped_ports.append(port)
+                    continue
+
+                # 其他worker正在预留或已占用该端口，稍后重试
+                if not await self._acquire_port_lease(port):
+                    logger.debug(f"端口 {port} 已被其他进程占用，跳过")
+                    self._defer_port(port)
+                    continue
+
+                # 本机端口冲突检查（单次绑定测试）
+                if not self._is_port_available(port):
+                    logger.debug(f"端口 {port} 已被系统占用，跳过")
+                    await self._delete_reservation(port)
+                    self._defer_port(port)
+                    continue
+
+                logger.info(f"分配端口: {port}")
+                return port
+        finally:
+            for port in skipped_ports:
+                self._return_port(port)
+
     def _get_system_used_ports(self) -> Set[int]:
         """获取系统已使用的端口"""
         used_ports = set()
@@ -114,7 +268,6 @@ class ResourceManager:
     def _is_port_available(self, port: int) -> bool:
         """通过尝试绑定来检查端口是否可用"""
         import socket
-        import time
         
         try:
             # 尝试绑定TCP端口
@@ -123,10 +276,6 @@ class ResourceManager:
                 # 设置非阻塞模式，快速检测
                 sock.settimeout(0.1)
                 sock.bind(('127.0.0.1', port))
-                # 立即关闭socket，释放端口
-                sock.close()
-                # 短暂等待确保端口完全释放
-                time.sleep(0.01)
                 return True
         except (socket.error, OSError):
             return False
@@ -465,11 +614,23 @@ class ResourceManager:
             services_to_cleanup = cleanup_result.scalars().all()
             
             for service in services_to_cleanup:
-                if service.status not in ['running', 'starting']:
-                    service.gradio_port = None
-                    logger.info(f"清理服务 {service.id} 的未使用端口 {service.gradio_port}")
+                # 空闲服务的容器已停止但仍保留端口映射，恢复时需要原端口
+                if service.status in _PORT_RETAINING_STATUSES or service.container_id:
+                    continue
+                logger.info(f"清理服务 {service.id} 的未使用端口 {service.gradio_port}")
+                service.gradio_port = None
             
             await db.commit()
+
+        # 删除过期的端口预留（异常退出的worker遗留）
+        await db.execute(
+            delete(PortReservation).where(PortReservation.expires_at < func.now())
+        )
+        await db.commit()
+
+        # 与数据库重新同步空闲端口池，回收其他worker变更或异常路径遗留的端口
+        async with self._port_pool_lock:
+            await self._seed_port_pool(db)
         
         return len(unused_ports)
 
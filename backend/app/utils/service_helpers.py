@@ -131,11 +131,14 @@ class BatchOperationManager:
         service_ids: List[int],
         repository: Repository,
         current_user: User,
-        operation_func,
-        background_tasks,
+        batch_func,
         operation_name: str,
     ):
-        """执行批量服务操作的通用逻辑"""
+        """执行批量服务操作的通用逻辑
+
+        batch_func(db, services, user_id) 一次处理全部有效服务，
+        返回 (成功的服务ID列表, 失败信息列表)
+        """
         # 1. 检查权限
         ServicePermissionManager.check_repository_owner_permission(
             repository, current_user, f"批量{operation_name}服务"
@@ -149,26 +152,21 @@ class BatchOperationManager:
         )
 
         # 3. 执行操作
-        successful = []
-        failed = []
-
-        # 处理无效服务
-        for service_id in invalid_service_ids:
-            failed.append(
-                {"service_id": service_id, "error": "服务不存在或不属于该仓库"}
+        failed = [
+            {"service_id": service_id, "error": "服务不存在或不属于该仓库"}
+            for service_id in invalid_service_ids
+        ]
+        if not valid_services:
+            return [], failed
+
+        try:
+            successful, batch_failed = await batch_func(
+                db, valid_services, current_user.id
             )
+        except Exception as e:
+            return [], failed + [
+                {"service_id": service.id, "error": str(e)}
+                for service in valid_services
+            ]
 
-        # 处理有效服务
-        for service in valid_services:
-            try:
-                background_tasks.add_task(
-                    operation_func,
-                    db=db,
-                    service_id=service.id,
-                    user_id=current_user.id,
-                )
-                successful.append(service.id)
-            except Exception as e:
-                failed.append({"service_id": service.id, "error": str(e)})
-
-        return successful, failed
+        return successful, failed + batch_failed
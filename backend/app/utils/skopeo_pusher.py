@@ -5,16 +5,17 @@ Skopeo镜像推送工具
 """
 
 import asyncio
-import json
 import tempfile
 import shutil
 import os
 import uuid
 from pathlib import Path
-from typing import Dict, BinaryIO, Any, Optional, Tuple
+from typing import Dict, BinaryIO, Any, Optional, Tuple, Union
 import logging
 
 from app.config import settings
+from app.utils.docker_archive import DockerArchiveError, inspect_archive
+from app.utils.tar_ingest import SpooledTar, TarSource, spool_tar
 
 logger = logging.getLogger(__name__)
 
@@ -139,7 +140,7 @@ class SkopeoPusher:
 
     async def push_from_tar(
         self,
-        tar_file: BinaryIO,
+        tar_file: Union[SpooledTar, BinaryIO],
         harbor_url: str,
         username: str,
         password: str,
@@ -152,7 +153,7 @@ class SkopeoPusher:
         使用skopeo从tar文件推送镜像到Harbor
 
         Args:
-            tar_file: Docker tar文件流
+            tar_file: 已落盘的tar包（直接使用，不再复制），或Docker tar文件流
             harbor_url: Harbor服务器URL
             username: 用户名
             password: 密码
@@ -164,16 +165,18 @@ class SkopeoPusher:
         Returns:
             推送结果字典
         """
-        host_tar_path = None
+        spooled = None
+        owned = False
 
         try:
             method = "Docker容器" if self.use_docker else "原生Skopeo"
             if progress_callback:
                 await progress_callback(5, f"准备{method}推送...")
 
-            # 1. 保存tar文件到临时路径 (返回宿主机路径和容器路径)
-            host_tar_path, container_tar_path = await self._save_temp_tar(tar_file)
-            logger.info(f"临时tar文件已保存: {host_tar_path}")
+            # 1. 获取落盘的tar文件 (宿主机路径和容器路径)
+            spooled, owned = await self._resolve_tar(tar_file)
+            host_tar_path = spooled.path
+            container_tar_path = self._container_path(host_tar_path)
 
             if progress_callback:
                 await progress_callback(10, "开始skopeo推送...")
@@ -187,7 +190,8 @@ class SkopeoPusher:
             result = await self._execute_skopeo_copy(
                 host_tar_path, container_tar_path,
                 target_url, username, password,
-                progress_callback
+                progress_callback,
+                transport=self._source_transport(spooled)
             )
 
             if result.get('status') == 'success':
@@ -212,55 +216,80 @@ class SkopeoPusher:
             }
 
         finally:
-            # 清理临时文件
-            if host_tar_path and host_tar_path.exists():
-                try:
-                    host_tar_path.unlink()
-                    logger.debug(f"清理临时文件: {host_tar_path}")
-                except Exception as e:
-                    logger.warning(f"清理临时文件失败: {e}")
+            # 只清理本方法落盘的文件，传入的 SpooledTar 由调用方清理
+            if spooled and owned:
+                spooled.cleanup()
+
+    @property
+    def spool_dir(self) -> Path:
+        """tar包落盘目录：Docker模式为共享目录，原生模式为系统临时目录"""
+        if self.use_docker:
+            return self.host_shared_dir
+        return Path(tempfile.gettempdir())
 
-    async def _save_temp_tar(self, tar_file: BinaryIO) -> Tuple[Path, str]:
+    async def ingest(
+        self,
+        source: TarSource,
+        max_size: Optional[int] = None,
+        fail_fast: bool = False,
+    ) -> SpooledTar:
+        """将上传数据一次写入落盘目录，同时计算sha256并解析tar清单
+
+        Args:
+            source: 请求体异步迭代器、UploadFile 或文件对象
+            max_size: 最大字节数
+            fail_fast: 数据不是有效tar时立即中止接收
         """
-        保存tar文件到临时路径
+        return await spool_tar(
+            source,
+            self.spool_dir,
+            prefix="skopeo_",
+            max_size=max_size,
+            fail_fast=fail_fast,
+        )
+
+    def _container_path(self, host_path: Path) -> str:
+        """宿主机路径对应的skopeo可见路径"""
+        if not self.use_docker:
+            # 原生模式下,宿主机路径和容器路径相同
+            return str(host_path)
+        relative = host_path.relative_to(self.host_shared_dir)
+        return f"{self.container_shared_dir}/{relative.as_posix()}"
+
+    @staticmethod
+    def _source_transport(spooled: SpooledTar) -> str:
+        """根据tar包布局选择skopeo源传输方式（只有 index.json 时按OCI归档读取）"""
+        if "manifest.json" not in spooled.captured and "index.json" in spooled.captured:
+            return "oci-archive"
+        return "docker-archive"
+
+    async def _resolve_tar(
+        self, tar_file: Union[SpooledTar, BinaryIO]
+    ) -> Tuple[SpooledTar, bool]:
+        """获取可供skopeo读取的落盘tar包
 
         Returns:
-            tuple: (宿主机路径, 容器内路径)
+            (落盘tar包, 是否由本次调用创建并负责清理)
         """
-        try:
-            # 重置文件指针
-            tar_file.seek(0)
-
-            if self.use_docker:
-                # Docker模式: 保存到共享目录
-                filename = f"skopeo_{uuid.uuid4().hex}.tar"
-                host_path = self.host_shared_dir / filename
-                container_path = f"{self.container_shared_dir}/{filename}"
-
-                # 保存到宿主机共享目录
-                with open(host_path, 'wb') as f:
-                    shutil.copyfileobj(tar_file, f)
-
-                logger.debug(f"保存到共享目录 - 宿主机: {host_path}, 容器: {container_path}")
-                logger.debug(f"文件大小: {host_path.stat().st_size} bytes")
-                return host_path, container_path
-
-            else:
-                # 原生模式: 使用系统临时目录
-                temp_fd, temp_path_str = tempfile.mkstemp(suffix='.tar', prefix='skopeo_')
-                temp_path = Path(temp_path_str)
-
-                # 写入数据
-                with open(temp_fd, 'wb') as f:
-                    shutil.copyfileobj(tar_file, f)
-
-                logger.debug(f"保存到临时文件: {temp_path} ({temp_path.stat().st_size} bytes)")
-                # 原生模式下,宿主机路径和容器路径相同
-                return temp_path, str(temp_path)
+        if isinstance(tar_file, SpooledTar):
+            if not self.use_docker or tar_file.path.is_relative_to(
+                self.host_shared_dir
+            ):
+                return tar_file, False
+
+            # Docker模式下文件不在共享目录：同一文件系统时硬链接，否则复制一次
+            target = self.host_shared_dir / f"skopeo_{uuid.uuid4().hex}.tar"
+            try:
+                os.link(tar_file.path, target)
+            except OSError:
+                loop = asyncio.get_event_loop()
+                await loop.run_in_executor(
+                    None, shutil.copyfile, tar_file.path, target
+                )
+            return tar_file.at(target), True
 
-        except Exception as e:
-            logger.error(f"保存临时tar文件失败: {e}")
-            raise
+        spooled = await self.ingest(tar_file)
+        return spooled, True
 
     async def _execute_skopeo_copy(
         self,
@@ -269,7 +298,8 @@ class SkopeoPusher:
         target_url: str,
         username: str,
         password: str,
-        progress_callback=None
+        progress_callback=None,
+        transport: str = "docker-archive"
     ) -> Dict[str, Any]:
         """执行skopeo copy命令"""
         try:
@@ -283,7 +313,7 @@ class SkopeoPusher:
                     "--dest-tls-verify=false",
                     "--dest-username", username,
                     "--dest-password", password,
-                    f"docker-archive:{tar_path_for_skopeo}",
+                    f"{transport}:{tar_path_for_skopeo}",
                     f"docker://{target_url}"
                 ]
             else:
@@ -295,7 +325,7 @@ class SkopeoPusher:
                     "--dest-tls-verify=false",
                     "--dest-username", username,
                     "--dest-password", password,
-                    f"docker-archive:{tar_path_for_skopeo}",
+                    f"{transport}:{tar_path_for_skopeo}",
                     f"docker://{target_url}"
                 ]
 
@@ -389,52 +419,42 @@ class SkopeoPusher:
         except asyncio.CancelledError:
             pass
 
-    async def get_image_info_from_tar(self, tar_file: BinaryIO) -> Dict[str, Any]:
-        """从tar文件获取镜像信息 (用于进度显示等)"""
-        temp_tar_path = None
-
-        try:
-            # 保存临时文件
-            temp_tar_path, container_tar_path = await self._save_temp_tar(tar_file)
-
-            if self.use_docker:
-                # Docker模式
-                cmd = [
-                    "docker", "exec", self.container_name,
-                    "skopeo", "inspect",
-                    f"docker-archive:{container_tar_path}"
-                ]
-            else:
-                # 原生模式
-                cmd = [
-                    "skopeo", "inspect",
-                    f"docker-archive:{temp_tar_path}"
-                ]
-
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
+    async def get_image_info_from_tar(
+        self, tar_file: Union[SpooledTar, BinaryIO]
+    ) -> Dict[str, Any]:
+        """从tar文件获取镜像信息 (用于上传校验、进度显示等)
 
-            stdout, stderr = await process.communicate()
+        进程内读取 manifest.json、镜像配置和层信息，只定位所需的tar成员，
+        不复制文件也不启动skopeo；已落盘的tar包直接使用落盘时解析的成员索引。
+        """
+        loop = asyncio.get_event_loop()
 
-            if process.returncode == 0 and stdout:
-                info = json.loads(stdout.decode())
-                return {
-                    'status': 'success',
-                    'info': info,
-                    'layers_count': len(info.get('Layers', [])),
-                    'size': info.get('Size', 0)
-                }
+        try:
+            if isinstance(tar_file, SpooledTar):
+                members = None if tar_file.compressed else tar_file.members
+                info = await loop.run_in_executor(
+                    None, inspect_archive, tar_file.path, members
+                )
             else:
-                error_msg = stderr.decode() if stderr else "Unknown error"
-                logger.error(f"获取镜像信息失败: {error_msg}")
-                return {
-                    'status': 'error',
-                    'message': error_msg
-                }
+                tar_file.seek(0)
+                info = await loop.run_in_executor(None, inspect_archive, tar_file)
+
+            result = {
+                'status': 'success',
+                'info': info,
+                'layers_count': len(info['Layers']),
+                'size': info['Size']
+            }
+            if isinstance(tar_file, SpooledTar):
+                result['tar_sha256'] = tar_file.sha256
+            return result
 
+        except DockerArchiveError as e:
+            logger.error(f"镜像包校验失败: {e}")
+            return {
+                'status': 'error',
+                'message': str(e)
+            }
         except Exception as e:
             logger.error(f"获取镜像信息异常: {e}")
             return {
@@ -442,18 +462,10 @@ class SkopeoPusher:
                 'message': str(e)
             }
 
-        finally:
-            # 清理临时文件
-            if temp_tar_path and temp_tar_path.exists():
-                try:
-                    temp_tar_path.unlink()
-                except Exception as e:
-                    logger.warning(f"清理临时文件失败: {e}")
-
 
 # 便捷函数
 async def skopeo_push_to_harbor(
-    tar_file: BinaryIO,
+    tar_file: Union[SpooledTar, BinaryIO],
     harbor_url: str,
     username: str,
     password: str,
@@ -467,7 +479,7 @@ async def skopeo_push_to_harbor(
     便捷函数：使用skopeo推送镜像到Harbor，支持自动回退
 
     Args:
-        tar_file: Docker tar文件流
+        tar_file: 已落盘的tar包或Docker tar文件流
         harbor_url: Harbor服务器URL
         username: 用户名
         password: 密码
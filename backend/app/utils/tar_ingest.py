@@ -0,0 +1,435 @@
+"""
+镜像tar包落盘工具
+上传数据只写一次磁盘，写入的同时计算sha256、增量解析tar结构（记录成员位置并提取 manifest.json 等元数据），
+后续的校验、inspect 和推送都基于同一个文件
+"""
+
+import asyncio
+import base64
+import copy
+import hashlib
+import json
+import logging
+import tarfile
+import uuid
+import zlib
+from pathlib import Path
+from typing import Any, AsyncIterator, BinaryIO, Dict, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+BLOCK_SIZE = 512
+# 解析过程中保留内容的元数据文件
+CAPTURE_MEMBERS = {"manifest.json", "index.json", "repositories", "oci-layout"}
+CAPTURE_MAX_SIZE = 4 * 1024 * 1024
+
+
+class TarTooLargeError(ValueError):
+    """tar包超过大小限制"""
+
+
+class TarFormatError(ValueError):
+    """数据不是有效的tar包"""
+
+
+class TarStreamScanner:
+    """增量解析tar流
+
+    只处理512字节的头部块，成员数据按大小跳过；记录每个普通文件的数据偏移和大小，
+    并保留 CAPTURE_MEMBERS 中小文件的内容。支持 GNU 长文件名和 pax 扩展头。
+    """
+
+    def __init__(self):
+        self.members: Dict[str, Tuple[int, int]] = {}  # 名称 -> (数据偏移, 大小)
+        self.captured: Dict[str, bytes] = {}
+        self.finished = False
+        self.error: Optional[str] = None
+        self._buffer = bytearray()
+        self._offset = 0  # _buffer 起始位置在tar流中的偏移
+        self._skip = 0  # 当前成员剩余待跳过的字节数（含补齐）
+        self._capture: Optional[bytearray] = None
+        self._capture_left = 0
+        self._capture_kind: Optional[str] = None
+        self._capture_name: Optional[str] = None
+        self._next_name: Optional[str] = None
+
+    def feed(self, data: bytes):
+        """输入一段tar流数据"""
+        if self.finished or self.error:
+            return
+        self._buffer += data
+
+        while True:
+            if self._skip:
+                n = min(self._skip, len(self._buffer))
+                if self._capture is not None and self._capture_left:
+                    take = min(n, self._capture_left)
+                    self._capture += self._buffer[:take]
+                    self._capture_left -= take
+                    if not self._capture_left:
+                        self._finish_capture()
+                del self._buffer[:n]
+                self._offset += n
+                self._skip -= n
+                if self._skip:
+                    return
+                continue
+
+            if len(self._buffer) < BLOCK_SIZE:
+                return
+
+            header = bytes(self._buffer[:BLOCK_SIZE])
+            del self._buffer[:BLOCK_SIZE]
+            self._offset += BLOCK_SIZE
+
+            if header == b"\0" * BLOCK_SIZE:
+                # 归档结束标记
+                self.finished = True
+                self._buffer.clear()
+                return
+
+            try:
+                info = tarfile.TarInfo.frombuf(header, "utf-8", "surrogateescape")
+            except tarfile.HeaderError as e:
+                self.error = f"无效的tar头部(偏移 {self._offset - BLOCK_SIZE}): {e}"
+                self._buffer.clear()
+                return
+
+            self._handle_member(info)
+
+    def _handle_member(self, info: tarfile.TarInfo):
+        """处理一个成员头部"""
+        size = info.size
+        self._skip = (size + BLOCK_SIZE - 1) // BLOCK_SIZE * BLOCK_SIZE
+
+        if info.type == tarfile.GNUTYPE_LONGNAME:
+            self._start_capture("longname", None, size)
+            return
+        if info.type == tarfile.XHDTYPE:
+            self._start_capture("pax", None, size)
+            return
+        if info.type in (tarfile.XGLTYPE, tarfile.GNUTYPE_LONGLINK):
+            return
+
+        name = self._next_name or info.name
+        self._next_name = None
+        name = name[2:] if name.startswith("./") else name
+
+        if info.isreg():
+            self.members[name] = (self._offset, size)
+            if name in CAPTURE_MEMBERS and size <= CAPTURE_MAX_SIZE:
+                self._start_capture("member", name, size)
+
+    def _start_capture(self, kind: str, name: Optional[str], size: int):
+        self._capture = bytearray()
+        self._capture_left = size
+        self._capture_kind = kind
+        self._capture_name = name
+        if not size:
+            self._finish_capture()
+
+    def _finish_capture(self):
+        data = bytes(self._capture)
+        kind, name = self._capture_kind, self._capture_name
+        self._capture = None
+        self._capture_kind = None
+        self._capture_name = None
+
+        if kind == "longname":
+            self._next_name = data.rstrip(b"\0").decode("utf-8", "surrogateescape")
+        elif kind == "pax":
+            path = _parse_pax_path(data)
+            if path:
+                self._next_name = path
+        else:
+            self.captured[name] = data
+
+
+def _parse_pax_path(data: bytes) -> Optional[str]:
+    """从pax扩展头中取出 path 记录"""
+    pos = 0
+    while pos < len(data):
+        space = data.find(b" ", pos)
+        if space < 0:
+            break
+        try:
+            length = int(data[pos:space])
+        except ValueError:
+            break
+        record = data[space + 1 : pos + length - 1]
+        key, _, value = record.partition(b"=")
+        if key == b"path":
+            return value.decode("utf-8", "surrogateescape")
+        pos += length
+    return None
+
+
+class SpooledTar:
+    """已落盘的镜像tar包"""
+
+    def __init__(
+        self,
+        path: Path,
+        size: int,
+        sha256: str,
+        compressed: bool,
+        scanner: TarStreamScanner,
+    ):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.compressed = compressed
+        self.members = scanner.members
+        self.captured = scanner.captured
+        self.scan_error = scanner.error
+
+    @property
+    def manifest(self) -> Optional[List[Dict[str, Any]]]:
+        """docker-archive 的 manifest.json 内容"""
+        data = self.captured.get("manifest.json")
+        if data is None:
+            return None
+        try:
+            manifest = json.loads(data)
+        except ValueError:
+            return None
+        return manifest if isinstance(manifest, list) else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """序列化为可写入后台任务参数的字典"""
+        return {
+            "path": str(self.path),
+            "size": self.size,
+            "sha256": self.sha256,
+            "compressed": self.compressed,
+            "members": {name: list(entry) for name, entry in self.members.items()},
+            "captured": {
+                name: base64.b64encode(data).decode("ascii")
+                for name, data in self.captured.items()
+            },
+            "scan_error": self.scan_error,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SpooledTar":
+        """从 to_dict 的结果恢复（文件需仍在原路径）"""
+        scanner = TarStreamScanner()
+        scanner.members = {
+            name: (entry[0], entry[1]) for name, entry in data["members"].items()
+        }
+        scanner.captured = {
+            name: base64.b64decode(value) for name, value in data["captured"].items()
+        }
+        scanner.error = data.get("scan_error")
+        return cls(
+            Path(data["path"]),
+            data["size"],
+            data["sha256"],
+            data["compressed"],
+            scanner,
+        )
+
+    def at(self, path: Path) -> "SpooledTar":
+        """同一内容位于另一路径（硬链接或副本）时的描述"""
+        clone = copy.copy(self)
+        clone.path = path
+        return clone
+
+    def cleanup(self):
+        """删除落盘文件"""
+        try:
+            self.path.unlink(missing_ok=True)
+            logger.debug(f"清理临时文件: {self.path}")
+        except Exception as e:
+            logger.warning(f"清理临时文件失败: {e}")
+
+
+class _SpoolWriter:
+    """写入文件并同步计算sha256、解析tar结构"""
+
+    def __init__(self, file: BinaryIO, max_size: Optional[int], fail_fast: bool = False):
+        self.file = file
+        self.max_size = max_size
+        self.fail_fast = fail_fast
+        self.size = 0
+        self.digest = hashlib.sha256()
+        self.scanner = TarStreamScanner()
+        self.compressed: Optional[bool] = None
+        self._decompressor = None
+
+    def write(self, chunk: bytes):
+        if not chunk:
+            return
+        if self.max_size and self.size + len(chunk) > self.max_size:
+            raise TarTooLargeError(f"镜像文件过大，最大支持 {self.max_size // 1024 ** 3}GB")
+        self.file.write(chunk)
+        self.consume(chunk)
+
+    def consume(self, chunk: bytes):
+        """计算sha256并解析tar结构（不写文件，续传时重放已落盘的数据也使用该方法）"""
+        if not chunk:
+            return
+        self.size += len(chunk)
+        self.digest.update(chunk)
+
+        if self.compressed is None:
+            # 根据首个数据块判断是否为gzip压缩包
+            self.compressed = chunk[:2] == b"\x1f\x8b"
+            if self.compressed:
+                self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+        if self.scanner.finished or self.scanner.error:
+            return
+        if self._decompressor is not None:
+            try:
+                self.scanner.feed(self._decompressor.decompress(chunk))
+            except zlib.error as e:
+                self.scanner.error = f"gzip解压失败: {e}"
+        else:
+            self.scanner.feed(chunk)
+
+        if self.fail_fast and self.scanner.error:
+            # 格式错误时立即中止，不再接收剩余数据
+            raise TarFormatError(f"无效的镜像tar包: {self.scanner.error}")
+
+    def copy_from(self, source: BinaryIO, chunk_size: int):
+        """从同步文件对象复制全部数据"""
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            self.write(chunk)
+
+
+class ResumableTarSpool:
+    """可续传的落盘tar包
+
+    数据按偏移顺序追加到同一文件，追加时同步计算整体sha256并解析tar结构。
+    解析状态缓存在进程内；缓存缺失（进程重启或请求落到其他进程）时重放已确认的数据重建。
+    以下方法均为同步IO，应在执行器中调用
+    """
+
+    def __init__(self, path: Path, max_size: Optional[int] = None):
+        self.path = Path(path)
+        self.max_size = max_size
+        self._writer: Optional[_SpoolWriter] = None
+
+    def _writer_at(self, offset: int) -> _SpoolWriter:
+        """获取已处理到 offset 的写入器，文件中超出 offset 的未确认数据被截断"""
+        if self._writer is not None and self._writer.size == offset:
+            return self._writer
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.touch(exist_ok=True)
+        if self.path.stat().st_size < offset:
+            raise TarFormatError(
+                f"已确认的数据不完整: 文件 {self.path.stat().st_size} 字节，已确认 {offset} 字节"
+            )
+
+        writer = _SpoolWriter(None, self.max_size)
+        with open(self.path, "r+b") as f:
+            f.truncate(offset)
+            remaining = offset
+            while remaining:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                writer.consume(chunk)
+                remaining -= len(chunk)
+        if offset:
+            logger.info(f"已重放 {offset} 字节重建续传状态: {self.path}")
+        self._writer = writer
+        return writer
+
+    def append(self, offset: int, data: bytes) -> int:
+        """在 offset 处追加数据，返回新的偏移
+
+        数据不是有效tar或超过大小限制时抛出 TarFormatError / TarTooLargeError
+        """
+        writer = self._writer_at(offset)
+        try:
+            with open(self.path, "r+b") as f:
+                f.seek(offset)
+                writer.file = f
+                writer.write(data)
+                if writer.scanner.error:
+                    raise TarFormatError(f"无效的镜像tar包: {writer.scanner.error}")
+        except BaseException:
+            # 写入中断时丢弃缓存，下次按已确认的偏移重建
+            self._writer = None
+            raise
+        finally:
+            writer.file = None
+        return writer.size
+
+    def finish(self, size: int) -> SpooledTar:
+        """全部数据到达后生成 SpooledTar"""
+        writer = self._writer_at(size)
+        spooled = SpooledTar(
+            self.path,
+            writer.size,
+            writer.digest.hexdigest(),
+            bool(writer.compressed),
+            writer.scanner,
+        )
+        self._writer = None
+        return spooled
+
+    def discard(self):
+        """删除落盘文件"""
+        self._writer = None
+        self.path.unlink(missing_ok=True)
+
+
+TarSource = Union[BinaryIO, AsyncIterator[bytes], Any]
+
+
+async def spool_tar(
+    source: TarSource,
+    target_dir: Path,
+    prefix: str = "image_",
+    max_size: Optional[int] = None,
+    chunk_size: int = CHUNK_SIZE,
+    fail_fast: bool = False,
+) -> SpooledTar:
+    """将tar数据写入 target_dir 下的单个文件
+
+    Args:
+        source: 请求体异步迭代器、UploadFile 或同步文件对象
+        target_dir: 目标目录（应与后续使用该文件的进程在同一磁盘）
+        prefix: 文件名前缀
+        max_size: 最大字节数，超过时中止并删除文件
+        chunk_size: 读取块大小
+        fail_fast: 数据不是有效tar时立即中止（抛出 TarFormatError）
+    """
+    target_dir.mkdir(parents=True, exist_ok=True)
+    path = target_dir / f"{prefix}{uuid.uuid4().hex}.tar"
+    loop = asyncio.get_event_loop()
+
+    try:
+        with open(path, "wb") as f:
+            writer = _SpoolWriter(f, max_size, fail_fast)
+
+            if hasattr(source, "__aiter__"):
+                async for chunk in source:
+                    await loop.run_in_executor(None, writer.write, chunk)
+            else:
+                # UploadFile 使用其底层文件对象，整个复制过程在执行器中完成
+                file = getattr(source, "file", source)
+                file.seek(0)
+                await loop.run_in_executor(None, writer.copy_from, file, chunk_size)
+
+        spooled = SpooledTar(
+            path,
+            writer.size,
+            writer.digest.hexdigest(),
+            bool(writer.compressed),
+            writer.scanner,
+        )
+        logger.info(
+            f"镜像tar包已落盘: {path} ({writer.size} bytes, sha256 {spooled.sha256[:12]})"
+        )
+        return spooled
+
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
@@ -0,0 +1,84 @@
+"""
+文本增量工具
+文件版本以行为单位保存为相对上一版本的增量：
+复制基准版本的连续行用 [起始行, 行数] 表示，新增内容直接保存文本
+"""
+
+import json
+from typing import List, Optional, Union
+
+from app.utils.text_diff import diff_opcodes
+
+DELTA_FORMAT_VERSION = 1
+
+DeltaOp = Union[List[int], str]
+
+
+class DeltaApplyError(ValueError):
+    """增量与基准内容不匹配"""
+
+
+def _split_lines(content: str) -> List[str]:
+    # 保留换行符，拼接后与原文完全一致
+    return content.splitlines(keepends=True)
+
+
+def compute_delta(old_content: str, new_content: str, max_cost: int = 1000) -> List[DeltaOp]:
+    """计算从 old_content 到 new_content 的增量操作列表
+
+    max_cost 限制单个片段的编辑距离，超过时该片段整体保存为新文本，保证耗时有界
+    """
+    old_lines = _split_lines(old_content)
+    new_lines = _split_lines(new_content)
+
+    ops: List[DeltaOp] = []
+    for tag, i1, i2, j1, j2 in diff_opcodes(old_lines, new_lines, max_cost):
+        if tag == "equal":
+            ops.append([i1, i2 - i1])
+        elif j2 > j1:
+            # replace / insert 保存新文本；delete 不需要记录
+            text = "".join(new_lines[j1:j2])
+            if ops and isinstance(ops[-1], str):
+                ops[-1] += text
+            else:
+                ops.append(text)
+    return ops
+
+
+def apply_delta(base_content: str, ops: List[DeltaOp]) -> str:
+    """将增量应用到基准内容上"""
+    base_lines = _split_lines(base_content)
+    parts = []
+    for op in ops:
+        if isinstance(op, str):
+            parts.append(op)
+            continue
+        start, count = op
+        if start < 0 or start + count > len(base_lines):
+            raise DeltaApplyError(
+                f"增量引用的行 {start}-{start + count} 超出基准内容的 {len(base_lines)} 行"
+            )
+        parts.extend(base_lines[start:start + count])
+    return "".join(parts)
+
+
+def encode_delta(ops: List[DeltaOp], base_content_hash: str) -> str:
+    """序列化增量，记录基准内容哈希用于还原时校验"""
+    return json.dumps(
+        {"format": DELTA_FORMAT_VERSION, "base": base_content_hash, "ops": ops},
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+
+
+def decode_delta(payload: str, base_content_hash: Optional[str] = None) -> List[DeltaOp]:
+    """反序列化增量，base_content_hash 不一致时拒绝应用"""
+    try:
+        data = json.loads(payload)
+    except ValueError as e:
+        raise DeltaApplyError(f"增量数据无效: {e}")
+    if data.get("format") != DELTA_FORMAT_VERSION:
+        raise DeltaApplyError(f"不支持的增量格式: {data.get('format')}")
+    if base_content_hash and data.get("base") != base_content_hash:
+        raise DeltaApplyError("增量的基准内容与基准版本不一致")
+    return data["ops"]
@@ -0,0 +1,343 @@
+"""
+文本行差异计算
+先用 patience 算法以两侧都只出现一次的行为锚点切分，锚点之间的片段再用 Myers 算法求最短编辑；
+Myers 的编辑距离设有上限，超过上限的片段整体视为替换，保证大文件的耗时和内存有界。
+超过大小限制或二进制内容只计算按行统计的近似摘要，不生成差异块
+"""
+
+import bisect
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# (tag, i1, i2, j1, j2)，与 difflib.SequenceMatcher.get_opcodes 含义一致
+Opcode = Tuple[str, int, int, int, int]
+
+DEFAULT_CONTEXT_LINES = 3
+BINARY_SNIFF_SIZE = 8192
+
+
+def is_binary(content: str) -> bool:
+    """内容中出现NUL字符时视为二进制"""
+    return "\x00" in content[:BINARY_SNIFF_SIZE]
+
+
+def _myers(
+    a: Sequence[int], b: Sequence[int], max_cost: int
+) -> Optional[List[Tuple[int, int]]]:
+    """Myers O(ND) 算法，返回匹配的行对；编辑距离超过 max_cost 时返回 None"""
+    n, m = len(a), len(b)
+    max_d = min(n + m, max_cost)
+    v = {1: 0}
+    trace = []
+    for d in range(max_d + 1):
+        trace.append(v.copy())
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[k - 1] < v[k + 1]):
+                x = v[k + 1]
+            else:
+                x = v[k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            v[k] = x
+            if x >= n and y >= m:
+                return _myers_backtrack(trace, n, m)
+    return None
+
+
+def _myers_backtrack(trace: List[Dict[int, int]], n: int, m: int) -> List[Tuple[int, int]]:
+    matches = []
+    x, y = n, m
+    for d in range(len(trace) - 1, -1, -1):
+        v = trace[d]
+        k = x - y
+        if d == 0:
+            prev_x = prev_y = 0
+        else:
+            if k == -d or (k != d and v[k - 1] < v[k + 1]):
+                prev_k = k + 1
+            else:
+                prev_k = k - 1
+            prev_x = v[prev_k]
+            prev_y = prev_x - prev_k
+        while x > prev_x and y > prev_y:
+            x -= 1
+            y -= 1
+            matches.append((x, y))
+        x, y = prev_x, prev_y
+    matches.reverse()
+    return matches
+
+
+def _unique_anchors(
+    a: Sequence[int], b: Sequence[int], a_lo: int, a_hi: int, b_lo: int, b_hi: int
+) -> List[Tuple[int, int]]:
+    """两侧都只出现一次的行中，取位置递增的最长序列作为锚点"""
+    a_count = Counter(a[a_lo:a_hi])
+    b_count = Counter(b[b_lo:b_hi])
+    b_pos = {}
+    for j in range(b_lo, b_hi):
+        line = b[j]
+        if b_count[line] == 1 and a_count.get(line) == 1:
+            b_pos[line] = j
+    pairs = [(i, b_pos[a[i]]) for i in range(a_lo, a_hi) if a[i] in b_pos]
+    if not pairs:
+        return []
+
+    # patience 排序求 b 位置的最长递增子序列
+    tails: List[int] = []
+    tail_index: List[int] = []
+    prev = [-1] * len(pairs)
+    for idx, (_, j) in enumerate(pairs):
+        pos = bisect.bisect_left(tails, j)
+        if pos == len(tails):
+            tails.append(j)
+            tail_index.append(idx)
+        else:
+            tails[pos] = j
+            tail_index[pos] = idx
+        prev[idx] = tail_index[pos - 1] if pos > 0 else -1
+
+    anchors = []
+    idx = tail_index[-1]
+    while idx != -1:
+        anchors.append(pairs[idx])
+        idx = prev[idx]
+    anchors.reverse()
+    return anchors
+
+
+def _match_lines(a: Sequence[int], b: Sequence[int], max_cost: int) -> List[Tuple[int, int]]:
+    """计算两侧匹配的行对（按位置递增）"""
+    matches: List[Tuple[int, int]] = []
+    # 显式栈代替递归：("segment", a_lo, a_hi, b_lo, b_hi) 为待处理片段，("match", 行对列表) 为已确定的匹配
+    stack: List[tuple] = [("segment", 0, len(a), 0, len(b))]
+    while stack:
+        task = stack.pop()
+        if task[0] == "match":
+            matches.extend(task[1])
+            continue
+        _, a_lo, a_hi, b_lo, b_hi = task
+
+        # 公共前缀
+        while a_lo < a_hi and b_lo < b_hi and a[a_lo] == b[b_lo]:
+            matches.append((a_lo, b_lo))
+            a_lo += 1
+            b_lo += 1
+        # 公共后缀
+        suffix = []
+        while a_lo < a_hi and b_lo < b_hi and a[a_hi - 1] == b[b_hi - 1]:
+            a_hi -= 1
+            b_hi -= 1
+            suffix.append((a_hi, b_hi))
+        suffix.reverse()
+
+        if a_lo < a_hi and b_lo < b_hi:
+            anchors = _unique_anchors(a, b, a_lo, a_hi, b_lo, b_hi)
+            if anchors:
+                # 逆序压栈，保证按位置顺序输出
+                stack.append(("match", suffix))
+                i_end, j_end = a_hi, b_hi
+                for ai, bj in reversed(anchors):
+                    stack.append(("segment", ai + 1, i_end, bj + 1, j_end))
+                    stack.append(("match", [(ai, bj)]))
+                    i_end, j_end = ai, bj
+                stack.append(("segment", a_lo, i_end, b_lo, j_end))
+                continue
+
+            found = _myers(a[a_lo:a_hi], b[b_lo:b_hi], max_cost)
+            if found:
+                matches.extend((a_lo + i, b_lo + j) for i, j in found)
+
+        matches.extend(suffix)
+    return matches
+
+
+def _opcodes(matches: List[Tuple[int, int]], n: int, m: int) -> List[Opcode]:
+    opcodes: List[Opcode] = []
+    i = j = 0
+    for ai, bj in matches + [(n, m)]:
+        if ai > i and bj > j:
+            opcodes.append(("replace", i, ai, j, bj))
+        elif ai > i:
+            opcodes.append(("delete", i, ai, j, j))
+        elif bj > j:
+            opcodes.append(("insert", i, i, j, bj))
+        if ai < n and bj < m:
+            if opcodes and opcodes[-1][0] == "equal":
+                _, i1, _, j1, _ = opcodes[-1]
+                opcodes[-1] = ("equal", i1, ai + 1, j1, bj + 1)
+            else:
+                opcodes.append(("equal", ai, ai + 1, bj, bj + 1))
+        i, j = ai + 1, bj + 1
+    return opcodes
+
+
+def diff_opcodes(old_lines: List[str], new_lines: List[str], max_cost: int) -> List[Opcode]:
+    """计算行级差异操作"""
+    # 行内容映射为整数，比较更快
+    ids: Dict[str, int] = {}
+    a = [ids.setdefault(line, len(ids)) for line in old_lines]
+    b = [ids.setdefault(line, len(ids)) for line in new_lines]
+    return _opcodes(_match_lines(a, b, max_cost), len(a), len(b))
+
+
+def summarize(opcodes: List[Opcode]) -> Dict[str, int]:
+    """差异摘要：替换块中成对的行计为修改，多出的行计为新增或删除"""
+    added = removed = changed = 0
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == "equal":
+            continue
+        deleted, inserted = i2 - i1, j2 - j1
+        pairs = min(deleted, inserted)
+        changed += pairs
+        removed += deleted - pairs
+        added += inserted - pairs
+    return {"lines_added": added, "lines_removed": removed, "lines_changed": changed}
+
+
+def approximate_summary(old_lines: List[str], new_lines: List[str]) -> Dict[str, int]:
+    """按行计数的近似摘要，不考虑行的顺序，用于超出大小限制的内容"""
+    old_count = Counter(old_lines)
+    new_count = Counter(new_lines)
+    removed = sum((old_count - new_count).values())
+    added = sum((new_count - old_count).values())
+    changed = min(added, removed)
+    return {
+        "lines_added": added - changed,
+        "lines_removed": removed - changed,
+        "lines_changed": changed,
+    }
+
+
+def build_hunks(
+    old_lines: List[str],
+    new_lines: List[str],
+    opcodes: List[Opcode],
+    context_lines: int = DEFAULT_CONTEXT_LINES,
+) -> List[Dict[str, Any]]:
+    """按上下文行数合并差异块，行号从1开始"""
+    changes = [op for op in opcodes if op[0] != "equal"]
+    if not changes:
+        return []
+
+    # 将间隔不超过 2*context_lines 的变更合并为一个块
+    groups: List[List[Opcode]] = [[changes[0]]]
+    for op in changes[1:]:
+        if op[1] - groups[-1][-1][2] <= 2 * context_lines:
+            groups[-1].append(op)
+        else:
+            groups.append([op])
+
+    hunks = []
+    for group in groups:
+        old_start = max(0, group[0][1] - context_lines)
+        new_start = max(0, group[0][3] - context_lines)
+        old_end = min(len(old_lines), group[-1][2] + context_lines)
+        new_end = min(len(new_lines), group[-1][4] + context_lines)
+
+        lines = []
+        i, j = old_start, new_start
+        for tag, i1, i2, j1, j2 in group + [("end", old_end, old_end, new_end, new_end)]:
+            # 变更之间（及首尾）的上下文行
+            while i < i1:
+                lines.append({"type": "context", "content": old_lines[i], "old_line": i + 1, "new_line": j + 1})
+                i += 1
+                j += 1
+            if tag == "end":
+                break
+            for k in range(i1, i2):
+                lines.append({"type": "delete", "content": old_lines[k], "old_line": k + 1, "new_line": None})
+            for k in range(j1, j2):
+                lines.append({"type": "add", "content": new_lines[k], "old_line": None, "new_line": k + 1})
+            i, j = i2, j2
+
+        hunks.append({
+            "old_start": old_start + 1 if old_end > old_start else old_start,
+            "old_lines": old_end - old_start,
+            "new_start": new_start + 1 if new_end > new_start else new_start,
+            "new_lines": new_end - new_start,
+            "lines": lines,
+        })
+    return hunks
+
+
+def format_unified(hunks: List[Dict[str, Any]], old_label: str, new_label: str) -> str:
+    """生成 unified diff 文本"""
+    if not hunks:
+        return ""
+    out = [f"--- {old_label}\n", f"+++ {new_label}\n"]
+    prefix = {"context": " ", "delete": "-", "add": "+"}
+    for hunk in hunks:
+        out.append(
+            f"@@ -{hunk['old_start']},{hunk['old_lines']} +{hunk['new_start']},{hunk['new_lines']} @@\n"
+        )
+        for line in hunk["lines"]:
+            content = line["content"]
+            out.append(prefix[line["type"]] + content)
+            if not content.endswith(("\n", "\r")):
+                out.append("\n\\ No newline at end of file\n")
+    return "".join(out)
+
+
+def compute_diff(
+    old_content: str,
+    new_content: str,
+    context_lines: int = DEFAULT_CONTEXT_LINES,
+    max_bytes: Optional[int] = None,
+    max_cost: int = 1000,
+    old_label: str = "a",
+    new_label: str = "b",
+) -> Dict[str, Any]:
+    """计算两段文本的差异
+
+    返回 summary、hunks 和 unified 文本；二进制内容或任一侧超过 max_bytes 时
+    hunks 为空，summary 为近似值，并通过 is_binary / truncated 标记
+    """
+    if is_binary(old_content) or is_binary(new_content):
+        return {
+            "summary": {"lines_added": 0, "lines_removed": 0, "lines_changed": 0},
+            "hunks": [],
+            "unified": "",
+            "is_binary": True,
+            "truncated": False,
+        }
+
+    old_lines = old_content.splitlines(keepends=True)
+    new_lines = new_content.splitlines(keepends=True)
+
+    if max_bytes is not None and max(len(old_content), len(new_content)) > max_bytes:
+        return {
+            "summary": approximate_summary(old_lines, new_lines),
+            "hunks": [],
+            "unified": "",
+            "is_binary": False,
+            "truncated": True,
+        }
+
+    opcodes = diff_opcodes(old_lines, new_lines, max_cost)
+    hunks = build_hunks(old_lines, new_lines, opcodes, context_lines)
+    return {
+        "summary": summarize(opcodes),
+        "hunks": hunks,
+        "unified": format_unified(hunks, old_label, new_label),
+        "is_binary": False,
+        "truncated": False,
+    }
+
+
+def diff_summary(
+    old_content: str,
+    new_content: str,
+    max_bytes: Optional[int] = None,
+    max_cost: int = 1000,
+) -> Dict[str, int]:
+    """只计算差异摘要，不生成差异块"""
+    if is_binary(old_content) or is_binary(new_content):
+        return {"lines_added": 0, "lines_removed": 0, "lines_changed": 0}
+    old_lines = old_content.splitlines(keepends=True)
+    new_lines = new_content.splitlines(keepends=True)
+    if max_bytes is not None and max(len(old_content), len(new_content)) > max_bytes:
+        return approximate_summary(old_lines, new_lines)
+    return summarize(diff_opcodes(old_lines, new_lines, max_cost))
@@ -0,0 +1,66 @@
+"""
+后台任务工作进程
+
+独立运行: python -m app.worker [--concurrency N]
+可以在多台机器上同时运行多个工作进程（任务通过数据库行锁认领），
+此时 API 进程可设置 JOB_WORKER_ENABLED=false 不再执行任务。
+镜像tar包和任务附带文件的落盘目录（SKOPEO_SHARED_DIR / job_spool_dir）需对所有工作进程可见
+"""
+
+import argparse
+import asyncio
+import importlib
+import signal
+
+from app.utils.logger import setup_logging, get_logger
+
+# 注册了任务处理函数的模块
+JOB_HANDLER_MODULES = [
+    "app.services.image_service",
+    "app.services.container_service",
+    "app.services.stats_scheduler",
+]
+
+logger = get_logger(__name__)
+
+
+def load_job_handlers():
+    """导入所有注册任务处理函数的模块"""
+    for module in JOB_HANDLER_MODULES:
+        importlib.import_module(module)
+
+
+async def main(concurrency: int = None):
+    from app.database import AsyncSessionLocal
+    from app.services.job_queue import job_queue
+    from app.services.progress_broker import progress_broker
+    from app.services.model_service import service_manager
+
+    load_job_handlers()
+
+    # 创建服务等任务需要mManager控制器信息
+    async with AsyncSessionLocal() as db:
+        try:
+            await service_manager.initialize(db)
+        except Exception as e:
+            logger.error(f"服务管理器初始化失败: {e}")
+
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    job_queue.start(concurrency)
+    await stop.wait()
+    logger.info("收到停止信号，运行中的任务将重新排队")
+    await job_queue.stop()
+    await progress_broker.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="GeoML-Hub 后台任务工作进程")
+    parser.add_argument("--concurrency", type=int, default=None, help="同时执行的任务数")
+    args = parser.parse_args()
+
+    setup_logging()
+    asyncio.run(main(args.concurrency))
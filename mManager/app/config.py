@@ -32,6 +32,9 @@ class Settings(BaseSettings):
     # Docker 配置
     docker_host: str = os.getenv("DOCKER_HOST", "unix:///var/run/docker.sock")
     docker_timeout: int = 60
+    docker_pool_size: int = 32  # Docker API 连接池大小
+    docker_executor_workers: int = 32  # 执行docker-py阻塞调用的线程数
+    docker_liveness_interval: int = 15  # Docker存活检查间隔(秒)
 
     # 服务器信息
     server_id: str = os.getenv("SERVER_ID", "mmanager-local-01")
@@ -41,10 +44,29 @@ class Settings(BaseSettings):
     # 日志配置
     log_level: str = os.getenv("LOG_LEVEL", "INFO")
     log_file: str = os.getenv("LOG_FILE", "/tmp/logs/mmanager.log")
+    request_log_sample_rate: float = 0.1  # 成功请求的日志采样率
+    request_log_slow_ms: int = 1000  # 慢请求阈值(毫秒)，超过则始终记录
+    request_log_skip_paths: List[str] = ["/health", "/metrics", "/telemetry"]  # 仅在出错时记录的路径
+    log_stream_keepalive: int = 15  # 日志跟随流无输出时的保活间隔(秒)
 
     # 监控配置
     metrics_enabled: bool = True
     health_check_interval: int = 30
+    system_info_refresh_interval: int = 5  # 系统信息快照采样间隔(秒)
+    docker_info_refresh_interval: int = 60  # docker info 刷新间隔(秒)
+    stats_buffer_size: int = 300  # 每个容器保留的统计样本数(约每秒一个)
+    stats_sample_max_age: int = 5  # 统计样本最大有效期(秒)，超过则直接读取
+    stats_stream_interval: float = 1.0  # SSE 统计推送间隔(秒)
+    archive_stream_queue_size: int = 16  # 流式归档上传时缓冲的数据块数
+    batch_max_concurrency: int = 8  # 批量容器操作的并发数
+    batch_max_containers: int = 200  # 单次批量操作的最大容器数
+
+    # 负载遥测配置
+    telemetry_interval: float = 5.0  # 遥测报告生成/推送间隔(秒)
+    telemetry_image_refresh_interval: int = 60  # 镜像清单刷新间隔(秒)
+    telemetry_push_url: str = os.getenv("TELEMETRY_PUSH_URL", "")  # 后端遥测接收地址，为空时只提供 /telemetry 供轮询
+    telemetry_push_key: str = os.getenv("TELEMETRY_PUSH_KEY", "")  # 推送认证密钥，为空时使用 api_key
+    telemetry_push_timeout: float = 5.0  # 推送请求超时(秒)
 
     # 容器默认配置
     default_memory_limit: str = "512m"
@@ -3,6 +3,7 @@ mManager - GeoML Docker 控制器服务
 """
 
 import os
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
@@ -13,6 +14,7 @@ from app.config import settings
 from app.middleware import AuthenticationMiddleware, LoggingMiddleware
 from app.routers import containers, health, images
 from app.services.docker_service import docker_service
+from app.services.telemetry import telemetry_publisher
 
 
 # 配置日志
@@ -47,10 +49,17 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
     logger.info("mManager 启动中...")
+    sampler_task = None
+    liveness_task = None
+    telemetry_task = None
 
     try:
         # 初始化Docker服务
         await docker_service.get_system_info()  # 测试Docker连接
+        docker_service.start_event_watcher()  # 订阅Docker事件，维护容器状态缓存
+        sampler_task = asyncio.create_task(docker_service.run_system_sampler())
+        liveness_task = asyncio.create_task(docker_service.run_liveness_check())
+        telemetry_task = asyncio.create_task(telemetry_publisher.run())
         logger.info(f"mManager ({settings.server_id}) 启动成功")
         logger.info(f"服务器类型: {settings.server_type}")
         logger.info(f"最大容器数: {settings.max_containers}")
@@ -62,6 +71,11 @@ async def lifespan(app: FastAPI):
         raise
     finally:
         logger.info("mManager 关闭中...")
+        for task in (sampler_task, liveness_task, telemetry_task):
+            if task:
+                task.cancel()
+        docker_service.stop_event_watcher()
+        docker_service.shutdown()
 
 
 # 创建FastAPI应用
@@ -109,6 +123,7 @@ async def root():
             "containers": "/containers",
             "system": "/system",
             "capabilities": "/capabilities",
+            "telemetry": "/telemetry",
             "metrics": "/metrics",
             "docs": "/docs",
         },
@@ -2,11 +2,14 @@
 mManager 中间件
 """
 
+import hmac
+import json
+import random
 import time
 import logging
-from fastapi import Request, HTTPException, Depends
+from fastapi import HTTPException, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from app.config import settings
 
@@ -15,57 +18,145 @@ logger = logging.getLogger(__name__)
 # HTTPBearer安全方案实例
 security = HTTPBearer()
 
-class AuthenticationMiddleware(BaseHTTPMiddleware):
-    """API密钥认证中间件"""
-    
-    def __init__(self, app):
-        super().__init__(app)
-        self.security = HTTPBearer()
-    
-    async def dispatch(self, request: Request, call_next):
-        # 跳过健康检查、文档接口和根路径的认证
-        if request.url.path in ["/", "/health", "/docs", "/redoc", "/openapi.json"]:
-            return await call_next(request)
-        
-        # 检查Authorization头
-        authorization = request.headers.get("Authorization")
+class AuthenticationMiddleware:
+    """API密钥认证中间件（纯ASGI实现，不包装请求/响应流）"""
+
+    # 跳过健康检查、文档接口和根路径的认证
+    PUBLIC_PATHS = {"/", "/health", "/docs", "/redoc", "/openapi.json"}
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        # 按字节比较，非ASCII的请求头不会导致 compare_digest 抛出异常
+        self._expected = f"Bearer {settings.api_key}".encode()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"] in self.PUBLIC_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        authorization = _get_raw_header(scope, b"authorization")
         if not authorization:
-            raise HTTPException(status_code=401, detail="Missing Authorization header")
-        
-        if not authorization.startswith("Bearer "):
-            raise HTTPException(status_code=401, detail="Invalid authorization format")
-        
-        token = authorization.replace("Bearer ", "")
-        if token != settings.api_key:
-            logger.warning(f"Invalid API key attempt from {request.client.host}")
-            raise HTTPException(status_code=401, detail="Invalid API key")
-        
-        return await call_next(request)
-
-class LoggingMiddleware(BaseHTTPMiddleware):
-    """请求日志中间件"""
-    
-    async def dispatch(self, request: Request, call_next):
-        start_time = time.time()
-        
-        # 记录请求开始
-        logger.info(f"Request: {request.method} {request.url.path} from {request.client.host}")
-        
-        # 处理请求
-        response = await call_next(request)
-        
-        # 记录请求完成
-        process_time = time.time() - start_time
-        logger.info(
-            f"Response: {request.method} {request.url.path} - "
-            f"Status: {response.status_code} - Time: {process_time:.3f}s"
+            await _send_error(send, 401, "Missing Authorization header")
+            return
+
+        if not authorization.startswith(b"Bearer "):
+            await _send_error(send, 401, "Invalid authorization format")
+            return
+
+        if not hmac.compare_digest(authorization, self._expected):
+            client = scope.get("client")
+            logger.warning(f"Invalid API key attempt from {client[0] if client else '-'}")
+            await _send_error(send, 401, "Invalid API key")
+            return
+
+        await self.app(scope, receive, send)
+
+
+class LoggingMiddleware:
+    """请求日志中间件（纯ASGI实现）
+
+    每个请求输出一行结构化日志（key=value）。成功的请求按
+    request_log_sample_rate 采样，错误和慢请求始终记录，
+    request_log_skip_paths 中的路径（健康探测）只在出错时记录。
+    流式响应（SSE或没有 content-length 的分块响应）持续时间由客户端决定，不按慢请求处理。
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._server_id = settings.server_id.encode()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        status_code = 500
+        response_bytes = 0
+        streaming = False
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code, response_bytes, streaming
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                process_time = time.perf_counter() - start_time
+                # 添加响应头
+                headers = list(message.get("headers", []))
+                streaming = _is_streaming_response(headers)
+                headers.append((b"x-process-time", f"{process_time:.6f}".encode()))
+                headers.append((b"x-server-id", self._server_id))
+                message["headers"] = headers
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration_ms = (time.perf_counter() - start_time) * 1000
+            self._log(scope, status_code, duration_ms, response_bytes, streaming)
+
+    def _log(
+        self,
+        scope: Scope,
+        status_code: int,
+        duration_ms: float,
+        response_bytes: int,
+        streaming: bool = False,
+    ):
+        """按采样规则记录请求"""
+        path = scope["path"]
+        is_error = status_code >= 400
+        is_slow = not streaming and duration_ms >= settings.request_log_slow_ms
+
+        if not (is_error or is_slow):
+            if path in settings.request_log_skip_paths:
+                return
+            if random.random() >= settings.request_log_sample_rate:
+                return
+
+        client = scope.get("client")
+        level = logging.WARNING if status_code >= 500 or is_slow else logging.INFO
+        logger.log(
+            level,
+            f"request method={scope['method']} path={path} status={status_code} "
+            f"duration_ms={duration_ms:.1f} bytes={response_bytes} "
+            f"client={client[0] if client else '-'} server_id={settings.server_id}"
+            f"{' streaming=true' if streaming else ''}",
         )
-        
-        # 添加响应头
-        response.headers["X-Process-Time"] = str(process_time)
-        response.headers["X-Server-ID"] = settings.server_id
-        
-        return response
+
+
+def _is_streaming_response(headers) -> bool:
+    """SSE响应或没有 content-length 的分块响应"""
+    content_length = False
+    for key, value in headers:
+        key = key.lower()
+        if key == b"content-type" and value.startswith(b"text/event-stream"):
+            return True
+        if key == b"content-length":
+            content_length = True
+    return not content_length
+
+
+def _get_raw_header(scope: Scope, name: bytes) -> bytes:
+    """读取原始请求头字节（name 为小写字节串）"""
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value
+    return b""
+
+
+async def _send_error(send: Send, status_code: int, detail: str):
+    """直接返回JSON错误响应"""
+    body = json.dumps({"detail": detail}).encode()
+    headers = [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+    ]
+    if status_code == 401:
+        headers.append((b"www-authenticate", b"Bearer"))
+    await send({"type": "http.response.start", "status": status_code, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
 
 
 def verify_api_key(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
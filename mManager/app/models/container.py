@@ -121,6 +121,7 @@ class ContainerInfo(BaseModel):
     labels: Dict[str, str] = Field(default_factory=dict, description="标签")
     environment: Dict[str, str] = Field(default_factory=dict, description="环境变量")
     mounts: List[Dict[str, Any]] = Field(default_factory=list, description="挂载点")
+    health: Optional[str] = Field(None, description="健康状态: healthy, unhealthy, starting")
 
 class ContainerStatsResponse(BaseModel):
     """容器统计信息"""
@@ -138,6 +139,8 @@ class ContainerStatsResponse(BaseModel):
     # 网络统计
     network_rx_bytes: int = Field(0, description="网络接收字节数")
     network_tx_bytes: int = Field(0, description="网络发送字节数")
+    network_rx_rate: float = Field(0.0, description="网络接收速率(字节/秒)")
+    network_tx_rate: float = Field(0.0, description="网络发送速率(字节/秒)")
     
     # 块IO统计
     block_read_bytes: int = Field(0, description="磁盘读取字节数")
@@ -154,6 +157,8 @@ class ContainerLogsResponse(BaseModel):
     container_id: str = Field(..., description="容器ID")
     logs: str = Field(..., description="日志内容")
     lines: int = Field(..., description="日志行数")
+    cursor: Optional[str] = Field(None, description="增量读取游标，下次请求作为 since 传入")
+    truncated: bool = Field(False, description="日志超过行数限制：未指定游标时仅返回最新部分，指定游标时还有更多日志可凭游标继续获取")
     timestamp: str = Field(..., description="获取时间")
 
 class ContainerListResponse(BaseModel):
@@ -172,6 +177,36 @@ class ContainerOperationResponse(BaseModel):
     timestamp: str = Field(..., description="操作时间")
     details: Optional[Dict[str, Any]] = Field(None, description="操作详情")
 
+class ContainerBatchOperation(str, Enum):
+    """批量容器操作类型"""
+    START = "start"
+    STOP = "stop"
+    REMOVE = "remove"
+    INSPECT = "inspect"
+
+class ContainerBatchRequest(BaseModel):
+    """批量容器操作请求"""
+    operation: ContainerBatchOperation = Field(..., description="操作类型")
+    container_ids: List[str] = Field(..., min_length=1, description="容器ID列表")
+    timeout: int = Field(10, ge=0, description="停止超时时间(秒)，仅 stop 操作使用")
+    force: bool = Field(False, description="强制删除，仅 remove 操作使用")
+
+class ContainerBatchItemResult(BaseModel):
+    """批量操作中单个容器的结果"""
+    container_id: str = Field(..., description="容器ID")
+    success: bool = Field(..., description="操作是否成功")
+    message: str = Field(..., description="响应消息")
+    info: Optional[ContainerInfo] = Field(None, description="容器信息，仅 inspect 操作返回")
+
+class ContainerBatchResponse(BaseModel):
+    """批量容器操作响应"""
+    operation: ContainerBatchOperation = Field(..., description="操作类型")
+    total: int = Field(..., description="容器总数")
+    succeeded: int = Field(..., description="成功数量")
+    failed: int = Field(..., description="失败数量")
+    results: List[ContainerBatchItemResult] = Field(..., description="逐个容器的结果，顺序与请求一致")
+    timestamp: str = Field(..., description="操作时间")
+
 class ImageInfo(BaseModel):
     """镜像信息"""
     id: str = Field(..., description="镜像ID")
@@ -187,6 +222,7 @@ class SystemInfo(BaseModel):
     containers_stopped: int = Field(..., description="停止的容器数")
     images_total: int = Field(..., description="镜像总数")
     cpu_cores: int = Field(..., description="CPU核心数")
+    cpu_percent: Optional[float] = Field(None, description="CPU使用率(%)")
     memory_total_gb: float = Field(..., description="总内存(GB)")
     memory_available_gb: float = Field(..., description="可用内存(GB)")
     disk_usage: Dict[str, Any] = Field(default_factory=dict, description="磁盘使用情况")
@@ -2,10 +2,18 @@
 容器管理路由
 """
 
-from fastapi import APIRouter, HTTPException, Query, Path
-from typing import List, Optional
+import asyncio
+import json
+
+from fastapi import APIRouter, HTTPException, Query, Path, Request
+from fastapi.responses import StreamingResponse
+from typing import Dict, List, Optional
+
+from app.config import settings
 
 from app.models.container import (
+    ContainerBatchRequest,
+    ContainerBatchResponse,
     ContainerCreateRequest,
     ContainerInfo,
     ContainerStatsResponse,
@@ -17,6 +25,7 @@ from app.models.container import (
     ContainerDirectoryOperationRequest
 )
 from app.services.docker_service import docker_service
+from app.services.log_stream import parse_cursor
 
 router = APIRouter(prefix="/containers", tags=["containers"])
 
@@ -72,6 +81,24 @@ async def remove_container(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/batch", response_model=ContainerBatchResponse)
+async def batch_containers(request: ContainerBatchRequest):
+    """批量启动/停止/删除/查询容器，返回逐个容器的结果"""
+    if len(request.container_ids) > settings.batch_max_containers:
+        raise HTTPException(
+            status_code=400,
+            detail=f"单次批量操作最多 {settings.batch_max_containers} 个容器",
+        )
+    try:
+        return await docker_service.batch_containers(request)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/stats", response_model=Dict[str, ContainerStatsResponse])
+async def get_all_container_stats():
+    """获取所有运行中容器的最新统计样本（来自统计流缓冲区）"""
+    return docker_service.get_all_container_stats()
+
 @router.get("/{container_id}", response_model=ContainerInfo)
 async def get_container_info(
     container_id: str = Path(..., description="容器ID")
@@ -82,6 +109,16 @@ async def get_container_info(
     except Exception as e:
         raise HTTPException(status_code=404, detail=str(e))
 
+@router.get("/{container_id}/status", response_model=ContainerInfo)
+async def get_container_status(
+    container_id: str = Path(..., description="容器ID")
+):
+    """获取容器状态摘要（来自事件驱动的状态缓存）"""
+    try:
+        return await docker_service.get_container_state(container_id)
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
 @router.get("/{container_id}/stats", response_model=ContainerStatsResponse)
 async def get_container_stats(
     container_id: str = Path(..., description="容器ID")
@@ -92,17 +129,119 @@ async def get_container_stats(
     except Exception as e:
         raise HTTPException(status_code=404, detail=str(e))
 
+@router.get("/{container_id}/stats/history", response_model=List[ContainerStatsResponse])
+async def get_container_stats_history(
+    container_id: str = Path(..., description="容器ID"),
+    limit: int = Query(60, ge=1, le=settings.stats_buffer_size, description="样本数量")
+):
+    """获取容器最近的统计样本"""
+    return await docker_service.get_container_stats_history(container_id, limit)
+
+@router.get("/{container_id}/stats/stream")
+async def stream_container_stats(
+    container_id: str = Path(..., description="容器ID")
+):
+    """以SSE方式持续推送容器统计信息"""
+    try:
+        first = await docker_service.get_container_stats(container_id)
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    async def event_stream():
+        yield f"data: {first.model_dump_json()}\n\n"
+        try:
+            async for sample in docker_service.stats_streamer.subscribe(
+                first.container_id, settings.stats_stream_interval
+            ):
+                if sample is first:
+                    continue
+                yield f"data: {sample.model_dump_json()}\n\n"
+        except asyncio.CancelledError:
+            pass
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @router.get("/{container_id}/logs", response_model=ContainerLogsResponse)
 async def get_container_logs(
     container_id: str = Path(..., description="容器ID"),
-    lines: int = Query(100, description="日志行数", ge=1, le=10000)
+    lines: int = Query(100, description="日志行数", ge=1, le=10000),
+    since: Optional[str] = Query(None, description="上次响应返回的游标，只返回新日志"),
+    timestamps: bool = Query(False, description="日志行是否保留时间戳")
 ):
-    """获取容器日志"""
+    """获取容器日志（支持游标增量读取）"""
     try:
-        return await docker_service.get_container_logs(container_id, lines)
+        return await docker_service.get_container_logs(
+            container_id, lines, since, timestamps
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=404, detail=str(e))
 
+@router.get("/{container_id}/logs/stream")
+async def stream_container_logs(
+    request: Request,
+    container_id: str = Path(..., description="容器ID"),
+    lines: int = Query(100, description="初始日志行数", ge=1, le=10000),
+    since: Optional[str] = Query(None, description="游标，从游标之后开始跟随")
+):
+    """以SSE方式跟随容器日志，事件 id 为游标（支持 Last-Event-ID 断点续传）"""
+    since = since or request.headers.get("last-event-id")
+    try:
+        parse_cursor(since)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        info = await docker_service.get_container_state(container_id)
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    follower = docker_service.follow_container_logs(info.id, since, lines)
+
+    async def event_stream():
+        # 容器长时间无输出时定期发送SSE注释保活，避免下游读超时断开
+        pending = None
+        try:
+            while True:
+                if pending is None:
+                    pending = asyncio.ensure_future(follower.__anext__())
+                done, _ = await asyncio.wait(
+                    {pending}, timeout=settings.log_stream_keepalive
+                )
+                if not done:
+                    yield ": keepalive\n\n"
+                    continue
+                try:
+                    entry = pending.result()
+                except StopAsyncIteration:
+                    break
+                finally:
+                    pending = None
+                yield _log_event(*entry)
+        finally:
+            if pending is not None:
+                pending.cancel()
+                try:
+                    await pending
+                except (asyncio.CancelledError, StopAsyncIteration):
+                    pass
+            await follower.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def _log_event(cursor: str, stamp: str, text: str) -> str:
+    """格式化日志SSE事件"""
+    data = json.dumps({"timestamp": stamp, "line": text}, ensure_ascii=False)
+    return f"id: {cursor}\ndata: {data}\n\n"
+
 @router.get("/", response_model=ContainerListResponse)
 async def list_containers(
     all: bool = Query(False, description="显示所有容器（包括已停止的）")
@@ -135,6 +274,28 @@ async def restart_container(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.put("/{container_id}/archive", response_model=ContainerFileOperationResponse)
+async def put_container_archive(
+    request: Request,
+    container_id: str = Path(..., description="容器ID"),
+    path: str = Query(..., description="容器内解包目录"),
+    remove_path: Optional[str] = Query(None, description="解包前删除的容器内路径")
+):
+    """以二进制tar流写入容器（请求体为 application/x-tar，支持分块传输）"""
+    if not path.startswith("/") or (remove_path and not remove_path.startswith("/")):
+        raise HTTPException(status_code=400, detail="容器路径必须以/开头")
+    try:
+        result = await docker_service.put_archive_stream(
+            container_id, path, request.stream(), remove_path
+        )
+        if not result.success:
+            raise HTTPException(status_code=400, detail=result.message)
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.post("/{container_id}/files", response_model=ContainerFileOperationResponse)
 async def copy_file_to_container(
     container_id: str = Path(..., description="容器ID"),
@@ -9,6 +9,7 @@ from typing import Dict, Any
 from app.config import settings, get_server_capabilities
 from app.models.container import SystemInfo
 from app.services.docker_service import docker_service
+from app.services.telemetry import telemetry_publisher
 
 router = APIRouter(tags=["health"])
 
@@ -16,8 +17,8 @@ router = APIRouter(tags=["health"])
 async def health_check() -> Dict[str, Any]:
     """健康检查接口"""
     try:
-        # 获取系统信息
-        system_info = await docker_service.get_system_info()
+        # 获取系统信息快照（后台采样，不在探活请求中执行docker info）
+        system_info = await docker_service.get_system_snapshot()
         
         # 计算负载百分比
         load_percentage = (system_info.containers_running / settings.max_containers) * 100
@@ -60,6 +61,14 @@ async def health_check() -> Dict[str, Any]:
             "error": str(e)
         }
 
+@router.get("/telemetry")
+async def get_telemetry() -> Dict[str, Any]:
+    """获取负载遥测报告（后台周期生成，读取无Docker调用）"""
+    try:
+        return await telemetry_publisher.get_report()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/system", response_model=SystemInfo)
 async def get_system_info():
     """获取详细系统信息"""
@@ -83,7 +92,7 @@ async def get_capabilities() -> Dict[str, Any]:
 async def get_metrics() -> Dict[str, Any]:
     """获取Prometheus格式的指标"""
     try:
-        system_info = await docker_service.get_system_info()
+        system_info = await docker_service.get_system_snapshot()
         container_list = await docker_service.list_containers(all_containers=True)
         
         metrics = {
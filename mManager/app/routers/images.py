@@ -3,12 +3,16 @@ mManager镜像管理路由
 处理镜像的拉取、删除、清理等操作
 """
 
-import asyncio
+import json
+from datetime import datetime, timezone
 from typing import Dict, List, Optional
 from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from docker.errors import APIError, NotFound
 
 from app.services.docker_service import docker_service
+from app.services.image_pull import stream_pull
 from app.middleware import verify_api_key
 import logging
 
@@ -34,56 +38,87 @@ class ImageInfo(BaseModel):
     created: str
 
 
+async def _docker_api(method: str, *args, **kwargs):
+    """在执行器中调用docker-py低层API"""
+    await docker_service._ensure_connected()
+    return await docker_service._run(
+        getattr(docker_service.client.api, method), *args, **kwargs
+    )
+
+
+def _auth_config(auth: Optional[Dict]) -> Optional[Dict[str, str]]:
+    """将请求中的认证信息转换为docker-py auth_config"""
+    if not auth or not auth.get("username") or not auth.get("password"):
+        return None
+    return {"username": auth["username"], "password": auth["password"]}
+
+
+def _format_size(size: int) -> str:
+    """格式化字节数"""
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.1f}{unit}" if unit != "B" else f"{size}B"
+        size /= 1024
+    return f"{size:.1f}TB"
+
+
 @router.post("/images/pull")
-async def pull_image(request: ImagePullRequest, _: str = Depends(verify_api_key)):
+async def pull_image(
+    request: ImagePullRequest,
+    stream: Optional[str] = Query(
+        None, description="进度流格式: ndjson 或 sse，不指定时拉取完成后一次性返回"
+    ),
+    _: str = Depends(verify_api_key),
+):
     """
     拉取Docker镜像
-    """
-    try:
-        logger.info(f"开始拉取镜像: {request.image}")
-
-        # 构建Docker命令
-        pull_cmd = f"docker pull {request.image}"
-
-        # 如果有认证信息，先登录
-        if request.auth:
-            username = request.auth.get("username")
-            password = request.auth.get("password")
-            registry = request.image.split("/")[0]
-
-            if username and password:
-                login_cmd = f"echo '{password}' | docker login {registry} -u {username} --password-stdin"
-                process = await asyncio.create_subprocess_shell(
-                    login_cmd,
-                    stdout=asyncio.subprocess.PIPE,
-                    stderr=asyncio.subprocess.PIPE,
-                )
-                stdout, stderr = await process.communicate()
-
-                if process.returncode != 0:
-                    raise HTTPException(
-                        status_code=400, detail=f"Docker登录失败: {stderr.decode()}"
-                    )
 
-        # 执行拉取命令
-        process = await asyncio.create_subprocess_shell(
-            pull_cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    指定 stream 时以 NDJSON 或 SSE 逐条返回各镜像层的拉取进度，
+    最后一条记录的 status 为 success 或 error
+    """
+    logger.info(f"开始拉取镜像: {request.image}")
+    await docker_service._ensure_connected()
+    progress = stream_pull(
+        lambda: docker_service.client,
+        request.image,
+        _auth_config(request.auth),
+        request.platform,
+    )
+
+    if stream in ("ndjson", "sse"):
+
+        async def event_stream():
+            async for record in progress:
+                payload = json.dumps(record, ensure_ascii=False)
+                if stream == "sse":
+                    yield f"data: {payload}\n\n"
+                else:
+                    yield payload + "\n"
+
+        return StreamingResponse(
+            event_stream(),
+            media_type=(
+                "text/event-stream" if stream == "sse" else "application/x-ndjson"
+            ),
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
         )
-        stdout, stderr = await process.communicate()
 
-        if process.returncode != 0:
-            error_msg = stderr.decode()
-            logger.error(f"镜像拉取失败: {error_msg}")
-            raise HTTPException(status_code=400, detail=f"镜像拉取失败: {error_msg}")
+    try:
+        result = None
+        async for record in progress:
+            result = record
 
-        output = stdout.decode()
-        logger.info(f"镜像拉取成功: {request.image}")
+        if result["status"] != "success":
+            raise HTTPException(
+                status_code=400, detail=f"镜像拉取失败: {result['error']}"
+            )
 
         return {
             "status": "success",
             "image": request.image,
             "message": "镜像拉取成功",
-            "output": output,
+            "digest": result["digest"],
+            "layers": result["layers_total"],
         }
 
     except HTTPException:
@@ -102,57 +137,74 @@ async def list_images(
     列出本地Docker镜像
     """
     try:
-        # 构建命令
         if all_images:
-            cmd = "docker images --format 'table {{.ID}}\\t{{.Repository}}\\t{{.Tag}}\\t{{.Size}}\\t{{.CreatedAt}}'"
+            summaries = await _docker_api("images", all=True)
         else:
-            cmd = "docker images --filter 'dangling=false' --format 'table {{.ID}}\\t{{.Repository}}\\t{{.Tag}}\\t{{.Size}}\\t{{.CreatedAt}}'"
-
-        process = await asyncio.create_subprocess_shell(
-            cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await process.communicate()
-
-        if process.returncode != 0:
-            error_msg = stderr.decode()
-            logger.error(f"列出镜像失败: {error_msg}")
-            raise HTTPException(status_code=500, detail=f"列出镜像失败: {error_msg}")
-
-        output = stdout.decode()
-        lines = output.strip().split("\n")[1:]  # 跳过表头
+            summaries = await _docker_api("images", filters={"dangling": False})
 
         images = []
-        for line in lines:
-            if line.strip():
-                parts = line.split("\t")
-                if len(parts) >= 5:
-                    images.append(
-                        {
-                            "id": parts[0],
-                            "repository": parts[1],
-                            "tag": parts[2],
-                            "size": parts[3],
-                            "created": parts[4],
-                        }
-                    )
+        for summary in summaries:
+            created = datetime.fromtimestamp(
+                summary.get("Created", 0), tz=timezone.utc
+            ).isoformat()
+            repo_tags = summary.get("RepoTags") or ["<none>:<none>"]
+            for repo_tag in repo_tags:
+                repository, _sep, tag = repo_tag.rpartition(":")
+                images.append(
+                    {
+                        "id": summary["Id"].split(":")[-1][:12],
+                        "repository": repository,
+                        "tag": tag,
+                        "size": summary.get("Size", 0),
+                        "created": created,
+                    }
+                )
 
         return {"images": images, "total": len(images)}
 
-    except HTTPException:
-        raise
     except Exception as e:
         logger.error(f"列出镜像异常: {e}")
         raise HTTPException(status_code=500, detail=f"内部错误: {str(e)}")
 
 
+@router.get("/images/stats")
+async def get_images_stats(_: str = Depends(verify_api_key)):
+    """
+    获取镜像统计信息
+    """
+    try:
+        all_ids = await _docker_api("images", quiet=True)
+        dangling_ids = await _docker_api(
+            "images", quiet=True, filters={"dangling": True}
+        )
+        df = await _docker_api("df")
+
+        images = df.get("Images") or []
+        total_size = sum(image.get("Size", 0) for image in images)
+        reclaimable = sum(
+            image.get("Size", 0) for image in images if not image.get("Containers")
+        )
+
+        return {
+            "total_images": len(all_ids),
+            "dangling_images": len(dangling_ids),
+            "total_size": _format_size(total_size),
+            "reclaimable_size": _format_size(reclaimable),
+        }
+
+    except Exception as e:
+        logger.error(f"获取镜像统计异常: {e}")
+        raise HTTPException(status_code=500, detail=f"内部错误: {str(e)}")
+
+
 @router.get("/images/{image_name:path}")
 async def get_image_info(image_name: str, _: str = Depends(verify_api_key)):
     """
     获取镜像详细信息
     返回:
     - 200 + 镜像信息: 镜像存在
-    - 200 + null: 镜像不存在 (正常业务状态)
-    - 500: 系统错误 (Docker命令执行失败等)
+    - 200 + exists=false: 镜像不存在 (正常业务状态)
+    - 500: 系统错误 (Docker调用失败等)
     """
     try:
         # URL解码镜像名称
@@ -160,33 +212,12 @@ async def get_image_info(image_name: str, _: str = Depends(verify_api_key)):
 
         image_name = urllib.parse.unquote(image_name)
 
-        cmd = f"docker inspect {image_name}"
-        process = await asyncio.create_subprocess_shell(
-            cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await process.communicate()
-
-        if process.returncode != 0:
-            error_msg = stderr.decode()
-            if (
-                "No such image" in error_msg
-                or "No such object" in error_msg
-                or "not found" in error_msg.lower()
-            ):
-                # 镜像不存在是正常的业务状态，返回null而不是抛异常
-                logger.info(f"镜像不存在: {image_name}")
-                return {"exists": False, "image": image_name, "message": "镜像不存在"}
-            else:
-                # 真正的系统错误才抛异常
-                logger.error(f"Docker inspect命令执行失败: {error_msg}")
-                raise HTTPException(
-                    status_code=500, detail=f"获取镜像信息失败: {error_msg}"
-                )
-
-        # 镜像存在，解析信息
-        import json
-
-        image_info = json.loads(stdout.decode())[0]
+        try:
+            image_info = await _docker_api("inspect_image", image_name)
+        except NotFound:
+            # 镜像不存在是正常的业务状态，返回exists=false而不是抛异常
+            logger.info(f"镜像不存在: {image_name}")
+            return {"exists": False, "image": image_name, "message": "镜像不存在"}
 
         logger.info(f"成功获取镜像信息: {image_name}")
         return {
@@ -198,10 +229,9 @@ async def get_image_info(image_name: str, _: str = Depends(verify_api_key)):
             "config": image_info.get("Config", {}),
             "architecture": image_info.get("Architecture"),
             "os": image_info.get("Os"),
+            "layers": image_info.get("RootFS", {}).get("Layers", []),
         }
 
-    except HTTPException:
-        raise
     except Exception as e:
         logger.error(f"获取镜像信息系统异常: {e}")
         raise HTTPException(status_code=500, detail=f"内部错误: {str(e)}")
@@ -222,28 +252,17 @@ async def remove_image(
 
         image_name = urllib.parse.unquote(image_name)
 
-        # 构建删除命令
-        cmd = f"docker rmi {image_name}"
-        if force:
-            cmd += " --force"
-
-        process = await asyncio.create_subprocess_shell(
-            cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await process.communicate()
-
-        if process.returncode != 0:
-            error_msg = stderr.decode()
-            if "No such image" in error_msg:
-                raise HTTPException(status_code=404, detail="镜像不存在")
-            elif "image is being used by running container" in error_msg:
+        try:
+            output = await _docker_api("remove_image", image_name, force=force)
+        except NotFound:
+            raise HTTPException(status_code=404, detail="镜像不存在")
+        except APIError as e:
+            if e.status_code == 409:
                 raise HTTPException(status_code=409, detail="镜像正在被容器使用")
-            else:
-                raise HTTPException(
-                    status_code=400, detail=f"删除镜像失败: {error_msg}"
-                )
+            raise HTTPException(
+                status_code=400, detail=f"删除镜像失败: {e.explanation or e}"
+            )
 
-        output = stdout.decode()
         logger.info(f"镜像删除成功: {image_name}")
 
         return {
@@ -269,91 +288,19 @@ async def prune_images(
     清理未使用的镜像
     """
     try:
-        # 构建清理命令
-        cmd = "docker image prune -f"
-        if all_images:
-            cmd = "docker image prune -a -f"
-
-        process = await asyncio.create_subprocess_shell(
-            cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        # dangling=false 表示同时清理未被容器使用的带标签镜像（等同 prune -a）
+        result = await _docker_api(
+            "prune_images", filters={"dangling": not all_images}
         )
-        stdout, stderr = await process.communicate()
-
-        if process.returncode != 0:
-            error_msg = stderr.decode()
-            logger.error(f"镜像清理失败: {error_msg}")
-            raise HTTPException(status_code=500, detail=f"镜像清理失败: {error_msg}")
-
-        output = stdout.decode()
         logger.info("镜像清理完成")
 
-        # 解析清理结果
-        freed_space = "0B"
-        for line in output.split("\n"):
-            if "Total reclaimed space:" in line:
-                freed_space = line.split(":")[-1].strip()
-                break
-
         return {
             "status": "success",
             "message": "镜像清理完成",
-            "freed_space": freed_space,
-            "output": output,
+            "freed_space": _format_size(result.get("SpaceReclaimed") or 0),
+            "output": result.get("ImagesDeleted") or [],
         }
 
-    except HTTPException:
-        raise
     except Exception as e:
         logger.error(f"镜像清理异常: {e}")
         raise HTTPException(status_code=500, detail=f"内部错误: {str(e)}")
-
-
-@router.get("/images/stats")
-async def get_images_stats(_: str = Depends(verify_api_key)):
-    """
-    获取镜像统计信息
-    """
-    try:
-        # 获取镜像总数
-        count_cmd = "docker images -q | wc -l"
-        process = await asyncio.create_subprocess_shell(
-            count_cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await process.communicate()
-        total_images = int(stdout.decode().strip()) if process.returncode == 0 else 0
-
-        # 获取悬空镜像数量
-        dangling_cmd = "docker images -f 'dangling=true' -q | wc -l"
-        process = await asyncio.create_subprocess_shell(
-            dangling_cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await process.communicate()
-        dangling_images = int(stdout.decode().strip()) if process.returncode == 0 else 0
-
-        # 获取总大小
-        size_cmd = "docker system df --format 'table {{.Type}}\\t{{.Total}}\\t{{.Active}}\\t{{.Size}}\\t{{.Reclaimable}}' | grep Images"
-        process = await asyncio.create_subprocess_shell(
-            size_cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await process.communicate()
-
-        size_info = "未知"
-        reclaimable = "未知"
-        if process.returncode == 0:
-            output = stdout.decode().strip()
-            if output:
-                parts = output.split("\t")
-                if len(parts) >= 5:
-                    size_info = parts[3]
-                    reclaimable = parts[4]
-
-        return {
-            "total_images": total_images,
-            "dangling_images": dangling_images,
-            "total_size": size_info,
-            "reclaimable_size": reclaimable,
-        }
-
-    except Exception as e:
-        logger.error(f"获取镜像统计异常: {e}")
-        raise HTTPException(status_code=500, detail=f"内部错误: {str(e)}")
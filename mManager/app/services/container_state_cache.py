@@ -0,0 +1,228 @@
+"""
+容器状态缓存
+订阅Docker事件流，在内存中维护容器状态（状态、镜像、端口、健康）
+"""
+
+import threading
+import time
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Any
+
+from app.models.container import ContainerInfo, ContainerStatus
+
+logger = logging.getLogger(__name__)
+
+# 需要重新读取容器摘要的事件
+REFRESH_ACTIONS = {
+    "create",
+    "start",
+    "restart",
+    "die",
+    "stop",
+    "kill",
+    "pause",
+    "unpause",
+    "rename",
+    "update",
+    "oom",
+}
+
+
+class ContainerStateCache:
+    """基于Docker事件流的容器状态缓存"""
+
+    def __init__(self, reconnect_delay: float = 2.0):
+        self._containers: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._events = None
+        self._get_client = None
+        self.reconnect_delay = reconnect_delay
+
+    @property
+    def ready(self) -> bool:
+        """缓存是否已完成初始同步且事件流在线"""
+        return self._ready.is_set()
+
+    def start(self, get_client):
+        """启动事件订阅线程
+
+        Args:
+            get_client: 返回当前docker客户端的可调用对象（客户端重建后自动使用新实例）
+        """
+        if self._thread and self._thread.is_alive():
+            return
+        self._get_client = get_client
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="docker-events", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """停止事件订阅"""
+        self._stopping.set()
+        self._ready.clear()
+        events = self._events
+        if events is not None:
+            try:
+                events.close()
+            except Exception:
+                pass
+
+    def _run(self):
+        """事件循环：全量同步后增量处理事件，断线后重新同步"""
+        while not self._stopping.is_set():
+            try:
+                # 先订阅再全量同步，避免同步期间的事件丢失
+                self._events = self._get_client().events(
+                    decode=True, filters={"type": "container"}
+                )
+                self._full_sync()
+                self._ready.set()
+                logger.info(f"容器状态缓存已同步: {len(self._containers)} 个容器")
+
+                for event in self._events:
+                    self._handle_event(event)
+
+            except Exception as e:
+                if not self._stopping.is_set():
+                    logger.warning(f"Docker事件流中断，{self.reconnect_delay}秒后重连: {e}")
+            finally:
+                self._ready.clear()
+                self._events = None
+
+            if not self._stopping.is_set():
+                time.sleep(self.reconnect_delay)
+
+    def _full_sync(self):
+        """通过一次容器列表调用重建缓存"""
+        summaries = self._get_client().api.containers(all=True)
+        containers = {}
+        for summary in summaries:
+            entry = self._parse_summary(summary)
+            containers[entry["id"]] = entry
+        with self._lock:
+            self._containers = containers
+
+    def _refresh(self, container_id: str):
+        """刷新单个容器的摘要"""
+        summaries = self._get_client().api.containers(
+            all=True, filters={"id": container_id}
+        )
+        with self._lock:
+            if summaries:
+                entry = self._parse_summary(summaries[0])
+                previous = self._containers.get(entry["id"])
+                if previous and entry["health"] is None:
+                    entry["health"] = previous.get("health")
+                self._containers[entry["id"]] = entry
+            else:
+                self._containers.pop(container_id, None)
+
+    def _handle_event(self, event: Dict[str, Any]):
+        """处理单个容器事件"""
+        container_id = event.get("id") or event.get("Actor", {}).get("ID")
+        action = event.get("Action") or event.get("status") or ""
+        if not container_id:
+            return
+
+        try:
+            if action == "destroy":
+                with self._lock:
+                    self._containers.pop(container_id, None)
+            elif action.startswith("health_status"):
+                health = action.split(":", 1)[-1].strip()
+                with self._lock:
+                    entry = self._containers.get(container_id)
+                    if entry:
+                        entry["health"] = health
+            elif action in REFRESH_ACTIONS:
+                self._refresh(container_id)
+        except Exception as e:
+            logger.warning(f"处理容器事件 {action} ({container_id[:12]}) 失败: {e}")
+
+    @staticmethod
+    def _parse_summary(summary: Dict[str, Any]) -> Dict[str, Any]:
+        """将容器列表摘要转换为缓存条目"""
+        names = summary.get("Names") or []
+        ports = {}
+        for port in summary.get("Ports") or []:
+            if port.get("PublicPort"):
+                ports[f"{port['PrivatePort']}/{port.get('Type', 'tcp')}"] = port[
+                    "PublicPort"
+                ]
+
+        # Status 形如 "Up 2 hours (healthy)"
+        health = None
+        status_text = summary.get("Status") or ""
+        for candidate in ("healthy", "unhealthy", "health: starting"):
+            if f"({candidate})" in status_text:
+                health = candidate.replace("health: ", "")
+                break
+
+        created = summary.get("Created")
+        return {
+            "id": summary["Id"],
+            "name": names[0].lstrip("/") if names else summary["Id"][:12],
+            "image": summary.get("Image", ""),
+            "status": summary.get("State", "created"),
+            "created_at": (
+                datetime.fromtimestamp(created, tz=timezone.utc).isoformat()
+                if isinstance(created, (int, float))
+                else str(created or "")
+            ),
+            "labels": summary.get("Labels") or {},
+            "ports": ports,
+            "health": health,
+        }
+
+    def _lookup(self, container_id: str) -> Optional[Dict[str, Any]]:
+        """按完整ID、ID前缀或名称查找"""
+        entry = self._containers.get(container_id)
+        if entry:
+            return entry
+        for entry in self._containers.values():
+            if entry["id"].startswith(container_id) or entry["name"] == container_id:
+                return entry
+        return None
+
+    def get(self, container_id: str) -> Optional[ContainerInfo]:
+        """获取单个容器的缓存状态"""
+        with self._lock:
+            entry = self._lookup(container_id)
+            entry = dict(entry) if entry else None
+        return self._to_info(entry) if entry else None
+
+    def list(self, all_containers: bool = False) -> List[ContainerInfo]:
+        """列出缓存中的容器"""
+        with self._lock:
+            entries = [dict(entry) for entry in self._containers.values()]
+        return [
+            self._to_info(entry)
+            for entry in entries
+            if all_containers or entry["status"] == "running"
+        ]
+
+    def count(self, running_only: bool = True) -> int:
+        """统计容器数量"""
+        with self._lock:
+            if not running_only:
+                return len(self._containers)
+            return sum(1 for e in self._containers.values() if e["status"] == "running")
+
+    @staticmethod
+    def _to_info(entry: Dict[str, Any]) -> ContainerInfo:
+        return ContainerInfo(
+            id=entry["id"],
+            name=entry["name"],
+            image=entry["image"],
+            status=ContainerStatus(entry["status"]),
+            created_at=entry["created_at"],
+            ports=entry["ports"],
+            labels=entry["labels"],
+            health=entry["health"],
+        )
@@ -3,19 +3,38 @@ Docker 操作服务
 """
 
 import asyncio
+import functools
 import docker
+import requests
 import psutil
 import logging
 import base64
 import io
 import tarfile
 import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
-from typing import Dict, List, Optional, Any
+from typing import AsyncIterator, Dict, List, Optional, Any
 from docker.errors import DockerException, NotFound, APIError
 
 from app.config import settings, get_server_capabilities
+from app.services.container_state_cache import ContainerStateCache
+from app.services.stats_stream import stats_streamer, parse_stats
+from app.services.log_stream import (
+    cursor_to_since,
+    parse_cursor,
+    parse_log_output,
+    stream_logs,
+)
 from app.models.container import (
+    ContainerBatchItemResult,
+    ContainerBatchOperation,
+    ContainerBatchRequest,
+    ContainerBatchResponse,
     ContainerCreateRequest,
     ContainerInfo,
     ContainerStatus,
@@ -32,47 +51,162 @@ from app.models.container import (
 
 logger = logging.getLogger(__name__)
 
+# 流式归档传输中断的标记，写入线程收到后中止上传
+_ARCHIVE_ABORTED = object()
+
+# 用暂存目录中的内容完整替换: $1 待删除路径, $2 暂存目录, $3 解包目录
+_SWAP_STAGED_ARCHIVE = """
+set -e
+rm -rf "$1"
+for f in "$2"/* "$2"/.[!.]* "$2"/..?*; do
+  [ -e "$f" ] || [ -L "$f" ] || continue
+  name=$(basename "$f")
+  if [ -d "$f" ] && [ -d "$3/$name" ] && [ ! -L "$3/$name" ]; then
+    cp -a "$f"/. "$3/$name"/
+  else
+    rm -rf "$3/$name"
+    mv "$f" "$3/$name"
+  fi
+done
+rm -rf "$2"
+"""
+
 
 class DockerService:
     """Docker 操作服务"""
 
     def __init__(self):
         self.client = None
+        self._client_healthy = False
+        self._reconnect_lock = threading.Lock()
+        # docker-py 为同步阻塞调用，统一在有界线程池中执行，避免阻塞事件循环
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.docker_executor_workers,
+            thread_name_prefix="docker-api",
+        )
         self.server_capabilities = get_server_capabilities()
+        self.state_cache = ContainerStateCache()
+        self.stats_streamer = stats_streamer
+        # 系统信息快照（由后台采样器刷新）
+        self._system_snapshot: Optional[SystemInfo] = None
+        self._system_snapshot_at = 0.0
+        self._docker_info: Optional[Dict[str, Any]] = None
+        self._docker_info_at = 0.0
+        self._docker_version: Optional[str] = None
         self._init_docker_client()
 
+    def start_event_watcher(self):
+        """启动Docker事件订阅，维护容器状态缓存"""
+        self.state_cache.start(lambda: self.client)
+        self.stats_streamer.configure(lambda: self.client)
+
+    def stop_event_watcher(self):
+        """停止Docker事件订阅"""
+        self.state_cache.stop()
+        self.stats_streamer.stop_all()
+
+    def sync_stats_readers(self):
+        """按运行中容器启动/回收统计流读取线程"""
+        if self.state_cache.ready:
+            self.stats_streamer.sync(
+                info.id for info in self.state_cache.list(all_containers=False)
+            )
+
     def _init_docker_client(self):
-        """初始化Docker客户端"""
+        """初始化Docker客户端（连接池按并发请求数设置）"""
         try:
-            self.client = docker.from_env(timeout=settings.docker_timeout)
+            self.client = docker.from_env(
+                timeout=settings.docker_timeout,
+                max_pool_size=settings.docker_pool_size,
+            )
             # 测试连接
             self.client.ping()
+            self._client_healthy = True
             logger.info(f"Docker客户端初始化成功，连接到: {settings.docker_host}")
         except Exception as e:
             logger.error(f"Docker客户端初始化失败: {e}")
             self.client = None
+            self._client_healthy = False
             raise
 
-    def _ensure_client(self):
-        """确保Docker客户端可用"""
-        try:
-            if not self.client:
-                self._init_docker_client()
-            else:
-                self.client.ping()
-        except Exception as e:
-            logger.warning(f"Docker连接异常，尝试重新连接: {e}")
+    def _reconnect(self):
+        """重建Docker客户端（多个调用方同时发现连接失败时只重建一次）"""
+        with self._reconnect_lock:
+            if self.client and self._client_healthy:
+                return
+            old_client = self.client
             try:
                 self._init_docker_client()
             except Exception as init_error:
                 logger.error(f"Docker重新连接失败: {init_error}")
                 raise DockerException(f"Docker服务不可用: {str(init_error)}")
+            if old_client is not None:
+                try:
+                    old_client.close()
+                except Exception:
+                    pass
+
+    def _ensure_client(self):
+        """确保Docker客户端可用
+
+        不再逐次 ping，连接状态由后台存活检查和调用失败标记维护，
+        只有客户端被标记为不可用时才重连。
+        """
+        if not self.client or not self._client_healthy:
+            logger.warning("Docker客户端不可用，尝试重新连接")
+            self._reconnect()
+
+    async def _ensure_connected(self):
+        """异步版本的 _ensure_client：仅在需要重连时占用线程池"""
+        if not self.client or not self._client_healthy:
+            await self._run(self._ensure_client)
+
+    async def _run(self, func, *args, **kwargs):
+        """在Docker线程池中执行阻塞的docker-py调用"""
+        loop = asyncio.get_event_loop()
+        try:
+            return await loop.run_in_executor(
+                self._executor, functools.partial(func, *args, **kwargs)
+            )
+        except requests.exceptions.ConnectionError:
+            # 连接层失败：标记客户端不可用，下次调用时重连
+            self._client_healthy = False
+            raise
+
+    async def _get_container(self, container_id: str):
+        """获取容器对象（inspect 在线程池中执行）"""
+        return await self._run(self.client.containers.get, container_id)
+
+    async def run_liveness_check(self):
+        """后台Docker存活检查循环，失败时重建客户端"""
+        while True:
+            await asyncio.sleep(settings.docker_liveness_interval)
+            try:
+                if self.client and self._client_healthy:
+                    await self._run(self.client.ping)
+                else:
+                    await self._run(self._reconnect)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self._client_healthy:
+                    logger.warning(f"Docker存活检查失败，将重新连接: {e}")
+                self._client_healthy = False
+
+    def shutdown(self):
+        """关闭Docker线程池和客户端"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self.client:
+            try:
+                self.client.close()
+            except Exception:
+                pass
 
     async def create_container(
         self, config: ContainerCreateRequest
     ) -> ContainerOperationResponse:
         """创建容器"""
-        self._ensure_client()
+        await self._ensure_connected()
 
         try:
             # 添加调试日志：打印接收到的配置
@@ -88,8 +222,11 @@ class DockerService:
             logger.info(f"工作目录: {config.working_dir}")
             logger.info(f"启动命令: {config.command}")
 
-            # 检查容器数量限制
-            current_containers = len(self.client.containers.list())
+            # 检查容器数量限制（优先使用状态缓存）
+            if self.state_cache.ready:
+                current_containers = self.state_cache.count(running_only=True)
+            else:
+                current_containers = len(await self._run(self.client.containers.list))
             if current_containers >= settings.max_containers:
                 raise Exception(f"已达到最大容器数量限制: {settings.max_containers}")
 
@@ -138,16 +275,13 @@ class DockerService:
             logger.info(f"最终环境变量: {create_kwargs.get('environment', {})}")
 
             # 异步执行Docker操作
-            loop = asyncio.get_event_loop()
-            container = await loop.run_in_executor(
-                None, lambda: self.client.containers.create(**create_kwargs)
-            )
+            container = await self._run(self.client.containers.create, **create_kwargs)
 
             # 如果指定了额外网络，连接到这些网络
             for network_name in config.networks:
                 try:
-                    network = self.client.networks.get(network_name)
-                    await loop.run_in_executor(None, network.connect, container)
+                    network = await self._run(self.client.networks.get, network_name)
+                    await self._run(network.connect, container)
                 except Exception as e:
                     logger.warning(f"连接到网络 {network_name} 失败: {e}")
 
@@ -155,7 +289,7 @@ class DockerService:
 
             # 添加调试日志：验证创建的容器配置
             try:
-                container.reload()
+                await self._run(container.reload)
                 actual_config = container.attrs.get("Config", {})
                 actual_host_config = container.attrs.get("HostConfig", {})
                 network_settings = container.attrs.get("NetworkSettings", {})
@@ -211,10 +345,10 @@ class DockerService:
 
     async def start_container(self, container_id: str) -> ContainerOperationResponse:
         """启动容器"""
-        self._ensure_client()
+        await self._ensure_connected()
 
         try:
-            container = self.client.containers.get(container_id)
+            container = await self._get_container(container_id)
 
             # 检查容器状态
             if container.status == "running":
@@ -227,8 +361,7 @@ class DockerService:
                 )
 
             # 异步启动容器
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(None, container.start)
+            await self._run(container.start)
 
             logger.info(f"容器启动成功: {container_id[:12]}")
 
@@ -266,10 +399,10 @@ class DockerService:
         self, container_id: str, timeout: int = 10
     ) -> ContainerOperationResponse:
         """停止容器"""
-        self._ensure_client()
+        await self._ensure_connected()
 
         try:
-            container = self.client.containers.get(container_id)
+            container = await self._get_container(container_id)
 
             # 检查容器状态
             if container.status not in ["running", "restarting"]:
@@ -282,8 +415,7 @@ class DockerService:
                 )
 
             # 异步停止容器
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(None, lambda: container.stop(timeout=timeout))
+            await self._run(container.stop, timeout=timeout)
 
             logger.info(f"容器停止成功: {container_id[:12]}")
 
@@ -321,15 +453,14 @@ class DockerService:
         self, container_id: str, force: bool = False
     ) -> ContainerOperationResponse:
         """删除容器"""
-        self._ensure_client()
+        await self._ensure_connected()
 
         try:
-            container = self.client.containers.get(container_id)
+            container = await self._get_container(container_id)
             container_name = container.name
 
             # 异步删除容器
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(None, lambda: container.remove(force=force))
+            await self._run(container.remove, force=force)
 
             logger.info(f"容器删除成功: {container_id[:12]} ({container_name})")
 
@@ -364,14 +495,13 @@ class DockerService:
 
     async def get_container_info(self, container_id: str) -> ContainerInfo:
         """获取容器详细信息"""
-        self._ensure_client()
+        await self._ensure_connected()
 
         try:
-            container = self.client.containers.get(container_id)
+            container = await self._get_container(container_id)
 
             # 异步刷新容器状态
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(None, container.reload)
+            await self._run(container.reload)
 
             # 解析容器信息
             attrs = container.attrs
@@ -437,77 +567,98 @@ class DockerService:
             logger.error(f"获取容器信息失败: {e}")
             raise
 
+    async def get_container_state(self, container_id: str) -> ContainerInfo:
+        """获取容器状态摘要（状态、镜像、端口、健康），缓存在线时不访问Docker"""
+        if self.state_cache.ready:
+            info = self.state_cache.get(container_id)
+            if info:
+                return info
+            raise Exception(f"容器不存在: {container_id}")
+
+        return await self.get_container_info(container_id)
+
+    async def batch_containers(
+        self, request: ContainerBatchRequest
+    ) -> ContainerBatchResponse:
+        """批量启动/停止/删除/查询容器
+
+        各容器并发执行，并发数受 batch_max_concurrency 限制；
+        单个容器失败不影响其他容器，结果顺序与请求一致。
+        """
+        await self._ensure_connected()
+        semaphore = asyncio.Semaphore(settings.batch_max_concurrency)
+        operation = request.operation
+
+        async def run_one(container_id: str) -> ContainerBatchItemResult:
+            async with semaphore:
+                try:
+                    if operation == ContainerBatchOperation.INSPECT:
+                        info = await self.get_container_info(container_id)
+                        return ContainerBatchItemResult(
+                            container_id=container_id,
+                            success=True,
+                            message="获取容器信息成功",
+                            info=info,
+                        )
+
+                    if operation == ContainerBatchOperation.START:
+                        result = await self.start_container(container_id)
+                    elif operation == ContainerBatchOperation.STOP:
+                        result = await self.stop_container(
+                            container_id, request.timeout
+                        )
+                    else:
+                        result = await self.remove_container(
+                            container_id, request.force
+                        )
+                    return ContainerBatchItemResult(
+                        container_id=container_id,
+                        success=result.success,
+                        message=result.message,
+                    )
+                except Exception as e:
+                    return ContainerBatchItemResult(
+                        container_id=container_id, success=False, message=str(e)
+                    )
+
+        # 去重但保持请求顺序
+        container_ids = list(dict.fromkeys(request.container_ids))
+        results = await asyncio.gather(*(run_one(cid) for cid in container_ids))
+        succeeded = sum(1 for item in results if item.success)
+
+        logger.info(
+            f"批量{operation.value}完成: 成功 {succeeded}/{len(results)}"
+        )
+
+        return ContainerBatchResponse(
+            operation=operation,
+            total=len(results),
+            succeeded=succeeded,
+            failed=len(results) - succeeded,
+            results=results,
+            timestamp=datetime.now(timezone.utc).isoformat(),
+        )
+
     async def get_container_stats(self, container_id: str) -> ContainerStatsResponse:
-        """获取容器统计信息"""
-        self._ensure_client()
+        """获取容器统计信息，优先返回统计流中的最新样本"""
+        container_id = self._resolve_stats_id(container_id)
+        sample = self.stats_streamer.latest(
+            container_id, max_age=settings.stats_sample_max_age
+        )
+        if sample is not None:
+            return sample
+
+        await self._ensure_connected()
 
         try:
-            container = self.client.containers.get(container_id)
-
-            # 异步获取统计信息
-            loop = asyncio.get_event_loop()
-            stats = await loop.run_in_executor(
-                None, lambda: container.stats(stream=False)
-            )
-
-            # 解析统计数据
-            cpu_stats = stats.get("cpu_stats", {})
-            memory_stats = stats.get("memory_stats", {})
-            networks = stats.get("networks", {})
-            blkio_stats = stats.get("blkio_stats", {})
-
-            # 计算CPU使用率
-            cpu_percent = 0.0
-            if "cpu_usage" in cpu_stats and "precpu_stats" in stats:
-                precpu_stats = stats["precpu_stats"]
-                cpu_usage = cpu_stats["cpu_usage"]["total_usage"]
-                precpu_usage = precpu_stats.get("cpu_usage", {}).get("total_usage", 0)
-                system_usage = cpu_stats.get("system_cpu_usage", 0)
-                pre_system_usage = precpu_stats.get("system_cpu_usage", 0)
-
-                cpu_delta = cpu_usage - precpu_usage
-                system_delta = system_usage - pre_system_usage
-
-                if system_delta > 0 and cpu_delta > 0:
-                    cpu_percent = (cpu_delta / system_delta) * 100.0
-
-            # 内存使用情况
-            memory_usage = memory_stats.get("usage", 0)
-            memory_limit = memory_stats.get("limit", 0)
-            memory_percent = (
-                (memory_usage / memory_limit * 100.0) if memory_limit > 0 else 0.0
-            )
-
-            # 网络统计
-            network_rx_bytes = 0
-            network_tx_bytes = 0
-            for network_data in networks.values():
-                network_rx_bytes += network_data.get("rx_bytes", 0)
-                network_tx_bytes += network_data.get("tx_bytes", 0)
-
-            # 块IO统计
-            block_read_bytes = 0
-            block_write_bytes = 0
-            for io_stat in blkio_stats.get("io_service_bytes_recursive", []):
-                if io_stat["op"] == "Read":
-                    block_read_bytes += io_stat["value"]
-                elif io_stat["op"] == "Write":
-                    block_write_bytes += io_stat["value"]
-
-            return ContainerStatsResponse(
-                container_id=container_id,
-                cpu_percent=round(cpu_percent, 2),
-                cpu_usage=cpu_stats,
-                memory_usage_mb=round(memory_usage / 1024 / 1024, 2),
-                memory_limit_mb=round(memory_limit / 1024 / 1024, 2),
-                memory_percent=round(memory_percent, 2),
-                network_rx_bytes=network_rx_bytes,
-                network_tx_bytes=network_tx_bytes,
-                block_read_bytes=block_read_bytes,
-                block_write_bytes=block_write_bytes,
-                pids=stats.get("pids_stats", {}).get("current", 0),
-                timestamp=datetime.now(timezone.utc).isoformat(),
-            )
+            container = await self._get_container(container_id)
+
+            # 统计流尚未就绪：一次性读取，同时为后续请求启动读取线程
+            stats = await self._run(container.stats, stream=False)
+            if container.status == "running":
+                self.stats_streamer.ensure_reader(container.id)
+
+            return parse_stats(container.id, stats)
 
         except NotFound:
             raise Exception(f"容器不存在: {container_id}")
@@ -515,32 +666,100 @@ class DockerService:
             logger.error(f"获取容器统计信息失败: {e}")
             raise
 
+    def _resolve_stats_id(self, container_id: str) -> str:
+        """将ID前缀或名称解析为完整容器ID（统计缓冲区以完整ID为键）"""
+        if self.state_cache.ready:
+            info = self.state_cache.get(container_id)
+            if info:
+                return info.id
+        return container_id
+
+    async def get_container_stats_history(
+        self, container_id: str, limit: int = 60
+    ) -> List[ContainerStatsResponse]:
+        """获取容器最近的统计样本，只为运行中的容器启动统计读取线程"""
+        running_id = await self._running_container_id(container_id)
+        if running_id is None:
+            return []
+        self.stats_streamer.ensure_reader(running_id)
+        return self.stats_streamer.history(running_id, limit)
+
+    async def _running_container_id(self, container_id: str) -> Optional[str]:
+        """解析运行中容器的完整ID，容器不存在或未运行时返回None"""
+        if self.state_cache.ready:
+            info = self.state_cache.get(container_id)
+            if info and info.status == ContainerStatus.RUNNING:
+                return info.id
+            return None
+
+        # 状态缓存未就绪时查询Docker
+        await self._ensure_connected()
+        try:
+            container = await self._get_container(container_id)
+        except NotFound:
+            return None
+        return container.id if container.status == "running" else None
+
+    def get_all_container_stats(self) -> Dict[str, ContainerStatsResponse]:
+        """获取所有运行中容器的最新统计样本"""
+        return self.stats_streamer.snapshot()
+
     async def get_container_logs(
-        self, container_id: str, lines: int = 100, follow: bool = False
+        self,
+        container_id: str,
+        lines: int = 100,
+        since: Optional[str] = None,
+        timestamps: bool = False,
     ) -> ContainerLogsResponse:
-        """获取容器日志"""
-        self._ensure_client()
+        """获取容器日志
+
+        Args:
+            container_id: 容器ID
+            lines: 未指定游标时返回最后的行数；指定游标时为本次从游标起最多返回的行数
+            since: 上次响应返回的游标，只返回游标之后的新日志
+            timestamps: 日志行是否保留时间戳
+        """
+        await self._ensure_connected()
+        since_ns = parse_cursor(since)
 
         try:
-            container = self.client.containers.get(container_id)
+            container = await self._get_container(container_id)
 
-            # 异步获取日志
-            loop = asyncio.get_event_loop()
-            logs = await loop.run_in_executor(
-                None, lambda: container.logs(tail=lines, follow=follow, decode=True)
+            # 始终带时间戳读取，用于生成游标
+            kwargs = {"timestamps": True}
+            if since_ns is not None:
+                kwargs["since"] = cursor_to_since(since_ns)
+            else:
+                kwargs["tail"] = lines
+            output = await self._run(container.logs, **kwargs)
+            if isinstance(output, bytes):
+                output = output.decode("utf-8", errors="replace")
+
+            entries = parse_log_output(output, after_ns=since_ns)
+            truncated = len(entries) > lines
+            if truncated and since_ns is None:
+                entries = entries[-lines:]
+            elif truncated:
+                # 指定游标时返回最早的部分，游标停在最后返回的行，其余日志下次继续获取；
+                # 与最后一行时间戳相同的行一并返回，避免下次按时间戳去重时丢失
+                end = lines
+                last_ns = entries[lines - 1][0]
+                while end < len(entries) and entries[end][0] == last_ns:
+                    end += 1
+                truncated = end < len(entries)
+                entries = entries[:end]
+
+            logs = "\n".join(
+                f"{stamp} {text}" if timestamps else text
+                for _, stamp, text in entries
             )
 
-            # 处理日志内容
-            if isinstance(logs, bytes):
-                logs = logs.decode("utf-8", errors="replace")
-
-            # 计算实际行数
-            actual_lines = len([line for line in logs.split("\n") if line.strip()])
-
             return ContainerLogsResponse(
                 container_id=container_id,
                 logs=logs,
-                lines=actual_lines,
+                lines=len(entries),
+                cursor=str(entries[-1][0]) if entries else since,
+                truncated=truncated,
                 timestamp=datetime.now(timezone.utc).isoformat(),
             )
 
@@ -550,18 +769,40 @@ class DockerService:
             logger.error(f"获取容器日志失败: {e}")
             raise
 
+    async def follow_container_logs(
+        self, container_id: str, since: Optional[str] = None, lines: int = 100
+    ):
+        """跟随容器日志，产出 (游标, 时间戳, 日志内容)"""
+        await self._ensure_connected()
+        since_ns = parse_cursor(since)
+
+        async for ts, stamp, text in stream_logs(
+            lambda: self.client, container_id, since_ns, lines
+        ):
+            yield str(ts), stamp, text
+
     async def list_containers(
         self, all_containers: bool = False
     ) -> ContainerListResponse:
         """列出容器"""
-        self._ensure_client()
+        # 状态缓存在线时直接从内存返回
+        if self.state_cache.ready:
+            container_infos = self.state_cache.list(all_containers=all_containers)
+            running_count = sum(
+                1 for info in container_infos if info.status == ContainerStatus.RUNNING
+            )
+            return ContainerListResponse(
+                containers=container_infos,
+                total=len(container_infos),
+                running=running_count,
+                stopped=len(container_infos) - running_count,
+            )
+
+        await self._ensure_connected()
 
         try:
             # 异步获取容器列表
-            loop = asyncio.get_event_loop()
-            containers = await loop.run_in_executor(
-                None, lambda: self.client.containers.list(all=all_containers)
-            )
+            containers = await self._run(self.client.containers.list, all=all_containers)
 
             container_infos = []
             running_count = 0
@@ -573,11 +814,8 @@ class DockerService:
                     info = ContainerInfo(
                         id=container.id,
                         name=container.name,
-                        image=(
-                            container.image.tags[0]
-                            if container.image.tags
-                            else container.image.id[:12]
-                        ),
+                        # 使用 inspect 结果中的镜像名，避免逐个容器再查询镜像
+                        image=container.attrs.get("Config", {}).get("Image", ""),
                         status=ContainerStatus(container.status),
                         created_at=container.attrs.get("Created", ""),
                         labels=container.labels or {},
@@ -607,26 +845,27 @@ class DockerService:
             raise
 
     async def get_system_info(self) -> SystemInfo:
-        """获取系统信息"""
-        self._ensure_client()
+        """获取系统信息（实时采集）"""
+        await self._ensure_connected()
 
         try:
             # 异步获取Docker信息
-            loop = asyncio.get_event_loop()
-            docker_info = await loop.run_in_executor(None, self.client.info)
-            version_info = await loop.run_in_executor(None, self.client.version)
+            docker_info = await self._run(self.client.info)
+            version_info = await self._run(self.client.version)
+            self._docker_version = version_info.get("Version", "unknown")
 
             # 获取系统资源信息
             memory = psutil.virtual_memory()
             disk = psutil.disk_usage("/")
 
             return SystemInfo(
-                docker_version=version_info.get("Version", "unknown"),
+                docker_version=self._docker_version,
                 containers_total=docker_info.get("Containers", 0),
                 containers_running=docker_info.get("ContainersRunning", 0),
                 containers_stopped=docker_info.get("ContainersStopped", 0),
                 images_total=docker_info.get("Images", 0),
                 cpu_cores=psutil.cpu_count(),
+                cpu_percent=psutil.cpu_percent(interval=None),
                 memory_total_gb=round(memory.total / 1024 / 1024 / 1024, 2),
                 memory_available_gb=round(memory.available / 1024 / 1024 / 1024, 2),
                 disk_usage={
@@ -641,6 +880,80 @@ class DockerService:
             logger.error(f"获取系统信息失败: {e}")
             raise
 
+    async def refresh_system_snapshot(self) -> SystemInfo:
+        """刷新系统信息快照
+
+        docker version 只获取一次；docker info 按 docker_info_refresh_interval 刷新，
+        容器数量在状态缓存在线时直接取自缓存；psutil 使用非阻塞采样。
+        """
+        now = time.monotonic()
+
+        if (
+            self._docker_info is None
+            or not self.state_cache.ready
+            or now - self._docker_info_at >= settings.docker_info_refresh_interval
+        ):
+            await self._ensure_connected()
+            self._docker_info = await self._run(self.client.info)
+            self._docker_info_at = now
+
+        if self._docker_version is None:
+            version_info = await self._run(self.client.version)
+            self._docker_version = version_info.get("Version", "unknown")
+
+        docker_info = self._docker_info
+        if self.state_cache.ready:
+            containers_total = self.state_cache.count(running_only=False)
+            containers_running = self.state_cache.count(running_only=True)
+        else:
+            containers_total = docker_info.get("Containers", 0)
+            containers_running = docker_info.get("ContainersRunning", 0)
+
+        memory = psutil.virtual_memory()
+        disk = psutil.disk_usage("/")
+
+        self._system_snapshot = SystemInfo(
+            docker_version=self._docker_version,
+            containers_total=containers_total,
+            containers_running=containers_running,
+            containers_stopped=containers_total - containers_running,
+            images_total=docker_info.get("Images", 0),
+            cpu_cores=psutil.cpu_count(),
+            cpu_percent=psutil.cpu_percent(interval=None),
+            memory_total_gb=round(memory.total / 1024 / 1024 / 1024, 2),
+            memory_available_gb=round(memory.available / 1024 / 1024 / 1024, 2),
+            disk_usage={
+                "total_gb": round(disk.total / 1024 / 1024 / 1024, 2),
+                "used_gb": round(disk.used / 1024 / 1024 / 1024, 2),
+                "free_gb": round(disk.free / 1024 / 1024 / 1024, 2),
+                "percent": round(disk.used / disk.total * 100, 2),
+            },
+        )
+        self._system_snapshot_at = time.monotonic()
+        return self._system_snapshot
+
+    async def get_system_snapshot(self) -> SystemInfo:
+        """获取系统信息快照，快照过期（采样器停止）时同步刷新一次"""
+        max_age = settings.system_info_refresh_interval * 3
+        if (
+            self._system_snapshot is None
+            or time.monotonic() - self._system_snapshot_at > max_age
+        ):
+            return await self.refresh_system_snapshot()
+        return self._system_snapshot
+
+    async def run_system_sampler(self):
+        """后台系统信息采样循环"""
+        while True:
+            try:
+                await self.refresh_system_snapshot()
+                self.sync_stats_readers()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"系统信息采样失败: {e}")
+            await asyncio.sleep(settings.system_info_refresh_interval)
+
     def _format_volumes(self, volumes: Dict[str, str]) -> Dict[str, Dict[str, str]]:
         """格式化卷挂载"""
         formatted = {}
@@ -680,12 +993,12 @@ class DockerService:
     async def copy_file_to_container(
         self, container_id: str, request: ContainerFileOperationRequest
     ) -> ContainerFileOperationResponse:
-        """复制文件到容器"""
-        self._ensure_client()
+        """复制文件到容器（base64 JSON 接口，大文件请使用 put_archive_stream）"""
+        await self._ensure_connected()
 
         try:
             # 获取容器
-            container = self.client.containers.get(container_id)
+            container = await self._get_container(container_id)
 
             # 解码base64内容
             if not request.content_base64:
@@ -711,7 +1024,7 @@ class DockerService:
             if not target_dir:
                 target_dir = "/"
 
-            container.put_archive(target_dir, tar_buffer.read())
+            await self._run(container.put_archive, target_dir, tar_buffer.getvalue())
 
             logger.info(f"成功复制文件到容器 {container_id}:{request.container_path}")
 
@@ -751,12 +1064,12 @@ class DockerService:
     async def copy_directory_to_container(
         self, container_id: str, request: ContainerDirectoryOperationRequest
     ) -> ContainerFileOperationResponse:
-        """复制目录到容器"""
-        self._ensure_client()
+        """复制目录到容器（base64 JSON 接口，大目录请使用 put_archive_stream）"""
+        await self._ensure_connected()
 
         try:
             # 获取容器
-            container = self.client.containers.get(container_id)
+            container = await self._get_container(container_id)
 
             # 解码base64内容
             tar_content = base64.b64decode(request.archive_base64)
@@ -772,17 +1085,14 @@ class DockerService:
             if not was_running:
                 logger.info(f"容器未运行，启动容器以执行完整替换")
                 try:
-                    container.start()
+                    await self._run(container.start)
                     logger.info(f"容器 {container_id} 启动成功")
 
-                    # 等待容器启动完成
-                    import time
-
-                    # 3次重试机制
+                    # 等待容器启动完成，3次重试机制
                     for _ in range(3):
-                        time.sleep(2)
+                        await asyncio.sleep(2)
                         # 重新获取容器状态
-                        container.reload()
+                        await self._run(container.reload)
                         if container.attrs["State"]["Status"] == "running":
                             break
                         logger.info(f"等待容器 {container_id} 启动...")
@@ -807,7 +1117,9 @@ class DockerService:
             if request.remove_existing:
                 try:
                     logger.info(f"删除现有目录: {request.container_path}")
-                    result = container.exec_run(f"rm -rf {request.container_path}")
+                    result = await self._run(
+                        container.exec_run, f"rm -rf {request.container_path}"
+                    )
                     if result.exit_code == 0:
                         logger.info(f"成功删除目录: {request.container_path}")
                     else:
@@ -830,7 +1142,7 @@ class DockerService:
             if not parent_dir:
                 parent_dir = "/"
 
-            container.put_archive(parent_dir, tar_content)
+            await self._run(container.put_archive, parent_dir, tar_content)
 
             operation_type = "完整替换" if request.remove_existing else "合并更新"
             startup_info = " (已自动启动容器)" if not was_running else ""
@@ -873,5 +1185,163 @@ class DockerService:
             )
 
 
+    async def _exec_checked(self, container, cmd: List[str]):
+        """在容器内执行命令，失败时抛出异常"""
+        result = await self._run(container.exec_run, cmd)
+        if result.exit_code != 0:
+            output = result.output.decode("utf-8", errors="replace") if result.output else ""
+            raise Exception(f"命令执行失败({result.exit_code}): {output.strip()}")
+
+    async def _stream_archive(
+        self, container, target_dir: str, chunks: AsyncIterator[bytes]
+    ) -> int:
+        """将tar数据块流式写入容器，返回写入的字节数
+
+        数据块未完整读取（客户端断开或读取出错）时中止上传并抛出异常，
+        不会把截断的归档当作完整归档解包
+        """
+        loop = asyncio.get_event_loop()
+
+        # 请求体数据块经有界队列交给执行器线程中的 put_archive，队列满时读取方等待
+        pipe: "queue.Queue[Any]" = queue.Queue(
+            maxsize=settings.archive_stream_queue_size
+        )
+        finished = threading.Event()
+
+        def body():
+            while True:
+                chunk = pipe.get()
+                if chunk is None:
+                    return
+                if chunk is _ARCHIVE_ABORTED:
+                    raise IOError("归档数据传输中断")
+                yield chunk
+
+        def upload():
+            try:
+                return container.put_archive(target_dir, body())
+            finally:
+                finished.set()
+
+        # 上传与数据块投递持续整个传输过程，使用默认线程池，避免占满Docker线程池
+        upload_future = loop.run_in_executor(None, upload)
+
+        def feed(chunk: Any):
+            # put_archive 提前失败时不再阻塞
+            while not finished.is_set():
+                try:
+                    pipe.put(chunk, timeout=0.5)
+                    return
+                except queue.Full:
+                    continue
+
+        total_size = 0
+        completed = False
+        try:
+            async for chunk in chunks:
+                if not chunk:
+                    continue
+                if finished.is_set():
+                    break
+                total_size += len(chunk)
+                await loop.run_in_executor(None, feed, chunk)
+            completed = True
+        finally:
+            await loop.run_in_executor(
+                None, feed, None if completed else _ARCHIVE_ABORTED
+            )
+            if not completed:
+                # 等待上传线程结束，错误以读取请求体时的异常为准
+                await asyncio.gather(upload_future, return_exceptions=True)
+
+        if not await upload_future:
+            raise Exception("Docker拒绝了归档数据")
+        return total_size
+
+    async def put_archive_stream(
+        self,
+        container_id: str,
+        target_dir: str,
+        chunks: AsyncIterator[bytes],
+        remove_path: Optional[str] = None,
+    ) -> ContainerFileOperationResponse:
+        """将tar流直接写入容器（不在内存中缓存整个归档）
+
+        Args:
+            container_id: 容器ID
+            target_dir: 容器内解包目录
+            chunks: tar数据块的异步迭代器（通常为请求体）
+            remove_path: 需要完整替换的容器内路径，归档完整接收后才删除
+        """
+        await self._ensure_connected()
+        operation = "put_archive"
+        file_path = remove_path or target_dir
+
+        try:
+            container = await self._get_container(container_id)
+
+            staging_dir = None
+            if remove_path:
+                # 完整替换时先解包到暂存目录，归档完整接收后再替换，传输中断不会留下残缺目录
+                if container.status != "running":
+                    logger.info(f"容器 {container_id} 未运行，启动容器以执行完整替换")
+                    await self._run(container.start)
+                staging_dir = f"{target_dir.rstrip('/')}/.upload-{uuid.uuid4().hex[:12]}"
+                await self._exec_checked(container, ["mkdir", "-p", staging_dir])
+
+            try:
+                total_size = await self._stream_archive(
+                    container, staging_dir or target_dir, chunks
+                )
+                if staging_dir:
+                    await self._exec_checked(
+                        container,
+                        ["sh", "-c", _SWAP_STAGED_ARCHIVE, "sh", remove_path, staging_dir, target_dir],
+                    )
+            except BaseException:
+                if staging_dir:
+                    try:
+                        await self._run(container.exec_run, ["rm", "-rf", staging_dir])
+                    except Exception as e:
+                        logger.warning(f"清理暂存目录 {staging_dir} 失败: {e}")
+                raise
+
+            logger.info(
+                f"成功流式写入归档到容器 {container_id}:{target_dir} ({total_size} 字节)"
+            )
+            return ContainerFileOperationResponse(
+                success=True,
+                container_id=container_id,
+                message=f"归档写入成功: {file_path}",
+                operation=operation,
+                file_path=file_path,
+                file_size=total_size,
+                timestamp=datetime.now(timezone.utc).isoformat(),
+            )
+
+        except NotFound:
+            error_msg = f"容器 {container_id} 不存在"
+            logger.error(error_msg)
+            return ContainerFileOperationResponse(
+                success=False,
+                container_id=container_id,
+                message=error_msg,
+                operation=operation,
+                file_path=file_path,
+                timestamp=datetime.now(timezone.utc).isoformat(),
+            )
+        except Exception as e:
+            error_msg = f"写入归档失败: {str(e)}"
+            logger.error(f"流式写入归档到容器失败 {container_id}: {e}")
+            return ContainerFileOperationResponse(
+                success=False,
+                container_id=container_id,
+                message=error_msg,
+                operation=operation,
+                file_path=file_path,
+                timestamp=datetime.now(timezone.utc).isoformat(),
+            )
+
+
 # 全局Docker服务实例
 docker_service = DockerService()
@@ -0,0 +1,132 @@
+"""
+镜像拉取服务
+通过 docker-py 低层流式接口拉取镜像，并汇总各镜像层的进度
+"""
+
+import asyncio
+import threading
+import logging
+from typing import AsyncIterator, Callable, Dict, Optional, Any
+
+from docker.utils import parse_repository_tag
+
+logger = logging.getLogger(__name__)
+
+# 表示镜像层已完成的状态
+LAYER_DONE_STATUSES = {"Pull complete", "Already exists", "Download complete"}
+
+
+class PullProgress:
+    """单次镜像拉取的逐层进度"""
+
+    def __init__(self, image: str):
+        self.image = image
+        self.layers: Dict[str, Dict[str, Any]] = {}
+        self.status = "pulling"
+        self.digest: Optional[str] = None
+        self.error: Optional[str] = None
+
+    def update(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        """合并一条 docker pull 进度事件，返回对外输出的进度记录"""
+        if "error" in event:
+            self.status = "error"
+            self.error = event.get("error")
+            return self.summary()
+
+        status = event.get("status", "")
+        layer_id = event.get("id")
+        detail = event.get("progressDetail") or {}
+
+        if status.startswith("Digest:"):
+            self.digest = status.split(":", 1)[1].strip()
+
+        # "Pulling from ..." 事件的 id 是标签而非镜像层
+        if layer_id and not status.startswith("Pulling from"):
+            layer = self.layers.setdefault(
+                layer_id, {"status": status, "current": 0, "total": 0}
+            )
+            layer["status"] = status
+            if detail.get("total"):
+                layer["total"] = detail["total"]
+                layer["current"] = detail.get("current", 0)
+            if status in LAYER_DONE_STATUSES and layer["total"]:
+                layer["current"] = layer["total"]
+
+        record = self.summary()
+        record["layer"] = layer_id
+        record["layer_status"] = status
+        return record
+
+    def summary(self) -> Dict[str, Any]:
+        """汇总进度"""
+        total = sum(layer["total"] for layer in self.layers.values())
+        current = sum(layer["current"] for layer in self.layers.values())
+        completed = sum(
+            1
+            for layer in self.layers.values()
+            if layer["status"] in ("Pull complete", "Already exists")
+        )
+        return {
+            "image": self.image,
+            "status": self.status,
+            "layers_total": len(self.layers),
+            "layers_completed": completed,
+            "bytes_current": current,
+            "bytes_total": total,
+            "progress_percent": round(current / total * 100, 1) if total else 0.0,
+            "digest": self.digest,
+            "error": self.error,
+        }
+
+
+async def stream_pull(
+    get_client: Callable,
+    image: str,
+    auth_config: Optional[Dict[str, str]] = None,
+    platform: Optional[str] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """拉取镜像并异步产出进度记录，最后一条记录的 status 为 success 或 error
+
+    Args:
+        get_client: 返回docker客户端的可调用对象
+        image: 镜像名称
+        auth_config: 仓库认证信息 {"username": ..., "password": ...}
+        platform: 目标平台
+    """
+    loop = asyncio.get_event_loop()
+    events: asyncio.Queue = asyncio.Queue()
+    done = object()
+    progress = PullProgress(image)
+    repository, tag = parse_repository_tag(image)
+
+    def reader():
+        try:
+            stream = get_client().api.pull(
+                repository,
+                tag=tag or "latest",
+                stream=True,
+                decode=True,
+                auth_config=auth_config,
+                platform=platform,
+            )
+            for event in stream:
+                loop.call_soon_threadsafe(events.put_nowait, event)
+        except Exception as e:
+            loop.call_soon_threadsafe(events.put_nowait, {"error": str(e)})
+        finally:
+            loop.call_soon_threadsafe(events.put_nowait, done)
+
+    threading.Thread(target=reader, name=f"pull-{image}", daemon=True).start()
+
+    while True:
+        event = await events.get()
+        if event is done:
+            break
+        yield progress.update(event)
+
+    if progress.status != "error":
+        progress.status = "success"
+        logger.info(f"镜像拉取成功: {image} ({len(progress.layers)} 层)")
+    else:
+        logger.error(f"镜像拉取失败: {image}: {progress.error}")
+    yield progress.summary()
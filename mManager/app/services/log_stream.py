@@ -0,0 +1,144 @@
+"""
+容器日志游标与跟随流
+日志以 timestamps=True 读取，游标为最后一行的纳秒时间戳，增量读取时只返回游标之后的行
+"""
+
+import asyncio
+import threading
+import logging
+from calendar import timegm
+from datetime import datetime
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+LogEntry = Tuple[int, str, str]  # (纳秒时间戳, 原始时间戳, 日志内容)
+
+
+def parse_timestamp_ns(value: str) -> Optional[int]:
+    """解析Docker的 RFC3339Nano 时间戳为纳秒整数"""
+    try:
+        value = value.rstrip("Z")
+        seconds_part, _, fraction = value.partition(".")
+        seconds = timegm(datetime.strptime(seconds_part, "%Y-%m-%dT%H:%M:%S").timetuple())
+        nanos = int((fraction[:9]).ljust(9, "0")) if fraction else 0
+        return seconds * 1_000_000_000 + nanos
+    except ValueError:
+        return None
+
+
+def parse_cursor(cursor: Optional[str]) -> Optional[int]:
+    """解析游标（纳秒时间戳字符串）"""
+    if not cursor:
+        return None
+    try:
+        return int(cursor)
+    except ValueError:
+        raise ValueError(f"无效的日志游标: {cursor}")
+
+
+def cursor_to_since(cursor_ns: int) -> float:
+    """游标转换为Docker since 参数（秒，含小数）"""
+    return cursor_ns / 1_000_000_000
+
+
+def split_log_line(line: str) -> Optional[LogEntry]:
+    """拆分带时间戳的日志行"""
+    stamp, _, text = line.partition(" ")
+    ts = parse_timestamp_ns(stamp)
+    if ts is None:
+        return None
+    return ts, stamp, text
+
+
+def parse_log_output(output: str, after_ns: Optional[int] = None) -> List[LogEntry]:
+    """解析 timestamps=True 的日志输出，丢弃游标及之前的行
+
+    Docker 的 since 过滤包含边界，游标所在行会再次返回，这里按时间戳去重。
+    """
+    entries = []
+    for line in output.splitlines():
+        entry = split_log_line(line)
+        if entry is None:
+            # 无时间戳的续行（例如日志内容中的回车）并入上一行
+            if entries:
+                ts, stamp, text = entries[-1]
+                entries[-1] = (ts, stamp, f"{text}\n{line}")
+            continue
+        if after_ns is not None and entry[0] <= after_ns:
+            continue
+        entries.append(entry)
+    return entries
+
+
+async def stream_logs(
+    get_client: Callable,
+    container_id: str,
+    since_ns: Optional[int] = None,
+    tail: int = 100,
+) -> AsyncIterator[LogEntry]:
+    """跟随容器日志，异步产出新日志行
+
+    Args:
+        get_client: 返回docker客户端的可调用对象
+        container_id: 容器ID
+        since_ns: 游标，指定时从游标之后开始，否则先返回最后 tail 行
+        tail: 初始行数
+    """
+    loop = asyncio.get_event_loop()
+    lines: asyncio.Queue = asyncio.Queue()
+    done = object()
+    holder = {}
+
+    def emit(item):
+        try:
+            loop.call_soon_threadsafe(lines.put_nowait, item)
+        except RuntimeError:
+            # 事件循环已关闭
+            pass
+
+    def reader():
+        try:
+            kwargs = {"stream": True, "follow": True, "timestamps": True}
+            if since_ns is not None:
+                kwargs["since"] = cursor_to_since(since_ns)
+            else:
+                kwargs["tail"] = tail
+            stream = get_client().api.logs(container_id, **kwargs)
+            holder["stream"] = stream
+
+            # 数据块不保证按行切分，按换行符重新组装
+            buffer = b""
+            for chunk in stream:
+                buffer += chunk
+                *complete, buffer = buffer.split(b"\n")
+                for raw in complete:
+                    emit(raw.decode("utf-8", errors="replace"))
+            if buffer:
+                emit(buffer.decode("utf-8", errors="replace"))
+        except Exception as e:
+            logger.debug(f"容器 {container_id[:12]} 日志流结束: {e}")
+        finally:
+            emit(done)
+
+    threading.Thread(
+        target=reader, name=f"logs-{container_id[:12]}", daemon=True
+    ).start()
+
+    try:
+        while True:
+            line = await lines.get()
+            if line is done:
+                break
+            entry = split_log_line(line)
+            if entry is None or (since_ns is not None and entry[0] <= since_ns):
+                continue
+            yield entry
+    finally:
+        # 客户端断开时关闭Docker日志流，结束读取线程
+        stream = holder.get("stream")
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception:
+                pass
@@ -0,0 +1,243 @@
+"""
+容器资源统计流
+每个运行中的容器维持一个 stats(stream=True) 读取线程，结果写入环形缓冲区
+"""
+
+import asyncio
+import threading
+import time
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Any, AsyncIterator
+
+from app.config import settings
+from app.models.container import ContainerStatsResponse
+
+logger = logging.getLogger(__name__)
+
+
+def parse_stats(
+    container_id: str,
+    stats: Dict[str, Any],
+    previous: Optional[ContainerStatsResponse] = None,
+    interval: Optional[float] = None,
+) -> ContainerStatsResponse:
+    """将Docker原始统计数据转换为统计响应
+
+    Args:
+        container_id: 容器ID
+        stats: Docker stats API 返回的原始数据
+        previous: 上一个样本，用于计算网络速率
+        interval: 与上一个样本的间隔(秒)
+    """
+    cpu_stats = stats.get("cpu_stats", {})
+    memory_stats = stats.get("memory_stats", {})
+    networks = stats.get("networks", {})
+    blkio_stats = stats.get("blkio_stats", {})
+
+    # 计算CPU使用率
+    cpu_percent = 0.0
+    if "cpu_usage" in cpu_stats and "precpu_stats" in stats:
+        precpu_stats = stats["precpu_stats"]
+        cpu_usage = cpu_stats["cpu_usage"]["total_usage"]
+        precpu_usage = precpu_stats.get("cpu_usage", {}).get("total_usage", 0)
+        system_usage = cpu_stats.get("system_cpu_usage", 0)
+        pre_system_usage = precpu_stats.get("system_cpu_usage", 0)
+
+        cpu_delta = cpu_usage - precpu_usage
+        system_delta = system_usage - pre_system_usage
+
+        if system_delta > 0 and cpu_delta > 0:
+            online_cpus = cpu_stats.get("online_cpus") or 1
+            cpu_percent = (cpu_delta / system_delta) * online_cpus * 100.0
+
+    # 内存使用情况
+    memory_usage = memory_stats.get("usage", 0)
+    memory_limit = memory_stats.get("limit", 0)
+    memory_percent = (memory_usage / memory_limit * 100.0) if memory_limit > 0 else 0.0
+
+    # 网络统计
+    network_rx_bytes = 0
+    network_tx_bytes = 0
+    for network_data in networks.values():
+        network_rx_bytes += network_data.get("rx_bytes", 0)
+        network_tx_bytes += network_data.get("tx_bytes", 0)
+
+    network_rx_rate = 0.0
+    network_tx_rate = 0.0
+    if previous and interval and interval > 0:
+        network_rx_rate = max(network_rx_bytes - previous.network_rx_bytes, 0) / interval
+        network_tx_rate = max(network_tx_bytes - previous.network_tx_bytes, 0) / interval
+
+    # 块IO统计
+    block_read_bytes = 0
+    block_write_bytes = 0
+    for io_stat in blkio_stats.get("io_service_bytes_recursive") or []:
+        if io_stat["op"] == "Read":
+            block_read_bytes += io_stat["value"]
+        elif io_stat["op"] == "Write":
+            block_write_bytes += io_stat["value"]
+
+    return ContainerStatsResponse(
+        container_id=container_id,
+        cpu_percent=round(cpu_percent, 2),
+        cpu_usage=cpu_stats,
+        memory_usage_mb=round(memory_usage / 1024 / 1024, 2),
+        memory_limit_mb=round(memory_limit / 1024 / 1024, 2),
+        memory_percent=round(memory_percent, 2),
+        network_rx_bytes=network_rx_bytes,
+        network_tx_bytes=network_tx_bytes,
+        network_rx_rate=round(network_rx_rate, 2),
+        network_tx_rate=round(network_tx_rate, 2),
+        block_read_bytes=block_read_bytes,
+        block_write_bytes=block_write_bytes,
+        pids=stats.get("pids_stats", {}).get("current", 0),
+        timestamp=datetime.now(timezone.utc).isoformat(),
+    )
+
+
+class ContainerStatsStreamer:
+    """容器统计流管理器"""
+
+    def __init__(self):
+        self._get_client: Optional[Callable] = None
+        self._buffers: Dict[str, Deque[ContainerStatsResponse]] = {}
+        self._sample_times: Dict[str, float] = {}
+        self._readers: Dict[str, threading.Thread] = {}
+        self._streams: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, get_client: Callable):
+        """设置docker客户端获取方法"""
+        self._get_client = get_client
+
+    def ensure_reader(self, container_id: str):
+        """确保容器有一个统计读取线程"""
+        if not self._get_client:
+            return
+        with self._lock:
+            reader = self._readers.get(container_id)
+            if reader and reader.is_alive():
+                return
+            self._buffers.setdefault(
+                container_id, deque(maxlen=settings.stats_buffer_size)
+            )
+            reader = threading.Thread(
+                target=self._read_stream,
+                args=(container_id,),
+                name=f"stats-{container_id[:12]}",
+                daemon=True,
+            )
+            self._readers[container_id] = reader
+        reader.start()
+
+    def stop_reader(self, container_id: str, drop_buffer: bool = False):
+        """停止容器的统计读取"""
+        with self._lock:
+            stream = self._streams.pop(container_id, None)
+            self._readers.pop(container_id, None)
+            if drop_buffer:
+                self._buffers.pop(container_id, None)
+                self._sample_times.pop(container_id, None)
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+    def sync(self, running_ids: Iterable[str]):
+        """按运行中容器集合启动/停止读取线程"""
+        running_ids = set(running_ids)
+        for container_id in running_ids:
+            self.ensure_reader(container_id)
+        with self._lock:
+            stale = [cid for cid in self._buffers if cid not in running_ids]
+        for container_id in stale:
+            self.stop_reader(container_id, drop_buffer=True)
+
+    def stop_all(self):
+        """停止全部读取线程"""
+        with self._lock:
+            container_ids = list(self._readers.keys())
+        for container_id in container_ids:
+            self.stop_reader(container_id)
+
+    def _read_stream(self, container_id: str):
+        """读取线程：持续消费 stats 流并写入缓冲区"""
+        previous: Optional[ContainerStatsResponse] = None
+        previous_at: Optional[float] = None
+        try:
+            stream = self._get_client().api.stats(
+                container_id, stream=True, decode=True
+            )
+            with self._lock:
+                self._streams[container_id] = stream
+
+            for raw in stream:
+                now = time.monotonic()
+                sample = parse_stats(
+                    container_id,
+                    raw,
+                    previous,
+                    (now - previous_at) if previous_at else None,
+                )
+                with self._lock:
+                    buffer = self._buffers.get(container_id)
+                    if buffer is None:
+                        break
+                    buffer.append(sample)
+                    self._sample_times[container_id] = now
+                previous, previous_at = sample, now
+
+        except Exception as e:
+            logger.debug(f"容器 {container_id[:12]} 统计流结束: {e}")
+        finally:
+            with self._lock:
+                if self._readers.get(container_id) is threading.current_thread():
+                    self._readers.pop(container_id, None)
+                self._streams.pop(container_id, None)
+
+    def latest(
+        self, container_id: str, max_age: Optional[float] = None
+    ) -> Optional[ContainerStatsResponse]:
+        """获取最新样本，超过 max_age 秒的样本视为无效"""
+        with self._lock:
+            buffer = self._buffers.get(container_id)
+            if not buffer:
+                return None
+            if max_age is not None:
+                sampled_at = self._sample_times.get(container_id, 0)
+                if time.monotonic() - sampled_at > max_age:
+                    return None
+            return buffer[-1]
+
+    def history(self, container_id: str, limit: int = 60) -> List[ContainerStatsResponse]:
+        """获取最近的样本"""
+        with self._lock:
+            buffer = self._buffers.get(container_id)
+            if not buffer:
+                return []
+            return list(buffer)[-limit:]
+
+    def snapshot(self) -> Dict[str, ContainerStatsResponse]:
+        """获取所有容器的最新样本"""
+        with self._lock:
+            return {cid: buffer[-1] for cid, buffer in self._buffers.items() if buffer}
+
+    async def subscribe(
+        self, container_id: str, poll_interval: float = 1.0
+    ) -> AsyncIterator[ContainerStatsResponse]:
+        """异步迭代新样本（用于SSE）"""
+        self.ensure_reader(container_id)
+        last_sent = None
+        while True:
+            sample = self.latest(container_id)
+            if sample is not None and sample is not last_sent:
+                last_sent = sample
+                yield sample
+            await asyncio.sleep(poll_interval)
+
+
+# 全局统计流实例
+stats_streamer = ContainerStatsStreamer()
@@ -0,0 +1,140 @@
+"""
+控制器负载遥测
+周期性汇总运行容器数、CPU/内存压力和本地镜像清单，缓存为报告供 /telemetry 读取，
+并在配置了 telemetry_push_url 时推送给后端
+"""
+
+import asyncio
+import time
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from app.config import settings, get_server_capabilities
+from app.services.docker_service import docker_service
+
+logger = logging.getLogger(__name__)
+
+
+class TelemetryPublisher:
+    """负载遥测发布器"""
+
+    def __init__(self):
+        self._report: Optional[Dict[str, Any]] = None
+        self._report_at = 0.0
+        self._seq = 0
+        self._images: List[Dict[str, Any]] = []
+        self._images_at = 0.0
+        self._push_failures = 0
+
+    async def _refresh_images(self):
+        """刷新本地镜像清单（按 telemetry_image_refresh_interval 节流）"""
+        now = time.monotonic()
+        if self._images and now - self._images_at < settings.telemetry_image_refresh_interval:
+            return
+
+        await docker_service._ensure_connected()
+        summaries = await docker_service._run(
+            docker_service.client.api.images, filters={"dangling": False}
+        )
+        self._images = [
+            {"name": repo_tag, "id": summary["Id"], "size": summary.get("Size", 0)}
+            for summary in summaries
+            for repo_tag in summary.get("RepoTags") or []
+            if repo_tag != "<none>:<none>"
+        ]
+        self._images_at = now
+
+    async def refresh(self) -> Dict[str, Any]:
+        """重新生成遥测报告"""
+        system_info = await docker_service.get_system_snapshot()
+        try:
+            await self._refresh_images()
+        except Exception as e:
+            # 镜像清单获取失败时沿用上一次结果
+            logger.warning(f"刷新镜像清单失败: {e}")
+
+        running = system_info.containers_running
+        memory_total = system_info.memory_total_gb
+        self._seq += 1
+        self._report = {
+            "server_id": settings.server_id,
+            "server_type": settings.server_type,
+            "seq": self._seq,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "containers": {
+                "total": system_info.containers_total,
+                "running": running,
+                "stopped": system_info.containers_stopped,
+                "max_allowed": settings.max_containers,
+            },
+            "resources": {
+                "cpu_cores": system_info.cpu_cores,
+                "cpu_percent": system_info.cpu_percent,
+                "memory_total_gb": memory_total,
+                "memory_available_gb": system_info.memory_available_gb,
+                "memory_usage_percent": (
+                    round((memory_total - system_info.memory_available_gb) / memory_total * 100, 2)
+                    if memory_total
+                    else 0.0
+                ),
+                "disk_usage": system_info.disk_usage,
+            },
+            "load_percentage": round(running / settings.max_containers * 100, 2),
+            "capabilities": get_server_capabilities(),
+            "images": self._images,
+        }
+        self._report_at = time.monotonic()
+        return self._report
+
+    async def get_report(self) -> Dict[str, Any]:
+        """获取最新报告，尚未生成或已过期时立即生成"""
+        max_age = settings.telemetry_interval * 2
+        if self._report is None or time.monotonic() - self._report_at > max_age:
+            return await self.refresh()
+        return self._report
+
+    def _post(self, report: Dict[str, Any]):
+        """推送报告（同步，在执行器中调用）"""
+        response = requests.post(
+            settings.telemetry_push_url,
+            json=report,
+            headers={
+                "Authorization": f"Bearer {settings.telemetry_push_key or settings.api_key}"
+            },
+            timeout=settings.telemetry_push_timeout,
+        )
+        response.raise_for_status()
+
+    async def push(self, report: Dict[str, Any]):
+        """推送报告给后端，失败只记录日志，后端会退回轮询 /telemetry"""
+        loop = asyncio.get_event_loop()
+        try:
+            await loop.run_in_executor(None, self._post, report)
+            if self._push_failures:
+                logger.info(f"遥测推送恢复，此前连续失败 {self._push_failures} 次")
+            self._push_failures = 0
+        except Exception as e:
+            self._push_failures += 1
+            # 持续失败时降低日志频率
+            if self._push_failures == 1 or self._push_failures % 60 == 0:
+                logger.warning(f"遥测推送失败 (连续 {self._push_failures} 次): {e}")
+
+    async def run(self):
+        """后台遥测循环"""
+        while True:
+            try:
+                report = await self.refresh()
+                if settings.telemetry_push_url:
+                    await self.push(report)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"生成遥测报告失败: {e}")
+            await asyncio.sleep(settings.telemetry_interval)
+
+
+# 全局遥测发布器
+telemetry_publisher = TelemetryPublisher()